@@ -1,63 +1,169 @@
 import os
-import re
 
 from math import atan, sqrt, cos, sin
 
-from .abaqus_inp_parser import read_inp
-from .gmsh_pos_parser import read_pos_file, read_pos_field_options
-from .patran_neutral_parser import read_out
-from .samcef_dat_parser import read_dat
-
-from .patran_results_parser import read_rpt
-from .xfem_front_parser import read_sif_file, get_front_indices
-from .xfem_log_parser import write_log_report
-
-from .samres_results_reader import (get_group_names_from_file,
-                                    start_extraction_reac_xfem,
-                                    create_reac_report_xfem)
+from .lazy_import import LazyReaderDict, import_attribute
+from .instrumentation import Instrumentation, activate, phase
+from .file_io import input_extension
+
+
+# public names of the package, their modules are imported on first access
+_lazy_attributes = {'read_inp': 'abaqus_inp_parser',
+                    'read_pos_file': 'gmsh_pos_parser',
+                    'read_pos_field_options': 'gmsh_pos_parser',
+                    'read_out': 'patran_neutral_parser',
+                    'read_dat': 'samcef_dat_parser',
+                    'read_femb': 'femb_binary_parser',
+                    'write_femb': 'femb_binary_parser',
+                    'read_rpt': 'patran_results_parser',
+                    'read_sif_file': 'xfem_front_parser',
+                    'get_front_indices': 'xfem_front_parser',
+                    'write_log_report': 'xfem_log_parser',
+                    'get_group_names_from_file': 'samres_results_reader',
+                    'start_extraction_reac_xfem': 'samres_results_reader',
+                    'create_reac_report_xfem': 'samres_results_reader',
+                    'Mesh': 'mesh',
+                    'MeshCache': 'mesh_cache',
+                    'convert_mesh_file': 'mesh_converter',
+                    'read_dat_parallel': 'parallel_reader',
+                    'read_inp_parallel': 'parallel_reader',
+                    'read_out_parallel': 'parallel_reader',
+                    'read_mesh_groups': 'partial_reader',
+                    'SpatialIndex': 'spatial_index',
+                    'SegmentIndex': 'spatial_index',
+                    'build_chains': 'propagation_chains',
+                    'FieldHistory': 'field_history',
+                    'build_field_history': 'field_history',
+                    'IdSet': 'groups',
+                    'Group': 'groups',
+                    'merge_meshes': 'mesh_merge',
+                    'renumber_mesh': 'renumbering',
+                    'renumber_field': 'renumbering',
+                    'extract_skin': 'skin',
+                    'Connectivity': 'connectivity',
+                    'mesh_statistics': 'mesh_quality',
+                    'PosFieldMapper': 'field_mapping',
+                    'map_pos_files': 'field_mapping',
+                    'ResultsWatcher': 'results_watcher',
+                    'ResultClient': 'result_server'}
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        value = import_attribute(__name__, _lazy_attributes[name], name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
+
+
+def pos_lips_files(pos_file):
+    # pos files of the levres of xfem results, next to pos_file
+    dirname = os.path.dirname(pos_file)
+    if os.path.basename(pos_file) == 'DISPLACEMENT-1-0.pos':
+        return [os.path.join(dirname, 'DISPLACEMENT-1-1.pos'), os.path.join(dirname, 'DISPLACEMENT-1-2.pos')]
+    if os.path.basename(pos_file) == 'STRESS-1-0.pos':
+        return [os.path.join(dirname, 'STRESS-1-1.pos'), os.path.join(dirname, 'STRESS-1-2.pos')]
+    return []
 
 
 class FEMReader(object):
 
-    ReaderFromMeshFormatDict = {'patran': read_out,
-                                'samcef': read_dat,
-                                'abaqus': read_inp,
-                                'gmsh': read_pos_file}
+    ReaderFromMeshFormatDict = LazyReaderDict(__name__, {'patran': 'patran_neutral_parser:read_out',
+                                                         'samcef': 'samcef_dat_parser:read_dat',
+                                                         'abaqus': 'abaqus_inp_parser:read_inp',
+                                                         'gmsh': 'gmsh_pos_parser:read_pos_file',
+                                                         'femb': 'femb_binary_parser:read_femb'})
 
-    ReaderFromFileExtensionDict = {'.out': read_out,
-                                   '.dat': read_dat,
-                                   '.inp': read_inp,
-                                   '.pos': read_pos_file}
+    ReaderFromFileExtensionDict = LazyReaderDict(__name__, {'.out': 'patran_neutral_parser:read_out',
+                                                            '.dat': 'samcef_dat_parser:read_dat',
+                                                            '.inp': 'abaqus_inp_parser:read_inp',
+                                                            '.pos': 'gmsh_pos_parser:read_pos_file',
+                                                            '.femb': 'femb_binary_parser:read_femb'})
 
-    def __init__(self):
+    def __init__(self, cache=None, instrumentation=None):
         super(FEMReader, self).__init__()
+        self.cache = cache
+        self.instrumentation = instrumentation
 
-    def read_mesh_file(self, mesh_file, mesh_format=None, read_nodes=True, read_elems=True, read_groups=False):
+    def read_mesh_file(self, mesh_file, mesh_format=None, read_nodes=True, read_elems=True, read_groups=False,
+                       as_mesh=False, workers=None, groups=None, as_groups=False):
+        # with as_groups, groups of mesh dicts are Group objects (see Mesh.group for meshes)
+        from .mesh import Mesh
         if mesh_format:
             reader_func = FEMReader.ReaderFromMeshFormatDict[mesh_format]
         else:
-            file_extension = os.path.splitext(mesh_file)[-1]
+            file_extension = input_extension(mesh_file)
             reader_func = FEMReader.ReaderFromFileExtensionDict[file_extension]
-        mesh_dict = reader_func(mesh_file, read_nodes, read_elems, read_groups)
+        with activate(self.instrumentation):
+            if self.cache is not None:
+                # meshes are cached as Mesh, as_mesh and as_groups apply to the cached mesh
+                flags = {'reader': '{0}.{1}'.format(reader_func.__module__, reader_func.__name__),
+                         'read_nodes': bool(read_nodes),
+                         'read_elems': bool(read_elems),
+                         'read_groups': bool(read_groups)}
+                if groups is not None:
+                    flags['groups'] = list(groups)
+                with phase('cache', 'mesh_cache', mesh_file) as cache_phase:
+                    mesh = self.cache.get(mesh_file, **flags)
+                    if mesh is not None:
+                        cache_phase.count(mesh.n_nodes + mesh.n_elems)
+                if mesh is None:
+                    mesh = Mesh.from_dict(self.parse_mesh_file(reader_func, mesh_file, mesh_format,
+                                                               read_nodes, read_elems, read_groups, workers, groups))
+                    self.cache.put(mesh_file, mesh, **flags)
+                if as_mesh:
+                    return mesh
+                mesh_dict = mesh.to_dict()
+            else:
+                mesh_dict = self.parse_mesh_file(reader_func, mesh_file, mesh_format,
+                                                 read_nodes, read_elems, read_groups, workers, groups)
+        if as_mesh:
+            return Mesh.from_dict(mesh_dict)
+        if as_groups:
+            from .groups import as_groups
+            mesh_dict['groups'] = as_groups(mesh_dict['groups'])
         return mesh_dict
 
+    def read_mesh_files(self, mesh_files, prefetch=4, **read_args):
+        '''
+        Yields (mesh_file, mesh) of each file, read as read_mesh_file
+        does with read_args. The next prefetch files are transferred
+        in the background while a file is parsed
+        '''
+        from .file_io import Prefetcher
+        with Prefetcher(mesh_files, depth=prefetch):
+            for mesh_file in mesh_files:
+                yield mesh_file, self.read_mesh_file(mesh_file, **read_args)
+
+    def parse_mesh_file(self, reader_func, mesh_file, mesh_format, read_nodes, read_elems, read_groups, workers=None,
+                        groups=None):
+        # only the given groups, their elements and nodes are read when groups is given
+        if groups is not None:
+            from .partial_reader import read_mesh_groups
+            return read_mesh_groups(mesh_file, groups, mesh_format, read_nodes, read_elems, workers or 1, reader_func)
+        # ASCII decks are parsed by several processes when workers is given
+        if workers:
+            from .parallel_reader import get_parallel_reader
+            parallel_func = get_parallel_reader(mesh_file, mesh_format)
+            if parallel_func is not None:
+                return parallel_func(mesh_file, read_nodes, read_elems, read_groups, workers=workers)
+        return reader_func(mesh_file, read_nodes, read_elems, read_groups)
+
     def read_mesh_result_file(self, mesh_result_file, xf_lips=False):
-        file_extension = os.path.splitext(mesh_result_file)[-1]
+        from .gmsh_pos_parser import read_pos_file
+        file_extension = input_extension(mesh_result_file)
         if file_extension == '.pos':
-            dirname = os.path.dirname(mesh_result_file)
             pos_files = [mesh_result_file]
             # add levres files for xfem if needed
             if xf_lips:
-                if os.path.basename(mesh_result_file) == 'DISPLACEMENT-1-0.pos':
-                    levre_1 = os.path.join(dirname, 'DISPLACEMENT-1-1.pos')
-                    levre_2 = os.path.join(dirname, 'DISPLACEMENT-1-2.pos')
-                    pos_files.extend([levre_1, levre_2])
-                elif os.path.basename(mesh_result_file) == 'STRESS-1-0.pos':
-                    levre_1 = os.path.join(dirname, 'STRESS-1-1.pos')
-                    levre_2 = os.path.join(dirname, 'STRESS-1-2.pos')
-                    pos_files.extend([levre_1, levre_2])
+                pos_files.extend(pos_lips_files(mesh_result_file))
             _pos_files = [p for p in pos_files if os.path.exists(p)]
-            mesh_dict, _field_dict = read_pos_file(_pos_files, read_fields=True)
+            with activate(self.instrumentation):
+                mesh_dict, _field_dict = read_pos_file(_pos_files, read_fields=True)
             field_type = list(_field_dict.keys())[0]
             field_dict = {0: _field_dict[field_type]}
             return mesh_dict, field_dict
@@ -66,7 +172,8 @@ class FEMReader(object):
 class FieldReader(object):
 
     FieldFormatFromExtension = {'.pos': 'gmsh',
-                                '.rpt': 'patran'}
+                                '.rpt': 'patran',
+                                '.femb': 'femb'}
 
     PosFieldsNamesDict = {'DISPLACEMENT-1-0.pos': 'Déplacements (peau, XFEM)',
                           'DISPLACEMENT-1-1.pos': 'Déplacements (peau, levre 1)',
@@ -86,34 +193,59 @@ class FieldReader(object):
                           'Dtemp_xfe.pos': 'Décalage de température (XFEM)',
                           'tempsam.pos': 'Témperature (FEM)'}
 
-    def __init__(self):
+    def __init__(self, instrumentation=None):
         super(FieldReader, self).__init__()
+        self.instrumentation = instrumentation
 
-    def read_field_file(self, field_file, field_format=None, field_type='vector', xf_lips=False):
+    def read_field_file(self, field_file, field_format=None, field_type='vector', xf_lips=False, as_field=False,
+                        dtype='float64', sym_tensor=False):
+        # with as_field, fields are Field arrays of dtype, with sym_tensor tensors keep 6 components
         if not field_format:
-            file_extension = os.path.splitext(field_file)[-1]
+            file_extension = input_extension(field_file)
             field_format = FieldReader.FieldFormatFromExtension[file_extension]
         if field_format == 'gmsh':
-            dirname = os.path.dirname(field_file)
+            from .gmsh_pos_parser import read_pos_file
             pos_files = [field_file]
             if xf_lips:
-                if os.path.basename(field_file) == 'DISPLACEMENT-1-0.pos':
-                    levre_1 = os.path.join(dirname, 'DISPLACEMENT-1-1.pos')
-                    levre_2 = os.path.join(dirname, 'DISPLACEMENT-1-2.pos')
-                    pos_files.extend([levre_1, levre_2])
-                elif os.path.basename(field_file) == 'STRESS-1-0.pos':
-                    levre_1 = os.path.join(dirname, 'STRESS-1-1.pos')
-                    levre_2 = os.path.join(dirname, 'STRESS-1-2.pos')
-                    pos_files.extend([levre_1, levre_2])
-            mesh_dict, _field_dict = read_pos_file(pos_files, read_fields=True)
+                pos_files.extend(pos_lips_files(field_file))
+            with activate(self.instrumentation):
+                mesh_dict, _field_dict = read_pos_file(pos_files, read_fields=True, as_field=as_field, dtype=dtype,
+                                                       sym_tensor=sym_tensor)
             field_type = list(_field_dict.keys())[0]
             field_dict = {0: _field_dict[field_type]}
             return field_dict
         if field_format == 'patran':
-            field_dict = read_rpt(field_file, field_type)
+            from .patran_results_parser import read_rpt
+            with activate(self.instrumentation):
+                field_dict = read_rpt(field_file, field_type, as_field, dtype, sym_tensor)
             return field_dict
+        if field_format == 'femb':
+            from .femb_binary_parser import read_femb
+            mesh, field_dict = read_femb(field_file, read_fields=True)
+            if as_field:
+                from .fields import Field, compact_values
+                field_dict = {name: Field(field.ids, compact_values(field.values, dtype, sym_tensor), field.kind,
+                                          check_order=False) for name, field in field_dict.items()}
+            return field_dict
+
+    def read_field_files(self, field_files, prefetch=4, **read_args):
+        '''
+        Yields (field_file, field_dict) of each file, read as read_field_file
+        does with read_args. The next prefetch files (and their lips files)
+        are transferred in the background while a file is parsed
+        '''
+        from .file_io import Prefetcher
+        input_files = []
+        for field_file in field_files:
+            input_files.append(field_file)
+            if read_args.get('xf_lips'):
+                input_files.extend(pos_lips_files(field_file))
+        with Prefetcher(input_files, depth=prefetch):
+            for field_file in field_files:
+                yield field_file, self.read_field_file(field_file, **read_args)
 
     def get_pos_field_options(self, pos_file):
+        from .gmsh_pos_parser import read_pos_field_options
         return read_pos_field_options(pos_file)
 
     def get_pos_field_name(self, pos_file):
@@ -124,6 +256,7 @@ class FieldReader(object):
             return file_name
 
     def get_pos_mesh_name(self, pos_file):
+        import re
         dir_name = os.path.dirname(pos_file)
         step_str_list = re.findall('step\d+', dir_name)
         if step_str_list:
@@ -145,14 +278,18 @@ class XfemFrontReader(object):
                   SifSmoothName,
                   InfoPropaName]
 
-    def __init__(self):
+    def __init__(self, instrumentation=None):
         super(XfemFrontReader, self).__init__()
+        self.instrumentation = instrumentation
 
     def read_front_file(self, front_file, dk_coef=1.0, new_curv_coords=None):
-        mesh, fields = read_sif_file(front_file, dk_coef, new_curv_coords)
+        from .xfem_front_parser import read_sif_file
+        with activate(self.instrumentation):
+            mesh, fields = read_sif_file(front_file, dk_coef, new_curv_coords)
         return mesh, fields
 
     def read_fronts_for_step(self, step_folder, dk_coef, mu=0.3):
+        from .xfem_front_parser import read_sif_file
         front_files = [os.path.join(step_folder, name) for name in self.FrontFiles]
 
         mesh = {}
@@ -164,10 +301,11 @@ class XfemFrontReader(object):
                 continue
 
             basename = os.path.basename(front_file)
-            if curv_coord and basename == self.InfoPropaName:
-                _mesh, _fields = read_sif_file(front_file, dk_coef, new_curv_coords=curv_coord)
-            else:
-                _mesh, _fields = read_sif_file(front_file, dk_coef)
+            with activate(self.instrumentation):
+                if curv_coord and basename == self.InfoPropaName:
+                    _mesh, _fields = read_sif_file(front_file, dk_coef, new_curv_coords=curv_coord)
+                else:
+                    _mesh, _fields = read_sif_file(front_file, dk_coef)
 
             if not mesh:
                 mesh = _mesh
@@ -210,6 +348,7 @@ class XfemFrontReader(object):
         return mesh, fields
 
     def get_front_indices(self, step_folder):
+        from .xfem_front_parser import get_front_indices
         sif_1 = os.path.join(step_folder, 'sifs-1.txt')
         n_fronts = get_front_indices(sif_1)
         return n_fronts
@@ -222,11 +361,14 @@ class SamresReader(object):
         self.parent = parent
 
     def get_group_names(self, mesh_file):
+        from .samres_results_reader import get_group_names_from_file
         groups = get_group_names_from_file(mesh_file)
         return groups
 
     def start_extraction_reac_xfem(self, des_files, folder_to_dump, sam_exe, sam_zone):
+        from .samres_results_reader import start_extraction_reac_xfem
         return start_extraction_reac_xfem(des_files, folder_to_dump, sam_exe, sam_zone)
 
     def create_reac_report_xfem(self, folder_to_dump, nom_etude, answer_files, mesh_file, group_names):
+        from .samres_results_reader import create_reac_report_xfem
         return create_reac_report_xfem(folder_to_dump, nom_etude, answer_files, mesh_file, group_names)
@@ -0,0 +1,403 @@
+'''
+Benchmark suite for readers and writers of the package.
+Synthetic hex/tet/wedge meshes with groups and fields are
+generated in every supported format, then each reader and
+writer is timed and memory-profiled. Results are saved as
+json and can be compared with a previous run to detect
+regressions.
+
+Usage (from the folder containing the package):
+    python -m <package>._benchmark_suite --sizes 1e4 1e5 --save bench.json
+    python -m <package>._benchmark_suite --sizes 1e4 --baseline bench.json
+    python -m <package>._benchmark_suite --imports-only --import-budget 0.05
+'''
+
+
+import os
+import sys
+import json
+import time
+import struct
+import shutil
+import subprocess
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from .mesh import Mesh, ElemBlock
+from .fields import Field
+from .gmsh_pos_parser import keys_names, read_pos_file
+from .samcef_dat_parser import read_dat, write_dat
+from .abaqus_inp_parser import read_inp, write_inp
+from .patran_neutral_parser import read_out, write_out
+from .patran_results_parser import read_rpt, write_res, write_ses, write_template
+from .femb_binary_parser import read_femb, write_femb
+from .xfem_front_parser import read_sif_file
+from .xfem_log_parser import write_log_report
+from .mesh_converter import convert_mesh_file
+
+
+default_sizes = [1e4, 1e5]
+default_families = ['hex', 'tet', 'wedge']
+
+# regression if a timing grows (or a throughput drops) by more than this ratio
+default_tolerance = 0.25
+
+# seconds allowed for 'import <package>' in a fresh interpreter
+default_import_budget = 0.05
+import_modules = ['', 'samcef_dat_parser', 'abaqus_inp_parser', 'patran_neutral_parser', 'gmsh_pos_parser',
+                  'patran_results_parser', 'xfem_front_parser', 'femb_binary_parser', 'samres_results_reader']
+
+hex_to_tets = [[0, 1, 2, 6], [0, 2, 3, 6], [0, 3, 7, 6], [0, 7, 4, 6], [0, 4, 5, 6], [0, 5, 1, 6]]
+hex_to_wedges = [[0, 1, 2, 4, 5, 6], [0, 2, 3, 4, 6, 7]]
+elems_per_hex = {'hex': 1, 'tet': 6, 'wedge': 2}
+gmsh_elem_names = {'hex': 'HEXAHEDRA', 'tet': 'TETRAHEDRA', 'wedge': 'PRISMS'}
+
+
+def grid_size(n_elems, family):
+    n_hex = max(1, int(n_elems) // elems_per_hex[family])
+    nx = max(1, int(round(n_hex ** (1.0 / 3))))
+    ny = nx
+    nz = max(1, int(round(n_hex / float(nx * ny))))
+    return nx, ny, nz
+
+
+def make_synthetic_mesh(n_elems, family='hex', n_groups=4):
+    nx, ny, nz = grid_size(n_elems, family)
+    xs, ys, zs = np.meshgrid(np.linspace(0.0, 1.0, nx + 1),
+                             np.linspace(0.0, 1.0, ny + 1),
+                             np.linspace(0.0, 1.0 * nz / nx, nz + 1), indexing='ij')
+    # node (i, j, k) -> id 1 + i + (nx+1)*(j + (ny+1)*k)
+    coords = np.stack([xs.transpose(2, 1, 0).ravel(), ys.transpose(2, 1, 0).ravel(), zs.transpose(2, 1, 0).ravel()], axis=1)
+    node_ids = np.arange(1, len(coords) + 1, dtype=np.int64)
+    i, j, k = [a.transpose(2, 1, 0).ravel() for a in np.meshgrid(np.arange(nx), np.arange(ny), np.arange(nz), indexing='ij')]
+    nid = lambda di, dj, dk: 1 + (i + di) + (nx + 1) * ((j + dj) + (ny + 1) * (k + dk))
+    hexes = np.stack([nid(0, 0, 0), nid(1, 0, 0), nid(1, 1, 0), nid(0, 1, 0),
+                      nid(0, 0, 1), nid(1, 0, 1), nid(1, 1, 1), nid(0, 1, 1)], axis=1)
+    if family == 'hex':
+        conn = hexes
+    elif family == 'tet':
+        conn = hexes[:, hex_to_tets].reshape(-1, 4)
+        p = coords[conn - 1]
+        vol = np.einsum('ij,ij->i', np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]), p[:, 3] - p[:, 0])
+        conn[vol < 0] = conn[vol < 0][:, [0, 2, 1, 3]]
+    else:
+        conn = hexes[:, hex_to_wedges].reshape(-1, 6)
+    elem_ids = np.arange(1, len(conn) + 1, dtype=np.int64)
+    group_arrays = {}
+    for g, ids in enumerate(np.array_split(elem_ids, n_groups)):
+        group_arrays['GR_{0}'.format(g)] = {family: ids}
+    group_arrays['N_BASE'] = {'node': node_ids[coords[:, 2] == 0.0]}
+    return Mesh(node_ids, coords, {family: ElemBlock(elem_ids, conn)}, group_arrays)
+
+
+def make_synthetic_fields(mesh):
+    coords = mesh.coords
+    disp = np.stack([1e-3 * coords[:, 0], -1e-3 * coords[:, 1], 1e-4 * coords[:, 2]], axis=1)
+    stress = np.zeros((len(coords), 9))
+    stress[:, 0] = 100.0 * coords[:, 0]
+    stress[:, 4] = 50.0 * coords[:, 1]
+    stress[:, 8] = 10.0 * coords[:, 2]
+    stress[:, 1] = stress[:, 3] = 5.0
+    return {'scalar': Field(mesh.node_ids, coords[:, 0] * 20.0 + 293.0),
+            'vector': Field(mesh.node_ids, disp),
+            'tensor': Field(mesh.node_ids, stress)}
+
+
+def write_synthetic_pos(pos_file, mesh, field):
+    # one block of gmsh 1.4-style binary post-processing data,
+    # laid out as read_pos_file expects it
+    elem_type, block = list(mesh.elem_blocks.items())[0]
+    block_type = '{0}_{1}'.format(field.kind.upper(), gmsh_elem_names[elem_type])
+    counts = [0] * 28
+    counts[keys_names.index(block_type)] = len(block)
+    rows = mesh.node_index.rows(block.conn.ravel()).reshape(block.conn.shape)
+    xyz = mesh.coords[rows]
+    values = field.values[rows].reshape(len(block), -1)
+    data = np.concatenate([xyz[:, :, 0], xyz[:, :, 1], xyz[:, :, 2], values], axis=1)
+    with open(pos_file, 'wb') as f0:
+        f0.write(b'$PostFormat\n1.4 1 8\n$EndPostFormat\n$View\n')
+        f0.write('synthetic 1 {0}\n'.format(' '.join([str(c) for c in counts])).encode('ascii'))
+        f0.write(struct.pack('<i', 1) + struct.pack('<d', 0.0))
+        f0.write(np.ascontiguousarray(data, dtype='<f8').tobytes())
+        f0.write(b'\n$EndView\n')
+
+
+def write_synthetic_rpt(rpt_file, field, n_cases=2):
+    with open(rpt_file, 'w') as f0:
+        for case in range(n_cases):
+            f0.write('Load Case: Time step : {0}{{s}}\n'.format(float(case + 1)))
+            f0.write('Entity ID  Values\n')
+            for entity, vals in zip(field.ids.tolist(), field.values.tolist()):
+                f0.write('{0} {1}\n'.format(entity, ' '.join(['{0:.6e}'.format((case + 1) * v) for v in vals])))
+
+
+def write_synthetic_sif(sif_file, n_points, n_fronts=4):
+    labels = ['front', 'x', 'y', 'z', 'K1', 'K2', 'K3', 'J', 'DKeq']
+    with open(sif_file, 'w') as f0:
+        f0.write('#' + ' '.join(labels) + '\n')
+        per_front = max(2, n_points // n_fronts)
+        for front in range(n_fronts):
+            t = np.linspace(0.0, 1.0, per_front)
+            for x in t:
+                f0.write('{0} {1:.6e} {2:.6e} {3:.6e} {4:.6e} {5:.6e} {6:.6e} {7:.6e} {8:.6e}\n'.format(
+                    front, x, 0.1 * front, 0.01 * x * x, 10.0 + x, 1.0, 0.5, 1e-3, 12.0))
+
+
+def write_synthetic_log(log_file, n_steps):
+    with open(log_file, 'w') as f0:
+        for step in range(1, n_steps + 1):
+            f0.write('Start STEP {0}\n'.format(step))
+            f0.write('Front length = {0}\n width: 1.0\nradius: 2.0\n size_width: 0.1\nsize_radius: 0.2\n'.format(step))
+            f0.write('MAXIMUM CRACK GROWTH INCREMENT= 0.05\nNumber of elements after refinement: 1000\n')
+            f0.write('Step Time: 12.5\nnorm: 1e-3\nmode I: 1e-3\nmode II: 1e-4\nmode III: 1e-5\n')
+            f0.write('End of step {0}\n'.format(step))
+
+
+def measure(func, args=(), kwargs=None, memory=True):
+    kwargs = kwargs or {}
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        del result
+        tracemalloc.start()
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def make_record(operation, family, n_elems, path, elapsed, peak):
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return {'operation': operation,
+            'family': family,
+            'n_elems': int(n_elems),
+            'bytes': size,
+            'seconds': elapsed,
+            'peak_memory': peak,
+            'mb_per_s': size / 1e6 / elapsed if elapsed else None,
+            'elems_per_s': n_elems / elapsed if elapsed else None}
+
+
+def quiet(func):
+    # readers report progress with print, which is not what is measured here
+    def wrapper(*args, **kwargs):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return wrapper
+
+
+def run_case(work_dir, n_elems, family, memory=True):
+    records = []
+    mesh = make_synthetic_mesh(n_elems, family)
+    fields = make_synthetic_fields(mesh)
+    n = mesh.n_elems
+    base = os.path.join(work_dir, '{0}_{1}'.format(family, n))
+    paths = {ext: base + '.' + ext for ext in ('dat', 'inp', 'out', 'femb')}
+
+    writers = [('write_dat', write_dat, paths['dat']),
+               ('write_inp', write_inp, paths['inp']),
+               ('write_out', write_out, paths['out'])]
+    for name, writer, path in writers:
+        elapsed, peak, _ = measure(writer, (path, mesh), memory=memory)
+        records.append(make_record(name, family, n, path, elapsed, peak))
+    elapsed, peak, _ = measure(write_femb, (paths['femb'], mesh, fields), memory=memory)
+    records.append(make_record('write_femb', family, n, paths['femb'], elapsed, peak))
+
+    for field_type, field in fields.items():
+        res_path = '{0}_{1}.res'.format(base, field_type)
+        elapsed, peak, _ = measure(write_res, (res_path, 'n', 'bench', field_type, field.ids.tolist(), field),
+                                   memory=memory)
+        records.append(make_record('write_res_' + field_type, family, n, res_path, elapsed, peak))
+    write_ses(base + '.ses', base + '_vector.res', 'N', 'vector.res_tmpl')
+    write_template(base + '.res_tmpl', tmpl_type='vector', column='1,2,3', pri='USER_RES', sec='vector')
+
+    readers = [('read_dat', quiet(read_dat), paths['dat']),
+               ('read_inp', quiet(read_inp), paths['inp']),
+               ('read_out', quiet(read_out), paths['out']),
+               ('read_femb', read_femb, paths['femb'])]
+    for name, reader, path in readers:
+        elapsed, peak, _ = measure(reader, (path,), memory=memory)
+        records.append(make_record(name, family, n, path, elapsed, peak))
+
+    convert_path = base + '_converted.inp'
+    elapsed, peak, _ = measure(quiet(convert_mesh_file), (paths['dat'], convert_path), memory=memory)
+    records.append(make_record('convert_dat_to_inp', family, n, paths['dat'], elapsed, peak))
+
+    for field_type in ('scalar', 'vector', 'tensor'):
+        pos_path = '{0}_{1}.pos'.format(base, field_type)
+        write_synthetic_pos(pos_path, mesh, fields[field_type])
+        elapsed, peak, _ = measure(quiet(read_pos_file), (pos_path,), {'read_fields': True}, memory=memory)
+        records.append(make_record('read_pos_file_' + field_type, family, n, pos_path, elapsed, peak))
+
+    rpt_path = base + '.rpt'
+    write_synthetic_rpt(rpt_path, fields['vector'])
+    elapsed, peak, _ = measure(read_rpt, (rpt_path, 'vector'), memory=memory)
+    records.append(make_record('read_rpt', family, n, rpt_path, elapsed, peak))
+
+    sif_path = base + '_sifs-1.txt'
+    write_synthetic_sif(sif_path, n)
+    elapsed, peak, _ = measure(quiet(read_sif_file), (sif_path,), memory=memory)
+    records.append(make_record('read_sif_file', family, n, sif_path, elapsed, peak))
+
+    log_path = base + '.log'
+    report_path = base + '_report.csv'
+    write_synthetic_log(log_path, max(2, n // 1000))
+    elapsed, peak, _ = measure(write_log_report, (report_path, log_path), memory=memory)
+    records.append(make_record('write_log_report', family, n, log_path, elapsed, peak))
+    return records
+
+
+def measure_import_time(module_name, repeat=5):
+    # best of repeat fresh interpreters, only the import itself is timed
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ('import time; t = time.perf_counter(); import {0}; '
+            'print(time.perf_counter() - t)').format(module_name)
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root_dir)
+        times.append(float(output.decode().split()[-1]))
+    return min(times)
+
+
+def run_import_benchmarks(budget=default_import_budget, repeat=5):
+    package = __package__
+    records = []
+    for module_name in import_modules:
+        full_name = '{0}.{1}'.format(package, module_name) if module_name else package
+        seconds = measure_import_time(full_name, repeat)
+        records.append({'module': full_name,
+                        'seconds': seconds,
+                        'budget': budget if not module_name else None})
+    return records
+
+
+def check_import_budget(import_records):
+    return [r for r in import_records if r['budget'] is not None and r['seconds'] > r['budget']]
+
+
+def run_benchmarks(sizes=None, families=None, work_dir=None, memory=True, keep_files=False,
+                   imports=True, import_budget=default_import_budget):
+    sizes = default_sizes if sizes is None else sizes
+    families = families or default_families
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='fem_bench_')
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+    records = []
+    import_records = run_import_benchmarks(import_budget) if imports else []
+    try:
+        for n_elems in sizes:
+            for family in families:
+                print('Benchmark {0} {1:.0e} elements . . .'.format(family, n_elems))
+                records.extend(run_case(work_dir, n_elems, family, memory))
+    finally:
+        if own_dir and not keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {'meta': {'date': datetime.now().isoformat(),
+                     'python': sys.version.split()[0],
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'machine': platform.node()},
+            'imports': import_records,
+            'results': records}
+
+
+def record_key(record):
+    return (record['operation'], record['family'], record['n_elems'])
+
+
+def compare_results(results, baseline, tolerance=default_tolerance):
+    old_records = {record_key(r): r for r in baseline['results']}
+    regressions = []
+    old_imports = {r['module']: r for r in baseline.get('imports', [])}
+    for record in results.get('imports', []):
+        old = old_imports.get(record['module'])
+        if old and record['seconds'] > old['seconds'] * (1.0 + tolerance):
+            regressions.append((('import', record['module']), 'seconds', old['seconds'], record['seconds']))
+    for record in results['results']:
+        old = old_records.get(record_key(record))
+        if not old:
+            continue
+        if record['seconds'] > old['seconds'] * (1.0 + tolerance):
+            regressions.append((record_key(record), 'seconds', old['seconds'], record['seconds']))
+        if old['peak_memory'] and record['peak_memory'] and \
+                record['peak_memory'] > old['peak_memory'] * (1.0 + tolerance):
+            regressions.append((record_key(record), 'peak_memory', old['peak_memory'], record['peak_memory']))
+    return regressions
+
+
+def format_results(results):
+    lines = ['{0:<24}{1:<7}{2:>10}{3:>10}{4:>10}{5:>14}{6:>12}'.format(
+        'operation', 'family', 'elems', 'seconds', 'MB/s', 'elems/s', 'peak MB')]
+    for r in results['results']:
+        peak = r['peak_memory'] / 1e6 if r['peak_memory'] is not None else float('nan')
+        lines.append('{0:<24}{1:<7}{2:>10d}{3:>10.3f}{4:>10.2f}{5:>14.0f}{6:>12.1f}'.format(
+            r['operation'], r['family'], r['n_elems'], r['seconds'], r['mb_per_s'] or 0.0, r['elems_per_s'] or 0.0, peak))
+    if results.get('imports'):
+        lines.append('')
+        lines.append('{0:<40}{1:>10}{2:>10}'.format('import', 'ms', 'budget'))
+        for r in results['imports']:
+            budget = '{0:.1f}'.format(1e3 * r['budget']) if r['budget'] is not None else ''
+            lines.append('{0:<40}{1:>10.1f}{2:>10}'.format(r['module'], 1e3 * r['seconds'], budget))
+    return '\n'.join(lines)
+
+
+def save_results(results, path):
+    with open(path, 'w') as f0:
+        json.dump(results, f0, indent=1)
+
+
+def load_results(path):
+    with open(path, 'r') as f0:
+        return json.load(f0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of mesh and field readers/writers')
+    parser.add_argument('--sizes', nargs='+', type=float, default=default_sizes)
+    parser.add_argument('--families', nargs='+', default=default_families, choices=default_families)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--save', default=None, help='json file to save results')
+    parser.add_argument('--baseline', default=None, help='json file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=default_tolerance)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc runs')
+    parser.add_argument('--keep-files', action='store_true')
+    parser.add_argument('--import-budget', type=float, default=default_import_budget,
+                        help='seconds allowed for the package import')
+    parser.add_argument('--no-imports', action='store_true', help='skip import time measurement')
+    parser.add_argument('--imports-only', action='store_true', help='only measure import time')
+    args = parser.parse_args(argv)
+
+    sizes = [] if args.imports_only else args.sizes
+    results = run_benchmarks(sizes, args.families, args.work_dir, not args.no_memory, args.keep_files,
+                             not args.no_imports, args.import_budget)
+    print(format_results(results))
+    if args.save:
+        save_results(results, args.save)
+    failed = False
+    for record in check_import_budget(results['imports']):
+        print('IMPORT BUDGET {0}: {1:.1f} ms > {2:.1f} ms'.format(record['module'], 1e3 * record['seconds'],
+                                                                 1e3 * record['budget']))
+        failed = True
+    if args.baseline:
+        regressions = compare_results(results, load_results(args.baseline), args.tolerance)
+        for key, metric, old, new in regressions:
+            print('REGRESSION {0} {1}: {2:.4g} -> {3:.4g}'.format(key, metric, old, new))
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
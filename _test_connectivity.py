@@ -0,0 +1,106 @@
+import os
+import sys
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from . import connectivity
+from .connectivity import corner_sides
+from .mesh import Mesh, ElemBlock
+from .fields import Field
+from ._benchmark_suite import make_synthetic_mesh
+
+
+def elem_nodes(mesh):
+    # {elem_id: node ids} of all the blocks
+    return {elem_id: conn for block in mesh.elem_blocks.values()
+            for elem_id, conn in zip(block.ids.tolist(), block.conn.tolist())}
+
+
+def brute_force_neighbours(mesh, elem_id, kind):
+    nodes = elem_nodes(mesh)
+    if kind == 'node':
+        return sorted([other for other, conn in nodes.items() if other != elem_id and set(conn) & set(nodes[elem_id])])
+    sides = {}
+    for elem_type, block in mesh.elem_blocks.items():
+        for other, conn in zip(block.ids.tolist(), block.conn.tolist()):
+            for corners in corner_sides[elem_type]:
+                sides.setdefault(tuple(sorted([conn[i] for i in corners])), set()).add(other)
+    return sorted(set().union(*[elems for elems in sides.values() if elem_id in elems]) - {elem_id})
+
+
+def test_node_elems():
+    mesh = make_synthetic_mesh(1000, 'hex')
+    conn = mesh.connectivity()
+    assert mesh.connectivity() is conn
+    nodes = elem_nodes(mesh)
+    some_nodes = mesh.node_ids[::7][:50].tolist()
+    assert conn.elems_of_nodes(some_nodes).tolist() == \
+        sorted([elem_id for elem_id, elem_conn in nodes.items() if set(elem_conn) & set(some_nodes)])
+    node_set = set(mesh.node_ids[:300].tolist())
+    assert conn.elems_in_nodes(list(node_set)[::-1]).tolist() == \
+        sorted([elem_id for elem_id, elem_conn in nodes.items() if set(elem_conn) <= node_set])
+    assert not len(conn.elems_in_nodes([-1]))
+    elem_ids = sorted(nodes)[:20]
+    assert conn.nodes_of_elems(elem_ids[::-1]).tolist() == sorted(set([node_id for elem_id in elem_ids
+                                                                       for node_id in nodes[elem_id]]))
+    assert conn.elem_rows([elem_ids[3], -5]).tolist() == [3, -1]
+    degrees = dict(zip(mesh.node_ids.tolist(), conn.node_degrees().tolist()))
+    assert degrees == {node_id: sum([node_id in elem_conn for elem_conn in nodes.values()])
+                       for node_id in mesh.node_ids.tolist()}
+    # element values averaged at the nodes
+    average = conn.nodal_average(Field(sorted(nodes), np.c_[np.arange(len(nodes)), np.ones(len(nodes))]))
+    values = dict(zip(sorted(nodes), range(len(nodes))))
+    for node_id, value in zip(average.ids.tolist()[::37], average.values[::37].tolist()):
+        node_elems = [elem_id for elem_id, elem_conn in nodes.items() if node_id in elem_conn]
+        assert np.allclose(value, [np.mean([values[elem_id] for elem_id in node_elems]), 1.0])
+
+
+def test_neighbours():
+    chunk_size = connectivity.pairs_chunk_size
+    # node pairs built by small chunks of elements
+    connectivity.pairs_chunk_size = 1000
+    try:
+        for family in ('hex', 'tet', 'wedge'):
+            mesh = make_synthetic_mesh(300, family)
+            conn = mesh.connectivity()
+            for elem_id in elem_nodes(mesh).keys():
+                if elem_id % 23:
+                    continue
+                for kind in ('node', 'face'):
+                    assert conn.neighbours([elem_id], kind).tolist() == brute_force_neighbours(mesh, elem_id, kind), \
+                        (family, elem_id, kind)
+            ptr, rows = conn.adjacency('node')
+            for row in range(0, conn.n_elems, 29):
+                assert sorted(conn.elem_ids[rows[ptr[row]:ptr[row + 1]]].tolist()) == \
+                    brute_force_neighbours(mesh, int(conn.elem_ids[row]), 'node')
+    finally:
+        connectivity.pairs_chunk_size = chunk_size
+    shells = Mesh([1, 2, 3, 4, 5], np.zeros((5, 3)), {'tria': ElemBlock([1, 2, 3], [[1, 2, 3], [2, 4, 3], [4, 5, 3]])})
+    assert shells.connectivity().neighbours([2], 'face').tolist() == [1, 3]
+    assert shells.connectivity().neighbours([1], 'face').tolist() == [2]
+    try:
+        shells.connectivity().adjacency('edge')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('unknown adjacency without ValueError')
+
+
+def test_rebuilt():
+    mesh = make_synthetic_mesh(300, 'hex')
+    conn = mesh.connectivity()
+    block = mesh.elem_blocks['hex']
+    mesh.elem_blocks['hex'] = ElemBlock(block.ids[:10], block.conn[:10])
+    assert mesh.connectivity() is not conn and mesh.connectivity().n_elems == 10
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_node_elems()
+    test_neighbours()
+    test_rebuilt()
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import tempfile
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .femb_binary_parser import (write_femb, read_femb, read_femb_toc, read_femb_field_names, femb_header,
+                                 femb_magic, femb_version, femb_alignment)
+from .mesh import Mesh, ElemBlock
+from .fields import Field
+
+
+def sample_mesh_dict():
+    # sparse, unsorted ids, two element types, node and element groups
+    nodes = {node_id: [0.5 * i, 1.0 + i, -2.0 * i] for i, node_id in enumerate([7, 1, 2, 3, 4, 5, 6, 8, 9, 100000])}
+    elems = {'hex': {20: [1, 2, 3, 4, 5, 6, 7, 8]},
+             'tet': {12: [1, 2, 3, 100000], 3: [2, 3, 4, 9]}}
+    groups = {'BOTTOM': {'node': [1, 2, 4]},
+              'SOLID': {'hex': [20], 'tet': [3, 12]}}
+    return {'nodes': nodes, 'elems': elems, 'groups': groups}
+
+
+def grid_mesh(n):
+    # n x n x n hex grid, with a node group and an element group
+    ijk = np.stack(np.meshgrid(*[np.arange(n + 1)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+    node_ids = np.arange(1, len(ijk) + 1)
+    nid = lambda i, j, k: 1 + k + (n + 1) * (j + (n + 1) * i)
+    i, j, k = [a.ravel() for a in np.meshgrid(*[np.arange(n)] * 3, indexing='ij')]
+    conn = np.stack([nid(i, j, k), nid(i + 1, j, k), nid(i + 1, j + 1, k), nid(i, j + 1, k),
+                     nid(i, j, k + 1), nid(i + 1, j, k + 1), nid(i + 1, j + 1, k + 1), nid(i, j + 1, k + 1)], axis=1)
+    elem_ids = np.arange(1, len(conn) + 1)
+    groups = {'N_BASE': {'node': node_ids[ijk[:, 2] == 0]}, 'HALF': {'hex': elem_ids[i < n // 2]}}
+    return Mesh(node_ids, ijk * 0.1, {'hex': ElemBlock(elem_ids, conn)}, groups)
+
+
+def grid_fields(mesh):
+    coords = mesh.coords
+    return {'TEMP': Field(mesh.node_ids, coords[:, 0] * 20.0 + 293.0),
+            'DISP': Field(mesh.node_ids, 1e-3 * coords),
+            'STRESS': Field(mesh.node_ids, np.repeat(coords, 3, axis=1), 'tensor')}
+
+
+def sample_field_dict():
+    return {'TEMP': {9: 300.0, 1: 293.0, 100000: 310.5},
+            'DISP': Field([1, 2, 3], [[0.0, 0.1, 0.2], [1.0, 1.1, 1.2], [2.0, 2.1, 2.2]])}
+
+
+def test_round_trip():
+    mesh_dict, field_dict = sample_mesh_dict(), sample_field_dict()
+    with tempfile.TemporaryDirectory() as work_dir:
+        femb_file = os.path.join(work_dir, 'sample.femb')
+        write_femb(femb_file, mesh_dict, field_dict)
+        assert read_femb_field_names(femb_file) == ['TEMP', 'DISP']
+        for mmap in (True, False):
+            mesh, fields = read_femb(femb_file, read_fields=True, mmap=mmap)
+            assert mesh.to_dict() == mesh_dict
+            assert fields['TEMP'].ids.tolist() == [1, 9, 100000]
+            assert fields['TEMP'].values[:, 0].tolist() == [293.0, 300.0, 310.5]
+            assert fields['DISP'].kind == 'vector'
+            assert np.array_equal(fields['DISP'].values, field_dict['DISP'].values)
+            del mesh, fields
+        mesh = read_femb(femb_file, read_nodes=False, read_groups=False)
+        assert mesh.n_nodes == 0 and not mesh.group_arrays
+        assert mesh['elems']['tet'][12] == [1, 2, 3, 100000]
+        del mesh
+        # group ids are written sorted and unique
+        mesh_dict['groups']['SOLID'] = {'hex': [20], 'tet': [12, 3, 12]}
+        write_femb(femb_file, mesh_dict)
+        mesh = read_femb(femb_file)
+        assert mesh.group_arrays['SOLID']['tet'].tolist() == [3, 12]
+        del mesh
+
+
+def layout_bytes(femb_file):
+    # bytes of the .femb layout of the module docstring, rebuilt from the
+    # table of contents and the arrays of femb_file
+    toc = read_femb_toc(femb_file)
+    with open(femb_file, 'rb') as f0:
+        toc_size = femb_header.unpack(f0.read(femb_header.size))[2]
+        data = f0.read()
+    entries = [toc['nodes'][key] for key in ('ids', 'coords') if toc['nodes']]
+    entries += [entry for _, block in toc['elems'] for entry in (block['ids'], block['conn'])]
+    entries += [entry for _, group in toc['groups'] for entry in group.values()]
+    entries += [entry for _, field in toc['fields'] for entry in (field['ids'], field['values'])]
+    chunks = [femb_header.pack(femb_magic, femb_version, toc_size), json.dumps(toc).encode('utf8').ljust(toc_size)]
+    offset = femb_header.size + toc_size
+    for entry in entries:
+        assert entry['offset'] % femb_alignment == 0 and entry['offset'] >= offset
+        nbytes = int(np.prod(entry['shape'], dtype=np.int64)) * np.dtype(entry['dtype']).itemsize
+        start = entry['offset'] - femb_header.size
+        chunks += [b'\0' * (entry['offset'] - offset), data[start:start + nbytes]]
+        offset = entry['offset'] + nbytes
+    return b''.join(chunks)
+
+
+def test_layout():
+    # write_femb writes exactly the documented layout, nothing after the last array
+    mesh = grid_mesh(6)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for femb_name, mesh_dict, field_dict in (('sample.femb', sample_mesh_dict(), sample_field_dict()),
+                                                 ('grid.femb', mesh, grid_fields(mesh)),
+                                                 ('mesh.femb', mesh, None)):
+            femb_file = os.path.join(work_dir, femb_name)
+            write_femb(femb_file, mesh_dict, field_dict)
+            with open(femb_file, 'rb') as f0:
+                assert f0.read() == layout_bytes(femb_file), femb_name
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_round_trip()
+    test_layout()
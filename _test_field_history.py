@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from . import field_history
+from .field_history import FieldHistory, FieldHistoryWriter, build_field_history, find_step_files
+from .fields import Field, von_mises
+from ._benchmark_suite import make_synthetic_mesh, write_synthetic_pos
+
+
+def test_history():
+    mesh = make_synthetic_mesh(300, 'hex')
+    rng = np.random.default_rng(0)
+    steps = [1, 2, 3, 10]
+    values = np.stack([rng.normal(size=(mesh.n_nodes, 9)) for _ in steps])
+    with tempfile.TemporaryDirectory() as work_dir:
+        for step, step_values in zip(steps, values):
+            os.makedirs(os.path.join(work_dir, 'step{0:03d}'.format(step)))
+            write_synthetic_pos(os.path.join(work_dir, 'step{0:03d}'.format(step), 'STRESS.pos'), mesh,
+                                Field(mesh.node_ids, step_values, 'tensor'))
+        os.makedirs(os.path.join(work_dir, 'other'))
+        # pos values are given at the nodes of each element
+        values = values[:, mesh.node_index.rows(mesh.elem_blocks['hex'].conn.ravel())]
+        step_files = find_step_files(work_dir, 'STRESS.pos')
+        assert [step for step, _ in step_files] == steps
+        history = build_field_history(os.path.join(work_dir, 'stress.femh'), step_files, dtype='float64')
+        assert len(history) == 4 and history.kind == 'tensor' and history.ncomp == 9
+        assert history.ids.tolist() == list(range(1, values.shape[1] + 1))
+        mises = von_mises(values)
+        assert np.allclose(history.max('von_mises').values[:, 0], mises.max(0))
+        assert np.allclose(history.min('von_mises').values[:, 0], mises.min(0))
+        assert np.allclose(history.range(0).values[:, 0], np.ptp(values[:, :, 0], axis=0))
+        assert list(history.argmax_step('von_mises').values()) == [steps[row] for row in mises.argmax(0)]
+        assert np.allclose(history.max('magnitude', steps=[2, 10]).values[:, 0],
+                           np.sqrt((values[[1, 3]] ** 2).sum(2)).max(0))
+        assert np.allclose(history.field(10).values, values[3])
+        assert np.allclose(history.entity_history([6, 1]), values[:, [5, 0]])
+        del history
+
+
+def test_missing_entities():
+    # entities missing in a step are NaN and skipped, steps streamed one by one
+    block_size = field_history.default_block_size
+    field_history.default_block_size = 16
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            history_file = os.path.join(work_dir, 'history.femh')
+            with FieldHistoryWriter(history_file, 'TEMP', ids=[4, 1, 2, 3]) as writer:
+                writer.add(5, Field([1, 2, 3, 4], [1.0, 2.0, 3.0, 4.0]))
+                writer.add(7, Field([2, 3, 9], [5.0, -1.0, 7.0]))
+            history = FieldHistory(history_file)
+            assert history.name == 'TEMP' and history.steps == [5, 7]
+            assert np.isnan(history.values[1, [0, 3], 0]).all()
+            assert history.max().values[:, 0].tolist() == [1.0, 5.0, 3.0, 4.0]
+            assert history.argmin_step() == {1: 5, 2: 5, 3: 7, 4: 5}
+            del history
+            with FieldHistoryWriter(history_file):
+                pass
+            history = FieldHistory(history_file)
+            assert len(history) == 0 and len(history.ids) == 0
+            del history
+    finally:
+        field_history.default_block_size = block_size
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_history()
+    test_missing_entities()
@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .field_mapping import PosFieldMapper, map_pos_files
+from .fields import Field
+from .mesh import Mesh, ElemBlock
+from ._benchmark_suite import make_synthetic_mesh, make_synthetic_fields, write_synthetic_pos
+
+
+def renumbered_mesh(mesh, seed=0):
+    # same geometry with shuffled sparse node ids, to map the pos files back on
+    rng = np.random.default_rng(seed)
+    new_ids = (rng.permutation(mesh.n_nodes) + 1) * 7
+    block = mesh.elem_blocks['hex']
+    conn = new_ids[mesh.node_index.rows(block.conn.ravel())].reshape(block.conn.shape)
+    order = np.argsort(new_ids)
+    return Mesh(new_ids[order], mesh.coords[order], {'hex': ElemBlock(block.ids, conn)}), order
+
+
+def test_map_pos_files():
+    mesh = make_synthetic_mesh(1000, 'hex')
+    vector = make_synthetic_fields(mesh)['vector']
+    solver_mesh, order = renumbered_mesh(mesh)
+    with tempfile.TemporaryDirectory() as work_dir:
+        pos_files = []
+        for step in range(3):
+            pos_files.append(os.path.join(work_dir, 'step{0}.pos'.format(step)))
+            write_synthetic_pos(pos_files[-1], mesh, Field(vector.ids, vector.values * (step + 1), 'vector'))
+        mapper = PosFieldMapper(solver_mesh)
+        for step, pos_file in enumerate(pos_files):
+            fields = mapper.map_pos_file(pos_file)
+            assert list(fields) == ['vector']
+            assert fields['vector'].ids.tolist() == solver_mesh.node_ids.tolist()
+            assert np.allclose(fields['vector'].values, vector.values[order] * (step + 1))
+        # the steps share the geometry of the first one
+        assert len(mapper.node_maps) == 1
+        mapped = list(map_pos_files(solver_mesh.to_dict(), pos_files[:2], field_types=['vector']))
+        assert [pos_file for pos_file, _ in mapped] == pos_files[:2]
+        assert np.allclose(mapped[1][1]['vector'].values, vector.values[order] * 2)
+        assert not PosFieldMapper(solver_mesh).map_pos_file(pos_files[0], field_types=['scalar'])
+
+
+def test_tolerance():
+    mesh = make_synthetic_mesh(300, 'hex')
+    vector = make_synthetic_fields(mesh)['vector']
+    shifted = Mesh(mesh.node_ids, mesh.coords + 1e-3, mesh.elem_blocks)
+    with tempfile.TemporaryDirectory() as work_dir:
+        pos_file = os.path.join(work_dir, 'step.pos')
+        write_synthetic_pos(pos_file, mesh, vector)
+        mapper = PosFieldMapper(shifted)
+        assert not len(mapper.map_pos_file(pos_file)['vector'])
+        assert list(mapper.node_maps.values())[0].n_unmatched == 8 * len(mesh.elem_blocks['hex'])
+        fields = PosFieldMapper(shifted, tolerance=1e-2).map_pos_file(pos_file)
+        assert np.allclose(fields['vector'].values, vector.values)
+        # only some mesh nodes are mapped on
+        node_ids = mesh.node_ids[::3]
+        fields = PosFieldMapper(mesh, node_ids=node_ids).map_pos_file(pos_file)
+        assert fields['vector'].ids.tolist() == node_ids.tolist()
+        assert np.allclose(fields['vector'].values, vector.values[::3])
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_map_pos_files()
+    test_tolerance()
@@ -1,52 +1,16 @@
 import os
+import sys
 import glob
+import tempfile
 
-from gmsh_pos_parser import number_of_values_dict, read_pos_file
-from patran_neutral_parser import write_out, patran_elem_types
-from patran_results_parser import write_template, write_ses, write_res
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
 
-
-def convert_pos_data_to_patran(pos_name, mesh_dict, field_dict, work_dir=''):
-    if not work_dir:
-        work_dir = os.getcwd()
-    dir_for_files = os.path.join(work_dir, 'pos_to_patran')
-    if not os.path.exists(dir_for_files):
-        os.mkdir(dir_for_files)
-    #
-    out_name_abs = os.path.join(dir_for_files, '{0}_mesh.out'.format(pos_name))
-    print('Création du {0}_mesh.out à partir des données du fichier .pos . . .'.format(pos_name))
-    try:
-        write_out(out_name_abs, mesh_dict, write_nodes=True, write_elems=True, write_groups=False)
-    except KeyError:
-        print('Certains types d’éléments ne sont pas pris en charge et ne seront pas enregistrés dans {0}_mesh.out'.format(
-            pos_name))
-        elems_filtered = {}
-        for elem_type, elems_dict in mesh_dict['elems'].items():
-            if elem_type in patran_elem_types:
-                elems_filtered[elem_type] = elems_dict
-        mesh_dict_filtered = {'nodes': mesh_dict['nodes'],
-                              'elems': elems_filtered,
-                              'groups': mesh_dict['groups']}
-        write_out(out_name_abs, mesh_dict_filtered, write_nodes=True,
-                  write_elems=True, write_groups=False)
-    #
-    for field_type, field in field_dict.items():
-        print('Écrire des fichiers de résultats pour patran. Maillage de référence: {0}_mesh.out'.format(pos_name))
-        entities = sorted(list(field.keys()))
-        sc_name = '{0}_{1}'.format(pos_name, field_type)
-        ses_name = 'load_{0}_{1}.ses'.format(pos_name, field_type)
-        tmpl_name = '{0}.res_tmpl'.format(field_type)
-        n_comps = number_of_values_dict[field_type.upper()]
-        column_str = ','.join([str(i) for i in range(1, n_comps+1)])
-        #
-        sc_name_abs = os.path.join(dir_for_files, sc_name)
-        ses_name_abs = os.path.join(dir_for_files, ses_name)
-        tmpl_name_abs = os.path.join(dir_for_files, tmpl_name)
-        #
-        write_res(sc_name_abs, 'n', pos_name, field_type, entities, field)
-        write_ses(ses_name_abs, sc_name, 'N', tmpl_name, mode='w')
-        write_template(tmpl_name_abs, tmpl_type=field_type,
-                       column=column_str, pri='USER_RES', sec=field_type)
+from .gmsh_pos_parser import read_pos_file
+from .gmsh_to_patran_converter import convert_pos_data_to_patran, convert_pos_files_to_patran
+from ._benchmark_suite import make_synthetic_mesh, make_synthetic_fields, write_synthetic_pos
 
 
 def test_all_files():
@@ -65,6 +29,42 @@ def test_read_tensor():
         convert_pos_data_to_patran(pos_name, mesh_dict, field_dict)
 
 
+def synthetic_pos_files(work_dir):
+    # one pos file for each field kind, on a small tet mesh
+    mesh = make_synthetic_mesh(300, 'tet')
+    pos_files = []
+    for field_type, field in make_synthetic_fields(mesh).items():
+        pos_file = os.path.join(work_dir, 'SYNTHETIC_{0}.pos'.format(field_type.upper()))
+        write_synthetic_pos(pos_file, mesh, field)
+        pos_files.append(pos_file)
+    return pos_files
+
+
+def patran_lines(path):
+    # lines of a converted file, without the file path and the date of the .out header
+    with open(path, 'r') as f0:
+        lines = f0.readlines()
+    return lines[:1] + lines[2:3] + lines[4:] if path.endswith('.out') else lines
+
+
+def test_streamed_files():
+    # the streamed export writes the same files as the in-memory one
+    with tempfile.TemporaryDirectory() as work_dir:
+        pos_files = glob.glob('tests_data/step0/*.pos') + synthetic_pos_files(work_dir)
+        memory_dir, streamed_dir = os.path.join(work_dir, 'memory'), os.path.join(work_dir, 'streamed')
+        for pos_file in pos_files:
+            pos_name = os.path.splitext(os.path.basename(pos_file))[0]
+            mesh_dict, field_dict = read_pos_file(pos_file, read_fields=True)
+            convert_pos_data_to_patran(pos_name, mesh_dict, field_dict, work_dir=memory_dir)
+        convert_pos_files_to_patran(pos_files, work_dirs=streamed_dir, workers=2)
+        memory_files = sorted(os.listdir(os.path.join(memory_dir, 'pos_to_patran')))
+        assert memory_files == sorted(os.listdir(os.path.join(streamed_dir, 'pos_to_patran')))
+        for file_name in memory_files:
+            assert patran_lines(os.path.join(memory_dir, 'pos_to_patran', file_name)) == \
+                patran_lines(os.path.join(streamed_dir, 'pos_to_patran', file_name)), file_name
+
+
 if __name__ == '__main__':
     print('Start tests...')
     test_all_files()
+    test_streamed_files()
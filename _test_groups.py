@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .groups import IdSet, Group, as_groups, groups_to_dict, sorted_unique, sorted_contains
+from .mesh import ElemTypeIndex
+from .samcef_dat_parser import write_dat, read_dat
+from .abaqus_inp_parser import write_inp
+from .patran_neutral_parser import write_out
+
+
+def test_id_sets():
+    rng = np.random.default_rng(0)
+    arrays = [rng.integers(0, 2000, 500) for _ in range(4)]
+    sets = [set(ids.tolist()) for ids in arrays]
+    id_sets = [IdSet(ids) for ids in arrays]
+    assert [id_set.tolist() for id_set in id_sets] == [sorted(ids) for ids in sets]
+    assert IdSet.union_all(id_sets).tolist() == sorted(set().union(*sets))
+    assert id_sets[0].union(*id_sets[1:]) == IdSet.union_all(id_sets)
+    assert (id_sets[0] | id_sets[1]).tolist() == sorted(sets[0] | sets[1])
+    assert (id_sets[0] & id_sets[1]).tolist() == sorted(sets[0] & sets[1])
+    assert id_sets[0].intersection(id_sets[1], id_sets[2]).tolist() == sorted(sets[0] & sets[1] & sets[2])
+    assert (id_sets[0] - id_sets[1]).tolist() == sorted(sets[0] - sets[1])
+    assert (id_sets[0] ^ id_sets[1]).tolist() == sorted(sets[0] ^ sets[1])
+    assert (id_sets[0] & id_sets[1]) <= id_sets[0] and id_sets[0] >= (id_sets[0] - id_sets[1])
+    assert not id_sets[0] <= id_sets[1]
+    queries = np.arange(-5, 2100)
+    assert id_sets[0].contains(queries).tolist() == [i in sets[0] for i in queries.tolist()]
+    assert int(arrays[0][3]) in id_sets[0] and -1 not in id_sets[0]
+    assert sorted_unique(arrays[0]).tolist() == sorted(sets[0])
+    assert sorted_contains(np.zeros(0, dtype=np.int64), [1, 2]).tolist() == [False, False]
+    assert IdSet([3, 1, 3]) == IdSet([1, 3]) and IdSet([1]) != IdSet([2])
+
+
+def test_groups():
+    g1 = Group({'node': [3, 1, 2], 'hex': [11, 10]})
+    g2 = Group.from_dict({'hex': [11, 12], 'tet': [5]})
+    assert Group.from_dict(g1) is g1
+    assert (g1 | g2).to_dict() == {'node': [1, 2, 3], 'hex': [10, 11, 12], 'tet': [5]}
+    assert (g1 & g2).to_dict() == {'hex': [11]}
+    assert (g1 - g2).to_dict() == {'node': [1, 2, 3], 'hex': [10]}
+    assert (g1 ^ g2).to_dict() == {'node': [1, 2, 3], 'hex': [10, 12], 'tet': [5]}
+    assert g1.elems().tolist() == [10, 11] and g2.elems().tolist() == [5, 11, 12]
+    assert g1.nodes().tolist() == [1, 2, 3] and not len(g2.nodes())
+    assert g1.n_entities == 5 and g1.contains('hex', [10, 12]).tolist() == [True, False]
+    assert not g1.contains('tet', [5]).any()
+    groups = as_groups({'A': {'node': [2, 1]}, 'B': g2})
+    assert groups['B'] is g2 and groups_to_dict(groups) == {'A': {'node': [1, 2]}, 'B': g2.to_dict()}
+    type_index = ElemTypeIndex()
+    type_index.add('hex', [10, 11, 12])
+    type_index.add('tet', [5, 6])
+    assert Group.from_elem_ids([12, 5, 10, 5], type_index).to_dict() == {'hex': [10, 12], 'tet': [5]}
+    try:
+        Group.from_elem_ids([5, 99], type_index)
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('unknown element id without KeyError')
+
+
+def test_writers():
+    # writers take Group objects as they take group dicts
+    mesh_dict = {'nodes': {i: [float(i), 0.0, 0.0] for i in range(1, 9)},
+                 'elems': {'hex': {10: list(range(1, 9)), 11: list(range(1, 9))}},
+                 'groups': {'A': {'node': [1, 2, 3], 'hex': [10, 11]}}}
+    group_dict = dict(mesh_dict, groups=as_groups(mesh_dict['groups']))
+    with tempfile.TemporaryDirectory() as work_dir:
+        for write, ext in ((write_dat, '.dat'), (write_inp, '.inp'), (write_out, '.out')):
+            dict_file, group_file = os.path.join(work_dir, 'dict' + ext), os.path.join(work_dir, 'group' + ext)
+            write(dict_file, mesh_dict)
+            write(group_file, group_dict)
+            with open(dict_file) as f0, open(group_file) as f1:
+                # the headers hold the file names
+                assert [line for line in f0 if 'dict' + ext not in line] == \
+                    [line for line in f1 if 'group' + ext not in line], ext
+        # .dat files split the node and element groups
+        read_dict = read_dat(os.path.join(work_dir, 'group.dat'), 1, 1, 1)
+        assert Group.union_all(read_dict['groups'].values()) == group_dict['groups']['A']
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_id_sets()
+    test_groups()
+    test_writers()
@@ -0,0 +1,136 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .mesh import Mesh, IdIndex, ElemTypeIndex, split_by_elem_type
+from .samcef_dat_parser import write_dat
+from .abaqus_inp_parser import write_inp
+from .patran_neutral_parser import write_out
+from .renumbering import renumber_mesh
+
+
+def sample_mesh_dict():
+    # sparse, unsorted ids and two element types
+    nodes = {node_id: [0.5 * i, 1.0 + i, -2.0 * i] for i, node_id in enumerate([7, 1, 2, 3, 4, 5, 6, 8, 9, 100000])}
+    elems = {'hex': {20: [1, 2, 3, 4, 5, 6, 7, 8]},
+             'tet': {12: [1, 2, 3, 100000], 3: [2, 3, 4, 9]}}
+    groups = {'BOTTOM': {'node': [4, 1, 2]},
+              'SOLID': {'hex': [20], 'tet': [3, 12]}}
+    return {'nodes': nodes, 'elems': elems, 'groups': groups}
+
+
+def test_round_trip():
+    mesh_dict = sample_mesh_dict()
+    mesh = Mesh.from_dict(mesh_dict)
+    assert Mesh.from_dict(mesh) is mesh
+    assert mesh.n_nodes == 10 and mesh.n_elems == 3
+    assert mesh.node_ids.tolist() == sorted(mesh_dict['nodes'])
+    assert mesh.elem_blocks['tet'].ids.tolist() == [3, 12]
+    assert mesh.to_dict() == mesh_dict
+    assert mesh['nodes'][100000] == mesh_dict['nodes'][100000]
+    assert mesh['elems']['tet'][12] == [1, 2, 3, 100000]
+    assert 12 in mesh['elems']['tet'] and 20 not in mesh['elems']['tet']
+    assert mesh['groups']['BOTTOM'] == {'node': [4, 1, 2]}
+    assert Mesh.from_dict(mesh.to_dict()).to_dict() == mesh_dict
+
+
+def check_index(ids):
+    index = IdIndex(np.array(ids))
+    missing = [ids[0] - 1, ids[-1] + 1, ids[1] - 1 if ids[1] - 1 != ids[0] else ids[-1] + 100]
+    assert index.rows(ids).tolist() == list(range(len(ids)))
+    assert index.rows(ids[::-1]).tolist() == list(range(len(ids)))[::-1]
+    assert index.rows(missing).tolist() == [-1] * len(missing)
+    assert index.contains([ids[2]] + missing).tolist() == [True] + [False] * len(missing)
+    assert index.row(ids[-1]) == len(ids) - 1
+    for strict_call in (lambda: index.row(missing[0]), lambda: index.rows(ids[:3] + missing[:1], strict=True)):
+        try:
+            strict_call()
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('missing id without KeyError')
+    return index
+
+
+def test_id_index():
+    # dense numbering uses the lookup table, sparse one the binary search
+    dense = check_index(list(range(5, 5000, 2)))
+    assert dense._table is not None
+    sparse = check_index([10 ** 6 * i + 3 for i in range(1, 2000)])
+    assert sparse._table is None
+    assert IdIndex([]).rows([1, 2]).tolist() == [-1, -1]
+
+
+def test_elem_type_index():
+    mesh_dict = sample_mesh_dict()
+    dict_elem_types = {elem_id: elem_type for elem_type, elems in mesh_dict['elems'].items() for elem_id in elems}
+    index = ElemTypeIndex()
+    index.add('tet', [12, 3])
+    index.add('hex', [20])
+    assert index[20] == 'hex' and index[3] == 'tet'
+    assert 12 in index and 13 not in index
+    assert index.codes([3, 13, 20]).tolist() == [0, -1, 1]
+    entities = [20, 3, 12]
+    assert index.split(entities) == split_by_elem_type(entities, dict_elem_types) == {'tet': [3, 12], 'hex': [20]}
+    try:
+        index.split([3, 13])
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('unknown element id without KeyError')
+
+
+# lines of the headers holding the date, the time or the file path
+header_lines = {'.dat': [2], '.inp': [1], '.out': [1, 3]}
+
+
+def written_lines(path):
+    with open(path, 'r') as f0:
+        lines = f0.readlines()
+    return [line for i, line in enumerate(lines) if i not in header_lines[os.path.splitext(path)[1]]]
+
+
+def test_writers():
+    # the writers write the same files from the mesh dict and from the Mesh
+    mesh_dict = sample_mesh_dict()
+    mesh = Mesh.from_dict(mesh_dict)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for write, ext in ((write_dat, '.dat'), (write_inp, '.inp'), (write_out, '.out')):
+            dict_file = os.path.join(work_dir, 'sample' + ext)
+            mesh_file = os.path.join(work_dir, 'from_mesh', 'sample' + ext)
+            os.makedirs(os.path.dirname(mesh_file), exist_ok=True)
+            write(dict_file, mesh_dict)
+            write(mesh_file, mesh)
+            assert written_lines(dict_file) == written_lines(mesh_file), ext
+
+
+def test_writers_renumber():
+    # renumbered files are the ones of the renumbered mesh, with the id maps of renumber_mesh
+    mesh_dict = sample_mesh_dict()
+    renumbered, id_maps = renumber_mesh(mesh_dict, 'rcm')
+    with tempfile.TemporaryDirectory() as work_dir:
+        for write, ext in ((write_dat, '.dat'), (write_inp, '.inp'), (write_out, '.out')):
+            renumbered_file = os.path.join(work_dir, 'sample' + ext)
+            ref_file = os.path.join(work_dir, 'from_mesh', 'sample' + ext)
+            os.makedirs(os.path.dirname(ref_file), exist_ok=True)
+            assert write(ref_file, renumbered) is None
+            written_maps = write(renumbered_file, mesh_dict, renumber='rcm')
+            assert written_lines(renumbered_file) == written_lines(ref_file), ext
+            for key in ('nodes', 'elems'):
+                assert [ids.tolist() for ids in written_maps[key]] == [ids.tolist() for ids in id_maps[key]], key
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_round_trip()
+    test_id_index()
+    test_elem_type_index()
+    test_writers()
+    test_writers_renumber()
@@ -0,0 +1,102 @@
+import os
+import sys
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .mesh_merge import merge_meshes, coincident_labels
+from .mesh import Mesh, ElemBlock
+from ._benchmark_suite import make_synthetic_mesh
+
+
+def shifted_cubes():
+    # two unit cubes sharing the face x = 1, with the same ids
+    first = make_synthetic_mesh(1000, 'hex')
+    second = make_synthetic_mesh(1000, 'hex')
+    second = Mesh(second.node_ids, second.coords + [1.0, 0.0, 0.0], second.elem_blocks, second.group_arrays)
+    return first, second
+
+
+def assert_mapped(mesh, parts, id_maps):
+    # elements of each part found with their new ids, on the same points
+    for part, id_map in zip(parts, id_maps):
+        old_nodes, new_nodes = id_map['nodes']
+        assert old_nodes.tolist() == part.node_ids.tolist()
+        assert np.allclose(mesh.node_coords(new_nodes), part.coords)
+        old_elems, new_elems = id_map['elems']
+        block, part_block = mesh.elem_blocks['hex'], part.elem_blocks['hex']
+        rows = np.searchsorted(block.ids, new_elems[np.searchsorted(old_elems, part_block.ids)])
+        assert (block.ids[rows] == new_elems[np.searchsorted(old_elems, part_block.ids)]).all()
+        assert np.allclose(mesh.node_coords(block.conn[rows].ravel()), part.node_coords(part_block.conn.ravel()))
+        for gr_name, group in part.group_arrays.items():
+            for ent_type, ids in group.items():
+                old_ids, new_ids = id_map['nodes' if ent_type == 'node' else 'elems']
+                assert set(new_ids[np.searchsorted(old_ids, ids)].tolist()) <= \
+                    set(mesh.group_arrays[gr_name][ent_type].tolist())
+
+
+def test_merge():
+    parts = shifted_cubes()
+    n_shared = int(np.isclose(parts[0].coords[:, 0], 1.0).sum())
+    mesh, id_maps = merge_meshes(parts)
+    assert mesh.n_nodes == 2 * parts[0].n_nodes and len(mesh.elem_blocks['hex']) == 2 * len(parts[0].elem_blocks['hex'])
+    assert id_maps[1]['nodes'][1][0] == parts[0].node_ids[-1] + 1
+    assert_mapped(mesh, parts, id_maps)
+    assert len(mesh.group_arrays['GR_0']['hex']) == 2 * len(parts[0].group_arrays['GR_0']['hex'])
+    for ids_mode in ('offset', 'renumber'):
+        mesh, id_maps = merge_meshes(parts, ids_mode, tolerance=1e-6)
+        assert mesh.n_nodes == 2 * parts[0].n_nodes - n_shared
+        assert_mapped(mesh, parts, id_maps)
+        # shared nodes are the ones of the first part
+        assert np.isin(id_maps[1]['nodes'][1], id_maps[0]['nodes'][1]).sum() == n_shared
+    assert mesh.node_ids.tolist() == list(range(1, mesh.n_nodes + 1))
+    mesh, _ = merge_meshes(parts, group_prefixes=['A_', 'B_'])
+    assert sorted(mesh.group_arrays) == sorted([prefix + gr_name for prefix in ('A_', 'B_')
+                                                for gr_name in parts[0].group_arrays])
+
+
+def test_keep_ids():
+    parts = shifted_cubes()
+    try:
+        merge_meshes(parts, 'keep')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('ids of several meshes kept without ValueError')
+    second = parts[1]
+    block = second.elem_blocks['hex']
+    shifted = Mesh(second.node_ids + 10 ** 6, second.coords,
+                   {'hex': ElemBlock(block.ids + 10 ** 6, block.conn + 10 ** 6)}, {})
+    mesh, id_maps = merge_meshes([parts[0], shifted], 'keep', tolerance=1e-6)
+    assert_mapped(mesh, [parts[0], shifted], id_maps)
+    # nodes of the shared face take the ids of the first part, the other ones keep theirs
+    shared = np.isclose(second.coords[:, 0], 1.0)
+    new_nodes = id_maps[1]['nodes'][1]
+    assert (new_nodes[~shared] == shifted.node_ids[~shared]).all() and (new_nodes[shared] < 10 ** 6).all()
+    single, id_maps = merge_meshes([parts[0]], 'keep')
+    assert single.node_ids.tolist() == parts[0].node_ids.tolist()
+    assert id_maps[0]['elems'][1].tolist() == id_maps[0]['elems'][0].tolist()
+
+
+def test_coincident_labels():
+    rng = np.random.default_rng(0)
+    points = rng.random((400, 3))
+    parts = np.repeat([0, 1], 200)
+    points[200:250] = points[:50] + 1e-9
+    # points of the same part are not merged
+    points[50] = points[51]
+    labels = coincident_labels(points, parts, 1e-6)
+    expected = np.arange(400)
+    expected[200:250] = np.arange(50)
+    assert labels.tolist() == expected.tolist()
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_merge()
+    test_keep_ids()
+    test_coincident_labels()
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from . import mesh_quality
+from .mesh_quality import mesh_statistics, element_quality, format_statistics
+from .mesh import Mesh, ElemBlock
+from ._benchmark_suite import make_synthetic_mesh
+
+
+def unit_elements():
+    # unit cube, corner tet, half cube wedge, regular tet, in the node order of the mesh dict
+    coords = [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],
+              [0.5, np.sqrt(3) / 2, 0], [0.5, np.sqrt(3) / 6, np.sqrt(2.0 / 3)]]
+    elem_blocks = {'hex': ElemBlock([1], [[1, 2, 3, 4, 5, 6, 7, 8]]),
+                   'tet': ElemBlock([2, 3], [[1, 2, 4, 5], [1, 2, 9, 10]]),
+                   'wedge': ElemBlock([4], [[1, 2, 4, 5, 6, 8]])}
+    return Mesh(np.arange(1, 11), coords, elem_blocks)
+
+
+def test_unit_elements():
+    mesh = unit_elements()
+    ids, values = element_quality(mesh, 'hex')
+    assert ids.tolist() == [1] and np.allclose([values[measure][0] for measure in ('size', 'aspect_ratio',
+                                                                                   'scaled_jacobian')], 1.0)
+    ids, values = element_quality(mesh, 'tet')
+    assert np.allclose(values['size'], [1.0 / 6, np.sqrt(2) / 12])
+    assert np.allclose(values['aspect_ratio'], [np.sqrt(2), 1.0])
+    # lowest corner of the corner tet at (1, 0, 0): unit edges (-1, 1, 0) / sqrt(2), (-1, 0, 0), (-1, 0, 1) / sqrt(2)
+    assert np.allclose(values['scaled_jacobian'], [0.5, 1 / np.sqrt(2)])
+    ids, values = element_quality(mesh, 'wedge')
+    assert np.allclose(values['size'], 0.5) and np.allclose(values['aspect_ratio'], np.sqrt(2))
+    assert (values['scaled_jacobian'] > 0).all()
+
+
+def test_synthetic_meshes():
+    chunk_size = mesh_quality.quality_chunk_size
+    for family in ('hex', 'tet', 'wedge'):
+        mesh = make_synthetic_mesh(2000, family)
+        stats = mesh_statistics(mesh, bins=5, n_worst=3)
+        type_stats = stats['types'][family]
+        assert stats['n_nodes'] == mesh.n_nodes and type_stats['count'] == len(mesh.elem_blocks[family])
+        # the elements fill the bounding box
+        low, high = stats['bounding_box']
+        assert np.isclose(type_stats['total_size'], np.prod(high - low)) and type_stats['n_inverted'] == 0
+        assert type_stats['size']['histogram'][0].sum() == type_stats['count']
+        assert len(type_stats['aspect_ratio']['worst'][0]) == 3
+        # measured by chunks of elements
+        mesh_quality.quality_chunk_size = 7
+        try:
+            _, chunk_values = element_quality(mesh, family)
+        finally:
+            mesh_quality.quality_chunk_size = chunk_size
+        _, values = element_quality(mesh, family)
+        assert all([np.allclose(chunk_values[measure], values[measure]) for measure in values])
+
+
+def test_inverted_and_degenerate():
+    mesh = make_synthetic_mesh(1000, 'hex')
+    block = mesh.elem_blocks['hex']
+    conn = block.conn.copy()
+    conn[5] = conn[5][[4, 5, 6, 7, 0, 1, 2, 3]]
+    stats = mesh_statistics(Mesh(mesh.node_ids, mesh.coords, {'hex': ElemBlock(block.ids, conn)}), n_worst=2)
+    type_stats = stats['types']['hex']
+    assert type_stats['n_inverted'] == 1 and type_stats['scaled_jacobian']['worst'][0][0] == block.ids[5]
+    assert type_stats['size']['min'] < 0
+    shells = {'nodes': {1: [0, 0, 0], 2: [1, 0, 0], 3: [1, 1, 0], 4: [0, 1, 0], 5: [2, 0, 0]},
+              'elems': {'quad': {1: [1, 2, 3, 4]}, 'tria': {2: [2, 5, 3], 3: [1, 2, 2]},
+                        'bar2': {4: [1, 5, 2]}, 'point': {9: [1]}},
+              'groups': {}}
+    stats = mesh_statistics(shells)
+    assert stats['types']['point'] == {'count': 1}
+    assert np.isclose(stats['types']['quad']['size']['min'], 1.0)
+    assert np.isclose(stats['types']['bar2']['total_size'], 2.0)
+    # the flat tria has a zero length edge: infinite aspect ratio, worst first
+    aspect_ratio = stats['types']['tria']['aspect_ratio']
+    assert aspect_ratio['n_degenerate'] == 1 and aspect_ratio['worst'][0].tolist() == [3, 2]
+    assert np.isclose(aspect_ratio['max'], np.sqrt(2))
+    assert 'quad' in format_statistics(stats)
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_unit_elements()
+    test_synthetic_meshes()
+    test_inverted_and_degenerate()
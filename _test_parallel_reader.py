@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .samcef_dat_parser import read_dat, write_dat
+from .abaqus_inp_parser import read_inp, write_inp
+from .patran_neutral_parser import read_out, write_out
+from .parallel_reader import read_dat_parallel, read_inp_parallel, read_out_parallel
+from ._benchmark_suite import make_synthetic_mesh
+
+
+# small ranges, so that every section is split between the workers
+chunk_size = 2000
+workers = 2
+
+
+def assert_same_mesh(mesh_dict, ref_dict):
+    # same content and same key order as the mesh dict of the serial reader
+    assert list(mesh_dict) == list(ref_dict)
+    assert list(mesh_dict['nodes'].items()) == list(ref_dict['nodes'].items())
+    assert list(mesh_dict['elems']) == list(ref_dict['elems'])
+    for elem_type in ref_dict['elems']:
+        assert list(mesh_dict['elems'][elem_type].items()) == list(ref_dict['elems'][elem_type].items()), elem_type
+    assert list(mesh_dict['groups'].items()) == list(ref_dict['groups'].items())
+
+
+def check_parallel(mesh_file, read_serial, read_parallel):
+    for flags in ((1, 0, 0), (0, 1, 1), (1, 1, 0), (1, 1, 1)):
+        ref_dict = read_serial(mesh_file, *flags)
+        assert_same_mesh(read_parallel(mesh_file, *flags, workers=workers, chunk_size=chunk_size), ref_dict)
+        assert_same_mesh(read_parallel(mesh_file, *flags, workers=1, chunk_size=chunk_size), ref_dict)
+    return ref_dict
+
+
+def split_dat_elem_lines(datin, datout):
+    # element lines cut in two, the first part ending with the '$' continuation mark
+    with open(datin, 'r') as f0, open(datout, 'w') as f1:
+        for line in f0:
+            if line.startswith('     I ') and ' N ' in line and ' 0 ' in line:
+                line = line.replace(' 0 ', ' $\n 0 ', 1)
+            f1.write(line)
+
+
+def test_dat():
+    mesh = make_synthetic_mesh(500, 'hex')
+    with tempfile.TemporaryDirectory() as work_dir:
+        dat_file = os.path.join(work_dir, 'mesh.dat')
+        split_file = os.path.join(work_dir, 'split.dat')
+        write_dat(dat_file, mesh)
+        split_dat_elem_lines(dat_file, split_file)
+        ref_dict = check_parallel(dat_file, read_dat, read_dat_parallel)
+        assert_same_mesh(check_parallel(split_file, read_dat, read_dat_parallel), ref_dict)
+
+
+def test_inp():
+    # hex element lines end with ',' and go on the next line
+    with tempfile.TemporaryDirectory() as work_dir:
+        for family in ('hex', 'tet'):
+            inp_file = os.path.join(work_dir, '{0}.inp'.format(family))
+            write_inp(inp_file, make_synthetic_mesh(500, family))
+            check_parallel(inp_file, read_inp, read_inp_parallel)
+
+
+def test_out():
+    with tempfile.TemporaryDirectory() as work_dir:
+        for family in ('hex', 'wedge'):
+            out_file = os.path.join(work_dir, '{0}.out'.format(family))
+            write_out(out_file, make_synthetic_mesh(500, family))
+            check_parallel(out_file, read_out, read_out_parallel)
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_dat()
+    test_inp()
+    test_out()
@@ -0,0 +1,88 @@
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .samcef_dat_parser import read_dat, write_dat
+from .abaqus_inp_parser import read_inp, write_inp
+from .patran_neutral_parser import read_out, write_out
+from .femb_binary_parser import write_femb
+from .partial_reader import read_indexed_groups, read_mesh_groups, select_groups, clear_index_cache
+from ._benchmark_suite import make_synthetic_mesh
+
+
+def assert_same_selection(mesh_dict, ref_dict):
+    # same nodes and elements in the same order, same group members
+    assert list(mesh_dict['nodes'].items()) == list(ref_dict['nodes'].items())
+    assert list(mesh_dict['elems']) == list(ref_dict['elems'])
+    for elem_type in ref_dict['elems']:
+        assert list(mesh_dict['elems'][elem_type].items()) == list(ref_dict['elems'][elem_type].items()), elem_type
+    assert {gr_name: {ent_type: list(ids) for ent_type, ids in group.items()}
+            for gr_name, group in mesh_dict['groups'].items()} == \
+        {gr_name: {ent_type: list(ids) for ent_type, ids in group.items()}
+         for gr_name, group in ref_dict['groups'].items()}
+
+
+def group_selections(group_names):
+    return [[gr_name] for gr_name in group_names] + [group_names, group_names[:1] + ['MISSING']]
+
+
+def test_indexed_groups():
+    mesh = make_synthetic_mesh(500, 'hex')
+    with tempfile.TemporaryDirectory() as work_dir:
+        for write, read, ext in ((write_dat, read_dat, '.dat'), (write_inp, read_inp, '.inp'),
+                                 (write_out, read_out, '.out')):
+            mesh_file = os.path.join(work_dir, 'mesh' + ext)
+            write(mesh_file, mesh)
+            full_dict = read(mesh_file, 1, 1, 1)
+            for group_names in group_selections(list(full_dict['groups'])):
+                ref_dict = select_groups(full_dict, group_names)
+                # small index chunks, so that only some of them hold the groups
+                for chunk_size, workers in ((2000, 1), (2000, 2), (10 ** 7, 1)):
+                    clear_index_cache()
+                    mesh_dict = read_indexed_groups(mesh_file, group_names, chunk_size=chunk_size, workers=workers)
+                    assert_same_selection(mesh_dict, ref_dict)
+
+
+def test_femb_groups():
+    mesh = make_synthetic_mesh(500, 'tet')
+    full_dict = mesh.to_dict()
+    with tempfile.TemporaryDirectory() as work_dir:
+        femb_file = os.path.join(work_dir, 'mesh.femb')
+        write_femb(femb_file, mesh)
+        for group_names in group_selections(list(full_dict['groups'])):
+            assert_same_selection(read_mesh_groups(femb_file, group_names).to_dict(),
+                                  select_groups(full_dict, group_names))
+
+
+def test_compressed_groups():
+    # read in full with the reader of the file extension, then filtered
+    mesh = make_synthetic_mesh(500, 'hex')
+    with tempfile.TemporaryDirectory() as work_dir:
+        mesh_file = os.path.join(work_dir, 'mesh.dat')
+        write_dat(mesh_file, mesh)
+        with open(mesh_file, 'rb') as f0, gzip.open(mesh_file + '.gz', 'wb') as f1:
+            shutil.copyfileobj(f0, f1)
+        full_dict = read_dat(mesh_file, 1, 1, 1)
+        for group_names in group_selections(list(full_dict['groups'])):
+            assert_same_selection(read_mesh_groups(mesh_file + '.gz', group_names),
+                                  select_groups(full_dict, group_names))
+        try:
+            read_mesh_groups(os.path.join(work_dir, 'mesh.xyz'), ['GR_0'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('no error for a file without reader')
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_indexed_groups()
+    test_femb_groups()
+    test_compressed_groups()
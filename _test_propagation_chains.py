@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .propagation_chains import build_chains, chain_field, link_fronts, nearest_on_polyline
+from .spatial_index import distance_points_segment
+
+
+def half_circle_fronts(n_fronts, n_points, growth=0.01):
+    # front meshes and fields of half circles growing by growth at each front
+    front_meshes, front_fields = {}, {}
+    for front in range(1, n_fronts + 1):
+        radius = 1.0 + growth * (front - 1)
+        angles = np.linspace(0.0, np.pi, n_points + front % 3)
+        points = np.c_[radius * np.cos(angles), radius * np.sin(angles), np.zeros(len(angles))]
+        front_meshes[front] = {'nodes': {i: tuple(point) for i, point in enumerate(points.tolist())},
+                               'elems': {'bar': {i: [i, i + 1] for i in range(len(points) - 1)}}}
+        front_fields[front] = {'x': points[:, 0].tolist(), 'y': points[:, 1].tolist(), 'z': points[:, 2].tolist(),
+                               'DKeq': (front + angles).tolist(), 'curv.coord.': (radius * angles).tolist()}
+    return front_meshes, front_fields
+
+
+def test_nearest_on_polyline():
+    rng = np.random.default_rng(0)
+    polyline = np.cumsum(rng.normal(size=(300, 3)), axis=0)
+    points = polyline[::7] + rng.normal(size=(43, 3)) * 2.0
+    segment_ids, distances, t = nearest_on_polyline(points, polyline)
+    brute = np.stack([distance_points_segment(points, np.repeat(polyline[j:j + 1], len(points), 0),
+                                              np.repeat(polyline[j + 1:j + 2], len(points), 0))
+                      for j in range(len(polyline) - 1)], 1)
+    assert np.allclose(distances, brute.min(1))
+    closest = polyline[segment_ids] + t[:, None] * (polyline[segment_ids + 1] - polyline[segment_ids])
+    assert np.allclose(np.sqrt(((points - closest) ** 2).sum(1)), distances)
+    point_ids, distances, _ = nearest_on_polyline(points, polyline, to_segments=False)
+    brute = np.sqrt(((points[:, None] - polyline[None]) ** 2).sum(2))
+    assert np.allclose(distances, brute.min(1)) and np.allclose(brute[np.arange(len(points)), point_ids], distances)
+
+
+def test_chains():
+    front_meshes, front_fields = half_circle_fronts(5, 50)
+    chains = build_chains(front_meshes)
+    assert chains['fronts'] == [1, 2, 3, 4, 5] and chains['points'].shape == (5, 51, 3)
+    # chords of the half circles are up to 5e-4 inside them
+    assert np.allclose(chains['increments'], 0.01, atol=1e-3)
+    assert np.allclose(chains['lengths'][-1], chains['increments'].sum(0))
+    # the chains stay on the fronts
+    radii = np.sqrt((chains['points'] ** 2).sum(2))
+    assert np.allclose(radii, 1.0 + 0.01 * np.arange(5)[:, None], atol=1e-3)
+    # points of a front are linked to themselves
+    targets, increments, positions = link_fronts(chains['points'][0], chains['points'][0])
+    assert np.allclose(targets, chains['points'][0]) and np.allclose(increments, 0.0)
+    assert np.allclose(positions, np.arange(51))
+    # DKeq is front + angle, the angle of a chain hardly changes
+    values = chain_field(chains, front_fields, 'DKeq')
+    angles = np.arctan2(chains['points'][:, :, 1], chains['points'][:, :, 0])
+    assert np.allclose(values, np.arange(1, 6)[:, None] + angles, atol=1e-3)
+
+
+def test_start_points():
+    front_meshes, _ = half_circle_fronts(4, 50)
+    chains = build_chains(front_meshes, start_points=[[0.0, 1.2, 0.0], [1.5, 0.0, 0.0]], fronts=[1, 3, 4])
+    assert chains['points'].shape == (3, 2, 3)
+    assert np.allclose(chains['points'][0, :, :2], [[0.0, 1.0], [1.0, 0.0]], atol=1e-3)
+    assert np.allclose(chains['lengths'][-1], 0.03, atol=1e-3)
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_nearest_on_polyline()
+    test_chains()
+    test_start_points()
@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import http.client
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .result_server import (ResultStore, ResultClient, start_server, make_server, pack_message, unpack_message,
+                            token_header)
+from .femb_binary_parser import write_femb
+from ._benchmark_suite import make_synthetic_mesh, make_synthetic_fields
+
+
+def assert_refused(query, message):
+    try:
+        query()
+    except ValueError as error:
+        assert message in str(error), error
+    else:
+        raise AssertionError('query not refused')
+
+
+def test_messages():
+    value = {'ids': np.arange(5), 'nested': [{'values': np.ones((2, 3), dtype=np.float32)}, 'text', 1.5]}
+    message = unpack_message(pack_message(value))
+    assert message['ids'].tolist() == list(range(5)) and message['nested'][1:] == ['text', 1.5]
+    assert message['nested'][0]['values'].dtype == np.float32 and message['nested'][0]['values'].shape == (2, 3)
+    assert_refused(lambda: unpack_message(b'FEMB' + bytes(60)), 'Not a result server message')
+
+
+def test_queries():
+    mesh = make_synthetic_mesh(1000, 'hex')
+    fields = make_synthetic_fields(mesh)
+    with tempfile.TemporaryDirectory() as root_dir:
+        femb_file = os.path.join(root_dir, 'mesh.femb')
+        write_femb(femb_file, mesh, fields)
+        server = start_server(port=0, store=ResultStore(root_dir=root_dir))
+        read_args = {'field_format': 'femb'}
+        try:
+            with ResultClient(port=server.server_address[1], token=server.token) as client:
+                info = client.mesh_info(femb_file)
+                assert info['n_nodes'] == mesh.n_nodes and info['elem_types'] == {'hex': len(mesh.elem_blocks['hex'])}
+                full = client.mesh(femb_file)
+                assert np.array_equal(full.node_ids, mesh.node_ids) and np.array_equal(full.coords, mesh.coords)
+                subset = client.mesh(femb_file, groups=['GR_1'])
+                block = subset.elem_blocks['hex']
+                assert np.array_equal(block.ids, mesh.group_arrays['GR_1']['hex'])
+                assert np.array_equal(subset.node_ids, np.unique(block.conn))
+                assert client.mesh(femb_file, elem_ids=[5, 3, 10 ** 8]).elem_blocks['hex'].ids.tolist() == [3, 5]
+                assert np.array_equal(client.group(femb_file, 'N_BASE')['node'], mesh.group_arrays['N_BASE']['node'])
+                assert client.field_info(femb_file, read_args)['vector']['ncomp'] == 3
+                values = client.values(femb_file, [3, 1, 10 ** 9], case='vector', read_args=read_args)
+                assert values.ids.tolist() == [1, 3] and np.allclose(values.values, fields['vector'].values[[0, 2]])
+                reduced = client.reduce(femb_file, 'magnitude', case='vector', read_args=read_args)
+                magnitudes = np.sqrt((fields['vector'].values ** 2).sum(1))
+                assert np.isclose(reduced['max'], magnitudes.max())
+                assert reduced['max_id'] == mesh.node_ids[magnitudes.argmax()]
+                assert_refused(lambda: client.group(femb_file, 'MISSING'), 'KeyError')
+                assert_refused(lambda: client.reduce(femb_file, case='tensor', read_args=read_args), 'quantity')
+                assert_refused(lambda: client.query('shutdown'), 'Unknown query')
+                # the connection is kept after errors
+                assert client.mesh_info(femb_file)['n_nodes'] == mesh.n_nodes
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def test_refused():
+    mesh = make_synthetic_mesh(300, 'hex')
+    with tempfile.TemporaryDirectory() as work_dir:
+        root_dir = os.path.join(work_dir, 'served')
+        os.makedirs(root_dir)
+        inside, outside = os.path.join(root_dir, 'mesh.femb'), os.path.join(work_dir, 'mesh.femb')
+        write_femb(inside, mesh)
+        write_femb(outside, mesh)
+        server = start_server(port=0, store=ResultStore(root_dir=root_dir), token='secret')
+        port = server.server_address[1]
+        try:
+            with ResultClient(port=port, token='wrong') as client:
+                assert_refused(lambda: client.mesh_info(inside), 'Invalid result server token')
+            # refused before the body is read
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('POST', '/', body=b'not a message', headers={token_header: 'wrong'})
+            response = connection.getresponse()
+            assert response.status == 403 and response.getheader('Connection') == 'close'
+            connection.close()
+            with ResultClient(port=port, token='secret') as client:
+                assert client.mesh_info(inside)['n_nodes'] == mesh.n_nodes
+                for path in (outside, os.path.join(root_dir, '..', 'mesh.femb')):
+                    assert_refused(lambda: client.mesh_info(path), 'PermissionError')
+                assert_refused(lambda: client.mesh_info(inside, read_args={'workers': 64}), 'not allowed')
+        finally:
+            server.shutdown()
+            server.server_close()
+    # the current folder is served by default
+    server = make_server(port=0)
+    try:
+        assert server.store.root_dir == os.path.realpath(os.getcwd()) and len(server.token) == 32
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_messages()
+    test_queries()
+    test_refused()
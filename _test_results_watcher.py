@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .results_watcher import ResultsWatcher, scan_results, file_step
+from .field_mapping import PosFieldMapper
+from .fields import Field
+from ._benchmark_suite import make_synthetic_mesh, make_synthetic_fields, write_synthetic_pos
+
+
+def settle(path):
+    # modified 10 s ago, no longer written
+    old = time.time() - 10
+    os.utime(path, (old, old))
+
+
+def write_step(root_dir, step, mesh, vector):
+    # pos and front files of a stepNNN folder, samres answer file of the step
+    step_dir = os.path.join(root_dir, 'step{0:03d}'.format(step))
+    os.makedirs(step_dir)
+    write_synthetic_pos(os.path.join(step_dir, 'DISPLACEMENT-1-0.pos'), mesh,
+                        Field(vector.ids, vector.values * step, 'vector'))
+    with open(os.path.join(step_dir, 'sifs-1.txt'), 'w') as f0:
+        f0.write('# front x y z K1 K2 K3 J\n')
+        for i in range(5):
+            f0.write('1 {0} 0 0 {1} 0.1 0.0 1.0\n'.format(i * 0.1, step + i))
+    answer_file = os.path.join(root_dir, 'reac_all_nodes_step{0:03d}.out'.format(step))
+    with open(answer_file, 'w') as f0:
+        f0.write('a\nb\nc\n2\nd\n1\n1\n1\n2\n2\n2\n1.0\n2.0\n3.0\n4.0\n5.0\n{0}\n'.format(float(step)))
+    for path in [os.path.join(step_dir, name) for name in os.listdir(step_dir)] + [answer_file]:
+        settle(path)
+
+
+def event_keys(events):
+    return [(event, kind, step, os.path.basename(path)) for event, kind, step, path, _ in events]
+
+
+def test_poll():
+    mesh = make_synthetic_mesh(300, 'hex')
+    vector = make_synthetic_fields(mesh)['vector']
+    with tempfile.TemporaryDirectory() as root_dir:
+        write_step(root_dir, 1, mesh, vector)
+        assert sorted([file_step(path) for path in scan_results(root_dir)]) == [1, 1, 1]
+        state_file = os.path.join(root_dir, 'state.json')
+        watcher = ResultsWatcher(root_dir, state_file=state_file)
+        events = watcher.poll()
+        assert sorted(event_keys(events)) == [('added', 'front', 1, 'step001'),
+                                              ('added', 'pos', 1, 'DISPLACEMENT-1-0.pos'),
+                                              ('added', 'samres', 1, 'reac_all_nodes_step001.out')]
+        data = dict([(kind, data) for _, kind, _, _, data in events])
+        assert list(data['pos']) == ['vector'] and data['pos']['vector'].kind == 'vector'
+        assert isinstance(data['samres'], Field)
+        assert watcher.poll() == []
+        write_step(root_dir, 2, mesh, vector)
+        events = watcher.poll()
+        assert len(events) == 3 and all([step == 2 for _, _, step, _, _ in events])
+        # files still written are left for the next poll
+        smooth_file = os.path.join(root_dir, 'step002', 'smoothsifs-1.txt')
+        shutil.copy(os.path.join(root_dir, 'step002', 'sifs-1.txt'), smooth_file)
+        assert watcher.poll() == []
+        settle(smooth_file)
+        assert event_keys(watcher.poll()) == [('changed', 'front', 2, 'step002')]
+        # a new watcher starts from the state file
+        watcher = ResultsWatcher(root_dir, state_file=state_file)
+        assert watcher.poll() == []
+        os.remove(smooth_file)
+        assert event_keys(watcher.poll()) == [('removed', 'front', 2, 'smoothsifs-1.txt')]
+        # files in error are reported once
+        bad_file = os.path.join(root_dir, 'step002', 'STRESS-1-0.pos')
+        with open(bad_file, 'wb') as f0:
+            f0.write(b'$PostFormat\n1.4 1 8\n$EndPostFormat\n$View\nxx')
+        settle(bad_file)
+        assert [event[:2] for event in watcher.poll()] == [('error', 'pos')]
+        assert watcher.poll() == []
+
+
+def test_mapped_pos():
+    # pos fields keyed by field type, mapped on the mesh or not
+    mesh = make_synthetic_mesh(300, 'hex')
+    vector = make_synthetic_fields(mesh)['vector']
+    with tempfile.TemporaryDirectory() as root_dir:
+        write_step(root_dir, 3, mesh, vector)
+        events = ResultsWatcher(root_dir, mapper=PosFieldMapper(mesh)).poll()
+        fields = [data for _, kind, _, _, data in events if kind == 'pos'][0]
+        assert list(fields) == ['vector'] and np.allclose(fields['vector'].values, vector.values * 3)
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_poll()
+    test_mapped_pos()
@@ -0,0 +1,79 @@
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .skin import extract_skin, corner_faces
+from ._benchmark_suite import make_synthetic_mesh
+
+
+def brute_force_skin(mesh, elem_ids=None):
+    # {(parent id, face number): face nodes} of the faces found once
+    faces = {}
+    for elem_type, block in mesh.elem_blocks.items():
+        for elem_id, conn in zip(block.ids.tolist(), block.conn.tolist()):
+            if elem_ids is not None and elem_id not in elem_ids:
+                continue
+            for face, corners in enumerate(corner_faces[elem_type]):
+                faces[(elem_id, face)] = [conn[i] for i in corners]
+    counts = Counter([tuple(sorted(nodes)) for nodes in faces.values()])
+    return {key: nodes for key, nodes in faces.items() if counts[tuple(sorted(nodes))] == 1}
+
+
+def skin_faces(skin, parents):
+    # {(parent id, face number): face nodes} of the skin elements
+    conns = {}
+    for block in skin.elem_blocks.values():
+        conns.update(zip(block.ids.tolist(), block.conn.tolist()))
+    skin_ids, parent_ids, faces = [ids.tolist() for ids in parents]
+    return {(parent_id, face): conns[skin_id] for skin_id, parent_id, face in zip(skin_ids, parent_ids, faces)}
+
+
+def test_skin():
+    for family, skin_type in (('hex', 'quad'), ('tet', 'tria'), ('wedge', None)):
+        mesh = make_synthetic_mesh(1000, family)
+        skin, parents = extract_skin(mesh, start_elem_id=101)
+        assert skin_faces(skin, parents) == brute_force_skin(mesh), family
+        assert sorted(parents[0].tolist()) == list(range(101, 101 + len(parents[0])))
+        skin_nodes = set([node_id for block in skin.elem_blocks.values() for node_id in block.conn.ravel().tolist()])
+        assert skin.node_ids.tolist() == sorted(skin_nodes)
+        if skin_type:
+            assert list(skin.elem_blocks) == [skin_type]
+
+
+def test_skin_of_elems():
+    mesh = make_synthetic_mesh(1000, 'tet')
+    elem_ids = list(range(1, 2000, 3))
+    skin, parents = extract_skin(mesh, elem_ids=elem_ids[::-1])
+    assert skin_faces(skin, parents) == brute_force_skin(mesh, set(elem_ids))
+
+
+def test_skin_groups():
+    # group ids in file order, not sorted
+    mesh = make_synthetic_mesh(1000, 'hex')
+    rng = np.random.default_rng(0)
+    all_ids = mesh.elem_blocks['hex'].ids
+    mesh.set_group('ALL', {'hex': rng.permutation(all_ids)})
+    mesh.set_group('SOME', {'hex': rng.permutation(all_ids)[:300]})
+    mesh.set_group('N_SHUFFLED', {'node': rng.permutation(mesh.node_ids)})
+    skin, (skin_ids, parent_ids, _) = extract_skin(mesh)
+    assert skin.group_arrays['ALL']['quad'].tolist() == sorted(skin_ids.tolist())
+    some = set(mesh.group_arrays['SOME']['hex'].tolist())
+    assert skin.group_arrays['SOME']['quad'].tolist() == \
+        sorted([skin_id for skin_id, parent_id in zip(skin_ids.tolist(), parent_ids.tolist()) if parent_id in some])
+    assert sorted(skin.group_arrays['N_SHUFFLED']['node'].tolist()) == skin.node_ids.tolist()
+    base = mesh.group_arrays['N_BASE']['node']
+    assert skin.group_arrays['N_BASE']['node'].tolist() == base.tolist()
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_skin()
+    test_skin_of_elems()
+    test_skin_groups()
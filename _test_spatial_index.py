@@ -0,0 +1,97 @@
+import os
+import sys
+
+import numpy as np
+
+if __name__ == '__main__' and not __package__:
+    # run as a script: the folder is imported as a package, for the relative imports of its modules
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+from .spatial_index import SpatialIndex, SegmentIndex, distance_points_segment
+
+
+def point_sets(rng):
+    # uniform, flat, single point, on a line, clustered with far outliers
+    return [rng.random((3000, 3)), np.c_[rng.random((2000, 2)), np.zeros(2000)], rng.random((1, 3)),
+            rng.random((7, 3)) * [1, 0, 0],
+            np.concatenate([rng.random((2000, 3)) * 1e-3, rng.random((10, 3)) * 100])]
+
+
+def segment_distances(points, p1, p2):
+    # (n points, n segments) distances
+    return np.stack([distance_points_segment(points, np.repeat(p1[j:j + 1], len(points), 0),
+                                             np.repeat(p2[j:j + 1], len(points), 0)) for j in range(len(p1))], 1)
+
+
+def assert_csr(offsets, ids, distances, ref_ids):
+    # ids of each query as in ref_ids, sorted by distance
+    for i, ref in enumerate(ref_ids):
+        assert sorted(ids[offsets[i]:offsets[i + 1]].tolist()) == sorted(ref), i
+        assert (np.diff(distances[offsets[i]:offsets[i + 1]]) >= 0).all(), i
+
+
+def test_points():
+    rng = np.random.default_rng(0)
+    for points in point_sets(rng):
+        ids = np.arange(len(points)) * 3 + 7
+        index = SpatialIndex(points, ids)
+        queries = np.concatenate([rng.random((200, 3)) * 1.4 - 0.2, rng.random((5, 3)) * 300])
+        distances = np.sqrt(((queries[:, None] - points[None]) ** 2).sum(2))
+        found, found_distances = index.nearest(queries)
+        assert np.allclose(found_distances, distances.min(1))
+        assert np.allclose(distances[np.arange(len(queries)), (found - 7) // 3], distances.min(1))
+        found, _ = index.nearest(queries, max_distance=0.05)
+        assert (found == np.where(distances.min(1) <= 0.05, ids[distances.argmin(1)], -1)).all()
+        for radius in (0.1, 200.0):
+            assert_csr(*index.radius(queries, radius), [ids[row <= radius].tolist() for row in distances])
+        radii = rng.random(len(queries)) * 0.2
+        assert_csr(*index.radius(queries, radii), [ids[row <= r].tolist() for row, r in zip(distances, radii)])
+
+
+def test_near_segments():
+    rng = np.random.default_rng(1)
+    for points in point_sets(rng)[:3]:
+        index = SpatialIndex(points)
+        p1 = rng.random((40, 3))
+        p2 = p1 + rng.normal(size=(40, 3)) * 0.3
+        distances = segment_distances(points, p1, p2)
+        assert_csr(*index.near_segments(p1, p2, 0.05), [np.flatnonzero(column <= 0.05).tolist()
+                                                         for column in distances.T])
+
+
+def test_radius_clustered():
+    # a far point makes the grid fine, the cells of the radius outnumber the occupied cells
+    rng = np.random.default_rng(2)
+    points = np.concatenate([rng.random((20000, 3)) * 1e-3, [[100.0, 100.0, 100.0]]])
+    index = SpatialIndex(points)
+    for query, radius in (([0.0, 0.0, 0.0], 0.2), ([0.0, 0.0, 0.0], 200.0), ([99.9, 100.0, 100.0], 0.2)):
+        distances = np.sqrt(((points - query) ** 2).sum(1))
+        assert_csr(*index.radius([query], radius), [np.flatnonzero(distances <= radius).tolist()])
+
+
+def test_segments():
+    rng = np.random.default_rng(3)
+    p1 = rng.random((40, 3))
+    p2 = p1 + rng.normal(size=(40, 3)) * 0.3
+    index = SegmentIndex(p1, p2, ids=np.arange(40) + 100)
+    queries = rng.random((300, 3)) * 1.4 - 0.2
+    distances = segment_distances(queries, p1, p2)
+    ids, found_distances, t = index.nearest(queries)
+    assert np.allclose(found_distances, distances.min(1))
+    closest = p1[ids - 100] + t[:, None] * (p2 - p1)[ids - 100]
+    assert np.allclose(np.sqrt(((queries - closest) ** 2).sum(1)), found_distances)
+    ids, _, _ = index.nearest(queries, max_distance=0.1)
+    assert (ids == np.where(distances.min(1) <= 0.1, distances.argmin(1) + 100, -1)).all()
+    assert_csr(*index.within(queries, 0.1), [(np.flatnonzero(row <= 0.1) + 100).tolist() for row in distances])
+    # samples of a long segment are farther than max_distance of a point close to it
+    ids, found_distances, t = SegmentIndex([[0, 0, 0]], [[2, 0, 0]]).nearest([[1, 0.9, 0], [1, 1.9, 0]], 1.0)
+    assert ids.tolist() == [0, -1] and np.isclose(found_distances[0], 0.9) and np.isclose(t[0], 0.5)
+
+
+if __name__ == '__main__':
+    print('Start tests...')
+    test_points()
+    test_near_segments()
+    test_radius_clustered()
+    test_segments()
@@ -9,6 +9,8 @@ import re
 from datetime import datetime
 
 from .common_functions import sci_float
+from .file_io import open_input
+from .instrumentation import phase
 
 
 abaqus_elem_types = {'C3D4': 'tet',
@@ -118,10 +120,34 @@ def is_nset_block(block_str):
     return block_str.startswith('NSET,')
 
 
-def read_inp(inp_in, read_nodes=1, read_elems=1, read_groups=1):
+inp_float_expr = r"\-?\d+\.?\d*(?i:E\-?\+?\d+)*"
+inp_node_expr = re.compile('(\d+),\s*({0}),\s*({0}),*\s*({0})*\n'.format(inp_float_expr))
+inp_elem_block_break = re.compile(',\n')
+
+
+def read_inp_nodes(block):
+    return [(int(data[0]), [float(val) if val else 0.0 for val in data[1:]]) for data in inp_node_expr.findall(block)]
+
+
+def read_inp_elem_type(block):
+    return re.findall('TYPE=([a-zA-z0-9]+)\s*\n', block)[0]
+
+
+def read_inp_elems(elem_block):
+    elem_block_clean = inp_elem_block_break.sub(',', elem_block)
+    return [[int(val_str.strip()) for val_str in line.split(
+        ',') if val_str.strip()] for line in elem_block_clean.split('\n') if line.strip()]
+
+
+def read_inp_group(block, keyword):
+    gr_name = re.findall('{0}=([\-_a-zA-z0-9]+)'.format(keyword), block)[0]
+    ents_str = block.split('\n', 1)[1]
+    entities = [int(elem_id) for elem_id in re.findall('(\d+)', ents_str)]
+    return gr_name, entities
 
-    float_expr = r"\-?\d+\.?\d*(?i:E\-?\+?\d+)*"
-    elem_block_break = re.compile(',\n')
+
+def read_inp(inp_in, read_nodes=1, read_elems=1, read_groups=1):
+    from .mesh import split_by_elem_type
 
     nodes = {}
     elems = {}
@@ -130,54 +156,119 @@ def read_inp(inp_in, read_nodes=1, read_elems=1, read_groups=1):
     elem_types = set()
     mesh_dict = {'nodes': {}, 'elems': {}, 'groups': {}}
 
-    with open(inp_in, 'r') as f0:
-        inp_str = '\n'.join([line.strip() for line in f0.readlines() if not line.startswith('**')])
+    with phase('read', 'read_inp', inp_in) as read_phase:
+        section = read_phase.section('header')
+        with open_input(inp_in, 'r') as f0:
+            lines = f0.readlines()
+        section.add_bytes(sum([len(line) for line in lines]))
+        inp_str = '\n'.join([line.strip() for line in lines if not line.startswith('**')])
         blocks = inp_str.split('*')
-    blocks = inp_str.split('*')
-    for block in blocks:
-        if read_nodes and is_node_block(block):
-            nodes_data = re.findall('(\d+),\s*({0}),\s*({0}),*\s*({0})*\n'.format(float_expr), block)
-            nodes.update(
-                {int(data[0]):  [float(val) if val else 0.0 for val in data[1:]] for data in nodes_data})
-        elif read_elems and is_elem_block(block):
-            abaqus_elem_type = re.findall('TYPE=([a-zA-z0-9]+)\s*\n', block)[0]
-            if abaqus_elem_type in abaqus_elem_types:
-                elem_type = abaqus_elem_types[abaqus_elem_type]
-                if elem_type not in elem_types:
-                    elem_types.add(elem_type)
-                    elems[elem_type] = {}
-                elem_block = block.split('\n', 1)[1]
-                elem_block_clean = elem_block_break.sub(',', elem_block)
-                elems_data = [[int(val_str.strip()) for val_str in line.split(
-                    ',') if val_str.strip()] for line in elem_block_clean.split('\n') if line.strip()]
-                #
-                elems[elem_type].update({data[0]:  convert_out_to_inp_elem_list(
-                    data[1:], elem_type) for data in elems_data})
-                dict_elem_types.update({int(data[0]): elem_type for data in elems_data})
-            else:
-                print('Elément du type {0} a été ignoré'.format(abaqus_elem_type))
-        elif read_groups and is_elset_block(block):
-            gr_name = re.findall('ELSET=([\-_a-zA-z0-9]+)', block)[0]
-            ents_str = block.split('\n', 1)[1]
-            entities = [int(elem_id) for elem_id in re.findall('(\d+)', ents_str)]
-            try:
-                ent_elem_types = [dict_elem_types[elem_id] for elem_id in entities]
-                pairs = list(zip(entities, ent_elem_types))
-                groups[gr_name] = {elem_type: [e[0] for e in list(
-                    filter(lambda el: el[1] == elem_type, pairs))] for elem_type in set(ent_elem_types)}
-            except:
-                print('N\'arrive pas de lire le contenu du groupe {}'.format(gr_name))
-        elif read_groups and is_nset_block(block):
-            gr_name = re.findall('NSET=([\-_a-zA-z0-9]+)', block)[0]
-            ents_str = block.split('\n', 1)[1]
-            entities = [int(elem_id) for elem_id in re.findall('(\d+)', ents_str)]
-            groups[gr_name] = {'node': entities}
+        for block in blocks:
+            if read_nodes and is_node_block(block):
+                section = read_phase.section('nodes')
+                block_nodes = read_inp_nodes(block)
+                nodes.update(block_nodes)
+                section.count(len(block_nodes))
+            elif read_elems and is_elem_block(block):
+                section = read_phase.section('elems')
+                abaqus_elem_type = read_inp_elem_type(block)
+                if abaqus_elem_type in abaqus_elem_types:
+                    elem_type = abaqus_elem_types[abaqus_elem_type]
+                    if elem_type not in elem_types:
+                        elem_types.add(elem_type)
+                        elems[elem_type] = {}
+                    elems_data = read_inp_elems(block.split('\n', 1)[1])
+                    #
+                    elems[elem_type].update({data[0]:  convert_out_to_inp_elem_list(
+                        data[1:], elem_type) for data in elems_data})
+                    dict_elem_types.update({int(data[0]): elem_type for data in elems_data})
+                    section.count(len(elems_data))
+                else:
+                    print('Elément du type {0} a été ignoré'.format(abaqus_elem_type))
+            elif read_groups and is_elset_block(block):
+                section = read_phase.section('groups')
+                gr_name, entities = read_inp_group(block, 'ELSET')
+                try:
+                    groups[gr_name] = split_by_elem_type(entities, dict_elem_types)
+                except:
+                    print('N\'arrive pas de lire le contenu du groupe {}'.format(gr_name))
+                section.count()
+            elif read_groups and is_nset_block(block):
+                section = read_phase.section('groups')
+                gr_name, entities = read_inp_group(block, 'NSET')
+                groups[gr_name] = {'node': entities}
+                section.count()
     mesh_dict['nodes'] = nodes
     mesh_dict['elems'] = elems
     mesh_dict['groups'] = groups
     return mesh_dict
 
 
+def iter_inp_blocks(f0):
+    # yields blocks as read_inp sees them: text between '*', with stripped lines
+    block_lines = []
+    for line in f0:
+        if line.startswith('**'):
+            continue
+        line = line.strip()
+        if line.startswith('*'):
+            if block_lines:
+                yield block_lines
+            block_lines = [line[1:]]
+        elif block_lines:
+            block_lines.append(line)
+    if block_lines:
+        yield block_lines
+
+
+def iter_inp(inp_in, read_nodes=1, read_elems=1, read_groups=1, chunk_size=100000):
+    '''
+    Streaming version of read_inp, yields the sections described
+    in samcef_dat_parser.iter_dat. Large node and element blocks are
+    split in chunks of chunk_size lines
+    '''
+    from .mesh import ElemTypeIndex, split_by_elem_type
+    dict_elem_types = ElemTypeIndex()
+    with open_input(inp_in, 'r') as f0:
+        for block_lines in iter_inp_blocks(f0):
+            header = block_lines[0] + '\n'
+            if read_nodes and is_node_block(header):
+                for i in range(1, len(block_lines), chunk_size):
+                    node_pairs = read_inp_nodes('\n'.join(block_lines[i:i + chunk_size]) + '\n')
+                    if node_pairs:
+                        node_ids, coords = zip(*node_pairs)
+                        yield ('nodes', list(node_ids), list(coords))
+            elif read_elems and is_elem_block(header):
+                abaqus_elem_type = read_inp_elem_type(header)
+                if abaqus_elem_type not in abaqus_elem_types:
+                    print('Elément du type {0} a été ignoré'.format(abaqus_elem_type))
+                    continue
+                elem_type = abaqus_elem_types[abaqus_elem_type]
+                start = 1
+                while start < len(block_lines):
+                    end = min(start + chunk_size, len(block_lines))
+                    # do not split continuation lines of one element
+                    while end < len(block_lines) and block_lines[end - 1].endswith(','):
+                        end += 1
+                    elems_data = read_inp_elems('\n'.join(block_lines[start:end]))
+                    start = end
+                    if not elems_data:
+                        continue
+                    elem_ids = [data[0] for data in elems_data]
+                    dict_elem_types.add(elem_type, elem_ids)
+                    yield ('elems', elem_type, elem_ids,
+                           [convert_out_to_inp_elem_list(data[1:], elem_type) for data in elems_data])
+            elif read_groups and is_elset_block(header):
+                gr_name, entities = read_inp_group('\n'.join(block_lines), 'ELSET')
+                try:
+                    yield ('group', gr_name, split_by_elem_type(entities, dict_elem_types))
+                except KeyError:
+                    print('N\'arrive pas de lire le contenu du groupe {}'.format(gr_name))
+            elif read_groups and is_nset_block(header):
+                gr_name, entities = read_inp_group('\n'.join(block_lines), 'NSET')
+                yield ('group', gr_name, {'node': entities})
+
+
 def get_inp_elem_line(elem_type, elem_id, nodes):
     _nodes = [node_id for node_id in nodes if node_id]
     if elem_type == 'tet':
@@ -224,32 +315,54 @@ def get_inp_elem_line(elem_type, elem_id, nodes):
         raise TypeError
 
 
-def write_inp(outinp, mesh_dict, write_nodes=1, write_elems=1, write_groups=1):
+def inp_header(outinp):
+    cur_time = str(datetime.now().strftime('%H%M%S %Y%m%d'))
+    return ''.join(['*HEADING\n',
+                    '{0}  6 (creation time, creation date, unitsys)\n'.format(cur_time),
+                    '** if you modify the *HEADING, please modify from the second line and leave the first line\n',
+                    '**\n',
+                    '** ABAQUS input file is written by mesh.py from smartec python library\n',
+                    '** ABAQUS solver add-in version 18,2017,101,1\n',
+                    "** JOBNAME IS '{0}'\n".format(os.path.basename(outinp)),
+                    '**\n',
+                    '**---------------------------------------\n',
+                    '** Topology\n',
+                    '**---------------------------------------\n'])
+
+
+def inp_node_line(node_id, coords):
+    str_nodes = [sci_float(coords[i], prec=9).rjust(20) for i in range(3)]
+    return '{0},{1},{2},{3}\n'.format(str(node_id).rjust(8), *str_nodes)
+
+
+def inp_group_lines(gr_name, ent_type, entities):
+    if ent_type == 'node':
+        str_ent_1 = 'NSET'
+    else:
+        str_ent_1 = 'ELSET'
+    el_lines = [str(ent_id) + ', ' + '\n' * int(bool(not (i+1) % 10)) for i, ent_id in enumerate(entities)]
+    return '*{0}, {0}={1}\n'.format(str_ent_1, gr_name) + ''.join(el_lines)[:-2].strip(',') + '\n'
+
+
+def write_inp(outinp, mesh_dict, write_nodes=1, write_elems=1, write_groups=1, renumber=None):
+    # renumber: None, 'compact' or 'rcm' (see renumbering.renumber_mesh). The id maps
+    # of the renumbering are returned, for renumbering.renumber_field (None otherwise)
+    id_maps = None
+    if renumber:
+        from .renumbering import renumber_mesh
+        mesh_dict, id_maps = renumber_mesh(mesh_dict, renumber)
     node_dict = mesh_dict['nodes']
     elem_dict = mesh_dict['elems']
     group_dict = mesh_dict['groups']
     #
-    cur_time = str(datetime.now().strftime('%H%M%S %Y%m%d'))
     with open(outinp, 'w') as f0:
-        f0.write('*HEADING\n')
-        f0.write('{0}  6 (creation time, creation date, unitsys)\n'.format(cur_time))
-        f0.write('** if you modify the *HEADING, please modify from the second line and leave the first line\n')
-        f0.write('**\n')
-        f0.write('** ABAQUS input file is written by mesh.py from smartec python library\n')
-        f0.write('** ABAQUS solver add-in version 18,2017,101,1\n')
-        f0.write("** JOBNAME IS '{0}'\n".format(os.path.basename(outinp)))
-        f0.write('**\n')
-        f0.write('**---------------------------------------\n')
-        f0.write('** Topology\n')
-        f0.write('**---------------------------------------\n')
+        f0.write(inp_header(outinp))
         # nodes block
         if write_nodes:
             f0.write('*NODE\n')
             n_lines = []
-            for node_id in sorted(list(node_dict.keys())):
-                str_nodes = [sci_float(node_dict[node_id][i], prec=9).rjust(20) for i in range(3)]
-                line = '{0},{1},{2},{3}\n'.format(str(node_id).rjust(8), *str_nodes)
-                n_lines.append(line)
+            for node_id, coords in sorted(node_dict.items(), key=lambda pair: pair[0]):
+                n_lines.append(inp_node_line(node_id, coords))
             f0.write(''.join(n_lines))
         # elems block
         if write_elems:
@@ -257,17 +370,61 @@ def write_inp(outinp, mesh_dict, write_nodes=1, write_elems=1, write_groups=1):
                 cur_elem_dict = elem_dict[elem_type]
                 abaqus_elem_type = abaqus_elem_types_[elem_type]
                 f0.write('*ELEMENT, TYPE={0}\n'.format(abaqus_elem_type))
-                for elem_id in sorted(list(cur_elem_dict.keys())):
-                    f0.write(get_inp_elem_line(elem_type, elem_id, cur_elem_dict[elem_id]))
+                for elem_id, elem_nodes in sorted(cur_elem_dict.items(), key=lambda pair: pair[0]):
+                    f0.write(get_inp_elem_line(elem_type, elem_id, elem_nodes))
         # group block
         if write_groups:
             for gr_name in sorted(group_dict.keys()):
                 for ent_type in group_dict[gr_name].keys():
-                    entities = group_dict[gr_name][ent_type]
-                    if ent_type == 'node':
-                        str_ent_1 = 'NSET'
-                    else:
-                        str_ent_1 = 'ELSET'
-                    f0.write('*{0}, {0}={1}\n'.format(str_ent_1, gr_name))
-                    el_lines = [str(ent_id) + ', ' + '\n' * int(bool(not (i+1) % 10)) for i, ent_id in enumerate(entities)]
-                    f0.write(''.join(el_lines)[:-2].strip(',') + '\n')
+                    f0.write(inp_group_lines(gr_name, ent_type, group_dict[gr_name][ent_type]))
+    return id_maps
+
+
+class InpStreamWriter(object):
+    '''
+    Writes an .inp file section by section, in the order the
+    sections are given (see samcef_dat_parser.iter_dat)
+    '''
+
+    def __init__(self, outinp):
+        super(InpStreamWriter, self).__init__()
+        self.f0 = open(outinp, 'w')
+        self.f0.write(inp_header(outinp))
+        self.cur_block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_nodes(self, node_ids, coords):
+        if self.cur_block != 'NODE':
+            self.f0.write('*NODE\n')
+            self.cur_block = 'NODE'
+        self.f0.write(''.join([inp_node_line(node_id, node_coords) for node_id, node_coords in zip(node_ids, coords)]))
+
+    def write_elems(self, elem_type, elem_ids, elem_nodes):
+        abaqus_elem_type = abaqus_elem_types_[elem_type]
+        if self.cur_block != abaqus_elem_type:
+            self.f0.write('*ELEMENT, TYPE={0}\n'.format(abaqus_elem_type))
+            self.cur_block = abaqus_elem_type
+        self.f0.write(''.join([get_inp_elem_line(elem_type, elem_id, nodes)
+                               for elem_id, nodes in zip(elem_ids, elem_nodes)]))
+
+    def write_group(self, gr_name, group):
+        self.cur_block = 'SET'
+        for ent_type, entities in group.items():
+            self.f0.write(inp_group_lines(gr_name, ent_type, entities))
+
+    def write_section(self, section):
+        if section[0] == 'nodes':
+            self.write_nodes(*section[1:])
+        elif section[0] == 'elems':
+            self.write_elems(*section[1:])
+        elif section[0] == 'group':
+            self.write_group(*section[1:])
+
+    def close(self):
+        if not self.f0.closed:
+            self.f0.close()
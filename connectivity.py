@@ -0,0 +1,211 @@
+'''
+Module with the inverse connectivity of array-backed meshes.
+Elements of all the blocks are numbered by rows, in the order
+of mesh.elem_blocks. CSR arrays (offsets + indices) give the
+node rows of each element, the element rows of each node and,
+built on demand, the neighbours of each element (elements
+sharing a node or a face). Mesh.connectivity() keeps one
+Connectivity per mesh, so operations share it
+'''
+
+
+import numpy as np
+
+from .mesh import IdIndex, id_dtype
+from .groups import sorted_unique, sorted_contains
+from .skin import corner_faces, sorted_columns, sorted_faces
+
+
+# sides shared by neighbour elements: faces of volume elements, edges of shells
+corner_sides = dict(corner_faces)
+corner_sides.update({'tria': ((0, 1), (1, 2), (2, 0)),
+                     'quad': ((0, 1), (1, 2), (2, 3), (3, 0)),
+                     'bar': ((0,), (1,))})
+
+adjacency_kinds = ('node', 'face')
+
+# neighbour pairs expanded at a time when building the node adjacency
+pairs_chunk_size = 2 ** 24
+
+
+def concat_ranges(starts, counts):
+    # concatenation of the ranges [start, start + count)
+    shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return shifts + np.arange(counts.sum(), dtype=np.int64)
+
+
+def csr_rows(ptr, indices, rows):
+    # indices of the rows of a CSR, one after the other
+    counts = ptr[rows + 1] - ptr[rows]
+    return indices[concat_ranges(ptr[rows], counts)], counts
+
+
+def csr_from_pairs(n_rows, rows, indices, is_sorted=False):
+    # (ptr, indices) CSR of (row, index) pairs, indices of a row in no particular order unless is_sorted
+    ptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=ptr[1:])
+    return ptr, indices if is_sorted else indices[np.argsort(rows)]
+
+
+class Connectivity(object):
+    '''
+    Element <-> node CSR index of a Mesh. elem_ptr / elem_nodes give
+    the node rows of each element row, node_ptr / node_elems the element
+    rows of each node row. elem_ids are the ids of the element rows
+    '''
+
+    def __init__(self, mesh):
+        super(Connectivity, self).__init__()
+        self.blocks = list(mesh.elem_blocks.items())
+        self.node_index = mesh.node_index
+        self.elem_types = [elem_type for elem_type, _ in self.blocks]
+        sizes = [len(block) for _, block in self.blocks]
+        self.type_starts = np.cumsum([0] + sizes)
+        self.elem_ids = np.concatenate([block.ids for _, block in self.blocks] + [np.zeros(0, dtype=id_dtype)])
+        counts = np.repeat([block.conn.shape[1] for _, block in self.blocks], sizes).astype(np.int64)
+        self.elem_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.elem_ptr[1:])
+        self.elem_nodes = np.concatenate([self.node_index.rows(block.conn.ravel(), strict=True)
+                                          for _, block in self.blocks] + [np.zeros(0, dtype=id_dtype)])
+        elem_rows = np.repeat(np.arange(self.n_elems, dtype=np.int64), counts)
+        self.node_ptr, self.node_elems = csr_from_pairs(self.n_nodes, self.elem_nodes, elem_rows)
+        self._elem_order = None
+        self._elem_index = None
+        self._adjacency = {}
+
+    @property
+    def n_nodes(self):
+        return len(self.node_index)
+
+    @property
+    def n_elems(self):
+        return len(self.elem_ids)
+
+    def is_current(self, mesh):
+        # False once the nodes or the blocks of mesh were replaced
+        return (mesh.node_index is self.node_index and len(mesh.elem_blocks) == len(self.blocks)
+                and all([mesh.elem_blocks.get(elem_type) is block for elem_type, block in self.blocks]))
+
+    def elem_rows(self, elem_ids, strict=False):
+        # rows of elem_ids, -1 for unknown ids (KeyError with strict)
+        if self._elem_index is None:
+            self._elem_order = np.argsort(self.elem_ids, kind='stable')
+            self._elem_index = IdIndex(self.elem_ids[self._elem_order])
+        rows = self._elem_index.rows(elem_ids, strict)
+        return np.where(rows >= 0, self._elem_order[rows], -1)
+
+    def node_degrees(self):
+        # number of elements of each node row
+        return np.diff(self.node_ptr)
+
+    def elems_of_nodes(self, node_ids):
+        # sorted ids of the elements with at least one of the nodes
+        rows = self.node_index.rows(node_ids)
+        elem_rows, _ = csr_rows(self.node_ptr, self.node_elems, rows[rows >= 0])
+        return sorted_unique(self.elem_ids[elem_rows])
+
+    def elems_in_nodes(self, node_ids):
+        # sorted ids of the elements with all their nodes in node_ids (elements of a node group)
+        rows = self.node_index.rows(node_ids)
+        rows = rows[rows >= 0]
+        in_nodes = np.zeros(self.n_nodes, dtype=bool)
+        in_nodes[rows] = True
+        elem_rows = sorted_unique(csr_rows(self.node_ptr, self.node_elems, rows)[0])
+        if not len(elem_rows):
+            return self.elem_ids[:0]
+        node_rows, counts = csr_rows(self.elem_ptr, self.elem_nodes, elem_rows)
+        inside = np.logical_and.reduceat(in_nodes[node_rows], np.cumsum(counts) - counts)
+        return np.sort(self.elem_ids[elem_rows[inside]])
+
+    def nodes_of_elems(self, elem_ids):
+        # sorted ids of the nodes of the elements
+        rows = self.elem_rows(elem_ids)
+        node_rows, _ = csr_rows(self.elem_ptr, self.elem_nodes, rows[rows >= 0])
+        return self.node_index.ids[sorted_unique(node_rows)]
+
+    def nodal_average(self, field):
+        '''
+        Field of element values (Field or {elem_id: value}) averaged at the
+        nodes of the elements, each element of a node weighing the same
+        '''
+        from .fields import Field
+        field = Field.from_dict(field)
+        rows = self.elem_rows(field.ids)
+        found = rows >= 0
+        node_rows, counts = csr_rows(self.elem_ptr, self.elem_nodes, rows[found])
+        values = field.values[found]
+        weights = np.bincount(node_rows, minlength=self.n_nodes)
+        sums = np.stack([np.bincount(node_rows, np.repeat(values[:, i], counts), minlength=self.n_nodes)
+                         for i in range(field.ncomp)], axis=1)
+        touched = weights > 0
+        return Field(self.node_index.ids[touched], sums[touched] / weights[touched, None], field.kind,
+                     check_order=False)
+
+    def adjacency(self, kind='face'):
+        '''
+        (ptr, elem_rows) CSR of the neighbours of each element row: the
+        elements sharing a node ('node') or a side ('face': faces of volume
+        elements, edges of shells, end nodes of bars)
+        '''
+        if kind not in adjacency_kinds:
+            raise ValueError('Unknown adjacency {0}'.format(kind))
+        if kind not in self._adjacency:
+            pairs = self.node_pairs() if kind == 'node' else self.side_pairs()
+            self._adjacency[kind] = csr_from_pairs(self.n_elems, *pairs, is_sorted=True)
+        return self._adjacency[kind]
+
+    def neighbours(self, elem_ids, kind='face'):
+        # sorted ids of the neighbours of the elements, the elements excluded
+        rows = self.elem_rows(elem_ids)
+        rows = sorted_unique(rows[rows >= 0])
+        ptr, adjacent_rows = self.adjacency(kind)
+        neighbour_rows = sorted_unique(csr_rows(ptr, adjacent_rows, rows)[0])
+        neighbour_rows = neighbour_rows[~sorted_contains(rows, neighbour_rows)]
+        return np.sort(self.elem_ids[neighbour_rows])
+
+    def node_pairs(self):
+        # (elem row, neighbour row) pairs of the elements sharing a node, sorted, by chunks of elements
+        degrees = self.node_degrees()
+        elem_pairs = np.add.reduceat(degrees[self.elem_nodes], self.elem_ptr[:-1]) if self.n_elems else degrees[:0]
+        chunk_ends = np.searchsorted(np.cumsum(elem_pairs), np.arange(1, 1 + elem_pairs.sum() // pairs_chunk_size)
+                                     * pairs_chunk_size)
+        bounds = sorted_unique(np.concatenate([[0], chunk_ends, [self.n_elems]]))
+        sources, targets = [], []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            node_rows, counts = csr_rows(self.elem_ptr, self.elem_nodes, np.arange(start, end))
+            elem_rows = np.repeat(np.arange(start, end), counts)
+            neighbour_rows, counts = csr_rows(self.node_ptr, self.node_elems, node_rows)
+            elem_rows = np.repeat(elem_rows, counts)
+            keys = sorted_unique(elem_rows[neighbour_rows != elem_rows] * self.n_elems
+                                 + neighbour_rows[neighbour_rows != elem_rows])
+            sources.append(keys // self.n_elems)
+            targets.append(keys % self.n_elems)
+        if not sources:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(sources), np.concatenate(targets)
+
+    def side_pairs(self):
+        # (elem row, neighbour row) pairs of the elements sharing a side, both ways, sorted
+        chunks = {}
+        for (elem_type, block), start in zip(self.blocks, self.type_starts):
+            sides = corner_sides.get(elem_type.rstrip('2'))
+            if sides is None or not len(block):
+                continue
+            rows = self.elem_nodes[self.elem_ptr[start]:self.elem_ptr[start + len(block)]].reshape(block.conn.shape)
+            for corners in sides:
+                chunks.setdefault(len(corners), []).append((start + np.arange(len(block)), rows[:, list(corners)]))
+        sources, targets = [], []
+        for n_corners, side_chunks in chunks.items():
+            elem_rows = np.concatenate([chunk[0] for chunk in side_chunks])
+            columns = [np.concatenate([chunk[1][:, i] for chunk in side_chunks]) for i in range(n_corners)]
+            if n_corners > 1:
+                columns = sorted_columns(columns)
+            # a side of more than two elements links them one after the other
+            order, same = sorted_faces(columns, self.n_nodes)
+            first, second = elem_rows[order[:-1][same]], elem_rows[order[1:][same]]
+            sources.extend([first, second])
+            targets.extend([second, first])
+        if not sources:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        keys = sorted_unique(np.concatenate(sources) * self.n_elems + np.concatenate(targets))
+        return keys // self.n_elems, keys % self.n_elems
@@ -0,0 +1,160 @@
+'''
+Module with functions for parsing (reading and writing)
+of native binary mesh/field files .femb
+
+File layout (little-endian):
+    0   4 bytes   magic b'FEMB'
+    4   uint32    format version
+    8   uint64    size of the table of contents in bytes
+    16  utf8 JSON table of contents, padded with spaces
+        so that the first array starts on a 64 bytes boundary
+    ... arrays, each one starting on a 64 bytes boundary
+
+Table of contents:
+    {"nodes": {"ids": A, "coords": A},
+     "elems": [[elem_type, {"ids": A, "conn": A}], ...],
+     "groups": [[group_name, {ent_type: A, ...}], ...],
+     "fields": [[field_name, {"kind": kind, "ids": A, "values": A}], ...]}
+where each array A is {"offset": int, "dtype": str, "shape": [int, ...]}
+with offset counted from the beginning of the file.
+Node, element, group and field ids are stored sorted, so the
+arrays are used directly as memory-mapped zero-copy views
+'''
+
+
+import json
+import struct
+
+import numpy as np
+
+from .mesh import Mesh, ElemBlock, id_dtype, coord_dtype
+from .groups import sorted_unique
+from .fields import Field
+
+
+femb_magic = b'FEMB'
+femb_version = 1
+femb_alignment = 64
+femb_header = struct.Struct('<4sIQ')
+
+# placeholder wide enough for any real offset while sizing the table of contents
+offset_placeholder = 10 ** 18
+
+
+def align(offset, alignment=femb_alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class FembArrays(object):
+    '''
+    Arrays to be written with their table of contents entries
+    '''
+
+    def __init__(self):
+        super(FembArrays, self).__init__()
+        self.entries = []
+
+    def add(self, array, dtype):
+        array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+        entry = {'offset': offset_placeholder, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        self.entries.append((entry, array))
+        return entry
+
+
+def write_femb(outfemb, mesh_dict, field_dict=None, write_nodes=True, write_elems=True, write_groups=True):
+    mesh = Mesh.from_dict(mesh_dict)
+    arrays = FembArrays()
+    toc = {'nodes': {}, 'elems': [], 'groups': [], 'fields': []}
+    if write_nodes:
+        toc['nodes'] = {'ids': arrays.add(mesh.node_ids, id_dtype),
+                        'coords': arrays.add(mesh.coords, coord_dtype)}
+    if write_elems:
+        for elem_type, block in mesh.elem_blocks.items():
+            toc['elems'].append([elem_type, {'ids': arrays.add(block.ids, id_dtype),
+                                             'conn': arrays.add(block.conn, id_dtype)}])
+    if write_groups:
+        for gr_name, group in mesh.group_arrays.items():
+            # group ids are in file order
+            group = {ent_type: sorted_unique(np.asarray(ids, dtype=id_dtype)) for ent_type, ids in group.items()}
+            toc['groups'].append([gr_name, {ent_type: arrays.add(ids, id_dtype) for ent_type, ids in group.items()}])
+    if field_dict:
+        for field_name, field in field_dict.items():
+            field = Field.from_dict(field)
+            toc['fields'].append([str(field_name), {'kind': field.kind,
+                                                    'ids': arrays.add(field.ids, id_dtype),
+                                                    'values': arrays.add(field.values, field.values.dtype)}])
+    with open(outfemb, 'wb') as f0:
+        for chunk in femb_chunks(toc, arrays):
+            f0.write(chunk)
+
+
+def femb_chunks(toc, arrays, magic=femb_magic, version=femb_version):
+    # bytes of the header, the table of contents and the arrays (FembArrays) of toc, in the .femb layout
+    toc_size = align(femb_header.size + len(json.dumps(toc).encode('utf8'))) - femb_header.size
+    offset = femb_header.size + toc_size
+    for entry, array in arrays.entries:
+        entry['offset'] = offset
+        offset = align(offset + array.nbytes)
+    yield femb_header.pack(magic, version, toc_size)
+    yield json.dumps(toc).encode('utf8').ljust(toc_size)
+    offset = femb_header.size + toc_size
+    for entry, array in arrays.entries:
+        yield b'\0' * (entry['offset'] - offset)
+        yield memoryview(array).cast('B')
+        offset = entry['offset'] + array.nbytes
+
+
+def read_femb_toc(femb_file):
+    with open(femb_file, 'rb') as f0:
+        header = f0.read(femb_header.size)
+        if len(header) < femb_header.size:
+            raise ValueError('{0} is not a .femb file'.format(femb_file))
+        magic, version, toc_size = femb_header.unpack(header)
+        if magic != femb_magic:
+            raise ValueError('{0} is not a .femb file'.format(femb_file))
+        if version > femb_version:
+            raise ValueError('Unsupported .femb version {0} in {1}'.format(version, femb_file))
+        return json.loads(f0.read(toc_size).decode('utf8'))
+
+
+def femb_array(buffer, entry):
+    dtype = np.dtype(entry['dtype'])
+    shape = tuple(entry['shape'])
+    count = int(np.prod(shape, dtype=np.int64))
+    start = entry['offset']
+    return buffer[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+
+
+def read_femb(femb_file, read_nodes=True, read_elems=True, read_groups=True, read_fields=False, mmap=True):
+    toc = read_femb_toc(femb_file)
+    if mmap:
+        buffer = np.memmap(femb_file, dtype=np.uint8, mode='r')
+    else:
+        buffer = np.fromfile(femb_file, dtype=np.uint8)
+    array = lambda entry: femb_array(buffer, entry)
+    if read_nodes and toc['nodes']:
+        node_ids = array(toc['nodes']['ids'])
+        coords = array(toc['nodes']['coords'])
+    else:
+        node_ids = np.zeros(0, dtype=id_dtype)
+        coords = np.zeros((0, 3), dtype=coord_dtype)
+    elem_blocks = {}
+    if read_elems:
+        for elem_type, entries in toc['elems']:
+            elem_blocks[elem_type] = ElemBlock(array(entries['ids']), array(entries['conn']), check_order=False)
+    group_arrays = {}
+    if read_groups:
+        for gr_name, entries in toc['groups']:
+            group_arrays[gr_name] = {ent_type: array(entry) for ent_type, entry in entries.items()}
+    mesh = Mesh(node_ids, coords, elem_blocks, group_arrays, check_order=False)
+    if read_fields:
+        field_dict = {}
+        for field_name, entries in toc['fields']:
+            field_dict[field_name] = Field(array(entries['ids']), array(entries['values']),
+                                           kind=entries['kind'], check_order=False)
+        return mesh, field_dict
+    return mesh
+
+
+def read_femb_field_names(femb_file):
+    return [field_name for field_name, _ in read_femb_toc(femb_file)['fields']]
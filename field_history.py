@@ -0,0 +1,290 @@
+'''
+Module with on-disk history of a field over the steps of
+a computation (stepNNN folders of XFEM runs). The values
+of all steps are stored in one steps x entities x
+components array, which is memory-mapped on read, so
+reductions over the steps (max, min, range, step of the
+max) stream over the steps without loading them all
+
+File layout (little-endian):
+    0   4 bytes   magic b'FEMH'
+    4   uint32    format version
+    8   uint64    offset of the table of contents
+    16  uint64    size of the table of contents in bytes
+    64  ids array, then the values array, step after step
+    ... utf8 JSON table of contents
+
+Table of contents:
+    {"name": str, "kind": kind, "steps": [step, ...],
+     "ids": A, "values": A}
+with A as in .femb files. Entities missing in a step are NaN
+'''
+
+
+import os
+import re
+import json
+import struct
+
+import numpy as np
+
+from .mesh import IdIndex, id_dtype
+from .fields import Field, von_mises
+from .femb_binary_parser import align, femb_array
+
+
+history_magic = b'FEMH'
+history_version = 1
+history_header = struct.Struct('<4sIQQ')
+history_extension = '.femh'
+
+# bytes of values read at once by the reductions
+default_block_size = 64 * 1024 ** 2
+
+
+class FieldHistoryWriter(object):
+    '''
+    Writes the steps one after the other, only one step is kept
+    in memory. Entity ids are the ones of the first step unless given
+    '''
+
+    def __init__(self, history_file, name='', ids=None, dtype='float32'):
+        super(FieldHistoryWriter, self).__init__()
+        self.history_file = history_file
+        self.name = name
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.ids = None if ids is None else np.sort(np.asarray(ids, dtype=id_dtype))
+        self.index = None
+        self.kind = None
+        self.ncomp = None
+        self.steps = []
+        self.toc = None
+        self.f0 = open(history_file, 'wb')
+        self.f0.write(history_header.pack(history_magic, history_version, 0, 0))
+
+    def start(self, field):
+        if self.ids is None:
+            self.ids = field.ids.astype(id_dtype)
+        self.index = IdIndex(self.ids)
+        self.kind = field.kind
+        self.ncomp = field.ncomp
+        ids = np.ascontiguousarray(self.ids, dtype=np.dtype(id_dtype).newbyteorder('<'))
+        self.f0.write(b'\0' * (align(self.f0.tell()) - self.f0.tell()))
+        self.toc = {'name': self.name, 'kind': self.kind, 'steps': self.steps,
+                    'ids': {'offset': self.f0.tell(), 'dtype': ids.dtype.str, 'shape': list(ids.shape)}}
+        self.f0.write(memoryview(ids).cast('B'))
+        self.f0.write(b'\0' * (align(self.f0.tell()) - self.f0.tell()))
+        self.toc['values'] = {'offset': self.f0.tell(), 'dtype': self.dtype.str, 'shape': [0, len(self.ids), self.ncomp]}
+
+    def add(self, step, field):
+        field = Field.from_dict(field)
+        if self.index is None:
+            self.start(field)
+        if field.ncomp != self.ncomp:
+            raise ValueError('Step {0} has {1} components instead of {2}'.format(step, field.ncomp, self.ncomp))
+        if len(field.ids) == len(self.ids) and (field.ids == self.ids).all():
+            values = field.values
+        else:
+            rows = self.index.rows(field.ids)
+            found = rows >= 0
+            if not found.all():
+                print('{0} entités du pas {1} ne sont pas dans l\'historique.'.format((~found).sum(), step))
+            values = np.full((len(self.ids), self.ncomp), np.nan)
+            values[rows[found]] = field.values[found]
+        self.f0.write(memoryview(np.ascontiguousarray(values, dtype=self.dtype)).cast('B'))
+        self.steps.append(step)
+
+    def close(self):
+        if self.f0.closed:
+            return
+        if self.toc is None:
+            self.toc = {'name': self.name, 'kind': None, 'steps': [], 'ids': None, 'values': None}
+        else:
+            self.toc['values']['shape'][0] = len(self.steps)
+        toc_offset = self.f0.tell()
+        toc_bytes = json.dumps(self.toc).encode('utf8')
+        self.f0.write(toc_bytes)
+        self.f0.seek(0)
+        self.f0.write(history_header.pack(history_magic, history_version, toc_offset, len(toc_bytes)))
+        self.f0.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_history_toc(history_file):
+    with open(history_file, 'rb') as f0:
+        header = f0.read(history_header.size)
+        if len(header) < history_header.size:
+            raise ValueError('{0} is not a field history file'.format(history_file))
+        magic, version, toc_offset, toc_size = history_header.unpack(header)
+        if magic != history_magic or not toc_offset:
+            raise ValueError('{0} is not a field history file'.format(history_file))
+        if version > history_version:
+            raise ValueError('Unsupported field history version {0} in {1}'.format(version, history_file))
+        f0.seek(toc_offset)
+        return json.loads(f0.read(toc_size).decode('utf8'))
+
+
+class FieldHistory(object):
+    '''
+    Memory-mapped history. values[i] are the values of steps[i],
+    quantities of the reductions are None (scalar fields), a
+    component index, 'magnitude', 'von_mises' or a function of
+    (n_steps, n_entities, ncomp) values giving (n_steps, n_entities)
+    '''
+
+    def __init__(self, history_file):
+        super(FieldHistory, self).__init__()
+        self.history_file = history_file
+        toc = read_history_toc(history_file)
+        self.name = toc['name']
+        self.kind = toc['kind']
+        self.steps = toc['steps']
+        buffer = np.memmap(history_file, dtype=np.uint8, mode='r')
+        if toc['values'] is None:
+            self.index = IdIndex(np.zeros(0, dtype=id_dtype))
+            self.values = np.zeros((0, 0, 1))
+        else:
+            self.index = IdIndex(femb_array(buffer, toc['ids']))
+            self.values = femb_array(buffer, toc['values'])
+        self._step_rows = {step: i for i, step in enumerate(self.steps)}
+
+    @property
+    def ids(self):
+        return self.index.ids
+
+    @property
+    def ncomp(self):
+        return self.values.shape[2]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __repr__(self):
+        return '<FieldHistory {0} {1} steps x {2} x {3} {4}>'.format(self.kind, len(self), len(self.ids),
+                                                                    self.ncomp, self.values.dtype)
+
+    def field(self, step):
+        return Field(self.ids, self.values[self._step_rows[step]], self.kind, check_order=False)
+
+    def entity_history(self, ids):
+        # (n_steps, len(ids), ncomp) values of some entities
+        return np.asarray(self.values[:, self.index.rows(ids, strict=True)])
+
+    def quantity_values(self, values, quantity):
+        if quantity is None:
+            if values.shape[2] != 1:
+                raise ValueError('A quantity is needed for {0} fields'.format(self.kind))
+            return values[:, :, 0]
+        if quantity == 'von_mises':
+            return von_mises(values)
+        if quantity == 'magnitude':
+            return np.sqrt((values ** 2).sum(2))
+        if callable(quantity):
+            return quantity(values)
+        return values[:, :, quantity]
+
+    def step_blocks(self, steps=None):
+        # (step rows, values) of a few steps at a time
+        rows = np.arange(len(self)) if steps is None else np.array([self._step_rows[step] for step in steps])
+        step_bytes = max(self.values[0].nbytes if len(self) else 1, 1)
+        n_rows = max(1, default_block_size // step_bytes)
+        for start in range(0, len(rows), n_rows):
+            block_rows = rows[start:start + n_rows]
+            if len(block_rows) > 1 and (np.diff(block_rows) == 1).all():
+                values = self.values[block_rows[0]:block_rows[-1] + 1]
+            else:
+                values = self.values[block_rows]
+            yield block_rows, np.asarray(values, dtype=np.float64)
+
+    def reduce(self, quantity=None, steps=None):
+        '''
+        Streams over the steps, returns (min, max, step row of min,
+        step row of max) arrays for each entity. NaN values (entities
+        missing in a step) are skipped
+        '''
+        n = len(self.ids)
+        low, high = np.full(n, np.inf), np.full(n, -np.inf)
+        low_rows, high_rows = np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64)
+        for block_rows, values in self.step_blocks(steps):
+            block = self.quantity_values(values, quantity)
+            for row, step_values in zip(block_rows, block):
+                lower = step_values < low
+                higher = step_values > high
+                low[lower], low_rows[lower] = step_values[lower], row
+                high[higher], high_rows[higher] = step_values[higher], row
+        empty = high_rows < 0
+        low[empty] = high[empty] = np.nan
+        return low, high, low_rows, high_rows
+
+    def scalar_field(self, values):
+        return Field(self.ids, values, 'scalar', check_order=False)
+
+    def max(self, quantity=None, steps=None):
+        return self.scalar_field(self.reduce(quantity, steps)[1])
+
+    def min(self, quantity=None, steps=None):
+        return self.scalar_field(self.reduce(quantity, steps)[0])
+
+    def range(self, quantity=None, steps=None):
+        low, high, _, _ = self.reduce(quantity, steps)
+        return self.scalar_field(high - low)
+
+    def argmax_step(self, quantity=None, steps=None):
+        # step of the max of each entity (None when the entity is missing in all steps)
+        high_rows = self.reduce(quantity, steps)[3]
+        return dict(zip(self.ids.tolist(), [self.steps[row] if row >= 0 else None for row in high_rows.tolist()]))
+
+    def argmin_step(self, quantity=None, steps=None):
+        low_rows = self.reduce(quantity, steps)[2]
+        return dict(zip(self.ids.tolist(), [self.steps[row] if row >= 0 else None for row in low_rows.tolist()]))
+
+
+def find_step_files(root_dir, file_name):
+    '''
+    [(step, path)] of the file_name files of the stepNNN folders
+    of root_dir, sorted by step number
+    '''
+    step_files = []
+    for dir_name in os.listdir(root_dir):
+        match = re.match(r'step(\d+)$', dir_name)
+        path = os.path.join(root_dir, dir_name, file_name)
+        if match and os.path.isfile(path):
+            step_files.append((int(match.group(1)), path))
+    return sorted(step_files)
+
+
+def step_field(field_dict, case, path):
+    # field of the case of a step file, the only field of the file when case is None
+    if case is None:
+        if len(field_dict) != 1:
+            raise ValueError('{0} holds {1} fields, a case is needed'.format(path, len(field_dict)))
+        case = list(field_dict.keys())[0]
+    elif case not in field_dict:
+        raise KeyError('No case {0} in {1}'.format(case, path))
+    return field_dict[case]
+
+
+def build_field_history(history_file, step_files, name=None, dtype='float32', sym_tensor=False, ids=None,
+                        prefetch=1, case=None):
+    '''
+    Consolidates the field files [(step, path)] (see find_step_files)
+    in history_file, reading one step at a time. The next prefetch
+    files are read ahead, each one held in memory until it is parsed.
+    case is the key of the field in step files holding several fields
+    (rpt cases, femb field names)
+    '''
+    from . import FieldReader
+    from .file_io import Prefetcher
+    reader = FieldReader()
+    name = name if name is not None else os.path.basename(step_files[0][1]) if step_files else ''
+    prefetcher = Prefetcher([path for _, path in step_files], depth=prefetch)
+    with FieldHistoryWriter(history_file, name, ids, dtype) as writer, prefetcher:
+        for step, path in step_files:
+            field_dict = reader.read_field_file(path, as_field=True, dtype=dtype, sym_tensor=sym_tensor)
+            writer.add(step, step_field(field_dict, case, path))
+    return FieldHistory(history_file)
@@ -0,0 +1,157 @@
+'''
+Module for mapping the fields of .pos files back onto the
+solver mesh they were computed on. Pos files number their
+nodes from 1 in element order, so each pos node is matched
+to the closest mesh node within a tolerance (spatial index
+on the mesh nodes). Values of the pos nodes of one mesh node
+are averaged. Mappings are kept by PosFieldMapper for each
+pos geometry, so the steps of a run are matched only once
+'''
+
+
+import hashlib
+
+import numpy as np
+
+from .mesh import Mesh, IdIndex
+from .fields import Field
+from .gmsh_pos_parser import iter_pos
+
+
+default_relative_tolerance = 1e-6
+
+
+class PosNodeMap(object):
+    '''
+    Mesh node row of each pos node (-1 when no mesh node is within the
+    tolerance), pos nodes being given by their ids
+    '''
+
+    def __init__(self, pos_ids, mesh_rows, distances):
+        super(PosNodeMap, self).__init__()
+        self.pos_index = IdIndex(pos_ids)
+        self.mesh_rows = mesh_rows
+        self.distances = distances
+
+    @property
+    def n_unmatched(self):
+        return int((self.mesh_rows < 0).sum())
+
+    def rows(self, pos_ids):
+        # mesh rows of pos ids, -1 for unknown or unmatched pos nodes
+        pos_rows = self.pos_index.rows(pos_ids)
+        return np.where(pos_rows >= 0, self.mesh_rows[pos_rows], -1)
+
+
+def read_pos_nodes(pos_file, chunk_size=100000):
+    # (node ids, coords, digest of the coords) of a pos file
+    digest = hashlib.blake2b(digest_size=16)
+    node_ids, coords = [], []
+    for _, ids, xyz in iter_pos(pos_file, read_elems=False, read_fields=False, chunk_size=chunk_size,
+                                as_arrays=True):
+        node_ids.append(ids)
+        coords.append(xyz)
+        digest.update(np.ascontiguousarray(ids).tobytes())
+        digest.update(np.ascontiguousarray(xyz).tobytes())
+    if not node_ids:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 3)), digest.hexdigest()
+    return np.concatenate(node_ids), np.concatenate(coords), digest.hexdigest()
+
+
+class FieldAccumulator(object):
+    # sums and counts of values on the mesh node rows
+
+    def __init__(self, mesh, kind):
+        super(FieldAccumulator, self).__init__()
+        self.mesh = mesh
+        self.kind = kind
+        self.sums = None
+        self.counts = np.zeros(mesh.n_nodes, dtype=np.int64)
+
+    def add(self, mesh_rows, values):
+        matched = mesh_rows >= 0
+        mesh_rows, values = mesh_rows[matched], values[matched]
+        if self.sums is None:
+            self.sums = np.zeros((self.mesh.n_nodes, values.shape[1]))
+        self.counts += np.bincount(mesh_rows, minlength=self.mesh.n_nodes)
+        for i in range(values.shape[1]):
+            self.sums[:, i] += np.bincount(mesh_rows, values[:, i], minlength=self.mesh.n_nodes)
+
+    def field(self):
+        if self.sums is None:
+            return Field(np.zeros(0, dtype=np.int64), np.zeros((0, 1)), self.kind)
+        found = self.counts > 0
+        return Field(self.mesh.node_ids[found], self.sums[found] / self.counts[found, None], self.kind,
+                     check_order=False)
+
+
+class PosFieldMapper(object):
+    '''
+    Maps pos fields onto the nodes of mesh (mesh dict or Mesh), or of
+    its node_ids only. tolerance is the largest distance between a pos
+    node and its mesh node, by default default_relative_tolerance of
+    the mesh bounding box diagonal. One PosNodeMap is kept for each pos
+    geometry (node ids and coords), so pos files of the steps of a run
+    reuse the mapping of the first one
+    '''
+
+    def __init__(self, mesh, tolerance=None, node_ids=None):
+        super(PosFieldMapper, self).__init__()
+        from .spatial_index import SpatialIndex
+        self.mesh = Mesh.from_dict(mesh)
+        self.index = SpatialIndex.from_mesh(self.mesh, node_ids)
+        if tolerance is None:
+            coords = self.mesh.coords
+            diagonal = np.sqrt(((coords.max(0) - coords.min(0)) ** 2).sum()) if len(coords) else 0.0
+            tolerance = default_relative_tolerance * diagonal
+        self.tolerance = tolerance
+        self.node_maps = {}
+
+    def node_map(self, pos_file):
+        # PosNodeMap of pos_file, computed once for each pos geometry
+        pos_ids, coords, digest = read_pos_nodes(pos_file)
+        if digest not in self.node_maps:
+            node_ids, distances = self.index.nearest(coords, self.tolerance)
+            mesh_rows = np.where(node_ids >= 0, self.mesh.node_index.rows(node_ids), -1)
+            node_map = PosNodeMap(pos_ids, mesh_rows, distances)
+            if node_map.n_unmatched:
+                print('{0} noeuds du fichier {1} n’ont pas de noeud du maillage à moins de {2:g}.'.format(
+                    node_map.n_unmatched, pos_file, self.tolerance))
+            self.node_maps[digest] = node_map
+        return self.node_maps[digest]
+
+    def map_field(self, field, node_map):
+        '''
+        Field (Field or {pos node id: value}) on the mesh node ids, the
+        values of the pos nodes of a mesh node being averaged
+        '''
+        field = Field.from_dict(field)
+        accumulator = FieldAccumulator(self.mesh, field.kind)
+        accumulator.add(node_map.rows(field.ids), field.values)
+        return accumulator.field()
+
+    def map_pos_file(self, pos_file, field_types=None, chunk_size=100000, dtype='float64', sym_tensor=False):
+        '''
+        {field_type: Field on the mesh node ids} of the fields of pos_file
+        (field_types only), read chunk_size elements at a time
+        '''
+        node_map = self.node_map(pos_file)
+        accumulators = {}
+        for _, field_type, pos_ids, values in iter_pos(pos_file, read_nodes=False, read_elems=False,
+                                                       chunk_size=chunk_size, dtype=dtype, sym_tensor=sym_tensor):
+            if field_types is not None and field_type not in field_types:
+                continue
+            if field_type not in accumulators:
+                accumulators[field_type] = FieldAccumulator(self.mesh, field_type)
+            accumulators[field_type].add(node_map.rows(pos_ids), values)
+        return {field_type: accumulator.field() for field_type, accumulator in accumulators.items()}
+
+
+def map_pos_files(mesh, pos_files, tolerance=None, field_types=None, **map_args):
+    '''
+    Yields (pos_file, {field_type: Field on the mesh node ids}) for the
+    pos files (steps of a run), matched with one PosFieldMapper
+    '''
+    mapper = PosFieldMapper(mesh, tolerance)
+    for pos_file in pos_files:
+        yield pos_file, mapper.map_pos_file(pos_file, field_types, **map_args)
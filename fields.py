@@ -0,0 +1,137 @@
+'''
+Module with array-backed field container.
+Field keeps entity ids and an (n, ncomp) array of values
+and behaves like the {entity_id: value} dicts returned
+by the field readers of this package
+'''
+
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from .mesh import IdIndex, id_dtype
+
+
+field_kinds = {1: 'scalar',
+               3: 'vector',
+               6: 'tensor',
+               9: 'tensor'}
+
+# xx, yy, zz, xy, yz, xz components of a full (row-major) tensor
+sym_tensor_columns = [0, 4, 8, 1, 5, 2]
+
+
+def compact_values(values, dtype=np.float64, sym_tensor=False):
+    # (n, ncomp) values in dtype, full tensors reduced to their 6 symmetric components
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    if sym_tensor and values.shape[1] == 9:
+        values = values[:, sym_tensor_columns]
+    return values.astype(dtype, copy=False)
+
+
+def von_mises(values):
+    # equivalent stress of (..., 6) symmetric (xx, yy, zz, xy, yz, xz) or (..., 9) full tensors
+    values = np.asarray(values)
+    if values.shape[-1] == 9:
+        values = values[..., sym_tensor_columns]
+    xx, yy, zz, xy, yz, xz = [values[..., i] for i in range(6)]
+    return np.sqrt(0.5 * ((xx - yy) ** 2 + (yy - zz) ** 2 + (zz - xx) ** 2) + 3.0 * (xy ** 2 + yz ** 2 + xz ** 2))
+
+
+class Field(Mapping):
+
+    def __init__(self, ids, values, kind=None, check_order=True):
+        super(Field, self).__init__()
+        ids = np.asarray(ids, dtype=id_dtype)
+        values = np.asarray(values)
+        if values.dtype.kind != 'f':
+            values = values.astype(np.float64)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        if check_order and len(ids) > 1 and (np.diff(ids) <= 0).any():
+            order = np.argsort(ids, kind='stable')
+            ids = ids[order]
+            values = values[order]
+        self.index = IdIndex(ids)
+        self.values = values
+        self.kind = kind or field_kinds.get(values.shape[1], 'scalar')
+
+    @classmethod
+    def from_dict(cls, field_dict, kind=None, dtype=np.float64, sym_tensor=False):
+        if isinstance(field_dict, Field):
+            return field_dict
+        ids = np.fromiter(field_dict.keys(), dtype=id_dtype, count=len(field_dict))
+        values = compact_values(np.array(list(field_dict.values()), dtype=dtype), dtype, sym_tensor)
+        return cls(ids, values, kind)
+
+    @classmethod
+    def from_rows(cls, ids, values, kind=None, dtype=np.float64, sym_tensor=False):
+        '''
+        Field of rows read in file order, the last row of an id
+        is kept as it would be in a dict
+        '''
+        ids = np.asarray(ids, dtype=id_dtype)
+        values = compact_values(values, dtype, sym_tensor)
+        if len(ids) > 1 and (np.diff(ids) <= 0).any():
+            order = np.argsort(ids, kind='stable')
+            ids = ids[order]
+            last = np.append(ids[1:] != ids[:-1], True)
+            ids = ids[last]
+            values = values[order][last]
+        return cls(ids, values, kind, check_order=False)
+
+    def to_dict(self):
+        return dict(self.items())
+
+    @property
+    def ids(self):
+        return self.index.ids
+
+    @property
+    def ncomp(self):
+        return self.values.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.values.nbytes
+
+    def values_at(self, ids):
+        return self.values[self.index.rows(ids, strict=True)]
+
+    def _pack(self, row):
+        if self.ncomp == 1:
+            return float(row[0])
+        return tuple(row.tolist())
+
+    def __getitem__(self, entity):
+        return self._pack(self.values[self.index.row(entity)])
+
+    def __contains__(self, entity):
+        return bool(self.index.contains([entity])[0])
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def items(self):
+        if self.ncomp == 1:
+            return zip(self.ids.tolist(), self.values[:, 0].tolist())
+        return zip(self.ids.tolist(), map(tuple, self.values.tolist()))
+
+    def __repr__(self):
+        return '<Field {0} {1}x{2} {3}>'.format(self.kind, len(self), self.ncomp, self.values.dtype)
+
+
+def concat_fields(fields):
+    # fields read one after the other, later values win as with dict.update
+    fields = list(fields)
+    if len(fields) == 1:
+        return fields[0]
+    ids = np.concatenate([field.ids for field in fields])
+    values = np.concatenate([field.values for field in fields])
+    return Field.from_rows(ids, values, fields[0].kind, values.dtype)
@@ -0,0 +1,452 @@
+'''
+Module for opening input files of result folders, often
+on network shares (SMB/NFS). Files are opened with large
+read-ahead buffers, and the files of a batch are prefetched
+in memory by background threads, a few files ahead of the
+one being parsed, so transfers overlap with parsing. Readers
+open their inputs with open_input, which serves prefetched
+files from memory
+
+Compressed inputs (gzip, bz2, xz) are recognized from their
+first bytes, whatever their name, and decompressed on the fly
+without temporary files. Files made of independent blocks
+(xz files written with several threads or with a block size,
+BGZF gzip files) are loaded in memory and their blocks are
+decompressed by several threads
+'''
+
+
+import io
+import os
+import time
+import struct
+import threading
+
+
+read_ahead_size = 8 * 1024 ** 2
+default_prefetch_depth = 4
+# bigger files are not prefetched, they are only read ahead when opened
+default_max_prefetch_size = 512 * 1024 ** 2
+
+compression_magics = [(b'\x1f\x8b', 'gzip'),
+                      (b'BZh', 'bz2'),
+                      (b'\xfd7zXZ\x00', 'xz')]
+compression_extensions = ['.gz', '.bz2', '.xz']
+
+# {absolute path: (prefetcher, index in its files, future of the content)}
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+_opener = open
+
+
+def file_key(path):
+    return os.path.abspath(path)
+
+
+def set_opener(opener=None):
+    '''
+    Replaces the function used to open files (open by default),
+    e.g. with a ThrottledOpener to stand in for a network share.
+    Returns the previous one
+    '''
+    global _opener
+    previous = _opener
+    _opener = opener or open
+    return previous
+
+
+def read_file(path):
+    # whole content of the file, read in large sequential chunks
+    chunks = []
+    with _opener(path, 'rb', buffering=0) as f0:
+        while True:
+            data = f0.read(read_ahead_size)
+            if not data:
+                break
+            chunks.append(data)
+    return b''.join(chunks)
+
+
+def prefetched_content(path):
+    with _prefetched_lock:
+        entry = _prefetched.get(file_key(path))
+    if entry is None:
+        return None
+    prefetcher, index, future = entry
+    prefetcher.advance(index)
+    try:
+        return future.result()
+    except OSError:
+        # the error is raised again by the normal open
+        return None
+
+
+def input_buffering(path):
+    # read-ahead buffer no larger than the file, the default buffer for small files
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return -1
+    return min(read_ahead_size, size) if size > io.DEFAULT_BUFFER_SIZE else -1
+
+
+def open_input(path, mode='r', encoding=None, errors=None):
+    '''
+    Same as open for reading, from memory when the file has been
+    prefetched, with a large read-ahead buffer otherwise. Compressed
+    files are decompressed
+    '''
+    content = prefetched_content(path)
+    if content is not None:
+        compression = compression_format(content[:6])
+        stream = io.BytesIO(decompress(content, compression) if compression else content)
+    else:
+        stream = _opener(path, 'rb', buffering=input_buffering(path))
+        compression = compression_format(stream.peek(6)[:6])
+        if compression:
+            stream = open_compressed(stream, compression)
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, errors=errors)
+
+
+# Compressed files
+
+
+def compression_format(head):
+    # 'gzip', 'bz2', 'xz' or None from the first bytes of a file
+    for magic, compression in compression_magics:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def file_compression(path):
+    with _opener(path, 'rb') as f0:
+        return compression_format(f0.read(6))
+
+
+def input_extension(path):
+    # extension of the file, without the one of the compression
+    root, extension = os.path.splitext(path)
+    if extension.lower() in compression_extensions:
+        extension = os.path.splitext(root)[-1]
+    return extension
+
+
+def open_compressed(raw, compression):
+    # decompressed stream of the open binary file raw
+    import gzip
+    import bz2
+    import lzma
+    if compression == 'bz2':
+        return DecompressedStream(bz2.BZ2File(raw), raw)
+    if compression == 'gzip' and not is_bgzf(raw.peek(18)[:18]):
+        return DecompressedStream(gzip.GzipFile(fileobj=raw), raw)
+    with raw:
+        data = raw.read()
+    if compression == 'xz' and len(xz_blocks(data)) < 2:
+        return DecompressedStream(lzma.LZMAFile(io.BytesIO(data)))
+    return io.BytesIO(decompress(data, compression))
+
+
+class DecompressedStream(io.BufferedReader):
+    '''
+    Buffered decompressed stream, closing the compressed file with it
+    '''
+
+    def __init__(self, decompressed, compressed=None):
+        super(DecompressedStream, self).__init__(decompressed, read_ahead_size)
+        self.compressed = compressed
+
+    def close(self):
+        try:
+            super(DecompressedStream, self).close()
+        finally:
+            if self.compressed is not None:
+                self.compressed.close()
+
+
+def decompress(data, compression, workers=None):
+    '''
+    Decompressed data, the independent blocks of the data
+    (see gzip_members, xz_blocks) are decompressed by workers threads
+    '''
+    import gzip
+    import bz2
+    if compression == 'bz2':
+        return bz2.decompress(data)
+    if compression == 'gzip':
+        blocks = gzip_members(data) if is_bgzf(data[:18]) else []
+        if len(blocks) < 2:
+            return gzip.decompress(data)
+    else:
+        blocks = xz_blocks(data)
+        if len(blocks) < 2:
+            import lzma
+            return lzma.decompress(data)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        return b''.join(executor.map(lambda block: block[0](*block[1:]), blocks))
+
+
+def is_bgzf(head):
+    # first gzip member with a BC extra subfield holding the member size
+    return (len(head) >= 18 and head[3] & 4 and struct.unpack('<H', head[10:12])[0] == 6
+            and head[12:14] == b'BC' and struct.unpack('<H', head[14:16])[0] == 2)
+
+
+def gzip_member(data):
+    import zlib
+    return zlib.decompress(data, 31)
+
+
+def gzip_members(data):
+    # [(gzip_member, member)] of a BGZF file
+    members = []
+    data = memoryview(data)
+    start = 0
+    while start < len(data):
+        if not is_bgzf(data[start:start + 18]):
+            return []
+        end = start + struct.unpack('<H', data[start + 16:start + 18])[0] + 1
+        members.append((gzip_member, data[start:end]))
+        start = end
+    return members
+
+
+def read_varint(data, pos):
+    # (value, position after it) of a xz variable-length integer
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        value |= (byte & 0x7f) << shift
+        pos += 1
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+xz_check_sizes = [0, 4, 4, 4, 8, 8, 8, 16, 16, 16, 32, 32, 32, 64, 64, 64]
+
+
+def xz_stream_blocks(data, end):
+    # (start, [(offset, unpadded size, uncompressed size)]) of the stream ending at end
+    backward_size = (struct.unpack('<I', data[end - 8:end - 4])[0] + 1) * 4
+    index_start = end - 12 - backward_size
+    n_records, pos = read_varint(data, index_start + 1)
+    records = []
+    for _ in range(n_records):
+        unpadded_size, pos = read_varint(data, pos)
+        uncompressed_size, pos = read_varint(data, pos)
+        records.append((unpadded_size, uncompressed_size))
+    blocks_size = sum([(unpadded_size + 3) // 4 * 4 for unpadded_size, _ in records])
+    offset = index_start - blocks_size
+    if offset < 12 or data[offset - 12:offset - 6] != compression_magics[2][0]:
+        raise ValueError('Invalid xz index')
+    blocks = []
+    for unpadded_size, uncompressed_size in records:
+        blocks.append((offset, unpadded_size, uncompressed_size))
+        offset += (unpadded_size + 3) // 4 * 4
+    return offset - blocks_size - 12, blocks
+
+
+def lzma2_dict_size(prop):
+    if prop == 40:
+        return 0xffffffff
+    return (2 | (prop & 1)) << (prop // 2 + 11)
+
+
+def xz_block(data, check_size, uncompressed_size):
+    # uncompressed content of an xz block (header, compressed data), LZMA2 filter only
+    import lzma
+    header_size = (data[0] + 1) * 4
+    flags = data[1]
+    pos = 2
+    if flags & 0x40:
+        _, pos = read_varint(data, pos)
+    if flags & 0x80:
+        _, pos = read_varint(data, pos)
+    _, pos = read_varint(data, pos)
+    _, pos = read_varint(data, pos)
+    decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[{'id': lzma.FILTER_LZMA2,
+                                                                     'dict_size': lzma2_dict_size(data[pos])}])
+    content = decompressor.decompress(data[header_size:len(data) - check_size])
+    if len(content) != uncompressed_size:
+        raise lzma.LZMAError('Corrupt xz block')
+    return content
+
+
+def xz_lzma2_only(header):
+    # single LZMA2 filter in the block header
+    flags = header[1]
+    pos = 2
+    if flags & 0x40:
+        _, pos = read_varint(header, pos)
+    if flags & 0x80:
+        _, pos = read_varint(header, pos)
+    filter_id, _ = read_varint(header, pos)
+    return flags & 0x03 == 0 and filter_id == 0x21
+
+
+def xz_blocks(data):
+    '''
+    [(xz_block, block, check size, uncompressed size)] of the blocks of
+    all the streams of xz data, [] when the blocks can't be decompressed
+    separately (other filters than LZMA2 or invalid index)
+    '''
+    blocks = []
+    data = memoryview(data)
+    end = len(data)
+    try:
+        while end > 0:
+            # stream padding
+            while end >= 4 and data[end - 4:end] == b'\0\0\0\0':
+                end -= 4
+            if end <= 0:
+                break
+            start, stream_blocks = xz_stream_blocks(data, end)
+            check_size = xz_check_sizes[data[start + 7] & 0x0f]
+            stream_jobs = []
+            for offset, unpadded_size, uncompressed_size in stream_blocks:
+                block = data[offset:offset + unpadded_size]
+                if not xz_lzma2_only(block):
+                    return []
+                stream_jobs.append((xz_block, block, check_size, uncompressed_size))
+            blocks[:0] = stream_jobs
+            end = start
+    except (IndexError, ValueError, struct.error):
+        return []
+    return blocks
+
+
+class Prefetcher(object):
+    '''
+    Reads the files in background threads, in their order, at most
+    depth files ahead of the last one opened. Contents of the files
+    before the last one opened are dropped
+    '''
+
+    def __init__(self, paths, depth=default_prefetch_depth, max_size=default_max_prefetch_size):
+        from concurrent.futures import ThreadPoolExecutor
+        super(Prefetcher, self).__init__()
+        self.paths = list(paths)
+        self.keys = [file_key(path) for path in self.paths]
+        self.depth = depth
+        self.max_size = max_size
+        self.executor = ThreadPoolExecutor(max_workers=max(depth, 1))
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.closed = False
+
+    def __enter__(self):
+        self.advance(0)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def prefetchable(self, path):
+        try:
+            return os.path.getsize(path) <= self.max_size
+        except OSError:
+            return False
+
+    def advance(self, index):
+        # file index is being opened: drops the files before it, reads the next ones
+        with self.lock:
+            if self.closed:
+                return
+            with _prefetched_lock:
+                for key in self.keys[self.dropped:index]:
+                    entry = _prefetched.get(key)
+                    if entry is not None and entry[0] is self:
+                        del _prefetched[key]
+                        entry[2].cancel()
+                self.dropped = max(self.dropped, index)
+                while self.submitted < min(index + self.depth, len(self.paths)):
+                    path, key = self.paths[self.submitted], self.keys[self.submitted]
+                    if key not in _prefetched and self.prefetchable(path):
+                        _prefetched[key] = (self, self.submitted, self.executor.submit(read_file, path))
+                    self.submitted += 1
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            with _prefetched_lock:
+                for key in self.keys:
+                    entry = _prefetched.get(key)
+                    if entry is not None and entry[0] is self:
+                        del _prefetched[key]
+                        entry[2].cancel()
+        self.executor.shutdown(wait=True)
+
+
+def prefetch(paths, depth=default_prefetch_depth, max_size=default_max_prefetch_size):
+    '''
+    Context manager prefetching the files of paths, to be opened
+    in this order with open_input:
+        with prefetch(pos_files):
+            for pos_file in pos_files:
+                read_pos_file(pos_file)
+    '''
+    return Prefetcher(paths, depth, max_size)
+
+
+class ThrottledFile(io.RawIOBase):
+    '''
+    Raw file slowed down like a file of a network share
+    '''
+
+    def __init__(self, raw, bandwidth):
+        super(ThrottledFile, self).__init__()
+        self.raw = raw
+        self.bandwidth = bandwidth
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.raw.readinto(buffer)
+        if n and self.bandwidth:
+            time.sleep(n / float(self.bandwidth))
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super(ThrottledFile, self).close()
+
+
+class ThrottledOpener(object):
+    '''
+    Stand-in for a network share, to be given to set_opener: every
+    open takes latency seconds and reads go at bandwidth bytes/s
+    '''
+
+    def __init__(self, latency=0.01, bandwidth=50 * 1024 ** 2):
+        super(ThrottledOpener, self).__init__()
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def __call__(self, path, mode='r', buffering=-1, encoding=None, errors=None):
+        time.sleep(self.latency)
+        raw = ThrottledFile(open(path, 'rb', buffering=0), self.bandwidth)
+        if buffering == 0:
+            return raw
+        stream = io.BufferedReader(raw, buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE)
+        if 'b' in mode:
+            return stream
+        return io.TextIOWrapper(stream, encoding=encoding, errors=errors)
@@ -4,7 +4,9 @@ of Gmsh pos binary files
 '''
 
 import os
-import struct
+
+from .file_io import open_input
+from .instrumentation import phase
 
 
 # Gmsh-style data keys
@@ -93,7 +95,9 @@ def tensor_from_full_to_sym(tensor):
     return [tensor[j] for j in [0, 4, 8, 1, 5, 2]]
 
 
-def read_values_block(values_block, block_type, block_size, start_node_id=1, start_elem_id=1):
+def read_values_block(values_block, block_type, block_size, start_node_id=1, start_elem_id=1, as_field=False,
+                      dtype='float64', sym_tensor=False):
+    import numpy as np
     offset = 12
     data_type = block_type.split('_')[0]
     data_type_key = data_type.lower()
@@ -110,40 +114,38 @@ def read_values_block(values_block, block_type, block_size, start_node_id=1, sta
         mesh_elem_type = elem_type.lower()
     #
     vals_in_row = num_nodes * 3 + num_nodes * num_values
-    nodes = {}
-    elems = {mesh_elem_type: {}}
-    field_dict = {data_type_key: {}}
-    node_id = start_node_id
-    elem_id = start_elem_id
+    # one row of doubles per element: xs, ys, zs of its nodes then the values at its nodes
+    rows = np.frombuffer(values_block, dtype=np.float64, count=block_size * vals_in_row,
+                         offset=offset).reshape(block_size, vals_in_row)
+    coords = rows[:, :3 * num_nodes].reshape(block_size, 3, num_nodes).transpose(0, 2, 1).reshape(-1, 3)
+    values = rows[:, 3 * num_nodes:].reshape(-1, num_values)
+    node_ids = range(start_node_id, start_node_id + block_size * num_nodes)
     #
-    for i in range(block_size):
-        line_binary = values_block[8 * i * vals_in_row + offset: 8 * (i + 1) * vals_in_row + offset]
-        line_doubles = struct.unpack('d' * vals_in_row, line_binary)
-        #
-        xs = line_doubles[:num_nodes]
-        ys = line_doubles[num_nodes:2 * num_nodes]
-        zs = line_doubles[2 * num_nodes:3 * num_nodes]
-        #
-        elems[mesh_elem_type][elem_id] = list(range(node_id, node_id + num_nodes))
-        elem_id += 1
-        for i_res, coords in enumerate(zip(xs, ys, zs)):
-            nodes[node_id] = coords
-            start_index = 3 * num_nodes + i_res * num_values
-            end_index = 3 * num_nodes + (i_res + 1) * num_values
-            cur_field = line_doubles[start_index:end_index]
-            if len(cur_field) == 1:
-                field_dict[data_type_key][node_id] = cur_field[0]
-            elif len(cur_field) == 9:
-                # field_dict[data_type_key][node_id] = tensor_from_full_to_sym(cur_field)
-                field_dict[data_type_key][node_id] = cur_field
-            else:
-                field_dict[data_type_key][node_id] = cur_field
-            node_id += 1
+    nodes = dict(zip(node_ids, map(tuple, coords.tolist())))
+    elems = {mesh_elem_type: {start_elem_id + i: list(node_ids[i * num_nodes:(i + 1) * num_nodes])
+                              for i in range(block_size)}}
+    if as_field:
+        from .fields import Field, compact_values
+        field = Field(np.arange(node_ids.start, node_ids.stop), compact_values(values, dtype, sym_tensor),
+                      data_type_key, check_order=False)
+    elif num_values == 1:
+        field = dict(zip(node_ids, values[:, 0].tolist()))
+    else:
+        if sym_tensor and num_values == 9:
+            from .fields import sym_tensor_columns
+            values = values[:, sym_tensor_columns]
+        field = dict(zip(node_ids, map(tuple, values.tolist())))
+    field_dict = {data_type_key: field}
     mesh_dict = {'nodes': nodes, 'elems': elems, 'groups': {}}
-    return mesh_dict, field_dict, node_id, elem_id
+    return mesh_dict, field_dict, node_ids.stop, start_elem_id + block_size
 
 
-def read_pos_file(pos_files, read_nodes=True, read_elems=True, read_groups=True, read_fields=False):
+def read_pos_file(pos_files, read_nodes=True, read_elems=True, read_groups=True, read_fields=False, as_field=False,
+                  dtype='float64', sym_tensor=False):
+    '''
+    With as_field, fields are Field arrays of dtype. With sym_tensor,
+    tensors keep their 6 symmetric components (xx, yy, zz, xy, yz, xz)
+    '''
     if type(pos_files) is str:
         _pos_files = (pos_files, )
     else:
@@ -162,60 +164,128 @@ def read_pos_file(pos_files, read_nodes=True, read_elems=True, read_groups=True,
         folder = os.path.dirname(pos_file)
         name = os.path.basename(pos_file)
         print('Lecture du fichier {0}/{1}.'.format(folder, name))
-        with open(pos_file, 'rb') as f0:
-            content = f0.read()
-        data_blocks = content.split(b'\n', 5)
-        keys_block = data_blocks[-2]
-        keys_block_str = str(keys_block).strip('\'\"')
-        all_keys_list = [int(val.strip()) for val in keys_block_str.split()[-28:]]
-        existing_keys_list = [(k, v) for k, v in zip(keys_names, all_keys_list) if v]
-
-        if not len(existing_keys_list):
-            print('Fichier vide!')
-            return None
-
-        i_block = 0
-        for block_type, block_size in existing_keys_list:
-            print('Lecture de la partie du type {0} en cours.'.format(block_type))
-            values_block = data_blocks[5 + i_block]
-            _mesh_dict, _field_dict, max_node_id, max_elem_id = read_values_block(values_block,
-                                                                                  block_type,
-                                                                                  block_size,
-                                                                                  cur_node_id,
-                                                                                  cur_elem_id)
-            # updating mesh . . .
-            if read_nodes:
-                mesh_dict['nodes'].update(_mesh_dict['nodes'])
-            if read_elems:
-                for mesh_elem_type in _mesh_dict['elems']:
-                    if mesh_elem_type in mesh_dict['elems']:
-                        mesh_dict['elems'][mesh_elem_type].update(_mesh_dict['elems'][mesh_elem_type])
-                    else:
-                        mesh_dict['elems'][mesh_elem_type] = _mesh_dict['elems'][mesh_elem_type]
-            if read_fields:
-                # updating fields . . .
-                for field_type, field in _field_dict.items():
-                    if field_type in field_dict:
-                        field_dict[field_type].update(field)
-                    else:
-                        field_dict[field_type] = field
-            cur_node_id = max_node_id + 1
-            cur_elem_id = max_elem_id + 1
-            i_block += 1
+        with phase('read', 'read_pos_file', pos_file) as read_phase:
+            section = read_phase.section('header')
+            with open_input(pos_file, 'rb') as f0:
+                content = f0.read()
+            section.add_bytes(len(content))
+            data_blocks = content.split(b'\n', 5)
+            keys_block = data_blocks[-2]
+            keys_block_str = str(keys_block).strip('\'\"')
+            all_keys_list = [int(val.strip()) for val in keys_block_str.split()[-28:]]
+            existing_keys_list = [(k, v) for k, v in zip(keys_names, all_keys_list) if v]
+
+            if not len(existing_keys_list):
+                print('Fichier vide!')
+                return None
+
+            i_block = 0
+            for block_type, block_size in existing_keys_list:
+                print('Lecture de la partie du type {0} en cours.'.format(block_type))
+                section = read_phase.section('fields')
+                values_block = data_blocks[5 + i_block]
+                _mesh_dict, _field_dict, max_node_id, max_elem_id = read_values_block(values_block,
+                                                                                      block_type,
+                                                                                      block_size,
+                                                                                      cur_node_id,
+                                                                                      cur_elem_id,
+                                                                                      as_field,
+                                                                                      dtype,
+                                                                                      sym_tensor)
+                # updating mesh . . .
+                if read_nodes:
+                    mesh_dict['nodes'].update(_mesh_dict['nodes'])
+                if read_elems:
+                    for mesh_elem_type in _mesh_dict['elems']:
+                        if mesh_elem_type in mesh_dict['elems']:
+                            mesh_dict['elems'][mesh_elem_type].update(_mesh_dict['elems'][mesh_elem_type])
+                        else:
+                            mesh_dict['elems'][mesh_elem_type] = _mesh_dict['elems'][mesh_elem_type]
+                if read_fields:
+                    # updating fields . . .
+                    for field_type, field in _field_dict.items():
+                        if field_type in field_dict and as_field:
+                            from .fields import concat_fields
+                            field_dict[field_type] = concat_fields([field_dict[field_type], field])
+                        elif field_type in field_dict:
+                            field_dict[field_type].update(field)
+                        else:
+                            field_dict[field_type] = field
+                cur_node_id = max_node_id + 1
+                cur_elem_id = max_elem_id + 1
+                section.count(block_size)
+                i_block += 1
     if read_fields:
         return mesh_dict, field_dict
     else:
         return mesh_dict
 
 
-def read_pos_field_options(pos_file, only_first=True):
-    with open(pos_file, 'rb') as f0:
-        content = f0.read()
-    data_blocks = content.split(b'\n', 5)
-    keys_block = data_blocks[-2]
-    keys_block_str = str(keys_block).strip('\'\"')
+def read_pos_header(f0):
+    # (offset of the data, [(block type, block size)]) of an open pos file
+    header = b''
+    while header.count(b'\n') < 5:
+        data = f0.read(65536)
+        if not data:
+            break
+        header += data
+    header_lines = header.split(b'\n', 5)
+    keys_block_str = str(header_lines[4]).strip('\'\"')
     all_keys_list = [int(val.strip()) for val in keys_block_str.split()[-28:]]
-    existing_keys_list = [(k, v) for k, v in zip(keys_names, all_keys_list) if v]
+    data_start = len(header) - len(header_lines[5])
+    return data_start, [(k, v) for k, v in zip(keys_names, all_keys_list) if v]
+
+
+def iter_pos(pos_file, read_nodes=True, read_elems=True, read_fields=True, chunk_size=100000, dtype='float64',
+             sym_tensor=False, as_arrays=False):
+    '''
+    Streaming version of read_pos_file, chunk_size elements are read
+    at a time. Yields sections:
+        ('nodes', node_ids, coords)
+        ('elems', elem_type, elem_ids, elem_nodes)
+        ('field', field_type, ids, values)
+    with the ids of read_pos_file. Field ids and values are arrays,
+    values are (n, ncomp) arrays of dtype (tensors reduced with
+    sym_tensor), node ids and coords too with as_arrays. Blocks follow
+    each other in the data part of the file
+    '''
+    import numpy as np
+    from .fields import compact_values
+    cur_node_id = 1
+    cur_elem_id = 1
+    with open_input(pos_file, 'rb') as f0:
+        data_start, existing_keys_list = read_pos_header(f0)
+        block_start = data_start + 12
+        for block_type, block_size in existing_keys_list:
+            data_type, elem_type = block_type.split('_')
+            num_values = number_of_values_dict[data_type]
+            num_nodes = number_of_nodes_dict[elem_type]
+            mesh_elem_type = gmsh_type_to_mesh_type.get(elem_type, elem_type.lower())
+            vals_in_row = num_nodes * 3 + num_nodes * num_values
+            for start in range(0, block_size, chunk_size):
+                n_rows = min(chunk_size, block_size - start)
+                f0.seek(block_start + start * vals_in_row * 8)
+                rows = np.frombuffer(f0.read(n_rows * vals_in_row * 8), dtype='<f8').reshape(n_rows, vals_in_row)
+                first_node_id = cur_node_id + start * num_nodes
+                node_ids = np.arange(first_node_id, first_node_id + n_rows * num_nodes)
+                if read_nodes:
+                    coords = rows[:, :3 * num_nodes].reshape(n_rows, 3, num_nodes).transpose(0, 2, 1).reshape(-1, 3)
+                    yield ('nodes', node_ids, coords) if as_arrays else ('nodes', node_ids.tolist(), coords.tolist())
+                if read_elems:
+                    elem_ids = list(range(cur_elem_id + start, cur_elem_id + start + n_rows))
+                    yield ('elems', mesh_elem_type, elem_ids, node_ids.reshape(n_rows, num_nodes).tolist())
+                if read_fields:
+                    values = rows[:, 3 * num_nodes:].reshape(-1, num_values)
+                    yield ('field', data_type.lower(), node_ids, compact_values(values, dtype, sym_tensor))
+            block_start += block_size * vals_in_row * 8
+            # same numbering as read_pos_file
+            cur_node_id += block_size * num_nodes + 1
+            cur_elem_id += block_size + 1
+
+
+def read_pos_field_options(pos_file, only_first=True):
+    with open_input(pos_file, 'rb') as f0:
+        existing_keys_list = read_pos_header(f0)[1]
     if only_first:
         return existing_keys_list[0]
     else:
@@ -2,51 +2,182 @@
 Utility module for converting mesh and fields
 gained from gmsh binary files .pos to patran neutral
 file .out and .els files containing fields
+
+The mesh and each field are written by separate tasks,
+run in worker processes. Pos files are streamed a chunk
+of elements at a time, so whole step folders are converted
+in parallel with a bounded memory use
 '''
 
 
 import os
+import re
 
-from patran_neutral_parser import write_out, patran_elem_types
-from patran_results_parser import write_res, write_ses, write_template
-from gmsh_pos_parser import number_of_values_dict
+from .patran_neutral_parser import OutStreamWriter, write_out, patran_elem_types_
+from .patran_results_parser import ResStreamWriter, write_res, write_ses, write_template
+from .gmsh_pos_parser import (number_of_values_dict, number_of_nodes_dict, gmsh_type_to_mesh_type, iter_pos,
+                              read_pos_field_options)
+from .parallel_reader import run_tasks, default_workers
 
 
-def convert_pos_data_to_patran(pos_name, mesh_dict, field_dict, work_dir=''):
+default_memory_budget = 1024 ** 3
+
+# rough memory use in bytes of one value of the pos rows while it is converted to text
+bytes_per_value = 200
+
+
+def pos_dir(work_dir):
     if not work_dir:
         work_dir = os.getcwd()
     dir_for_files = os.path.join(work_dir, 'pos_to_patran')
-    if not os.path.exists(dir_for_files):
-        os.mkdir(dir_for_files)
-    out_name_abs = os.path.join(dir_for_files, '{0}_mesh.out'.format(pos_name))
-    print('Ecriture {0}_mesh.out a partir de donnees du fichier .pos . . .'.format(pos_name))
-    try:
-        write_out(out_name_abs, mesh_dict, write_nodes=True, write_elems=True, write_groups=False)
-    except KeyError:
+    os.makedirs(dir_for_files, exist_ok=True)
+    return dir_for_files
+
+
+def supported_elems(pos_name, elems):
+    # elements of the types known by patran, the other ones are reported and dropped
+    ignored = [elem_type for elem_type in elems if elem_type not in patran_elem_types_]
+    if ignored:
         print('Certains types d’éléments ne sont pas pris en charge et ne seront pas enregistrés dans {0}_mesh.out'.format(
             pos_name))
-        elems_filtered = {}
-        for elem_type, elems_dict in mesh_dict['elems'].items():
-            if elem_type in patran_elem_types:
-                elems_filtered[elem_type] = elems_dict
-        mesh_dict_filtered = {'nodes': mesh_dict['nodes'],
-                              'elems': elems_filtered,
-                              'groups': mesh_dict['groups']}
-        write_out(out_name_abs, mesh_dict_filtered, write_nodes=True, write_elems=True, write_groups=False)
+    return {elem_type: elems_dict for elem_type, elems_dict in elems.items() if elem_type in patran_elem_types_}
+
+
+def field_file_names(pos_name, field_type):
+    sc_name = '{0}_{1}'.format(pos_name, field_type)
+    ses_name = 'load_{0}_{1}.ses'.format(pos_name, field_type)
+    tmpl_name = '{0}.res_tmpl'.format(field_type)
+    return sc_name, ses_name, tmpl_name
+
+
+def sym_tensor_values(field):
+    # {entity: value} of a tensor field with the 6 symmetric components expected by the .res header
+    from .fields import sym_tensor_columns
+    return {entity: [value[j] for j in sym_tensor_columns] if len(value) == 9 else value
+            for entity, value in field.items()}
+
+
+def write_field_files(dir_for_files, pos_name, field_type, sections):
+    # .res of the ('field', field_type, ids, values) sections, then its .ses and template
+    print('Écrire des fichiers de résultats pour patran. Maillage de référence: {0}_mesh.out'.format(pos_name))
+    sc_name, ses_name, tmpl_name = field_file_names(pos_name, field_type)
+    n_comps = number_of_values_dict[field_type.upper()]
+    column_str = ','.join([str(i) for i in range(1, n_comps+1)])
+    with ResStreamWriter(os.path.join(dir_for_files, sc_name), 'n', pos_name, field_type) as writer:
+        for section in sections:
+            if section[1] == field_type:
+                writer.write(section[2].tolist(), section[3][:, 0].tolist() if field_type == 'scalar'
+                             else section[3].tolist())
+    write_ses(os.path.join(dir_for_files, ses_name), sc_name, 'N', tmpl_name, mode='w')
+    write_template(os.path.join(dir_for_files, tmpl_name), tmpl_type=field_type,
+                   column=column_str, pri='USER_RES', sec=field_type)
+
+
+def write_pos_mesh(dir_for_files, pos_name, node_sections, elem_sections):
+    print('Ecriture {0}_mesh.out a partir de donnees du fichier .pos . . .'.format(pos_name))
+    with OutStreamWriter(os.path.join(dir_for_files, '{0}_mesh.out'.format(pos_name))) as writer:
+        for section in node_sections:
+            writer.write_section(section)
+        for section in elem_sections:
+            writer.write_section(section)
+
+
+def convert_pos_task(pos_file, dir_for_files, pos_name, part, chunk_size):
+    # writes the mesh (part 'mesh') or the files of the field part of pos_file
+    if part == 'mesh':
+        write_pos_mesh(dir_for_files, pos_name,
+                       iter_pos(pos_file, read_elems=False, read_fields=False, chunk_size=chunk_size),
+                       (section for section in iter_pos(pos_file, read_nodes=False, read_fields=False,
+                                                        chunk_size=chunk_size)
+                        if section[1] in patran_elem_types_))
+    else:
+        write_field_files(dir_for_files, pos_name, part,
+                          iter_pos(pos_file, read_nodes=False, read_elems=False, chunk_size=chunk_size,
+                                   sym_tensor=True))
+    return pos_file, part
+
+
+def pos_tasks(pos_file, dir_for_files, pos_name, chunk_size):
+    # one task for the mesh and one for each field type, after checking the element types
+    blocks = read_pos_field_options(pos_file, only_first=False)
+    mesh_elem_types = [gmsh_type_to_mesh_type.get(block_type.split('_')[1], block_type.split('_')[1].lower())
+                       for block_type, _ in blocks]
+    supported_elems(pos_name, dict.fromkeys(mesh_elem_types))
+    field_types = sorted(set([block_type.split('_')[0].lower() for block_type, _ in blocks]))
+    return [(convert_pos_task, (pos_file, dir_for_files, pos_name, part, chunk_size))
+            for part in ['mesh'] + field_types]
+
+
+def pos_chunk_size(pos_files, workers, memory_budget):
+    # elements read at a time so that workers tasks stay within memory_budget bytes
+    row_sizes = [1]
+    for pos_file in pos_files:
+        for block_type, _ in read_pos_field_options(pos_file, only_first=False):
+            data_type, elem_type = block_type.split('_')
+            num_nodes = number_of_nodes_dict[elem_type]
+            row_sizes.append(num_nodes * 3 + num_nodes * number_of_values_dict[data_type])
+    return max(1, memory_budget // (workers * max(row_sizes) * bytes_per_value))
+
+
+def convert_pos_data_to_patran(pos_name, mesh_dict, field_dict, work_dir=''):
+    dir_for_files = pos_dir(work_dir)
+    out_name_abs = os.path.join(dir_for_files, '{0}_mesh.out'.format(pos_name))
+    print('Ecriture {0}_mesh.out a partir de donnees du fichier .pos . . .'.format(pos_name))
+    mesh_dict_filtered = {'nodes': mesh_dict['nodes'],
+                          'elems': supported_elems(pos_name, mesh_dict['elems']),
+                          'groups': mesh_dict['groups']}
+    write_out(out_name_abs, mesh_dict_filtered, write_nodes=True, write_elems=True, write_groups=False)
     for field_type, field in field_dict.items():
         print('Écrire des fichiers de résultats pour patran. Maillage de référence: {0}_mesh.out'.format(pos_name))
         entities = sorted(list(field.keys()))
-        sc_name = '{0}_{1}'.format(pos_name, field_type)
-        ses_name = 'load_{0}_{1}.ses'.format(pos_name, field_type)
-        tmpl_name = '{0}.res_tmpl'.format(field_type)
+        if field_type == 'tensor':
+            field = sym_tensor_values(field)
+        sc_name, ses_name, tmpl_name = field_file_names(pos_name, field_type)
         n_comps = number_of_values_dict[field_type.upper()]
         column_str = ','.join([str(i) for i in range(1, n_comps+1)])
-        #
-        sc_name_abs = os.path.join(dir_for_files, sc_name)
-        ses_name_abs = os.path.join(dir_for_files, ses_name)
-        tmpl_name_abs = os.path.join(dir_for_files, tmpl_name)
-        #
-        write_res(sc_name_abs, 'n', pos_name, field_type, entities, field)
-        write_ses(ses_name_abs, sc_name, 'N', tmpl_name, mode='w')
-        write_template(tmpl_name_abs, tmpl_type=field_type,
+        write_res(os.path.join(dir_for_files, sc_name), 'n', pos_name, field_type, entities, field)
+        write_ses(os.path.join(dir_for_files, ses_name), sc_name, 'N', tmpl_name, mode='w')
+        write_template(os.path.join(dir_for_files, tmpl_name), tmpl_type=field_type,
                        column=column_str, pri='USER_RES', sec=field_type)
+
+
+def convert_pos_files_to_patran(pos_files, work_dirs='', pos_names=None, workers=None,
+                                memory_budget=default_memory_budget):
+    '''
+    Converts the pos files without loading them. Files of each pos file
+    go in the pos_to_patran folder of its work dir (work_dirs is one dir
+    or one per pos file), named after pos_names (pos file names by
+    default). Tensors are written with their 6 symmetric components
+    '''
+    if isinstance(work_dirs, str):
+        work_dirs = [work_dirs] * len(pos_files)
+    if pos_names is None:
+        pos_names = [os.path.splitext(os.path.basename(pos_file))[0] for pos_file in pos_files]
+    workers = default_workers(workers)
+    chunk_size = pos_chunk_size(pos_files, workers, memory_budget)
+    tasks = []
+    for pos_file, work_dir, pos_name in zip(pos_files, work_dirs, pos_names):
+        tasks.extend(pos_tasks(pos_file, pos_dir(work_dir), pos_name, chunk_size))
+    for _ in run_tasks(tasks, workers):
+        pass
+
+
+def convert_pos_step_dirs(root_dir, work_dir='', file_pattern=r'.*\.pos$', workers=None,
+                          memory_budget=default_memory_budget):
+    '''
+    Converts the pos files of the stepNNN folders of root_dir, files of
+    a step go in work_dir/stepNNN/pos_to_patran
+    '''
+    if not work_dir:
+        work_dir = os.getcwd()
+    pos_files, work_dirs = [], []
+    for dir_name in sorted(os.listdir(root_dir)):
+        step_dir = os.path.join(root_dir, dir_name)
+        if not re.match(r'step(\d+)$', dir_name) or not os.path.isdir(step_dir):
+            continue
+        for file_name in sorted(os.listdir(step_dir)):
+            if re.match(file_pattern, file_name):
+                pos_files.append(os.path.join(step_dir, file_name))
+                work_dirs.append(os.path.join(work_dir, dir_name))
+    convert_pos_files_to_patran(pos_files, work_dirs, workers=workers, memory_budget=memory_budget)
+    return pos_files
@@ -0,0 +1,247 @@
+'''
+Module with array-backed groups supporting set algebra.
+An IdSet is a sorted array of unique ids, a Group maps
+entity types ('node' and element types) to IdSets, like the
+{ent_type: [ids]} groups of the mesh dict. Unions,
+intersections and differences are done with numpy on the
+sorted arrays. Groups behave like the group dicts (mapping
+of iterables of ids), so the writers accept them
+'''
+
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from .mesh import id_dtype
+
+
+def sorted_unique(ids):
+    # sorted unique ids (np.unique without its overhead)
+    ids = np.sort(ids)
+    if len(ids) < 2:
+        return ids
+    keep = np.empty(len(ids), dtype=bool)
+    keep[0] = True
+    np.not_equal(ids[1:], ids[:-1], out=keep[1:])
+    return ids[keep]
+
+
+def sorted_contains(sorted_ids, ids):
+    # mask of the ids found in the sorted array sorted_ids
+    ids = np.asarray(ids, dtype=id_dtype)
+    if not len(sorted_ids):
+        return np.zeros(ids.shape, dtype=bool)
+    rows = np.searchsorted(sorted_ids, ids)
+    rows[rows == len(sorted_ids)] = 0
+    return sorted_ids[rows] == ids
+
+
+class IdSet(object):
+    '''
+    Immutable set of ids stored as a sorted array of unique ids
+    '''
+
+    def __init__(self, ids=(), is_unique=False):
+        super(IdSet, self).__init__()
+        if isinstance(ids, IdSet):
+            ids = ids.ids
+            is_unique = True
+        ids = np.asarray(ids, dtype=id_dtype).ravel()
+        self.ids = ids if is_unique else sorted_unique(ids)
+
+    @classmethod
+    def union_all(cls, id_sets):
+        # union of many sets, sorted only once
+        arrays = [IdSet(id_set).ids for id_set in id_sets]
+        if not arrays:
+            return cls()
+        return cls(np.concatenate(arrays))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.ids if dtype is None else self.ids.astype(dtype)
+
+    def __contains__(self, _id):
+        return bool(sorted_contains(self.ids, [_id])[0])
+
+    def contains(self, ids):
+        return sorted_contains(self.ids, ids)
+
+    def union(self, *others):
+        if len(others) == 1:
+            other_ids = IdSet(others[0]).ids
+            return IdSet(np.concatenate([self.ids, other_ids[~sorted_contains(self.ids, other_ids)]]))
+        return IdSet.union_all((self,) + others)
+
+    def intersection(self, *others):
+        ids = self.ids
+        for other in others:
+            other_ids = IdSet(other).ids
+            if len(other_ids) < len(ids):
+                ids, other_ids = other_ids, ids
+            ids = ids[sorted_contains(other_ids, ids)]
+        return IdSet(ids, is_unique=True)
+
+    def difference(self, *others):
+        ids = self.ids
+        for other in others:
+            ids = ids[~sorted_contains(IdSet(other).ids, ids)]
+        return IdSet(ids, is_unique=True)
+
+    def symmetric_difference(self, other):
+        other = IdSet(other)
+        return IdSet(np.concatenate([self.ids[~sorted_contains(other.ids, self.ids)],
+                                     other.ids[~sorted_contains(self.ids, other.ids)]]))
+
+    def issubset(self, other):
+        return bool(sorted_contains(IdSet(other).ids, self.ids).all())
+
+    def issuperset(self, other):
+        return IdSet(other).issubset(self)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
+    __le__ = issubset
+    __ge__ = issuperset
+
+    def __eq__(self, other):
+        if not isinstance(other, IdSet):
+            return NotImplemented
+        return len(self.ids) == len(other.ids) and bool((self.ids == other.ids).all())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def tolist(self):
+        return self.ids.tolist()
+
+    def __repr__(self):
+        return '<IdSet {0} ids>'.format(len(self))
+
+
+class Group(Mapping):
+    '''
+    Group of entities, {ent_type: IdSet}. Set operations are done
+    type by type, types left without entities are dropped
+    '''
+
+    def __init__(self, id_sets=None):
+        super(Group, self).__init__()
+        self.id_sets = {}
+        for ent_type, ids in (id_sets or {}).items():
+            self.id_sets[ent_type] = IdSet(ids)
+
+    @classmethod
+    def from_dict(cls, group):
+        if isinstance(group, Group):
+            return group
+        return cls(group)
+
+    @classmethod
+    def from_elem_ids(cls, elem_ids, elem_type_index):
+        # group of elements of any type split with an ElemTypeIndex
+        elem_ids = IdSet(elem_ids).ids
+        codes = elem_type_index.codes(elem_ids)
+        if (codes < 0).any():
+            raise KeyError(int(elem_ids[codes < 0][0]))
+        return cls({elem_type_index.elem_types[code]: IdSet(elem_ids[codes == code], is_unique=True)
+                    for code in np.unique(codes).tolist()})
+
+    @classmethod
+    def union_all(cls, groups):
+        groups = [Group.from_dict(group) for group in groups]
+        ent_types = []
+        for group in groups:
+            ent_types.extend([ent_type for ent_type in group if ent_type not in ent_types])
+        return cls({ent_type: IdSet.union_all([group[ent_type] for group in groups if ent_type in group])
+                    for ent_type in ent_types})
+
+    def to_dict(self):
+        return {ent_type: id_set.tolist() for ent_type, id_set in self.id_sets.items()}
+
+    def __getitem__(self, ent_type):
+        return self.id_sets[ent_type]
+
+    def __iter__(self):
+        return iter(self.id_sets)
+
+    def __len__(self):
+        return len(self.id_sets)
+
+    @property
+    def n_entities(self):
+        return sum([len(id_set) for id_set in self.id_sets.values()])
+
+    def elems(self):
+        # elements of all types
+        return IdSet.union_all([id_set for ent_type, id_set in self.id_sets.items() if ent_type != 'node'])
+
+    def nodes(self):
+        return self.id_sets.get('node', IdSet())
+
+    def contains(self, ent_type, ids):
+        if ent_type not in self.id_sets:
+            return np.zeros(len(ids), dtype=bool)
+        return self.id_sets[ent_type].contains(ids)
+
+    def union(self, *others):
+        return Group.union_all((self,) + others)
+
+    def intersection(self, *others):
+        id_sets = dict(self.id_sets)
+        for other in others:
+            other = Group.from_dict(other)
+            id_sets = {ent_type: id_set & other[ent_type] for ent_type, id_set in id_sets.items() if ent_type in other}
+        return Group({ent_type: id_set for ent_type, id_set in id_sets.items() if len(id_set)})
+
+    def difference(self, *others):
+        id_sets = dict(self.id_sets)
+        for other in others:
+            other = Group.from_dict(other)
+            id_sets = {ent_type: id_set - other[ent_type] if ent_type in other else id_set
+                       for ent_type, id_set in id_sets.items()}
+        return Group({ent_type: id_set for ent_type, id_set in id_sets.items() if len(id_set)})
+
+    def symmetric_difference(self, other):
+        other = Group.from_dict(other)
+        return self.union(other).difference(self.intersection(other))
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
+
+    def __eq__(self, other):
+        if not isinstance(other, Group):
+            return NotImplemented
+        return self.id_sets == other.id_sets
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        types = ', '.join(['{0}: {1}'.format(ent_type, len(id_set)) for ent_type, id_set in self.id_sets.items()])
+        return '<Group {{{0}}}>'.format(types)
+
+
+def as_groups(groups):
+    # {gr_name: Group} of mesh dict groups
+    return {gr_name: Group.from_dict(group) for gr_name, group in groups.items()}
+
+
+def groups_to_dict(groups):
+    return {gr_name: group.to_dict() if isinstance(group, Group) else group for gr_name, group in groups.items()}
@@ -0,0 +1,255 @@
+'''
+Module with per-phase instrumentation of readers.
+An Instrumentation object records wall time, bytes read,
+entities parsed and peak memory of every phase (header,
+nodes, elems, groups, fields) of the readers called while
+it is active. When no instrumentation is active readers
+get a shared no-op phase, so the cost is one global check
+
+    with Instrumentation(trace_memory=True) as instr:
+        read_dat('model.dat', read_groups=True)
+    instr.to_csv('phases.csv')
+'''
+
+
+import time
+
+
+record_keys = ['reader', 'file', 'phase', 'parent', 'depth', 'start', 'wall_time', 'bytes', 'entities', 'peak_memory']
+
+_active = []
+
+# tracemalloc, json and csv are imported where used to keep the
+# package import light
+
+
+def stream_position(stream):
+    # text files can't tell() while iterated, their binary buffer can
+    try:
+        if stream.closed:
+            return None
+        buffer = getattr(stream, 'buffer', stream)
+        return buffer.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class NullPhase(object):
+    '''
+    Phase used when instrumentation is off, all methods are no-op
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def close(self):
+        pass
+
+    def section(self, name):
+        return self
+
+    def count(self, entities=1):
+        pass
+
+    def add_bytes(self, n_bytes):
+        pass
+
+
+null_phase = NullPhase()
+
+
+class Phase(object):
+
+    def __init__(self, instrumentation, name, reader=None, file=None, stream=None, parent=None):
+        super(Phase, self).__init__()
+        self.instrumentation = instrumentation
+        self.name = name
+        self.parent = parent
+        self.reader = reader or (parent.reader if parent else None)
+        self.file = file or (parent.file if parent else None)
+        self.stream = stream or (parent.stream if parent else None)
+        self.depth = parent.depth + 1 if parent else 0
+        self.entities = 0
+        self.bytes = 0
+        self.wall_time = None
+        self.peak_memory = None
+        self.start = None
+        self.closed = False
+        self._open_section = None
+        self._child_peak = 0
+        self._start_memory = None
+        self._start_position = None
+
+    def open(self):
+        import tracemalloc
+        self._start_position = stream_position(self.stream) if self.stream is not None else None
+        if self.instrumentation.trace_memory:
+            self._start_memory, peak = tracemalloc.get_traced_memory()
+            # peak of the parent so far is kept before the reset
+            if self.parent is not None:
+                self.parent._child_peak = max(self.parent._child_peak, peak)
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def close(self):
+        import tracemalloc
+        if self.closed:
+            return
+        if self._open_section is not None:
+            self._open_section.close()
+        self.wall_time = time.perf_counter() - self.start
+        if self._start_position is not None:
+            end_position = stream_position(self.stream)
+            if end_position is not None:
+                self.bytes += end_position - self._start_position
+        if self.instrumentation.trace_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            self.peak_memory = peak - self._start_memory
+            if self.parent is not None:
+                self.parent._child_peak = max(self.parent._child_peak, peak)
+        if self.parent is not None:
+            if self.parent._open_section is self:
+                self.parent._open_section = None
+            if self.parent._start_position is None:
+                self.parent.bytes += self.bytes
+            self.parent.entities += self.entities
+        self.closed = True
+        self.instrumentation.finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def section(self, name):
+        '''
+        Switches to the sub-phase name, closing the previous one.
+        Returns the current sub-phase if it already has this name
+        '''
+        cur_section = self._open_section
+        if cur_section is not None:
+            if cur_section.name == name:
+                return cur_section
+            cur_section.close()
+        self._open_section = self.instrumentation.start_phase(name, parent=self)
+        return self._open_section
+
+    def count(self, entities=1):
+        self.entities += entities
+
+    def add_bytes(self, n_bytes):
+        self.bytes += n_bytes
+
+    def to_record(self):
+        return {'reader': self.reader,
+                'file': self.file,
+                'phase': self.name,
+                'parent': self.parent.name if self.parent else None,
+                'depth': self.depth,
+                'start': self.start - self.instrumentation.t0,
+                'wall_time': self.wall_time,
+                'bytes': self.bytes,
+                'entities': self.entities,
+                'peak_memory': self.peak_memory}
+
+
+class Instrumentation(object):
+
+    def __init__(self, callbacks=None, trace_memory=False):
+        super(Instrumentation, self).__init__()
+        self.callbacks = list(callbacks or [])
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.t0 = time.perf_counter()
+        self._own_tracemalloc = False
+        self._depth = 0
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def __enter__(self):
+        import tracemalloc
+        if self._depth == 0 and self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        self._depth += 1
+        _active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        import tracemalloc
+        _active.remove(self)
+        self._depth -= 1
+        if self._depth == 0 and self._own_tracemalloc:
+            tracemalloc.stop()
+            self._own_tracemalloc = False
+        return False
+
+    def start_phase(self, name, reader=None, file=None, stream=None, parent=None):
+        return Phase(self, name, reader, file, stream, parent).open()
+
+    def finish(self, phase):
+        self.phases.append(phase)
+        if self.callbacks:
+            record = phase.to_record()
+            for callback in self.callbacks:
+                callback(record)
+
+    def to_records(self):
+        return [phase.to_record() for phase in self.phases]
+
+    def summary(self):
+        # totals per (reader, phase)
+        totals = {}
+        for record in self.to_records():
+            key = (record['reader'], record['phase'])
+            if key not in totals:
+                totals[key] = {'reader': record['reader'], 'phase': record['phase'], 'calls': 0,
+                               'wall_time': 0.0, 'bytes': 0, 'entities': 0, 'peak_memory': None}
+            total = totals[key]
+            total['calls'] += 1
+            total['wall_time'] += record['wall_time']
+            total['bytes'] += record['bytes']
+            total['entities'] += record['entities']
+            if record['peak_memory'] is not None:
+                total['peak_memory'] = max(total['peak_memory'] or 0, record['peak_memory'])
+        return list(totals.values())
+
+    def to_json(self, json_file):
+        import json
+        with open(json_file, 'w') as f0:
+            json.dump(self.to_records(), f0, indent=1)
+
+    def to_csv(self, csv_file):
+        import csv
+        with open(csv_file, 'w', newline='') as f0:
+            writer = csv.DictWriter(f0, fieldnames=record_keys)
+            writer.writeheader()
+            writer.writerows(self.to_records())
+
+    def clear(self):
+        self.phases = []
+        self.t0 = time.perf_counter()
+
+
+def phase(name, reader=None, file=None, stream=None):
+    '''
+    Starts a phase in the active instrumentation, to be used as
+    a context manager by readers. Returns null_phase when off
+    '''
+    if not _active:
+        return null_phase
+    return _active[-1].start_phase(name, reader, file, stream)
+
+
+def activate(instrumentation):
+    # context manager for optional instrumentation objects
+    if instrumentation is None:
+        return null_phase
+    return instrumentation
@@ -0,0 +1,46 @@
+'''
+Module with helpers for lazy loading of the package
+submodules. Readers are imported on first use, so tools
+needing one format don't pay for the others (and for
+numpy, subprocess, module level regexes . . .)
+'''
+
+
+import importlib
+
+
+def import_attribute(package, module_name, attribute):
+    module = importlib.import_module('{0}.{1}'.format(package, module_name))
+    return getattr(module, attribute)
+
+
+class LazyReaderDict(dict):
+    '''
+    dict of functions given as 'module:function' strings
+    relative to package. The module is imported and the entry
+    replaced by the function on first access. Functions can be
+    added directly as in a plain dict
+    '''
+
+    def __init__(self, package, entries):
+        super(LazyReaderDict, self).__init__(entries)
+        self.package = package
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, str):
+            module_name, attribute = value.split(':')
+            value = import_attribute(self.package, module_name, attribute)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
@@ -0,0 +1,377 @@
+'''
+Module with compact array-backed mesh container.
+Nodes and elements are kept in contiguous numpy arrays
+(sorted ids, coordinates and per-type connectivity) and
+are exposed through mapping views compatible with the
+mesh dict {'nodes': ..., 'elems': ..., 'groups': ...}
+returned by the readers of this package
+'''
+
+
+from collections.abc import Mapping
+
+import numpy as np
+
+
+id_dtype = np.int64
+coord_dtype = np.float64
+
+mesh_keys = ('nodes', 'elems', 'groups')
+
+
+class IdIndex(object):
+    '''
+    Sorted array of ids with id -> row lookup. Dense
+    numbering uses a direct lookup table, sparse one
+    uses binary search
+    '''
+
+    dense_ratio = 4
+
+    def __init__(self, ids):
+        super(IdIndex, self).__init__()
+        self.ids = np.asarray(ids, dtype=id_dtype)
+        self._table = None
+        self._start = 0
+        self._built = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build(self):
+        # lookup table is built on first query, so that
+        # memory-mapped ids are not touched before use
+        if len(self.ids):
+            self._start = int(self.ids[0])
+            span = int(self.ids[-1]) - self._start + 1
+            if span <= self.dense_ratio * len(self.ids) + 1024:
+                self._table = np.full(span, -1, dtype=id_dtype)
+                self._table[self.ids - self._start] = np.arange(len(self.ids), dtype=id_dtype)
+        self._built = True
+
+    def row(self, _id):
+        rows = self.rows(np.array([_id], dtype=id_dtype))
+        if rows[0] < 0:
+            raise KeyError(_id)
+        return int(rows[0])
+
+    def rows(self, ids, strict=False):
+        ids = np.asarray(ids, dtype=id_dtype)
+        if not self._built:
+            self._build()
+        if not len(self.ids):
+            rows = np.full(ids.shape, -1, dtype=id_dtype)
+        elif self._table is not None:
+            rel = ids - self._start
+            inside = (rel >= 0) & (rel < len(self._table))
+            rows = np.full(ids.shape, -1, dtype=id_dtype)
+            rows[inside] = self._table[rel[inside]]
+        else:
+            rows = np.searchsorted(self.ids, ids)
+            rows[rows == len(self.ids)] = 0
+            rows[self.ids[rows] != ids] = -1
+        if strict and (rows < 0).any():
+            raise KeyError(int(ids[rows < 0][0]))
+        return rows
+
+    def contains(self, ids):
+        return self.rows(ids) >= 0
+
+
+class ElemBlock(object):
+    '''
+    Elements of one type: sorted ids and (n, nodes_per_elem)
+    connectivity array holding node ids
+    '''
+
+    def __init__(self, ids, conn, check_order=True):
+        super(ElemBlock, self).__init__()
+        ids = np.asarray(ids, dtype=id_dtype)
+        conn = np.asarray(conn, dtype=id_dtype)
+        if conn.ndim != 2:
+            conn = conn.reshape(len(ids), -1 if len(ids) else 0)
+        if check_order and len(ids) > 1 and (np.diff(ids) <= 0).any():
+            order = np.argsort(ids, kind='stable')
+            ids = ids[order]
+            conn = conn[order]
+        self.index = IdIndex(ids)
+        self.conn = conn
+
+    @property
+    def ids(self):
+        return self.index.ids
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.conn.nbytes
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class NodesView(Mapping):
+
+    def __init__(self, mesh):
+        self._mesh = mesh
+
+    def __getitem__(self, node_id):
+        return self._mesh.coords[self._mesh.node_index.row(node_id)].tolist()
+
+    def __contains__(self, node_id):
+        return bool(self._mesh.node_index.contains([node_id])[0])
+
+    def __iter__(self):
+        return iter(self._mesh.node_ids.tolist())
+
+    def __len__(self):
+        return len(self._mesh.node_ids)
+
+    def items(self):
+        return zip(self._mesh.node_ids.tolist(), self._mesh.coords.tolist())
+
+    def values(self):
+        return self._mesh.coords.tolist()
+
+
+class ElemTypeView(Mapping):
+
+    def __init__(self, block):
+        self._block = block
+
+    def __getitem__(self, elem_id):
+        return self._block.conn[self._block.index.row(elem_id)].tolist()
+
+    def __contains__(self, elem_id):
+        return bool(self._block.index.contains([elem_id])[0])
+
+    def __iter__(self):
+        return iter(self._block.ids.tolist())
+
+    def __len__(self):
+        return len(self._block)
+
+    def items(self):
+        return zip(self._block.ids.tolist(), self._block.conn.tolist())
+
+    def values(self):
+        return self._block.conn.tolist()
+
+
+class ElemsView(Mapping):
+
+    def __init__(self, mesh):
+        self._mesh = mesh
+
+    def __getitem__(self, elem_type):
+        return ElemTypeView(self._mesh.elem_blocks[elem_type])
+
+    def __iter__(self):
+        return iter(self._mesh.elem_blocks)
+
+    def __len__(self):
+        return len(self._mesh.elem_blocks)
+
+
+class GroupsView(Mapping):
+
+    def __init__(self, mesh):
+        self._mesh = mesh
+
+    def __getitem__(self, gr_name):
+        return {ent_type: ids.tolist() for ent_type, ids in self._mesh.group_arrays[gr_name].items()}
+
+    def __iter__(self):
+        return iter(self._mesh.group_arrays)
+
+    def __len__(self):
+        return len(self._mesh.group_arrays)
+
+
+class Mesh(Mapping):
+    '''
+    Array-backed mesh. mesh['nodes'], mesh['elems'] and
+    mesh['groups'] behave like the dicts built by the
+    readers, so the writers accept a Mesh as mesh_dict
+    '''
+
+    def __init__(self, node_ids=(), coords=(), elem_blocks=None, group_arrays=None, check_order=True):
+        super(Mesh, self).__init__()
+        node_ids = np.asarray(node_ids, dtype=id_dtype)
+        coords = np.asarray(coords, dtype=coord_dtype).reshape(len(node_ids), 3)
+        if check_order and len(node_ids) > 1 and (np.diff(node_ids) <= 0).any():
+            order = np.argsort(node_ids, kind='stable')
+            node_ids = node_ids[order]
+            coords = coords[order]
+        self.node_index = IdIndex(node_ids)
+        self.coords = coords
+        self.elem_blocks = elem_blocks if elem_blocks is not None else {}
+        self.group_arrays = group_arrays if group_arrays is not None else {}
+        self._connectivity = None
+
+    @classmethod
+    def from_dict(cls, mesh_dict):
+        if isinstance(mesh_dict, Mesh):
+            return mesh_dict
+        nodes = mesh_dict.get('nodes', {})
+        node_ids = np.fromiter(nodes.keys(), dtype=id_dtype, count=len(nodes))
+        coords = np.array(list(nodes.values()), dtype=coord_dtype).reshape(-1, 3)
+        elem_blocks = {}
+        for elem_type, elems in mesh_dict.get('elems', {}).items():
+            elem_ids = np.fromiter(elems.keys(), dtype=id_dtype, count=len(elems))
+            try:
+                conn = np.array(list(elems.values()), dtype=id_dtype)
+            except ValueError:
+                raise ValueError('Elements of type {0} have different number of nodes'.format(elem_type))
+            elem_blocks[elem_type] = ElemBlock(elem_ids, conn)
+        group_arrays = {}
+        for gr_name, group in mesh_dict.get('groups', {}).items():
+            group_arrays[gr_name] = {ent_type: np.asarray(ids, dtype=id_dtype) for ent_type, ids in group.items()}
+        return cls(node_ids, coords, elem_blocks, group_arrays)
+
+    def to_dict(self):
+        nodes = dict(self.nodes.items())
+        elems = {elem_type: dict(ElemTypeView(block).items()) for elem_type, block in self.elem_blocks.items()}
+        groups = {gr_name: self.groups[gr_name] for gr_name in self.group_arrays}
+        return {'nodes': nodes, 'elems': elems, 'groups': groups}
+
+    @property
+    def node_ids(self):
+        return self.node_index.ids
+
+    @property
+    def nodes(self):
+        return NodesView(self)
+
+    @property
+    def elems(self):
+        return ElemsView(self)
+
+    @property
+    def groups(self):
+        return GroupsView(self)
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_elems(self):
+        return sum([len(block) for block in self.elem_blocks.values()])
+
+    @property
+    def nbytes(self):
+        n = self.node_ids.nbytes + self.coords.nbytes
+        n += sum([block.nbytes for block in self.elem_blocks.values()])
+        n += sum([ids.nbytes for group in self.group_arrays.values() for ids in group.values()])
+        return n
+
+    def group(self, gr_name):
+        # group gr_name as a Group, for set operations
+        from .groups import Group
+        return Group(self.group_arrays[gr_name])
+
+    def set_group(self, gr_name, group):
+        self.group_arrays[gr_name] = {ent_type: np.asarray(ids, dtype=id_dtype) for ent_type, ids in group.items()}
+
+    def connectivity(self):
+        # inverse connectivity (connectivity.Connectivity), rebuilt when nodes or blocks are replaced
+        if self._connectivity is None or not self._connectivity.is_current(self):
+            from .connectivity import Connectivity
+            self._connectivity = Connectivity(self)
+        return self._connectivity
+
+    def node_coords(self, node_ids):
+        return self.coords[self.node_index.rows(node_ids, strict=True)]
+
+    def __getitem__(self, key):
+        if key == 'nodes':
+            return self.nodes
+        elif key == 'elems':
+            return self.elems
+        elif key == 'groups':
+            return self.groups
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(mesh_keys)
+
+    def __len__(self):
+        return len(mesh_keys)
+
+    def __repr__(self):
+        types = ', '.join(['{0}: {1}'.format(k, len(b)) for k, b in self.elem_blocks.items()])
+        return '<Mesh nodes: {0}, elems: {{{1}}}, groups: {2}>'.format(self.n_nodes, types, len(self.group_arrays))
+
+
+def to_mesh(mesh_dict):
+    return Mesh.from_dict(mesh_dict)
+
+
+class ElemTypeIndex(object):
+    '''
+    Element id -> element type lookup filled chunk by chunk
+    while streaming elements, compact alternative to a dict
+    '''
+
+    def __init__(self):
+        super(ElemTypeIndex, self).__init__()
+        self.elem_types = []
+        self._chunks = []
+        self._ids = None
+        self._codes = None
+
+    def add(self, elem_type, elem_ids):
+        if elem_type not in self.elem_types:
+            self.elem_types.append(elem_type)
+        code = self.elem_types.index(elem_type)
+        self._chunks.append((code, np.asarray(elem_ids, dtype=id_dtype)))
+        self._ids = None
+
+    def _build(self):
+        if self._chunks:
+            ids = np.concatenate([chunk for _, chunk in self._chunks])
+            codes = np.concatenate([np.full(len(chunk), code, dtype=np.int16) for code, chunk in self._chunks])
+        else:
+            ids = np.zeros(0, dtype=id_dtype)
+            codes = np.zeros(0, dtype=np.int16)
+        order = np.argsort(ids, kind='stable')
+        self._ids = ids[order]
+        self._codes = codes[order]
+        self._chunks = [(code, ids[order][codes[order] == code]) for code in range(len(self.elem_types))]
+
+    def codes(self, elem_ids):
+        if self._ids is None:
+            self._build()
+        elem_ids = np.asarray(elem_ids, dtype=id_dtype)
+        rows = np.searchsorted(self._ids, elem_ids)
+        rows[rows == len(self._ids)] = 0
+        codes = np.full(len(elem_ids), -1, dtype=np.int16)
+        if len(self._ids):
+            found = self._ids[rows] == elem_ids
+            codes[found] = self._codes[rows[found]]
+        return codes
+
+    def __getitem__(self, elem_id):
+        code = int(self.codes([elem_id])[0])
+        if code < 0:
+            raise KeyError(elem_id)
+        return self.elem_types[code]
+
+    def __contains__(self, elem_id):
+        return int(self.codes([elem_id])[0]) >= 0
+
+    def split(self, elem_ids):
+        elem_ids = np.asarray(elem_ids, dtype=id_dtype)
+        codes = self.codes(elem_ids)
+        if (codes < 0).any():
+            raise KeyError(int(elem_ids[codes < 0][0]))
+        return {self.elem_types[code]: elem_ids[codes == code].tolist() for code in np.unique(codes).tolist()}
+
+
+def split_by_elem_type(entities, dict_elem_types):
+    if isinstance(dict_elem_types, ElemTypeIndex):
+        return dict_elem_types.split(entities)
+    ent_elem_types = [dict_elem_types[elem_id] for elem_id in entities]
+    pairs = list(zip(entities, ent_elem_types))
+    return {elem_type: [e[0] for e in list(
+        filter(lambda el: el[1] == elem_type, pairs))] for elem_type in set(ent_elem_types)}
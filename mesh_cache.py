@@ -0,0 +1,118 @@
+'''
+Module with persistent on-disk cache of parsed meshes.
+Meshes are stored as native .femb files keyed by file
+path, size, mtime and reader flags, so they can be
+memory-mapped on the next read instead of parsing the
+text deck again. Oldest entries are evicted when the
+cache grows over its size limit
+'''
+
+
+import os
+import json
+import hashlib
+import tempfile
+
+from .mesh import Mesh
+from .femb_binary_parser import read_femb, write_femb
+
+
+cache_extension = '.femb'
+
+
+class MeshCache(object):
+
+    DefaultCacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'fem_reader_meshes')
+    DefaultMaxSize = 4 * 1024 ** 3
+
+    def __init__(self, cache_dir=None, max_size=None, mmap=True):
+        super(MeshCache, self).__init__()
+        self.cache_dir = cache_dir or self.DefaultCacheDir
+        self.max_size = self.DefaultMaxSize if max_size is None else max_size
+        self.mmap = mmap
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, mesh_file, **flags):
+        stat = os.stat(mesh_file)
+        key_data = [os.path.abspath(mesh_file), stat.st_size, stat.st_mtime_ns, sorted(flags.items())]
+        return hashlib.sha1(json.dumps(key_data, default=str).encode('utf8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + cache_extension)
+
+    def get(self, mesh_file, **flags):
+        entry = self.entry_path(self.key(mesh_file, **flags))
+        if not os.path.exists(entry):
+            return None
+        try:
+            mesh = read_femb(entry, mmap=self.mmap)
+        except (OSError, ValueError):
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            return None
+        # mtime of the entry is used as last access time for LRU eviction
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return mesh
+
+    def put(self, mesh_file, mesh, **flags):
+        mesh = Mesh.from_dict(mesh)
+        if mesh.nbytes > self.max_size:
+            return None
+        entry = self.entry_path(self.key(mesh_file, **flags))
+        fd, tmp_entry = tempfile.mkstemp(prefix='.tmp_', suffix=cache_extension, dir=self.cache_dir)
+        os.close(fd)
+        try:
+            write_femb(tmp_entry, mesh)
+            os.replace(tmp_entry, entry)
+        except OSError:
+            try:
+                os.remove(tmp_entry)
+            except OSError:
+                pass
+            return None
+        self.evict(keep=entry)
+        return entry
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.tmp_') or not name.endswith(cache_extension):
+                continue
+            entry = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(entry)
+                entries.append((stat.st_mtime, stat.st_size, entry))
+            except OSError:
+                pass
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum([entry[1] for entry in self.entries()])
+
+    def evict(self, keep=None):
+        entries = self.entries()
+        total_size = sum([entry[1] for entry in entries])
+        for _, entry_size, entry in entries:
+            if total_size <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            try:
+                os.remove(entry)
+                total_size -= entry_size
+            except OSError:
+                pass
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
@@ -0,0 +1,70 @@
+'''
+Module for streaming conversion of meshes between
+formats (.dat, .inp, .out). Sections are passed one
+chunk at a time from the streaming reader of the source
+format to the streaming writer of the target format, so
+the whole mesh dict is never built in memory
+'''
+
+
+import os
+
+from .samcef_dat_parser import iter_dat, DatStreamWriter
+from .abaqus_inp_parser import iter_inp, InpStreamWriter
+from .patran_neutral_parser import iter_out, OutStreamWriter
+from .file_io import input_extension
+
+
+StreamReaderFromMeshFormatDict = {'patran': iter_out,
+                                  'samcef': iter_dat,
+                                  'abaqus': iter_inp}
+
+StreamReaderFromFileExtensionDict = {'.out': iter_out,
+                                     '.dat': iter_dat,
+                                     '.inp': iter_inp}
+
+StreamWriterFromMeshFormatDict = {'patran': OutStreamWriter,
+                                  'samcef': DatStreamWriter,
+                                  'abaqus': InpStreamWriter}
+
+StreamWriterFromFileExtensionDict = {'.out': OutStreamWriter,
+                                     '.dat': DatStreamWriter,
+                                     '.inp': InpStreamWriter}
+
+
+def get_stream_reader(mesh_file, mesh_format=None):
+    if mesh_format:
+        return StreamReaderFromMeshFormatDict[mesh_format]
+    return StreamReaderFromFileExtensionDict[input_extension(mesh_file)]
+
+
+def get_stream_writer(mesh_file, mesh_format=None):
+    if mesh_format:
+        return StreamWriterFromMeshFormatDict[mesh_format]
+    return StreamWriterFromFileExtensionDict[os.path.splitext(mesh_file)[-1]]
+
+
+def convert_mesh_file(mesh_file_in, mesh_file_out, format_in=None, format_out=None,
+                      read_nodes=True, read_elems=True, read_groups=True, chunk_size=100000):
+    '''
+    Converts mesh_file_in to mesh_file_out section by section.
+    Nodes and elements are written in the order of the source
+    file, element nodes are reordered by the writers exactly as
+    write_dat / write_inp / write_out do. Only the element id ->
+    type index needed to split groups by element type is kept
+    for the whole mesh
+    '''
+    reader_func = get_stream_reader(mesh_file_in, format_in)
+    writer_cls = get_stream_writer(mesh_file_out, format_out)
+    print('Conversion du fichier {0} vers {1}.'.format(mesh_file_in, mesh_file_out))
+    counts = {'nodes': 0, 'elems': 0, 'group': 0}
+    with writer_cls(mesh_file_out) as writer:
+        for section in reader_func(mesh_file_in, read_nodes, read_elems, read_groups, chunk_size=chunk_size):
+            writer.write_section(section)
+            if section[0] == 'nodes':
+                counts['nodes'] += len(section[1])
+            elif section[0] == 'elems':
+                counts['elems'] += len(section[2])
+            else:
+                counts['group'] += 1
+    return {'nodes': counts['nodes'], 'elems': counts['elems'], 'groups': counts['group']}
@@ -0,0 +1,171 @@
+'''
+Module for merging several meshes (parts, submodels read
+from different decks) in one array-backed Mesh. Node,
+element and group ids of each part are kept, offset or
+renumbered with array operations, and coincident nodes of
+different parts can be merged within a tolerance. The id
+mappings of each part are returned with the merged mesh
+'''
+
+
+import numpy as np
+
+from .mesh import Mesh, ElemBlock, IdIndex, id_dtype
+from .groups import sorted_unique
+
+
+def part_elem_ids(mesh):
+    # sorted ids of the elements of all types of a mesh
+    blocks = list(mesh.elem_blocks.values())
+    if not blocks:
+        return np.zeros(0, dtype=id_dtype)
+    return np.sort(np.concatenate([block.ids for block in blocks]))
+
+
+def new_part_ids(parts_ids, ids_mode, kind, check=True):
+    '''
+    New ids of the (sorted) ids of each part: 'keep' the ids (they must
+    not be in several parts, checked with check), 'offset' the ids of a
+    part past the ids of the previous ones when they overlap, or
+    'renumber' from 1
+    '''
+    new_ids = []
+    last_id = 0
+    for ids in parts_ids:
+        if not len(ids):
+            new_ids.append(ids.copy())
+        elif ids_mode == 'keep':
+            new_ids.append(ids.copy())
+        elif ids_mode == 'offset':
+            new_ids.append(ids + max(0, last_id - int(ids[0]) + 1))
+        elif ids_mode == 'renumber':
+            new_ids.append(np.arange(last_id + 1, last_id + 1 + len(ids), dtype=id_dtype))
+        else:
+            raise ValueError('Unknown ids mode {0}'.format(ids_mode))
+        if len(ids):
+            last_id = max(last_id, int(new_ids[-1][-1]))
+    if ids_mode == 'keep' and check and len(parts_ids) > 1:
+        check_unique(np.concatenate(new_ids), kind)
+    return new_ids
+
+
+def check_unique(ids, kind):
+    n_duplicates = len(ids) - len(sorted_unique(ids))
+    if n_duplicates:
+        raise ValueError('{0} {1} ids are in several meshes'.format(n_duplicates, kind))
+
+
+def overlap_rows(parts_points, tolerance):
+    # rows (in the concatenated points) of the points of each part inside the box of another part
+    boxes = [(points.min(0) - tolerance, points.max(0) + tolerance) if len(points) else None
+             for points in parts_points]
+    rows = []
+    start = 0
+    for i, points in enumerate(parts_points):
+        inside = np.zeros(len(points), dtype=bool)
+        for j, box in enumerate(boxes):
+            if j != i and box is not None:
+                inside |= ((points >= box[0]) & (points <= box[1])).all(1)
+        rows.append(start + np.flatnonzero(inside))
+        start += len(points)
+    return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+
+
+def coincident_labels(points, parts, tolerance):
+    '''
+    Label of each point: row of the first point (lowest row) of its
+    cluster of points closer than tolerance, only points of different
+    parts are merged
+    '''
+    from .spatial_index import SpatialIndex
+    labels = np.arange(len(points), dtype=np.int64)
+    parts_points = [points[parts == part] for part in np.unique(parts)]
+    candidates = overlap_rows(parts_points, tolerance)
+    if len(candidates) < 2:
+        return labels
+    index = SpatialIndex(points[candidates])
+    query_rows, point_rows, _ = index.radius_pairs(points[candidates], tolerance)
+    a, b = candidates[query_rows], candidates[index.ids[point_rows]]
+    keep = parts[a] != parts[b]
+    a, b = a[keep], b[keep]
+    # min label propagation with pointer jumping
+    while len(a):
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, a, labels[b])
+        new_labels = new_labels[new_labels]
+        if (new_labels == labels).all():
+            break
+        labels = new_labels
+    return labels
+
+
+def map_ids(old_ids, new_ids, ids, kind, part):
+    # new ids of ids of a part, ids not in the part are dropped
+    rows = IdIndex(old_ids).rows(ids)
+    missing = rows < 0
+    if missing.any():
+        print('{0} {1} des groupes de la partie {2} sont introuvables.'.format(missing.sum(), kind, part))
+    return new_ids[rows[~missing]]
+
+
+def merge_meshes(meshes, ids_mode='offset', tolerance=None, group_prefixes=None):
+    '''
+    Merges meshes (mesh dicts or Mesh) in one Mesh. ids_mode is 'offset',
+    'renumber' or 'keep' (see new_part_ids), nodes and elements are
+    numbered separately. With tolerance, nodes of different parts closer
+    than tolerance are merged in the node of the first part. Groups of
+    the same name are merged, unless group_prefixes (one per mesh) are
+    added to their names. Returns (mesh, id_maps), id_maps[i] being
+    {'nodes': (old ids, new ids), 'elems': (old ids, new ids)} of meshes[i]
+    '''
+    parts = [Mesh.from_dict(mesh) for mesh in meshes]
+    merge_nodes = tolerance is not None and len(parts) > 1
+    # with merged nodes, kept ids are checked once coincident nodes are merged
+    node_maps = new_part_ids([part.node_ids for part in parts], ids_mode, 'node', check=not merge_nodes)
+    elem_maps = new_part_ids([part_elem_ids(part) for part in parts], ids_mode, 'elem')
+    node_ids = np.concatenate([part.node_ids for part in parts]) if parts else np.zeros(0, dtype=id_dtype)
+    coords = np.concatenate([part.coords for part in parts]) if parts else np.zeros((0, 3))
+    new_node_ids = np.concatenate(node_maps) if parts else node_ids
+    part_rows = np.repeat(np.arange(len(parts)), [len(part.node_ids) for part in parts])
+    if merge_nodes:
+        labels = coincident_labels(coords, part_rows, tolerance)
+        kept = labels == np.arange(len(labels))
+        if ids_mode == 'renumber':
+            new_node_ids[kept] = np.arange(1, kept.sum() + 1, dtype=id_dtype)
+        elif ids_mode == 'keep':
+            check_unique(new_node_ids[kept], 'node')
+        new_node_ids = new_node_ids[labels]
+        starts = np.cumsum([0] + [len(part.node_ids) for part in parts])
+        node_maps = [new_node_ids[starts[i]:starts[i + 1]] for i in range(len(parts))]
+    else:
+        kept = np.ones(len(node_ids), dtype=bool)
+    elem_ids, elem_conns = {}, {}
+    groups = {}
+    for i, part in enumerate(parts):
+        old_elems = part_elem_ids(part)
+        for elem_type, block in part.elem_blocks.items():
+            conn = node_maps[i][part.node_index.rows(block.conn.ravel(), strict=True)].reshape(block.conn.shape)
+            elem_ids.setdefault(elem_type, []).append(elem_maps[i][np.searchsorted(old_elems, block.ids)])
+            elem_conns.setdefault(elem_type, []).append(conn)
+        prefix = group_prefixes[i] if group_prefixes else ''
+        for gr_name, group in part.group_arrays.items():
+            merged = groups.setdefault(prefix + gr_name, {})
+            for ent_type, ids in group.items():
+                if ent_type == 'node':
+                    new_ids = map_ids(part.node_ids, node_maps[i], ids, 'noeuds', i)
+                else:
+                    new_ids = map_ids(old_elems, elem_maps[i], ids, 'éléments', i)
+                merged.setdefault(ent_type, []).append(new_ids)
+    elem_blocks = {}
+    for elem_type in elem_ids:
+        try:
+            conn = np.concatenate(elem_conns[elem_type])
+        except ValueError:
+            raise ValueError('Elements of type {0} have different number of nodes'.format(elem_type))
+        elem_blocks[elem_type] = ElemBlock(np.concatenate(elem_ids[elem_type]), conn)
+    group_arrays = {gr_name: {ent_type: sorted_unique(np.concatenate(ids)) for ent_type, ids in group.items()}
+                    for gr_name, group in groups.items()}
+    mesh = Mesh(new_node_ids[kept], coords[kept], elem_blocks, group_arrays)
+    id_maps = [{'nodes': (part.node_ids, node_maps[i]), 'elems': (part_elem_ids(part), elem_maps[i])}
+               for i, part in enumerate(parts)]
+    return mesh, id_maps
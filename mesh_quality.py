@@ -0,0 +1,201 @@
+'''
+Module computing mesh statistics and element quality with
+batched array geometry. For each element type: count, size
+(volume, area or length), aspect ratio (longest / shortest
+edge) and scaled Jacobian (lowest over the corners, negative
+for inverted elements), with histograms and the worst elements.
+Quadratic elements are measured on their corner nodes
+'''
+
+
+import numpy as np
+
+from .mesh import Mesh
+
+
+# edges between corner nodes, in the node order of the mesh dict
+corner_edges = {'bar': ((0, 1),),
+                'tria': ((0, 1), (1, 2), (2, 0)),
+                'quad': ((0, 1), (1, 2), (2, 3), (3, 0)),
+                'tet': ((0, 1), (1, 2), (2, 0), (0, 3), (1, 3), (2, 3)),
+                'wedge': ((0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (0, 3), (1, 4), (2, 5)),
+                'hex': ((0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4),
+                        (0, 4), (1, 5), (2, 6), (3, 7))}
+
+# (corner, neighbour corners) giving a positive Jacobian for a valid element
+corner_frames = {'tria': ((0, 1, 2), (1, 2, 0), (2, 0, 1)),
+                 'quad': ((0, 1, 3), (1, 2, 0), (2, 3, 1), (3, 0, 2)),
+                 'tet': ((0, 1, 2, 3), (1, 2, 0, 3), (2, 0, 1, 3), (3, 0, 2, 1)),
+                 'wedge': ((0, 1, 2, 3), (1, 2, 0, 4), (2, 0, 1, 5), (3, 5, 4, 0), (4, 3, 5, 1), (5, 4, 3, 2)),
+                 'hex': ((0, 1, 3, 4), (1, 2, 0, 5), (2, 3, 1, 6), (3, 0, 2, 7),
+                         (4, 7, 5, 0), (5, 4, 6, 1), (6, 5, 7, 2), (7, 6, 4, 3))}
+
+# tets splitting the volume elements
+volume_tets = {'tet': ((0, 1, 2, 3),),
+               'wedge': ((0, 1, 2, 3), (1, 2, 3, 4), (2, 3, 4, 5)),
+               'hex': ((0, 1, 2, 6), (0, 2, 3, 6), (0, 3, 7, 6), (0, 7, 4, 6), (0, 4, 5, 6), (0, 5, 1, 6))}
+
+# elements measured at a time
+quality_chunk_size = 500000
+
+# quality measures and whether their worst values are the lowest ones
+quality_measures = (('size', True), ('aspect_ratio', False), ('scaled_jacobian', True))
+
+
+# vectors are (x, y, z) tuples of arrays, points (x, y, z) of (corners, n) arrays
+
+def edge(points, i, j):
+    return tuple([coords[j] - coords[i] for coords in points])
+
+
+def cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+
+def dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def norm(a):
+    return np.sqrt(dot(a, a))
+
+
+def element_sizes(family, points):
+    # volumes, areas or lengths of the elements
+    if family in volume_tets:
+        return sum([dot(edge(points, a, b), cross(edge(points, a, c), edge(points, a, d)))
+                    for a, b, c, d in volume_tets[family]]) / 6.0
+    if family == 'tria':
+        return 0.5 * norm(cross(edge(points, 0, 1), edge(points, 0, 2)))
+    if family == 'quad':
+        return 0.5 * norm(cross(edge(points, 0, 2), edge(points, 1, 3)))
+    return norm(edge(points, 0, 1))
+
+
+def aspect_ratios(family, points):
+    lengths = [norm(edge(points, i, j)) for i, j in corner_edges[family]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.maximum.reduce(lengths) / np.minimum.reduce(lengths)
+
+
+def scaled_jacobians(family, points):
+    '''
+    Lowest scaled Jacobian over the corners: triple product of the unit
+    edges to the neighbour corners (volume elements), or the sine of the
+    corner angle signed by the element normal (shells)
+    '''
+    if family not in corner_frames:
+        return np.ones(points[0].shape[1])
+    if family in ('tria', 'quad'):
+        normal = cross(edge(points, 0, 1), edge(points, 0, 2)) if family == 'tria' else \
+            cross(edge(points, 0, 2), edge(points, 1, 3))
+        normal_length = np.maximum(norm(normal), np.finfo(float).tiny)
+        normal = tuple([component / normal_length for component in normal])
+    jacobians = None
+    for frame in corner_frames[family]:
+        edges = [edge(points, frame[0], corner) for corner in frame[1:]]
+        lengths = np.prod([norm(vector) for vector in edges], axis=0)
+        if family in ('tria', 'quad'):
+            det = dot(cross(edges[0], edges[1]), normal)
+        else:
+            det = dot(edges[0], cross(edges[1], edges[2]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jacobian = np.where(lengths > 0, det / lengths, 0.0)
+        jacobians = jacobian if jacobians is None else np.minimum(jacobians, jacobian)
+    return jacobians
+
+
+def element_quality(mesh, elem_type):
+    '''
+    (ids, {measure: values}) of the elements of elem_type, see
+    quality_measures. None for element types without corner geometry
+    '''
+    mesh = Mesh.from_dict(mesh)
+    family = elem_type.rstrip('2')
+    if family not in corner_edges:
+        return None
+    block = mesh.elem_blocks[elem_type]
+    n_corners = max([max(edge) for edge in corner_edges[family]]) + 1
+    values = {measure: np.empty(len(block)) for measure, _ in quality_measures}
+    for chunk_start in range(0, len(block), quality_chunk_size):
+        chunk = slice(chunk_start, chunk_start + quality_chunk_size)
+        rows = mesh.node_index.rows(block.conn[chunk, :n_corners].T, strict=True)
+        points = tuple([mesh.coords[:, i][rows] for i in range(3)])
+        values['size'][chunk] = element_sizes(family, points)
+        values['aspect_ratio'][chunk] = aspect_ratios(family, points)
+        values['scaled_jacobian'][chunk] = scaled_jacobians(family, points)
+    return block.ids, values
+
+
+def histogram(values, bins):
+    # (counts, edges), nearly constant values go in bins around them
+    if not len(values):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    low, high = values.min(), values.max()
+    if high - low <= 1e-9 * max(abs(low), abs(high)):
+        pad = 0.5 * abs(low) if low else 0.5
+        return np.histogram(values, bins, range=(low - pad, high + pad))
+    return np.histogram(values, bins)
+
+
+def measure_statistics(ids, values, lowest_worst, bins, n_worst):
+    finite = np.isfinite(values)
+    summary = {'min': float(values[finite].min()) if finite.any() else float('nan'),
+               'max': float(values[finite].max()) if finite.any() else float('nan'),
+               'mean': float(values[finite].mean()) if finite.any() else float('nan'),
+               'n_degenerate': int((~finite).sum())}
+    summary['histogram'] = histogram(values[finite], bins)
+    # degenerate elements (nan, inf) come first among the worst
+    keys = np.where(finite, values if lowest_worst else -values, -np.inf)
+    n_worst = min(n_worst, len(keys))
+    worst = np.argpartition(keys, n_worst - 1)[:n_worst] if n_worst else np.zeros(0, dtype=np.int64)
+    worst = worst[np.argsort(keys[worst], kind='stable')]
+    summary['worst'] = (ids[worst], values[worst])
+    return summary
+
+
+def mesh_statistics(mesh, bins=10, n_worst=10):
+    '''
+    Statistics of mesh (mesh dict or Mesh): node and element counts,
+    bounding box, and for each element type its count and, for the
+    measures of quality_measures, min / max / mean, histogram (counts,
+    edges) with bins bins, and the n_worst worst elements (ids, values).
+    n_inverted counts the elements with a negative scaled Jacobian
+    '''
+    mesh = Mesh.from_dict(mesh)
+    coords = mesh.coords
+    stats = {'n_nodes': mesh.n_nodes,
+             'n_elems': mesh.n_elems,
+             'bounding_box': (coords.min(0), coords.max(0)) if len(coords) else (np.zeros(3), np.zeros(3)),
+             'types': {}}
+    for elem_type, block in mesh.elem_blocks.items():
+        type_stats = {'count': len(block)}
+        quality = element_quality(mesh, elem_type) if len(block) else None
+        if quality is not None:
+            ids, values = quality
+            for measure, lowest_worst in quality_measures:
+                type_stats[measure] = measure_statistics(ids, values[measure], lowest_worst, bins, n_worst)
+            type_stats['total_size'] = float(values['size'].sum())
+            type_stats['n_inverted'] = int((values['scaled_jacobian'] < 0).sum())
+        stats['types'][elem_type] = type_stats
+    return stats
+
+
+def format_statistics(stats):
+    lines = ['nodes: {0}  elems: {1}'.format(stats['n_nodes'], stats['n_elems']),
+             'bounding box: [{0}] - [{1}]'.format(
+                 ', '.join(['{0:.6g}'.format(x) for x in stats['bounding_box'][0]]),
+                 ', '.join(['{0:.6g}'.format(x) for x in stats['bounding_box'][1]])),
+             '',
+             '{0:<8}{1:>10}{2:>8}{3:>14}{4:>14}{5:>12}{6:>12}{7:>12}{8:>10}'.format(
+                 'type', 'elems', 'invert', 'size min', 'size total', 'AR mean', 'AR max', 'SJ min', 'worst SJ')]
+    for elem_type, type_stats in stats['types'].items():
+        if 'size' not in type_stats:
+            lines.append('{0:<8}{1:>10d}'.format(elem_type, type_stats['count']))
+            continue
+        worst_ids = type_stats['scaled_jacobian']['worst'][0]
+        lines.append('{0:<8}{1:>10d}{2:>8d}{3:>14.6g}{4:>14.6g}{5:>12.4g}{6:>12.4g}{7:>12.4g}{8:>10}'.format(
+            elem_type, type_stats['count'], type_stats['n_inverted'], type_stats['size']['min'],
+            type_stats['total_size'], type_stats['aspect_ratio']['mean'], type_stats['aspect_ratio']['max'],
+            type_stats['scaled_jacobian']['min'], str(worst_ids[0]) if len(worst_ids) else ''))
+    return '\n'.join(lines)
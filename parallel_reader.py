@@ -0,0 +1,300 @@
+'''
+Module for parallel parsing of a single large ASCII mesh
+deck (.dat, .inp, .out). The deck is indexed first (see
+section_index), large node and element sections are split
+in byte ranges at safe line boundaries, the ranges are
+parsed in worker processes and the partial arrays are
+merged in file order. The mesh dict is the same as the
+one of the serial reader, including the order of keys
+'''
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .section_index import (map_file, read_range, text_lines, dat_control_lines, dat_sections, split_dat_section,
+                            inp_blocks, inp_block_head, inp_text, split_inp_block, out_ranges)
+
+
+default_chunk_size = 32 * 1024 ** 2
+
+
+class ElemRows(object):
+    '''
+    Elements of a range in file order: ids, index of their type in
+    elem_types (in order of first appearance) and node lists per type
+    '''
+
+    def __init__(self):
+        super(ElemRows, self).__init__()
+        self.ids = []
+        self.codes = []
+        self.elem_types = []
+        self.rows = []
+        self._codes = {}
+
+    def add(self, elem_id, elem_type, elem_nodes):
+        code = self._codes.get(elem_type)
+        if code is None:
+            code = self._codes[elem_type] = len(self.elem_types)
+            self.elem_types.append(elem_type)
+            self.rows.append([])
+        self.ids.append(elem_id)
+        self.codes.append(code)
+        self.rows[code].append(elem_nodes)
+
+    def pack(self):
+        return (np.array(self.ids, dtype=np.int64), np.array(self.codes, dtype=np.int32),
+                self.elem_types, [pack_rows(rows) for rows in self.rows])
+
+
+def pack_rows(rows):
+    # 2d array when all rows have the same length, list of lists otherwise
+    if len(set(map(len, rows))) == 1:
+        return np.array(rows, dtype=np.int64)
+    return rows
+
+
+def pack_nodes(node_ids, coords):
+    return np.array(node_ids, dtype=np.int64), np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+
+class MeshMerger(object):
+    '''
+    Merges partial results in the mesh dict in the order they are given
+    '''
+
+    def __init__(self):
+        super(MeshMerger, self).__init__()
+        self.nodes = {}
+        self.elems = {}
+        self.groups = {}
+        self.dict_elem_types = {}
+
+    def add_nodes(self, node_ids, coords):
+        self.nodes.update(zip(node_ids.tolist(), coords.tolist()))
+
+    def add_elems(self, elem_ids, codes, elem_types, rows):
+        for code, elem_type in enumerate(elem_types):
+            if elem_type not in self.elems:
+                self.elems[elem_type] = {}
+            type_rows = rows[code].tolist() if isinstance(rows[code], np.ndarray) else rows[code]
+            self.elems[elem_type].update(zip(elem_ids[codes == code].tolist(), type_rows))
+        self.dict_elem_types.update(zip(elem_ids.tolist(), [elem_types[code] for code in codes.tolist()]))
+
+    def add(self, result):
+        if 'nodes' in result:
+            self.add_nodes(*result['nodes'])
+        if 'elems' in result:
+            self.add_elems(*result['elems'])
+        for gr_name, group in result.get('groups', []):
+            self.groups[gr_name] = group
+
+    def mesh_dict(self):
+        return {'nodes': self.nodes, 'elems': self.elems, 'groups': self.groups}
+
+
+def run_tasks(tasks, workers):
+    '''
+    Yields (task, result) in the order of tasks. Tasks are (func, args)
+    for worker processes or (None, args) for work done by the caller
+    '''
+    if workers == 1:
+        for func, args in tasks:
+            yield args, func(*args) if func else None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(args, executor.submit(func, *args) if func else None) for func, args in tasks]
+        for args, future in futures:
+            yield args, future.result() if future else None
+
+
+def default_workers(workers):
+    return workers or os.cpu_count() or 1
+
+
+# Samcef .dat
+
+
+def parse_dat_range(datin, kind, start, end):
+    from .samcef_dat_parser import read_dat_node_line, read_dat_elem_line
+    lines = text_lines(read_range(datin, start, end), 'utf8')
+    if kind == 'nodes':
+        node_ids, coords = [], []
+        for line in lines:
+            node_id, node_coords = read_dat_node_line(line)
+            node_ids.append(node_id)
+            coords.append(node_coords)
+        return {'nodes': pack_nodes(node_ids, coords)}
+    elem_rows = ElemRows()
+    for line in lines:
+        while "$" in line:
+            line = line.replace("$", "")
+            line += next(lines)
+        elem_rows.add(*read_dat_elem_line(line))
+    return {'elems': elem_rows.pack()}
+
+
+def read_dat_parallel(datin, read_nodes=1, read_elems=1, read_groups=1, workers=None,
+                      chunk_size=default_chunk_size):
+    from .samcef_dat_parser import read_dat, read_dat_sel_block
+    buffer = map_file(datin)
+    if buffer is None:
+        return read_dat(datin, read_nodes, read_elems, read_groups)
+    tasks = []
+    with buffer:
+        for kind, start, end in dat_sections(buffer, dat_control_lines(buffer), read_nodes, read_elems, read_groups):
+            if kind == 'groups':
+                tasks.append((None, (datin, kind, start, end)))
+                continue
+            for range_start, range_end in split_dat_section(buffer, kind, start, end, chunk_size):
+                tasks.append((parse_dat_range, (datin, kind, range_start, range_end)))
+    merger = MeshMerger()
+    counter = 0
+    for (_, kind, start, end), result in run_tasks(tasks, default_workers(workers)):
+        if kind == 'groups':
+            sel_lines = ''.join(text_lines(read_range(datin, start, end), 'utf8'))
+            counter = read_dat_sel_block(sel_lines, merger.dict_elem_types, merger.groups, counter)
+        else:
+            merger.add(result)
+    return merger.mesh_dict()
+
+
+# Abaqus .inp
+
+
+def parse_inp_range(inp_in, kind, start, end, at_line_start, at_eof, elem_type):
+    from .abaqus_inp_parser import (read_inp_nodes, read_inp_elems, read_inp_elem_type, abaqus_elem_types,
+                                    convert_out_to_inp_elem_list)
+    text = inp_text(read_range(inp_in, start, end), at_line_start, at_eof)
+    if kind == 'nodes':
+        nodes = read_inp_nodes(text)
+        return {'nodes': pack_nodes([node[0] for node in nodes], [node[1] for node in nodes])}
+    if not at_line_start:
+        # first range of the block starts with the keyword line
+        if elem_type is None:
+            abaqus_elem_type = read_inp_elem_type(text)
+            if abaqus_elem_type not in abaqus_elem_types:
+                return {'ignored': abaqus_elem_type}
+            elem_type = abaqus_elem_types[abaqus_elem_type]
+        text = text.split('\n', 1)[1]
+    elem_rows = ElemRows()
+    for data in read_inp_elems(text):
+        elem_rows.add(data[0], elem_type, convert_out_to_inp_elem_list(data[1:], elem_type))
+    return {'elems': elem_rows.pack()}
+
+
+def read_inp_parallel(inp_in, read_nodes=1, read_elems=1, read_groups=1, workers=None,
+                      chunk_size=default_chunk_size):
+    from .abaqus_inp_parser import (read_inp, read_inp_group, read_inp_elem_type, abaqus_elem_types,
+                                    is_node_block, is_elem_block, is_elset_block, is_nset_block)
+    from .mesh import split_by_elem_type
+    buffer = map_file(inp_in)
+    if buffer is None:
+        return read_inp(inp_in, read_nodes, read_elems, read_groups)
+    size = len(buffer)
+    tasks = []
+    with buffer:
+        for start, end in inp_blocks(buffer):
+            head = inp_block_head(buffer, start, end)
+            if read_nodes and is_node_block(head):
+                for range_start, range_end in split_inp_block(buffer, start, end, chunk_size):
+                    tasks.append((parse_inp_range, (inp_in, 'nodes', range_start, range_end, range_start != start,
+                                                    range_end == size, None)))
+            elif read_elems and is_elem_block(head):
+                try:
+                    abaqus_elem_type = read_inp_elem_type(head)
+                except IndexError:
+                    # type not on the keyword line, the whole block is left to one worker
+                    tasks.append((parse_inp_range, (inp_in, 'elems', start, end, start == 0, end == size, None)))
+                    continue
+                if abaqus_elem_type not in abaqus_elem_types:
+                    tasks.append((None, (inp_in, 'ignored', abaqus_elem_type)))
+                    continue
+                elem_type = abaqus_elem_types[abaqus_elem_type]
+                for range_start, range_end in split_inp_block(buffer, start, end, chunk_size, elems=True):
+                    tasks.append((parse_inp_range, (inp_in, 'elems', range_start, range_end, range_start != start,
+                                                    range_end == size, elem_type)))
+            elif read_groups and (is_elset_block(head) or is_nset_block(head)):
+                tasks.append((None, (inp_in, 'groups', start, end, start == 0, end == size)))
+    merger = MeshMerger()
+    for args, result in run_tasks(tasks, default_workers(workers)):
+        kind = args[1]
+        if kind == 'ignored' or (result and 'ignored' in result):
+            print('Elément du type {0} a été ignoré'.format(args[2] if kind == 'ignored' else result['ignored']))
+        elif kind == 'groups':
+            block = inp_text(read_range(inp_in, args[2], args[3]), args[4], args[5])
+            if is_elset_block(block):
+                gr_name, entities = read_inp_group(block, 'ELSET')
+                try:
+                    merger.groups[gr_name] = split_by_elem_type(entities, merger.dict_elem_types)
+                except:
+                    print('N\'arrive pas de lire le contenu du groupe {}'.format(gr_name))
+            else:
+                gr_name, entities = read_inp_group(block, 'NSET')
+                merger.groups[gr_name] = {'node': entities}
+        else:
+            merger.add(result)
+    return merger.mesh_dict()
+
+
+# Patran .out
+
+
+def parse_out_range(outin, start, end, read_nodes, read_elems, read_groups):
+    from .patran_neutral_parser import (is_finish_line, is_node_block, is_elem_block, is_group_block,
+                                        read_out_node_packet, read_out_elem_packet, read_out_group_packet)
+    f0 = text_lines(read_range(outin, start, end), 'utf8')
+    node_ids, coords = [], []
+    elem_rows = ElemRows()
+    groups = []
+    finished = False
+    for line in f0:
+        data = line.split()
+        if data:
+            if is_finish_line(line):
+                finished = True
+                break
+            if read_nodes and is_node_block(line):
+                node_id, node_coords = read_out_node_packet(line, f0)
+                node_ids.append(node_id)
+                coords.append(node_coords)
+            if read_elems and is_elem_block(line):
+                elem_rows.add(*read_out_elem_packet(line, f0))
+            if read_groups and is_group_block(line):
+                groups.append(read_out_group_packet(data, f0))
+    return {'nodes': pack_nodes(node_ids, coords), 'elems': elem_rows.pack(), 'groups': groups, 'finished': finished}
+
+
+def read_out_parallel(outin, read_nodes=True, read_elems=True, read_groups=True, workers=None,
+                      chunk_size=default_chunk_size):
+    from .patran_neutral_parser import read_out
+    buffer = map_file(outin)
+    if buffer is None:
+        return read_out(outin, read_nodes, read_elems, read_groups)
+    with buffer:
+        tasks = [(parse_out_range, (outin, start, end, read_nodes, read_elems, read_groups))
+                 for start, end in out_ranges(buffer, chunk_size)]
+    merger = MeshMerger()
+    for _, result in run_tasks(tasks, default_workers(workers)):
+        merger.add(result)
+        if result['finished']:
+            break
+    return merger.mesh_dict()
+
+
+ParallelReaderFromMeshFormatDict = {'patran': read_out_parallel,
+                                    'samcef': read_dat_parallel,
+                                    'abaqus': read_inp_parallel}
+
+ParallelReaderFromFileExtensionDict = {'.out': read_out_parallel,
+                                       '.dat': read_dat_parallel,
+                                       '.inp': read_inp_parallel}
+
+
+def get_parallel_reader(mesh_file, mesh_format=None):
+    if mesh_format:
+        return ParallelReaderFromMeshFormatDict.get(mesh_format)
+    return ParallelReaderFromFileExtensionDict.get(os.path.splitext(mesh_file)[-1])
@@ -0,0 +1,362 @@
+'''
+Module for reading only some groups of a mesh file.
+Group membership is read first, then only the elements of
+the groups and their nodes are extracted. ASCII decks are
+indexed once (byte ranges of node/element chunks with the
+bounds of their ids, group members), the index is kept in
+memory for the next reads of the same file and chunks that
+can't hold a wanted entity are never parsed
+'''
+
+
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from .mesh import Mesh, split_by_elem_type
+from .file_io import file_compression, input_extension
+from .section_index import (map_file, text_lines, dat_control_lines, dat_sections, split_dat_section, inp_blocks,
+                            inp_block_head, inp_text, split_inp_block, out_ranges, is_out_packet_header)
+from .parallel_reader import MeshMerger, run_tasks, parse_dat_range, parse_inp_range, parse_out_range
+
+
+default_index_chunk_size = 1024 ** 2
+index_cache_size = 8
+
+dat_id_expr = re.compile(rb'^\s*I\s+(\d+)', re.M)
+inp_id_expr = re.compile(rb'^\s*(\d+)\s*,', re.M)
+out_id_expr = re.compile(rb'^ ([12])\s*(\d+)\s', re.M)
+
+_index_cache = OrderedDict()
+
+
+class AnyElemType(dict):
+    # element type lookup used to read group members before the elements
+    def __missing__(self, elem_id):
+        return 'elem'
+
+
+class MeshIndex(object):
+    '''
+    node_chunks and elem_chunks are [(parse_func, args, min_id, max_id)],
+    groups is {group_name: {ent_type: ids}} where ent_type is 'node',
+    'elem' (elements of any type) or an element type
+    '''
+
+    def __init__(self, node_chunks, elem_chunks, groups):
+        super(MeshIndex, self).__init__()
+        self.node_chunks = node_chunks
+        self.elem_chunks = elem_chunks
+        self.groups = groups
+
+    def chunks_with(self, chunks, ids):
+        # chunks whose id bounds contain at least one of the sorted ids
+        selected = []
+        for chunk in chunks:
+            i = np.searchsorted(ids, chunk[2])
+            if i < len(ids) and ids[i] <= chunk[3]:
+                selected.append(chunk)
+        return selected
+
+
+def id_bounds(expr, data, group=1):
+    ids = [int(match.group(group)) for match in expr.finditer(data)]
+    if not ids:
+        return None
+    return min(ids), max(ids)
+
+
+def group_arrays(group):
+    return {ent_type: np.asarray(ids, dtype=np.int64) for ent_type, ids in group.items()}
+
+
+def index_dat(datin, chunk_size=default_index_chunk_size):
+    from .samcef_dat_parser import read_dat_sel_block
+    buffer = map_file(datin)
+    node_chunks, elem_chunks, groups = [], [], {}
+    if buffer is None:
+        return MeshIndex(node_chunks, elem_chunks, groups)
+    counter = 0
+    with buffer:
+        for kind, start, end in dat_sections(buffer, dat_control_lines(buffer)):
+            if kind == 'groups':
+                sel_lines = ''.join(text_lines(buffer[start:end], 'utf8'))
+                counter = read_dat_sel_block(sel_lines, AnyElemType(), groups, counter)
+                continue
+            chunks = node_chunks if kind == 'nodes' else elem_chunks
+            for range_start, range_end in split_dat_section(buffer, kind, start, end, chunk_size):
+                bounds = id_bounds(dat_id_expr, buffer[range_start:range_end])
+                if bounds:
+                    chunks.append((parse_dat_range, (datin, kind, range_start, range_end)) + bounds)
+    return MeshIndex(node_chunks, elem_chunks, {name: group_arrays(group) for name, group in groups.items()})
+
+
+def index_inp(inp_in, chunk_size=default_index_chunk_size):
+    from .abaqus_inp_parser import (read_inp_group, read_inp_elem_type, abaqus_elem_types,
+                                    is_node_block, is_elem_block, is_elset_block, is_nset_block)
+    buffer = map_file(inp_in)
+    node_chunks, elem_chunks, groups = [], [], {}
+    if buffer is None:
+        return MeshIndex(node_chunks, elem_chunks, groups)
+    with buffer:
+        size = len(buffer)
+        for start, end in inp_blocks(buffer):
+            head = inp_block_head(buffer, start, end)
+            if is_node_block(head) or is_elem_block(head):
+                kind = 'nodes' if is_node_block(head) else 'elems'
+                elem_type = None
+                if kind == 'elems':
+                    try:
+                        abaqus_elem_type = read_inp_elem_type(head)
+                    except IndexError:
+                        abaqus_elem_type = None
+                    if abaqus_elem_type is not None and abaqus_elem_type not in abaqus_elem_types:
+                        continue
+                    if abaqus_elem_type is not None:
+                        elem_type = abaqus_elem_types[abaqus_elem_type]
+                chunks = node_chunks if kind == 'nodes' else elem_chunks
+                block_ranges = split_inp_block(buffer, start, end, chunk_size, elems=(kind == 'elems'))
+                if elem_type is None and kind == 'elems':
+                    block_ranges = [(start, end)]
+                for range_start, range_end in block_ranges:
+                    data = buffer[range_start:range_end]
+                    if range_start == start:
+                        data = data[data.find(b'\n') + 1:] if b'\n' in data else b''
+                    bounds = id_bounds(inp_id_expr, data)
+                    if bounds:
+                        chunks.append((parse_inp_range, (inp_in, kind, range_start, range_end, range_start != start,
+                                                         range_end == size, elem_type)) + bounds)
+            elif is_elset_block(head) or is_nset_block(head):
+                block = inp_text(buffer[start:end], start == 0, end == size)
+                if is_elset_block(block):
+                    gr_name, entities = read_inp_group(block, 'ELSET')
+                    groups[gr_name] = {'elem': entities}
+                else:
+                    gr_name, entities = read_inp_group(block, 'NSET')
+                    groups[gr_name] = {'node': entities}
+    return MeshIndex(node_chunks, elem_chunks, {name: group_arrays(group) for name, group in groups.items()})
+
+
+def index_out(outin, chunk_size=default_index_chunk_size):
+    from .patran_neutral_parser import read_out_group_packet
+    buffer = map_file(outin)
+    node_chunks, elem_chunks, groups = [], [], {}
+    if buffer is None:
+        return MeshIndex(node_chunks, elem_chunks, groups)
+    with buffer:
+        size = len(buffer)
+        # nothing is read after the finish packet
+        for match in re.finditer(rb'^99', buffer, re.M):
+            size = match.start()
+            break
+        for start, end in out_ranges(buffer, chunk_size):
+            if start >= size:
+                break
+            end = min(end, size)
+            data = buffer[start:end]
+            node_ids, elem_ids = [], []
+            for match in out_id_expr.finditer(data):
+                (node_ids if match.group(1) == b'1' else elem_ids).append(int(match.group(2)))
+            if node_ids:
+                node_chunks.append((parse_out_range, (outin, start, end, True, False, False),
+                                    min(node_ids), max(node_ids)))
+            if elem_ids:
+                elem_chunks.append((parse_out_range, (outin, start, end, False, True, False),
+                                    min(elem_ids), max(elem_ids)))
+        for match in re.finditer(rb'^21', buffer[:size], re.M):
+            pos = match.start()
+            header_end = buffer.find(b'\n', pos) + 1 or size
+            if not is_out_packet_header(buffer[pos:header_end]):
+                continue
+            f0 = text_lines(buffer[header_end:size], 'utf8')
+            gr_name, group = read_out_group_packet(buffer[pos:header_end].decode('utf8').split(), f0)
+            groups[gr_name] = group
+    return MeshIndex(node_chunks, elem_chunks, {name: group_arrays(group) for name, group in groups.items()})
+
+
+IndexFromMeshFormatDict = {'patran': index_out,
+                           'samcef': index_dat,
+                           'abaqus': index_inp}
+
+IndexFromFileExtensionDict = {'.out': index_out,
+                              '.dat': index_dat,
+                              '.inp': index_inp}
+
+
+def get_index_func(mesh_file, mesh_format=None):
+    if mesh_format:
+        return IndexFromMeshFormatDict.get(mesh_format)
+    return IndexFromFileExtensionDict.get(os.path.splitext(mesh_file)[-1])
+
+
+def get_mesh_index(mesh_file, mesh_format=None, chunk_size=default_index_chunk_size):
+    stat = os.stat(mesh_file)
+    key = (os.path.abspath(mesh_file), stat.st_size, stat.st_mtime_ns, chunk_size)
+    if key in _index_cache:
+        _index_cache.move_to_end(key)
+        return _index_cache[key]
+    index = get_index_func(mesh_file, mesh_format)(mesh_file, chunk_size)
+    _index_cache[key] = index
+    while len(_index_cache) > index_cache_size:
+        _index_cache.popitem(last=False)
+    return index
+
+
+def clear_index_cache():
+    _index_cache.clear()
+
+
+def filter_nodes(packed, wanted):
+    node_ids, coords = packed
+    mask = np.isin(node_ids, wanted)
+    return node_ids[mask], coords[mask]
+
+
+def filter_elems(packed, wanted):
+    elem_ids, codes, elem_types, rows = packed
+    mask = np.isin(elem_ids, wanted)
+    type_rows = []
+    for code in range(len(elem_types)):
+        type_mask = mask[codes == code]
+        if isinstance(rows[code], np.ndarray):
+            type_rows.append(rows[code][type_mask])
+        else:
+            type_rows.append([row for row, keep in zip(rows[code], type_mask.tolist()) if keep])
+    # types without any wanted element are dropped so that they don't appear in the mesh dict
+    kept_codes = [code for code in range(len(elem_types)) if len(type_rows[code])]
+    new_codes = np.full(len(elem_types), -1, dtype=np.int32)
+    new_codes[kept_codes] = np.arange(len(kept_codes), dtype=np.int32)
+    return (elem_ids[mask], new_codes[codes[mask]], [elem_types[code] for code in kept_codes],
+            [type_rows[code] for code in kept_codes])
+
+
+def selected_groups(groups, group_names, mesh_file):
+    selected = {}
+    for gr_name in group_names:
+        if gr_name in groups:
+            selected[gr_name] = groups[gr_name]
+        else:
+            print('Groupe {0} introuvable dans le fichier {1}.'.format(gr_name, mesh_file))
+    return selected
+
+
+def wanted_ids(groups, ent_types):
+    ids = [group[ent_type] for group in groups.values() for ent_type in group if ent_type in ent_types]
+    if not ids:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate([np.asarray(i, dtype=np.int64) for i in ids]))
+
+
+def split_group(group, dict_elem_types):
+    # group members of any element type are split by the types of the extracted elements
+    split = {}
+    for ent_type, ids in group.items():
+        ids = [int(i) for i in ids]
+        if ent_type == 'elem':
+            split.update(split_by_elem_type([i for i in ids if i in dict_elem_types], dict_elem_types))
+        else:
+            split[ent_type] = ids
+    return split
+
+
+def read_indexed_groups(mesh_file, group_names, mesh_format=None, read_nodes=True, read_elems=True, workers=1,
+                        chunk_size=default_index_chunk_size):
+    index = get_mesh_index(mesh_file, mesh_format, chunk_size)
+    groups = selected_groups(index.groups, group_names, mesh_file)
+    elem_ids = wanted_ids(groups, [ent_type for group in groups.values() for ent_type in group if ent_type != 'node'])
+    merger = MeshMerger()
+    tasks = [chunk[:2] for chunk in index.chunks_with(index.elem_chunks, elem_ids)]
+    for _, result in run_tasks(tasks, workers):
+        if 'elems' in result:
+            merger.add_elems(*filter_elems(result['elems'], elem_ids))
+    node_ids = [wanted_ids(groups, ['node'])]
+    for elems in merger.elems.values():
+        node_ids.append(np.fromiter([node_id for nodes in elems.values() for node_id in nodes], dtype=np.int64))
+    node_ids = np.unique(np.concatenate(node_ids))
+    if read_nodes:
+        tasks = [chunk[:2] for chunk in index.chunks_with(index.node_chunks, node_ids)]
+        for _, result in run_tasks(tasks, workers):
+            merger.add_nodes(*filter_nodes(result['nodes'], node_ids))
+    mesh_dict = merger.mesh_dict()
+    mesh_dict['groups'] = {gr_name: split_group(group, merger.dict_elem_types) for gr_name, group in groups.items()}
+    if not read_elems:
+        mesh_dict['elems'] = {}
+    return mesh_dict
+
+
+def read_femb_groups(femb_file, group_names, read_nodes=True, read_elems=True):
+    from .femb_binary_parser import read_femb
+    from .mesh import ElemBlock
+    mesh = read_femb(femb_file)
+    groups = selected_groups(mesh.group_arrays, group_names, femb_file)
+    elem_blocks = {}
+    node_ids = [wanted_ids(groups, ['node'])]
+    for elem_type, block in mesh.elem_blocks.items():
+        wanted = wanted_ids(groups, [elem_type])
+        if not len(wanted):
+            continue
+        mask = np.isin(block.ids, wanted)
+        elem_blocks[elem_type] = ElemBlock(block.ids[mask], block.conn[mask], check_order=False)
+        node_ids.append(elem_blocks[elem_type].conn.ravel())
+    node_ids = np.unique(np.concatenate(node_ids))
+    if read_nodes:
+        mask = np.isin(mesh.node_ids, node_ids)
+        nodes = (mesh.node_ids[mask], mesh.coords[mask])
+    else:
+        nodes = (np.zeros(0, dtype=np.int64), np.zeros((0, 3)))
+    return Mesh(nodes[0], nodes[1], elem_blocks if read_elems else {}, groups, check_order=False)
+
+
+def select_groups(mesh_dict, group_names, mesh_file=None):
+    '''
+    Sub-mesh of a mesh dict with the given groups, the elements of
+    the groups and their nodes (plus the nodes of node groups)
+    '''
+    groups = selected_groups(mesh_dict['groups'], group_names, mesh_file)
+    elem_ids = {}
+    node_ids = set()
+    for group in groups.values():
+        for ent_type, ids in group.items():
+            if ent_type == 'node':
+                node_ids.update(ids)
+            else:
+                elem_ids.setdefault(ent_type, set()).update(ids)
+    elems = {}
+    for elem_type, type_elems in mesh_dict['elems'].items():
+        wanted = elem_ids.get(elem_type)
+        if wanted:
+            elems[elem_type] = {elem_id: nodes for elem_id, nodes in type_elems.items() if elem_id in wanted}
+            for nodes in elems[elem_type].values():
+                node_ids.update(nodes)
+    nodes = {node_id: coords for node_id, coords in mesh_dict['nodes'].items() if node_id in node_ids}
+    return {'nodes': nodes, 'elems': elems, 'groups': {name: dict(group) for name, group in groups.items()}}
+
+
+def read_mesh_groups(mesh_file, group_names, mesh_format=None, read_nodes=True, read_elems=True, workers=1,
+                     reader_func=None):
+    '''
+    Reads the groups group_names of mesh_file with their elements and
+    nodes. Formats without index and compressed files are read in
+    full (with reader_func, by default the reader of FEMReader for
+    the format or the file extension) and filtered
+    '''
+    if mesh_format == 'femb' or (not mesh_format and mesh_file.endswith('.femb')):
+        return read_femb_groups(mesh_file, group_names, read_nodes, read_elems)
+    if get_index_func(mesh_file, mesh_format) is not None and not file_compression(mesh_file):
+        return read_indexed_groups(mesh_file, group_names, mesh_format, read_nodes, read_elems, workers)
+    if reader_func is None:
+        from . import FEMReader
+        if mesh_format:
+            reader_func = FEMReader.ReaderFromMeshFormatDict.get(mesh_format)
+        else:
+            reader_func = FEMReader.ReaderFromFileExtensionDict.get(input_extension(mesh_file))
+        if reader_func is None:
+            raise ValueError('No mesh reader for {0}'.format(mesh_file))
+    mesh_dict = select_groups(reader_func(mesh_file, True, True, True), group_names, mesh_file)
+    if not read_nodes:
+        mesh_dict['nodes'] = {}
+    if not read_elems:
+        mesh_dict['elems'] = {}
+    return mesh_dict
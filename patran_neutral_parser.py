@@ -9,6 +9,8 @@ import re
 from datetime import datetime
 
 from .common_functions import check_num, sci_float
+from .file_io import open_input
+from .instrumentation import phase
 
 
 patran_elem_types = {2: 'bar',
@@ -67,6 +69,54 @@ def is_finish_line(line):
     return line.startswith('99')
 
 
+out_float_expr = r"\-?\d+\.?\d*(?i:E\-?\+?\d+)?"
+
+
+def read_out_node_packet(line, f0):
+    node_id = int(line[2:11].strip())
+    coo_str = next(f0)
+    coords = re.findall(out_float_expr, coo_str)
+    next(f0)
+    return node_id, [float(coords[0]), float(coords[1]), float(coords[2])]
+
+
+def read_out_elem_packet(line, f0):
+    next(f0)
+    elem_id = int(line[2:11].strip())
+    elem_type = patran_elem_types[int(line[11:18].strip())]
+    block_size = int(int(line[18:26].strip()))
+    elem_nodes = []
+    for i in range(block_size - 1):
+        cur_str = next(f0)
+        elem_nodes_cur = [int(cur_str[j*8:(j+1)*8].strip())
+                          for j in range(10) if check_num(cur_str[j*8:(j+1)*8].strip())]
+        elem_nodes.extend(elem_nodes_cur)
+    elem_nodes = [node for node in elem_nodes if node]
+    if len(elem_nodes) > patran_elem_size[elem_type]:
+        elem_type = elem_type + '2'
+    return elem_id, elem_type, elem_nodes
+
+
+def read_out_group_packet(data, f0):
+    block_size = int(data[3])
+    group_name = next(f0).strip()
+    group = {}
+    group_entity_types = set()
+    for i in range(block_size - 1):
+        cur_line = [int(s) for s in next(f0).split() if int(s) != 0]
+        for j in range(0, len(cur_line), 2):
+            try:
+                cur_type = patran_entity_types[cur_line[j]]
+                cur_ent = cur_line[j+1]
+                if cur_type not in group_entity_types:
+                    group_entity_types.add(cur_type)
+                    group[cur_type] = []
+                group[cur_type].append(cur_ent)
+            except Exception as e:
+                pass
+    return group_name, group
+
+
 def read_out(outin, read_nodes=True, read_elems=True, read_groups=True):
 
     nodes = {}
@@ -74,60 +124,88 @@ def read_out(outin, read_nodes=True, read_elems=True, read_groups=True):
     groups = {}
     elem_types = set()
     mesh_dict = {'nodes': {}, 'elems': {}, 'groups': {}}
-    float_expr = r"\-?\d+\.?\d*(?i:E\-?\+?\d+)?"
-    with open(outin, 'r', encoding="utf8") as f0:
+    with open_input(outin, 'r', encoding="utf8") as f0, phase('read', 'read_out', outin, f0) as read_phase:
+        read_phase.section('header')
         for line in f0:
             data = line.split()
             if data:
                 if is_finish_line(line):
                     break
                 if read_nodes and is_node_block(line):
-                    node_id = int(line[2:11].strip())
-                    coo_str = next(f0)
-                    coords = re.findall(float_expr, coo_str)
-                    nodes[node_id] = [float(coords[0]), float(coords[1]), float(coords[2])]
-                    next(f0)
+                    section = read_phase.section('nodes')
+                    node_id, coords = read_out_node_packet(line, f0)
+                    nodes[node_id] = coords
+                    section.count()
                 if read_elems and is_elem_block(line):
-                    next(f0)
-                    elem_id = int(line[2:11].strip())
-                    elem_type = patran_elem_types[int(line[11:18].strip())]
-                    block_size = int(int(line[18:26].strip()))
-                    elem_nodes = []
-                    for i in range(block_size - 1):
-                        cur_str = next(f0)
-                        elem_nodes_cur = [int(cur_str[j*8:(j+1)*8].strip())
-                                          for j in range(10) if check_num(cur_str[j*8:(j+1)*8].strip())]
-                        elem_nodes.extend(elem_nodes_cur)
-                    elem_nodes = [node for node in elem_nodes if node]
-                    if len(elem_nodes) > patran_elem_size[elem_type]:
-                        elem_type = elem_type + '2'
+                    section = read_phase.section('elems')
+                    elem_id, elem_type, elem_nodes = read_out_elem_packet(line, f0)
                     if elem_type not in elem_types:
                         elem_types.add(elem_type)
                         elems[elem_type] = {}
                     elems[elem_type][elem_id] = elem_nodes
+                    section.count()
                 if read_groups and is_group_block(line):
-                    block_size = int(data[3])
-                    group_name = next(f0).strip()
-                    groups[group_name] = {}
-                    group_entity_types = set()
-                    for i in range(block_size - 1):
-                        cur_line = [int(s) for s in next(f0).split() if int(s) != 0]
-                        for j in range(0, len(cur_line), 2):
-                            try:
-                                cur_type = patran_entity_types[cur_line[j]]
-                                cur_ent = cur_line[j+1]
-                                if cur_type not in group_entity_types:
-                                    group_entity_types.add(cur_type)
-                                    groups[group_name][cur_type] = []
-                                groups[group_name][cur_type].append(cur_ent)
-                            except Exception as e:
-                                pass
+                    section = read_phase.section('groups')
+                    group_name, group = read_out_group_packet(data, f0)
+                    groups[group_name] = group
+                    section.count()
     mesh_dict['nodes'] = nodes
     mesh_dict['elems'] = elems
     mesh_dict['groups'] = groups
     return mesh_dict
 
 
+def iter_out(outin, read_nodes=True, read_elems=True, read_groups=True, chunk_size=100000):
+    '''
+    Streaming version of read_out, yields the sections described
+    in samcef_dat_parser.iter_dat. Consecutive packets of the same
+    kind are gathered in chunks of chunk_size entities
+    '''
+    node_ids, coords = [], []
+    elem_chunks = {}
+
+    def flush_nodes():
+        if node_ids:
+            yield ('nodes', node_ids[:], coords[:])
+            del node_ids[:], coords[:]
+
+    def flush_elems():
+        for elem_type, (elem_ids, conn) in list(elem_chunks.items()):
+            if elem_ids:
+                yield ('elems', elem_type, elem_ids, conn)
+        elem_chunks.clear()
+
+    with open_input(outin, 'r', encoding="utf8") as f0:
+        for line in f0:
+            data = line.split()
+            if data:
+                if is_finish_line(line):
+                    break
+                if read_nodes and is_node_block(line):
+                    yield from flush_elems()
+                    node_id, node_coords = read_out_node_packet(line, f0)
+                    node_ids.append(node_id)
+                    coords.append(node_coords)
+                    if len(node_ids) == chunk_size:
+                        yield from flush_nodes()
+                if read_elems and is_elem_block(line):
+                    yield from flush_nodes()
+                    elem_id, elem_type, elem_nodes = read_out_elem_packet(line, f0)
+                    if elem_type not in elem_chunks:
+                        elem_chunks[elem_type] = ([], [])
+                    elem_chunks[elem_type][0].append(elem_id)
+                    elem_chunks[elem_type][1].append(elem_nodes)
+                    if len(elem_chunks[elem_type][0]) == chunk_size:
+                        yield ('elems', elem_type) + elem_chunks.pop(elem_type)
+                if read_groups and is_group_block(line):
+                    yield from flush_nodes()
+                    yield from flush_elems()
+                    group_name, group = read_out_group_packet(data, f0)
+                    yield ('group', group_name, group)
+    yield from flush_nodes()
+    yield from flush_elems()
+
+
 def count_lines(array, ncolumns):
     return len(array) // ncolumns + int(bool(len(array) % ncolumns))
 
@@ -145,66 +223,143 @@ def out_group_lines(pairs):
                       for i in range(count_lines(pairs, 5))]) + '0'.rjust(8)*2*(rest_columns(pairs, 5))
 
 
-def write_out(outout, mesh_dict, write_nodes=True, write_elems=True, write_groups=True):
-
-    n_nodes = len(mesh_dict['nodes'])
-    n_elems = sum([len(mesh_dict['elems'][k]) for k in mesh_dict['elems'].keys()])
+def out_header(outout, n_nodes, n_elems):
     date = str(datetime.now().strftime('%d-%m-%y')).ljust(12)
     time = str(datetime.now().strftime('%H:%M:%S')).ljust(12)
     ver = '3.0'.rjust(8)
+    return ''.join(['25       0       0       1       0       0       0       0       0\n',
+                    'P3/PATRAN Neutral File from: {0}'.format(os.path.abspath(outout))[0:80] + '\n',
+                    out_summary_line(n_nodes, n_elems),
+                    '{0}{1}{2}\n'.format(date, time, ver)])
+
+
+def out_summary_line(n_nodes, n_elems):
+    return '26       0       0       1{0}{1}{2}\n'.format(str(n_nodes).rjust(8), str(n_elems).rjust(8), '0'.rjust(8)*3)
+
+
+def out_node_packet(node_id, coords):
+    return ''.join([' 1{0}{1}{2}{3}\n'.format(str(node_id).rjust(8), '0'.rjust(8), '2'.rjust(8), '0'.rjust(8)*5),
+                    ''.join([sci_float(coo, prec=9, exp_digits=1).rjust(16) for coo in coords]) + '\n',
+                    '1G       6       0       0  000000\n'])
+
+
+def out_elem_packet(elem_id, elem_type, elem_nodes):
+    block_size = 1 + count_lines(elem_nodes, 10)
+    return ''.join([' 2{0}{1}{2}{3}\n'.format(str(elem_id).rjust(8), str(
+                        abs(elem_type)).rjust(8), str(block_size).rjust(8), '0'.rjust(8)*5),
+                    '{0}{1}{2}\n'.format(str(len(elem_nodes)).rjust(8),
+                                         '0'.rjust(8)*3, sci_float(0, prec=9, exp_digits=2).rjust(16)*3),
+                    '{0}\n'.format(out_elem_lines(elem_nodes))])
+
+
+def out_group_packet(i_gr, group_name, group):
+    node_pairs = []
+    elem_pairs = []
+    for ent_type in group.keys():
+        cur_pairs = [(patran_entity_types_[ent_type], entity)
+                     for entity in group[ent_type]]
+        if ent_type == 'node':
+            node_pairs = cur_pairs
+        else:
+            elem_pairs.extend(cur_pairs)
+    node_pairs.sort(key=lambda pair: pair[1])
+    elem_pairs.sort(key=lambda pair: pair[1])
+    pairs = node_pairs + elem_pairs
+    block_size = 1 + count_lines(pairs, 5)
+    return ''.join(['21{0}{1}{2}{3}\n'.format(str(i_gr).rjust(8), str(
+                        2 * len(pairs)).rjust(8), str(block_size).rjust(8), '0'.rjust(8)*5),
+                    '{0}\n'.format(group_name),
+                    '{0}\n'.format(out_group_lines(pairs))])
+
+
+out_finish_line = '99       0       0       1       0       0       0       0       0\n'
+
+
+def write_out(outout, mesh_dict, write_nodes=True, write_elems=True, write_groups=True, renumber=None):
+    # renumber: None, 'compact' or 'rcm' (see renumbering.renumber_mesh). The id maps
+    # of the renumbering are returned, for renumbering.renumber_field (None otherwise)
+    id_maps = None
+    if renumber:
+        from .renumbering import renumber_mesh
+        mesh_dict, id_maps = renumber_mesh(mesh_dict, renumber)
+
+    n_nodes = len(mesh_dict['nodes'])
+    n_elems = sum([len(mesh_dict['elems'][k]) for k in mesh_dict['elems'].keys()])
     with open(outout, 'w') as f0:
-        f0.write('25       0       0       1       0       0       0       0       0\n')
-        f0.write('P3/PATRAN Neutral File from: {0}'.format(os.path.abspath(outout))[0:80] + '\n')
-        f0.write('26       0       0       1{0}{1}{2}\n'.format(
-            str(n_nodes).rjust(8), str(n_elems).rjust(8), '0'.rjust(8)*3))
-        f0.write('{0}{1}{2}\n'.format(date, time, ver))
+        f0.write(out_header(outout, n_nodes, n_elems))
         if mesh_dict['nodes'] and write_nodes:
-            node_ids = list(mesh_dict['nodes'].keys())
-            node_ids.sort()
-            for node_id in node_ids:
-                f0.write(' 1{0}{1}{2}{3}\n'.format(str(node_id).rjust(
-                    8), '0'.rjust(8), '2'.rjust(8), '0'.rjust(8)*5))
-                f0.write(''.join([sci_float(coo, prec=9, exp_digits=1).rjust(16)
-                                  for coo in mesh_dict['nodes'][node_id]]) + '\n')
-                f0.write('1G       6       0       0  000000\n')
+            node_pairs = sorted(mesh_dict['nodes'].items(), key=lambda pair: pair[0])
+            for node_id, coords in node_pairs:
+                f0.write(out_node_packet(node_id, coords))
         if mesh_dict['elems'] and write_elems:
             elem_dict = {}
             for elem_type in mesh_dict['elems'].keys():
                 elem_dict.update({k: (abs(patran_elem_types_[
-                                 elem_type]), mesh_dict['elems'][elem_type][k]) for k in mesh_dict['elems'][elem_type].keys()})
+                                 elem_type]), v) for k, v in mesh_dict['elems'][elem_type].items()})
             elem_ids = list(elem_dict.keys())
             elem_ids.sort()
             for elem_id in elem_ids:
-                elem_type = elem_dict[elem_id][0]
-                elem_nodes = elem_dict[elem_id][1]
-                block_size = 1 + count_lines(elem_nodes, 10)
-                f0.write(' 2{0}{1}{2}{3}\n'.format(str(elem_id).rjust(8), str(
-                    abs(elem_type)).rjust(8), str(block_size).rjust(8), '0'.rjust(8)*5))
-                f0.write('{0}{1}{2}\n'.format(str(len(elem_nodes)).rjust(8),
-                                              '0'.rjust(8)*3, sci_float(0, prec=9, exp_digits=2).rjust(16)*3))
-                f0.write('{0}\n'.format(out_elem_lines(elem_nodes)))
+                f0.write(out_elem_packet(elem_id, *elem_dict[elem_id]))
         if mesh_dict['groups'] and write_groups:
             i_gr = 1
             group_dict = mesh_dict['groups']
             groups = list(group_dict.keys())
             groups.sort()
             for group in groups:
-                node_pairs = []
-                elem_pairs = []
-                for ent_type in group_dict[group].keys():
-                    cur_pairs = [(patran_entity_types_[ent_type], entity)
-                                 for entity in group_dict[group][ent_type]]
-                    if ent_type == 'node':
-                        node_pairs = cur_pairs
-                    else:
-                        elem_pairs.extend(cur_pairs)
-                node_pairs.sort(key=lambda pair: pair[1])
-                elem_pairs.sort(key=lambda pair: pair[1])
-                pairs = node_pairs + elem_pairs
-                block_size = 1 + count_lines(pairs, 5)
-                f0.write('21{0}{1}{2}{3}\n'.format(str(i_gr).rjust(8), str(
-                    2 * len(pairs)).rjust(8), str(block_size).rjust(8), '0'.rjust(8)*5))
-                f0.write('{0}\n'.format(group))
-                f0.write('{0}\n'.format(out_group_lines(pairs)))
+                f0.write(out_group_packet(i_gr, group, group_dict[group]))
                 i_gr += 1
-        f0.write('99       0       0       1       0       0       0       0       0\n')
+        f0.write(out_finish_line)
+    return id_maps
+
+
+class OutStreamWriter(object):
+    '''
+    Writes a Patran neutral file packet by packet, in the order
+    the sections are given (see samcef_dat_parser.iter_dat). Node
+    and element counts of the summary packet are updated on close
+    '''
+
+    def __init__(self, outout):
+        super(OutStreamWriter, self).__init__()
+        self.f0 = open(outout, 'w')
+        header_lines = out_header(outout, 0, 0).splitlines(True)
+        self.f0.write(''.join(header_lines[:2]))
+        self.summary_pos = self.f0.tell()
+        self.f0.write(''.join(header_lines[2:]))
+        self.n_nodes = 0
+        self.n_elems = 0
+        self.i_gr = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_nodes(self, node_ids, coords):
+        self.f0.write(''.join([out_node_packet(node_id, node_coords) for node_id, node_coords in zip(node_ids, coords)]))
+        self.n_nodes += len(node_ids)
+
+    def write_elems(self, elem_type, elem_ids, elem_nodes):
+        patran_type = abs(patran_elem_types_[elem_type])
+        self.f0.write(''.join([out_elem_packet(elem_id, patran_type, nodes) for elem_id, nodes in zip(elem_ids, elem_nodes)]))
+        self.n_elems += len(elem_ids)
+
+    def write_group(self, gr_name, group):
+        self.f0.write(out_group_packet(self.i_gr, gr_name, group))
+        self.i_gr += 1
+
+    def write_section(self, section):
+        if section[0] == 'nodes':
+            self.write_nodes(*section[1:])
+        elif section[0] == 'elems':
+            self.write_elems(*section[1:])
+        elif section[0] == 'group':
+            self.write_group(*section[1:])
+
+    def close(self):
+        if not self.f0.closed:
+            self.f0.write(out_finish_line)
+            self.f0.seek(self.summary_pos)
+            self.f0.write(out_summary_line(self.n_nodes, self.n_elems))
+            self.f0.close()
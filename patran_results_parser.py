@@ -4,17 +4,26 @@ Module with functions for writing of Patran .els files
 
 
 from .common_functions import check_num, sci_float
+from .file_io import open_input
+from .instrumentation import phase
 
 
-def read_rpt(rptin, rpt_type='scalar'):
+def read_rpt(rptin, rpt_type='scalar', as_field=False, dtype='float64', sym_tensor=False):
+    # with as_field, results of each load case are a Field of dtype. With sym_tensor,
+    # full tensors are reduced to their 6 symmetric components, in both outputs
     rpt_list = rptin.split(' ')
+    if sym_tensor and not as_field:
+        from .fields import sym_tensor_columns
     res_all_dict = {}
+    rows_dict = {}
     insts = []
     i = 0
     for rpt in rpt_list:
-        with open(rpt, 'r') as f0:
+        with open_input(rpt, 'r') as f0, phase('read', 'read_rpt', rpt, f0) as read_phase:
+            section = read_phase.section('header')
             for line in f0:
                 if 'Load Case:' in line:
+                    section = read_phase.section('fields')
                     if 'Time step' in line or ' Pas ' in line:
                         inst = float((line.split(':')[-1]).split(r'{')[0])
                         insts.append(inst)
@@ -25,16 +34,28 @@ def read_rpt(rptin, rpt_type='scalar'):
                     while inst in insts:
                         inst += 0.00001
                     insts.append(inst)
+                    res_all_dict[inst] = {}
+                    rows_dict[inst] = ([], [])
                 else:
                     data = line.split()
                     check = len(data) > 1 and all([check_num(s) for s in data])
                     if not check:
                         continue
                     entity, res = int(data[0]), [float(s) for s in data[1:]]
-                    if rpt_type == 'scalar':
+                    section.count()
+                    if as_field:
+                        rows_dict[inst][0].append(entity)
+                        rows_dict[inst][1].append(res[0] if rpt_type == 'scalar' else res)
+                    elif rpt_type == 'scalar':
                         res_all_dict[inst][entity] = res[0]
+                    elif sym_tensor and len(res) == 9:
+                        res_all_dict[inst][entity] = [res[j] for j in sym_tensor_columns]
                     else:
                         res_all_dict[inst][entity] = res
+    if as_field:
+        from .fields import Field
+        for inst, (entities, rows) in rows_dict.items():
+            res_all_dict[inst] = Field.from_rows(entities, rows, dtype=dtype, sym_tensor=sym_tensor)
     return res_all_dict
 
 
@@ -59,48 +80,62 @@ def write_ses(ifile, resfile_name, entity='E', tmplfile_name='template.res_tmpl'
             r'resold_import_results("{0}", "{1}", 1E-006, "{2}")'.format(resfile_name, entity, tmplfile_name) + '\n')
 
 
+res_n_comps = {'scalar': 1, 'vector': 3, 'tensor': 6}
+
+
+def res_header(entity_type, lc_name, tmpl_type):
+    n_comps = res_n_comps[tmpl_type]
+    if entity_type.lower() == 'n':
+        return '{0}\n       2       0    0.000000E+0       0       {1}\nX\nNONE\n'.format(lc_name, n_comps)
+    return '{0}\n{1}\nX\nNONE\n'.format(lc_name, n_comps)
+
+
+def res_entity_lines(entity_type, tmpl_type, entity, vals):
+    # vals is a number for scalar results, a sequence of numbers otherwise
+    if tmpl_type == 'scalar':
+        vals = [vals]
+    vals_strs = [sci_float(val, prec=5).rjust(13) for val in vals]
+    if tmpl_type == 'tensor':
+        vals_str = '{0}\n{1}'.format(''.join(vals_strs[:5]), ''.join(vals_strs[5:]))
+    else:
+        vals_str = ''.join(vals_strs)
+    if entity_type.lower() == 'n':
+        return '{0}{1}\n'.format(str(entity).rjust(8), vals_str)
+    if tmpl_type == 'scalar':
+        vals_str = vals_str.strip()
+    return '{0}0\n{1}\n'.format(str(entity).ljust(18), vals_str)
+
+
 def write_res(ifile, entity_type, lc_name, tmpl_type, entities, res_dict):
-    str_path = ifile
-    with open(str_path, 'w') as f:
-        if tmpl_type == 'scalar':
-            if entity_type.lower() == 'n':
-                f.write('{0}\n       2       0    0.000000E+0       0       1\nX\nNONE\n'.format(lc_name))
-                for entity in entities:
-                    f.write('{0}{1}\n'.format(str(entity).rjust(8),
-                                              sci_float(res_dict[entity], prec=5).rjust(13)))
-            else:
-                f.write('{0}\n1\nX\nNONE\n'.format(lc_name))
-                for entity in entities:
-                    f.write('{0}0\n{1}\n'.format(str(entity).ljust(
-                        18), sci_float(res_dict[entity], prec=5)))
-        elif tmpl_type == 'vector':
-            if entity_type.lower() == 'n':
-                f.write('{0}\n       2       0    0.000000E+0       0       3\nX\nNONE\n'.format(lc_name))
-                for entity in entities:
-                    vals_str = ''.join([sci_float(val, prec=5).rjust(13)
-                                        for val in res_dict[entity]])
-                    f.write('{0}{1}\n'.format(str(entity).rjust(8), vals_str))
-            else:
-                f.write('{0}\n3\nX\nNONE\n'.format(lc_name))
-                for entity in entities:
-                    vals_str = ''.join([sci_float(val, prec=5).rjust(13)
-                                        for val in res_dict[entity]])
-                    f.write('{0}0\n{1}\n'.format(str(entity).ljust(18), vals_str))
-        elif tmpl_type == 'tensor':
-            if entity_type.lower() == 'n':
-                f.write('{0}\n       2       0    0.000000E+0       0       6\nX\nNONE\n'.format(lc_name))
-                for entity in entities:
-                    vals_str_1 = ''.join([sci_float(val, prec=5).rjust(13)
-                                          for val in res_dict[entity][:5]])
-                    vals_str_2 = ''.join([sci_float(val, prec=5).rjust(13)
-                                          for val in res_dict[entity][5:]])
-                    f.write('{0}{1}\n{2}\n'.format(str(entity).rjust(8), vals_str_1, vals_str_2))
-            else:
-                f.write('{0}\n6\nX\nNONE\n'.format(lc_name))
-                for entity in entities:
-                    vals_str_1 = ''.join([sci_float(val, prec=5).rjust(13)
-                                          for val in res_dict[entity][:5]])
-                    vals_str_2 = ''.join([sci_float(val, prec=5).rjust(13)
-                                          for val in res_dict[entity][5:]])
-                    f.write('{0}0\n{1}\n{2}\n'.format(
-                        str(entity).ljust(18), vals_str_1, vals_str_2))
+    with open(ifile, 'w') as f:
+        f.write(res_header(entity_type, lc_name, tmpl_type))
+        for entity in entities:
+            f.write(res_entity_lines(entity_type, tmpl_type, entity, res_dict[entity]))
+
+
+class ResStreamWriter(object):
+    '''
+    Writes a Patran .res file chunk by chunk, entities are written
+    in the order they are given
+    '''
+
+    def __init__(self, ifile, entity_type, lc_name, tmpl_type):
+        super(ResStreamWriter, self).__init__()
+        self.entity_type = entity_type
+        self.tmpl_type = tmpl_type
+        self.f0 = open(ifile, 'w')
+        self.f0.write(res_header(entity_type, lc_name, tmpl_type))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, entities, values):
+        # values of the entities, numbers or sequences of numbers (see res_entity_lines)
+        self.f0.write(''.join([res_entity_lines(self.entity_type, self.tmpl_type, entity, vals)
+                               for entity, vals in zip(entities, values)]))
+
+    def close(self):
+        self.f0.close()
@@ -0,0 +1,149 @@
+'''
+Module for building crack propagation chains over all the
+fronts of a propagation (front meshes of read_sif_file).
+Each point of a front is linked to the closest point of
+the next front (on its segments or on its points), so a
+chain follows one point of the crack from the first front
+to the last one with the growth increment of each link
+'''
+
+
+import numpy as np
+
+from .spatial_index import as_points, group_argmin, segment_parameters
+
+
+# max number of (point, segment) pairs looked at in one go
+default_batch_size = 2 ** 21
+
+
+def front_points(front_mesh):
+    # points of a front polyline, in the order of its node ids
+    nodes = front_mesh['nodes']
+    return as_points([nodes[node_id] for node_id in sorted(nodes)])
+
+
+def polyline_lengths(points):
+    # curvilinear coordinate of the points of a polyline
+    lengths = np.zeros(len(points))
+    np.cumsum(np.sqrt((np.diff(points, axis=0) ** 2).sum(1)), out=lengths[1:])
+    return lengths
+
+
+def nearest_on_polyline(points, polyline, to_segments=True):
+    '''
+    Closest point of the polyline (of its segments, or of its points)
+    for each point. Returns (segment ids, distances, t) with t the
+    position on the segment, 0 at its first point and 1 at its last.
+    Segments are grouped in blocks of consecutive segments, only the
+    blocks whose bounding sphere can hold the closest point are looked at
+    '''
+    points, polyline = as_points(points), as_points(polyline)
+    if to_segments and len(polyline) > 1:
+        p1, p2 = polyline[:-1], polyline[1:]
+    else:
+        p1 = p2 = polyline
+    n_segments = len(p1)
+    block_size = max(int(np.sqrt(n_segments / 8.0)), 1)
+    n_blocks = -(-n_segments // block_size)
+    blocks = np.minimum(np.arange(n_blocks * block_size), n_segments - 1).reshape(n_blocks, block_size)
+    block_points = np.concatenate([p1[blocks], p2[blocks]], 1)
+    centers = 0.5 * (block_points.min(1) + block_points.max(1))
+    radii = np.sqrt(((block_points - centers[:, None, :]) ** 2).sum(2)).max(1)
+    center_len2 = (centers ** 2).sum(1)
+    axes = p2 - p1
+    axis_len2 = (axes ** 2).sum(1)
+    inv_len2 = np.divide(1.0, axis_len2, out=np.zeros(n_segments), where=axis_len2 > 0)
+    p1_blocks, axes_blocks, inv_len2_blocks = p1[blocks], axes[blocks], inv_len2[blocks]
+    segment_ids = np.zeros(len(points), dtype=np.int64)
+    distances = np.zeros(len(points))
+    batch_size = max(1, default_batch_size // (n_blocks * 3))
+    for start in range(0, len(points), batch_size):
+        batch = points[start:start + batch_size]
+        center_distances = (batch ** 2).sum(1)[:, None] + center_len2 - 2.0 * batch.dot(centers.T)
+        center_distances = np.sqrt(np.maximum(center_distances, 0.0, out=center_distances), out=center_distances)
+        # every block holds a point closer than its center distance + radius
+        upper = (center_distances + radii).min(1)
+        query_rows, block_rows = np.nonzero(center_distances - radii <= upper[:, None])
+        segments = blocks[block_rows]
+        block_axes = axes_blocks[block_rows]
+        relative = batch[query_rows][:, None, :] - p1_blocks[block_rows]
+        t = np.clip(np.einsum('ijk,ijk->ij', relative, block_axes) * inv_len2_blocks[block_rows], 0.0, 1.0)
+        relative -= t[:, :, None] * block_axes
+        pair_distances = np.einsum('ijk,ijk->ij', relative, relative)
+        pair_best = pair_distances.argmin(1)
+        best = group_argmin(query_rows, pair_distances[np.arange(len(segments)), pair_best])
+        segment_ids[start:start + len(batch)] = segments[best, pair_best[best]]
+        distances[start:start + len(batch)] = np.sqrt(pair_distances[best, pair_best[best]])
+    t = segment_parameters(points, p1[segment_ids], p2[segment_ids])
+    return segment_ids, distances, t
+
+
+def link_fronts(points, next_points, to_segments=True):
+    '''
+    Links points to the closest point of the polyline next_points.
+    Returns (targets, increments, positions) with positions the
+    fractional index of the targets along next_points (2.5 is
+    the middle of the segment between points 2 and 3)
+    '''
+    points, next_points = as_points(points), as_points(next_points)
+    segment_ids, increments, t = nearest_on_polyline(points, next_points, to_segments)
+    if not to_segments or len(next_points) < 2:
+        return next_points[segment_ids], increments, segment_ids.astype(np.float64)
+    targets = next_points[segment_ids] + t[:, None] * (next_points[segment_ids + 1] - next_points[segment_ids])
+    return targets, increments, segment_ids + t
+
+
+def build_chains(front_meshes, fronts=None, start_points=None, to_segments=True):
+    '''
+    Chains through the fronts (all of them, in order, by default).
+    Chains start at the points of the first front, or at start_points
+    (picked points) moved on the first front. Returns a dict of arrays:
+    points (n_fronts, n_chains, 3), positions (fractional point index
+    on each front), increments (n_fronts - 1, n_chains) and lengths
+    (crack growth from the first front, n_fronts, n_chains)
+    '''
+    if fronts is None:
+        fronts = sorted(front_meshes)
+    polylines = [front_points(front_meshes[front]) for front in fronts]
+    if start_points is None:
+        current = polylines[0]
+        positions = np.arange(len(current), dtype=np.float64)
+    else:
+        current, _, positions = link_fronts(start_points, polylines[0], to_segments)
+    n_chains = len(current)
+    points = np.zeros((len(fronts), n_chains, 3))
+    all_positions = np.zeros((len(fronts), n_chains))
+    increments = np.zeros((max(len(fronts) - 1, 0), n_chains))
+    points[0], all_positions[0] = current, positions
+    for i, next_points in enumerate(polylines[1:]):
+        current, increments[i], all_positions[i + 1] = link_fronts(current, next_points, to_segments)
+        points[i + 1] = current
+    lengths = np.zeros((len(fronts), n_chains))
+    np.cumsum(increments, axis=0, out=lengths[1:])
+    return {'fronts': list(fronts),
+            'points': points,
+            'positions': all_positions,
+            'increments': increments,
+            'lengths': lengths}
+
+
+def chain_field(chains, front_fields, label):
+    '''
+    Values of the front field label (read_sif_file fields) at the points
+    of the chains, (n_fronts, n_chains). Fields given on other points
+    than the front points (new_curv_coords) are interpolated along
+    the curvilinear coordinate
+    '''
+    values = np.zeros(chains['positions'].shape)
+    for i, (front, positions) in enumerate(zip(chains['fronts'], chains['positions'])):
+        fields = front_fields[front]
+        field = np.asarray(fields[label], dtype=np.float64)
+        n_points = len(fields['x'])
+        if len(field) == n_points:
+            values[i] = np.interp(positions, np.arange(n_points), field)
+        else:
+            points = as_points(list(zip(fields['x'], fields['y'], fields['z'])))
+            lengths = np.interp(positions, np.arange(n_points), polyline_lengths(points))
+            values[i] = np.interp(lengths, fields['curv.coord.'], field)
+    return values
@@ -0,0 +1,209 @@
+'''
+Module for renumbering meshes before export. Ids are made
+consecutive, and with the 'rcm' method nodes are ordered by
+Reverse Cuthill-McKee on the node graph (nodes sharing an
+element) to reduce the bandwidth, elements being ordered by
+their first node. Groups are remapped with the mesh, fields
+with the id maps returned by renumber_mesh
+'''
+
+
+import numpy as np
+
+from .mesh import Mesh, ElemBlock, IdIndex, id_dtype
+from .groups import sorted_unique
+from .connectivity import concat_ranges
+
+
+renumber_methods = ('compact', 'rcm')
+
+
+def elem_min(values, elem_ptr):
+    # min of values over the nodes of each element
+    if len(elem_ptr) < 2:
+        return np.zeros(0, dtype=values.dtype)
+    return np.minimum.reduceat(values, elem_ptr[:-1])
+
+
+def node_components(n_nodes, elem_ptr, elem_nodes):
+    # component of each node, labelled by its lowest row
+    labels = np.arange(n_nodes, dtype=np.int64)
+    counts = np.diff(elem_ptr)
+    while True:
+        roots = labels[elem_nodes]
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, roots, np.repeat(elem_min(roots, elem_ptr), counts))
+        # pointer jumping
+        while True:
+            jumped = new_labels[new_labels]
+            if (jumped == new_labels).all():
+                break
+            new_labels = jumped
+        if (new_labels == labels).all():
+            return labels
+        labels = new_labels
+
+
+def first_by_label(labels, keys):
+    # row of the lowest key for each label, in label order
+    order = np.lexsort((np.arange(len(labels)), keys, labels))
+    sorted_labels = labels[order]
+    return order[np.append(True, sorted_labels[1:] != sorted_labels[:-1])] if len(order) else order
+
+
+no_row = np.iinfo(np.int64).max
+
+
+def first_rows(values, scratch):
+    '''
+    Rows of the first occurrence of each value. scratch is an array
+    indexed by the values and filled with no_row, left as it was found
+    '''
+    rows = np.arange(len(values))
+    np.minimum.at(scratch, values, rows)
+    first = rows[scratch[values] == rows]
+    scratch[values] = no_row
+    return first
+
+
+def cuthill_mckee_levels(seeds, degree, graph, ordered=True):
+    '''
+    Breadth-first search from the seeds, all at once. Each new node is
+    attached to its first numbered neighbour of the previous level and,
+    when ordered, the nodes of a level are ordered by (position of that
+    neighbour, degree), as in Cuthill-McKee. Returns (order, levels)
+    '''
+    node_ptr, node_elems, elem_ptr, elem_nodes = graph
+    n_nodes, n_elems = len(degree), len(elem_ptr) - 1
+    position = np.full(n_nodes, -1, dtype=np.int64)
+    levels = np.full(n_nodes, -1, dtype=np.int64)
+    # all the nodes of an element are reached when it is first crossed, so it is crossed once
+    elem_done = np.zeros(n_elems, dtype=bool)
+    node_scratch = np.full(n_nodes, no_row, dtype=np.int64)
+    elem_scratch = np.full(n_elems, no_row, dtype=np.int64)
+    order = []
+    frontier = np.asarray(seeds, dtype=np.int64)
+    n_ordered, level = 0, 0
+    while len(frontier):
+        position[frontier] = np.arange(n_ordered, n_ordered + len(frontier))
+        levels[frontier] = level
+        order.append(frontier)
+        n_ordered += len(frontier)
+        level += 1
+        # pairs come in the order of the frontier, the first pair of an element or a node has its first parent
+        elem_counts = node_ptr[frontier + 1] - node_ptr[frontier]
+        parents = np.repeat(frontier, elem_counts)
+        elems = node_elems[concat_ranges(node_ptr[frontier], elem_counts)]
+        new = ~elem_done[elems]
+        parents, elems = parents[new], elems[new]
+        first = first_rows(elems, elem_scratch)
+        parents, elems = parents[first], elems[first]
+        elem_done[elems] = True
+        node_counts = elem_ptr[elems + 1] - elem_ptr[elems]
+        parents = np.repeat(parents, node_counts)
+        neighbours = elem_nodes[concat_ranges(elem_ptr[elems], node_counts)]
+        new = position[neighbours] < 0
+        parents, neighbours = parents[new], neighbours[new]
+        first = first_rows(neighbours, node_scratch)
+        frontier = neighbours[first]
+        if ordered:
+            frontier = frontier[np.lexsort((degree[frontier], position[parents[first]]))]
+    order = np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+    return order, levels
+
+
+def rcm_order(connectivity):
+    '''
+    Node rows in Reverse Cuthill-McKee order (connectivity is the mesh
+    Connectivity). Each connected part starts from a pseudo-peripheral
+    node (lowest degree node of the last level of a search from its
+    lowest degree node), the degree of a node being its number of
+    elements
+    '''
+    n_nodes = connectivity.n_nodes
+    elem_ptr, elem_nodes = connectivity.elem_ptr, connectivity.elem_nodes
+    graph = (connectivity.node_ptr, connectivity.node_elems, elem_ptr, elem_nodes)
+    degree = connectivity.node_degrees()
+    components = node_components(n_nodes, elem_ptr, elem_nodes)
+    _, levels = cuthill_mckee_levels(first_by_label(components, degree), degree, graph, ordered=False)
+    max_levels = np.zeros(n_nodes, dtype=np.int64)
+    np.maximum.at(max_levels, components, levels)
+    candidates = np.flatnonzero(levels == max_levels[components])
+    seeds = candidates[first_by_label(components[candidates], degree[candidates])]
+    order, _ = cuthill_mckee_levels(seeds, degree, graph)
+    # parts one after the other
+    order = order[np.argsort(components[order], kind='stable')]
+    return order[::-1]
+
+
+def remap_ids(index, new_ids, ids):
+    # sorted new ids of the ids found in index
+    rows = index.rows(ids)
+    return sorted_unique(new_ids[rows[rows >= 0]])
+
+
+def renumber_mesh(mesh, method='compact', start_node_id=1, start_elem_id=1):
+    '''
+    Renumbers nodes and elements of mesh (mesh dict or Mesh) from
+    start_node_id and start_elem_id. With 'compact', ids keep their
+    order, with 'rcm' nodes are in Reverse Cuthill-McKee order and
+    elements follow their lowest numbered node. Returns (mesh, id_maps)
+    with id_maps {'nodes': (old ids, new ids), 'elems': (old ids, new ids)}
+    '''
+    if method not in renumber_methods:
+        raise ValueError('Unknown renumbering method {0}'.format(method))
+    mesh = Mesh.from_dict(mesh)
+    connectivity = mesh.connectivity()
+    n_nodes = len(mesh.node_ids)
+    elem_ptr, elem_nodes = connectivity.elem_ptr, connectivity.elem_nodes
+    new_node_ids = np.empty(n_nodes, dtype=id_dtype)
+    node_order = rcm_order(connectivity) if method == 'rcm' else slice(None)
+    new_node_ids[node_order] = np.arange(start_node_id, start_node_id + n_nodes, dtype=id_dtype)
+    old_elem_ids = connectivity.elem_ids
+    id_order = np.argsort(old_elem_ids, kind='stable')
+    if method == 'rcm':
+        elem_order = np.lexsort((old_elem_ids, elem_min(new_node_ids[elem_nodes], elem_ptr)))
+    else:
+        elem_order = id_order
+    new_elem_ids = np.empty(len(old_elem_ids), dtype=id_dtype)
+    new_elem_ids[elem_order] = np.arange(start_elem_id, start_elem_id + len(old_elem_ids), dtype=id_dtype)
+    elem_blocks = {}
+    for (elem_type, block), start in zip(connectivity.blocks, connectivity.type_starts):
+        rows = elem_nodes[elem_ptr[start]:elem_ptr[start + len(block)]]
+        elem_blocks[elem_type] = ElemBlock(new_elem_ids[start:start + len(block)],
+                                           new_node_ids[rows].reshape(block.conn.shape))
+    elem_index = IdIndex(old_elem_ids[id_order])
+    new_elem_ids = new_elem_ids[id_order]
+    group_arrays = {}
+    for gr_name, group in mesh.group_arrays.items():
+        group_arrays[gr_name] = {ent_type: remap_ids(mesh.node_index, new_node_ids, ids) if ent_type == 'node'
+                                 else remap_ids(elem_index, new_elem_ids, ids) for ent_type, ids in group.items()}
+    new_mesh = Mesh(new_node_ids, mesh.coords, elem_blocks, group_arrays)
+    return new_mesh, {'nodes': (mesh.node_ids, new_node_ids), 'elems': (elem_index.ids, new_elem_ids)}
+
+
+def renumber_field(field, id_map):
+    '''
+    Field (Field or {id: value} dict) with the new ids of id_map
+    (id_maps['nodes'] or id_maps['elems'] of renumber_mesh), entities
+    not in id_map are dropped
+    '''
+    from .fields import Field
+    old_ids, new_ids = id_map
+    index = IdIndex(old_ids)
+    if isinstance(field, Field):
+        rows = index.rows(field.ids)
+        found = rows >= 0
+        return Field(new_ids[rows[found]], field.values[found], field.kind)
+    ids = np.fromiter(field.keys(), dtype=id_dtype, count=len(field))
+    rows = index.rows(ids)
+    return {int(new_ids[row]): value for row, value in zip(rows.tolist(), field.values()) if row >= 0}
+
+
+def node_bandwidth(mesh):
+    # largest difference of node ids (as rows of the sorted ids) in one element
+    connectivity = Mesh.from_dict(mesh).connectivity()
+    elem_ptr, elem_nodes = connectivity.elem_ptr, connectivity.elem_nodes
+    if not len(elem_nodes):
+        return 0
+    return int((np.maximum.reduceat(elem_nodes, elem_ptr[:-1]) - elem_min(elem_nodes, elem_ptr)).max())
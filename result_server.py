@@ -0,0 +1,401 @@
+'''
+Module with a local result server. One process loads the
+meshes and fields once (FEMReader / FieldReader) and serves
+them to several clients (GUI sessions) over localhost HTTP:
+mesh subsets, groups, field values at ids and reductions.
+Queries and replies are binary messages laid out as .femb
+files (JSON table of contents, then 64 bytes aligned arrays),
+so arrays are received as zero-copy views of the message
+
+Message: {"query": name, ...arguments} for queries, the result
+or {"error": message} for replies, where arrays are {"array": A}
+with A as in .femb files
+
+Clients send the token of the server in the X-Result-Token header,
+and only the files under the root folder of the store are served
+'''
+
+
+import os
+import hmac
+import json
+import secrets
+import threading
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .mesh import Mesh, ElemBlock, id_dtype
+from .fields import Field, von_mises
+from .groups import sorted_unique, sorted_contains
+from .femb_binary_parser import FembArrays, femb_chunks, femb_header, femb_array
+
+
+message_magic = b'FEMQ'
+message_version = 1
+default_host = '127.0.0.1'
+default_port = 47380
+token_header = 'X-Result-Token'
+
+# reader arguments accepted from the clients
+mesh_read_args = ('mesh_format', 'read_nodes', 'read_elems', 'read_groups', 'groups')
+field_read_args = ('field_format', 'field_type', 'xf_lips', 'dtype', 'sym_tensor')
+
+# errors of the queries themselves, the other ones are errors of the server
+query_errors = (OSError, ValueError, KeyError, TypeError, IndexError)
+
+
+def encode_value(value, arrays):
+    # value with its arrays replaced by their table of contents entries
+    if isinstance(value, np.ndarray):
+        return {'array': arrays.add(value, value.dtype)}
+    if isinstance(value, dict):
+        return {str(key): encode_value(item, arrays) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item, arrays) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def decode_value(value, buffer):
+    if isinstance(value, dict):
+        if list(value) == ['array']:
+            return femb_array(buffer, value['array'])
+        return {key: decode_value(item, buffer) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item, buffer) for item in value]
+    return value
+
+
+def pack_message(value):
+    arrays = FembArrays()
+    toc = encode_value(value, arrays)
+    return b''.join(femb_chunks(toc, arrays, message_magic, message_version))
+
+
+def unpack_message(data):
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if len(data) < femb_header.size:
+        raise ValueError('Truncated result server message')
+    magic, version, toc_size = femb_header.unpack(bytes(data[:femb_header.size]))
+    if magic != message_magic or version > message_version:
+        raise ValueError('Not a result server message')
+    toc = json.loads(bytes(data[femb_header.size:femb_header.size + toc_size]).decode('utf8'))
+    return decode_value(toc, buffer)
+
+
+def quantity_values(field, quantity):
+    # (n,) values of a quantity of field: None (scalar fields), a component, 'magnitude' or 'von_mises'
+    if quantity is None:
+        if field.ncomp != 1:
+            raise ValueError('A quantity is needed for {0} fields'.format(field.kind))
+        return field.values[:, 0]
+    if quantity == 'von_mises':
+        return von_mises(field.values)
+    if quantity == 'magnitude':
+        return np.sqrt((field.values.astype(np.float64) ** 2).sum(1))
+    return field.values[:, int(quantity)]
+
+
+def checked_read_args(read_args, allowed):
+    read_args = dict(read_args or {})
+    unknown = sorted(set(read_args) - set(allowed))
+    if unknown:
+        raise ValueError('Reader arguments not allowed: {0}'.format(', '.join(unknown)))
+    return read_args
+
+
+def mesh_group_ids(mesh, groups, ent_types):
+    # sorted ids of the ent_types entities of the groups of mesh
+    ids = [ids for gr_name in groups for ent_type, ids in mesh.group_arrays[gr_name].items()
+           if ent_type in ent_types]
+    return sorted_unique(np.concatenate(ids + [np.zeros(0, dtype=id_dtype)]))
+
+
+class ResultStore(object):
+    '''
+    Meshes and fields shared by the clients, read once for each file
+    and reader arguments. query(message) answers the queries:
+        mesh_info, mesh, group (mesh files)
+        field_info, values, reduce (field files)
+    Files outside of root_dir (the current folder by default) are refused
+    '''
+
+    def __init__(self, cache=None, instrumentation=None, root_dir=None):
+        super(ResultStore, self).__init__()
+        from . import FEMReader, FieldReader
+        self.root_dir = os.path.realpath(root_dir if root_dir is not None else os.getcwd())
+        self.mesh_reader = FEMReader(cache, instrumentation)
+        self.field_reader = FieldReader(instrumentation)
+        self.loaded = {}
+        self.lock = threading.Lock()
+        self.load_locks = {}
+
+    def load(self, key, load_func):
+        # loaded once even when several clients ask for it at the same time
+        with self.lock:
+            if key in self.loaded:
+                return self.loaded[key]
+            load_lock = self.load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            if key not in self.loaded:
+                value = load_func()
+                with self.lock:
+                    self.loaded[key] = value
+        return self.loaded[key]
+
+    def served_path(self, path):
+        # real path of a file asked by a client, PermissionError outside of root_dir
+        path = os.path.realpath(path)
+        if os.path.commonpath([self.root_dir, path]) != self.root_dir:
+            raise PermissionError('{0} is not under the served folder'.format(path))
+        return path
+
+    def mesh(self, mesh_file, read_args=None):
+        read_args = dict({'read_groups': True}, **checked_read_args(read_args, mesh_read_args))
+        mesh_file = self.served_path(mesh_file)
+        key = ('mesh', mesh_file, json.dumps(read_args, sort_keys=True))
+        return self.load(key, lambda: self.mesh_reader.read_mesh_file(mesh_file, as_mesh=True, **read_args))
+
+    def fields(self, field_file, read_args=None):
+        # {case: Field} of field_file
+        read_args = dict({'as_field': True}, **checked_read_args(read_args, field_read_args))
+        field_file = self.served_path(field_file)
+        key = ('fields', field_file, json.dumps(read_args, sort_keys=True))
+        return self.load(key, lambda: {str(case): Field.from_dict(field) for case, field in
+                                       self.field_reader.read_field_file(field_file, **read_args).items()})
+
+    def field(self, field_file, case=None, read_args=None):
+        fields = self.fields(field_file, read_args)
+        if case is None:
+            return list(fields.values())[0]
+        if str(case) not in fields:
+            raise KeyError('No case {0} in {1}'.format(case, field_file))
+        return fields[str(case)]
+
+    def query(self, message):
+        queries = {'mesh_info': self.mesh_info, 'mesh': self.mesh_subset, 'group': self.group,
+                   'field_info': self.field_info, 'values': self.values, 'reduce': self.reduce}
+        message = dict(message)
+        name = message.pop('query', None)
+        if name not in queries:
+            raise ValueError('Unknown query {0}'.format(name))
+        return queries[name](**message)
+
+    def mesh_info(self, mesh_file, read_args=None):
+        mesh = self.mesh(mesh_file, read_args)
+        return {'n_nodes': mesh.n_nodes,
+                'elem_types': {elem_type: len(block) for elem_type, block in mesh.elem_blocks.items()},
+                'groups': {gr_name: {ent_type: len(ids) for ent_type, ids in group.items()}
+                           for gr_name, group in mesh.group_arrays.items()}}
+
+    def mesh_subset(self, mesh_file, elem_ids=None, node_ids=None, groups=None, read_args=None):
+        '''
+        Nodes, elements and groups of the mesh: the elements of elem_ids
+        and of the groups, with their nodes, and the nodes of node_ids and
+        of the groups. The whole mesh when nothing is selected
+        '''
+        mesh = self.mesh(mesh_file, read_args)
+        groups = list(groups or [])
+        if elem_ids is None and node_ids is None and not groups:
+            elem_blocks = mesh.elem_blocks
+            node_rows = slice(None)
+        else:
+            elem_ids = sorted_unique(np.concatenate([np.asarray(elem_ids if elem_ids is not None else [],
+                                                                dtype=id_dtype),
+                                                     mesh_group_ids(mesh, groups, set(mesh.elem_blocks))]))
+            elem_blocks = {}
+            for elem_type, block in mesh.elem_blocks.items():
+                kept = sorted_contains(elem_ids, block.ids)
+                if kept.any():
+                    elem_blocks[elem_type] = ElemBlock(block.ids[kept], block.conn[kept], check_order=False)
+            selected_nodes = [np.asarray(node_ids if node_ids is not None else [], dtype=id_dtype),
+                              mesh_group_ids(mesh, groups, ('node',))]
+            selected_nodes.extend([block.conn.ravel() for block in elem_blocks.values()])
+            node_rows = mesh.node_index.rows(sorted_unique(np.concatenate(selected_nodes)))
+            node_rows = node_rows[node_rows >= 0]
+        return {'node_ids': mesh.node_ids[node_rows], 'coords': mesh.coords[node_rows],
+                'elems': {elem_type: {'ids': block.ids, 'conn': block.conn} for elem_type, block in elem_blocks.items()},
+                'groups': {gr_name: mesh.group_arrays[gr_name] for gr_name in groups}}
+
+    def group(self, mesh_file, name, read_args=None):
+        mesh = self.mesh(mesh_file, read_args)
+        if name not in mesh.group_arrays:
+            raise KeyError('No group {0} in {1}'.format(name, mesh_file))
+        return mesh.group_arrays[name]
+
+    def field_info(self, field_file, read_args=None):
+        return {str(case): {'kind': field.kind, 'ncomp': field.ncomp, 'n': len(field),
+                            'dtype': field.values.dtype.str}
+                for case, field in self.fields(field_file, read_args).items()}
+
+    def values(self, field_file, ids, case=None, read_args=None):
+        # sorted ids found in the field, with their values
+        field = self.field(field_file, case, read_args)
+        rows = field.index.rows(np.asarray(ids, dtype=id_dtype))
+        rows = sorted_unique(rows[rows >= 0])
+        return {'kind': field.kind, 'ids': field.ids[rows], 'values': field.values[rows]}
+
+    def reduce(self, field_file, quantity=None, ids=None, case=None, read_args=None):
+        '''
+        min, max (with the ids where they are reached) and mean of a
+        quantity of the field (see quantity_values), over ids only when given
+        '''
+        field = self.field(field_file, case, read_args)
+        values = quantity_values(field, quantity)
+        field_ids = field.ids
+        if ids is not None:
+            rows = field.index.rows(np.asarray(ids, dtype=id_dtype))
+            rows = sorted_unique(rows[rows >= 0])
+            values, field_ids = values[rows], field_ids[rows]
+        if not len(values):
+            return {'count': 0}
+        low, high = int(np.argmin(values)), int(np.argmax(values))
+        return {'count': len(values), 'min': float(values[low]), 'min_id': int(field_ids[low]),
+                'max': float(values[high]), 'max_id': int(field_ids[high]),
+                'mean': float(values.mean(dtype=np.float64))}
+
+
+class ResultRequestHandler(BaseHTTPRequestHandler):
+    # one query per POST request, connections are kept alive between queries
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        try:
+            if not hmac.compare_digest(self.headers.get(token_header, '').encode('utf8'),
+                                       self.server.token.encode('utf8')):
+                reply, status = pack_message({'error': 'Invalid result server token'}), 403
+            else:
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                reply, status = pack_message(self.server.store.query(unpack_message(data))), 200
+        except Exception as error:
+            status = 400 if isinstance(error, query_errors) else 500
+            reply = pack_message({'error': '{0}: {1}'.format(type(error).__name__, error)})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(reply)))
+        if status == 403:
+            # the body isn't read, the connection can't be used again
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=default_host, port=default_port, store=None, token=None):
+    '''
+    HTTP server answering the queries of the clients with store
+    (ResultStore, serving the current folder by default), one thread
+    for each client. port 0 takes a free port
+    (server.server_address). Clients must send token, a random one
+    (server.token) when it is not given
+    '''
+    server = ThreadingHTTPServer((host, port), ResultRequestHandler)
+    server.daemon_threads = True
+    server.store = store if store is not None else ResultStore()
+    server.token = token or secrets.token_hex(16)
+    return server
+
+
+def start_server(host=default_host, port=default_port, store=None, token=None):
+    # server running in a background thread, stopped by server.shutdown()
+    server = make_server(host, port, store, token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ResultClient(object):
+    '''
+    Client of a result server. Files are given by their path on the
+    server side, read_args are passed to the reader of the server
+    (see mesh_read_args and field_read_args). token is the one of the server
+    '''
+
+    def __init__(self, host=default_host, port=default_port, timeout=None, token=''):
+        super(ResultClient, self).__init__()
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.token = token
+
+    def query(self, query, **args):
+        self.connection.request('POST', '/', body=pack_message(dict(args, query=query)),
+                                headers={'Content-Type': 'application/octet-stream', token_header: self.token})
+        response = self.connection.getresponse()
+        reply = unpack_message(response.read())
+        if response.status != 200:
+            raise ValueError(reply.get('error', 'Result server error {0}'.format(response.status)))
+        return reply
+
+    def mesh_info(self, mesh_file, read_args=None):
+        return self.query('mesh_info', mesh_file=mesh_file, read_args=read_args)
+
+    def mesh(self, mesh_file, elem_ids=None, node_ids=None, groups=None, read_args=None):
+        # Mesh of the selected elements and nodes (see ResultStore.mesh_subset)
+        arrays = [None if ids is None else np.asarray(ids, dtype=id_dtype) for ids in (elem_ids, node_ids)]
+        reply = self.query('mesh', mesh_file=mesh_file, elem_ids=arrays[0], node_ids=arrays[1], groups=groups,
+                           read_args=read_args)
+        elem_blocks = {elem_type: ElemBlock(block['ids'], block['conn'], check_order=False)
+                       for elem_type, block in reply['elems'].items()}
+        return Mesh(reply['node_ids'], reply['coords'], elem_blocks, reply['groups'], check_order=False)
+
+    def group(self, mesh_file, name, read_args=None):
+        return self.query('group', mesh_file=mesh_file, name=name, read_args=read_args)
+
+    def field_info(self, field_file, read_args=None):
+        return self.query('field_info', field_file=field_file, read_args=read_args)
+
+    def values(self, field_file, ids, case=None, read_args=None):
+        # Field of the ids found in the field
+        reply = self.query('values', field_file=field_file, ids=np.asarray(ids, dtype=id_dtype), case=case,
+                           read_args=read_args)
+        return Field(reply['ids'], reply['values'], reply['kind'], check_order=False)
+
+    def reduce(self, field_file, quantity=None, ids=None, case=None, read_args=None):
+        return self.query('reduce', field_file=field_file, quantity=quantity,
+                          ids=None if ids is None else np.asarray(ids, dtype=id_dtype), case=case,
+                          read_args=read_args)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Local server of meshes and fields for several clients')
+    parser.add_argument('--host', default=default_host)
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--cache-dir', default=None, help='mesh cache folder (see mesh_cache.MeshCache)')
+    parser.add_argument('--root-dir', default=os.getcwd(), help='only the files under this folder are served')
+    parser.add_argument('--token', default=os.environ.get('RESULT_SERVER_TOKEN'),
+                        help='token of the clients (RESULT_SERVER_TOKEN, random by default)')
+    args = parser.parse_args(argv)
+    cache = None
+    if args.cache_dir:
+        from .mesh_cache import MeshCache
+        cache = MeshCache(args.cache_dir)
+    server = make_server(args.host, args.port, ResultStore(cache, root_dir=args.root_dir), args.token)
+    print('Serveur de résultats sur {0}:{1}, dossier {2}'.format(server.server_address[0], server.server_address[1],
+                                                                 server.store.root_dir))
+    if not args.token:
+        print('Jeton des clients: {0}'.format(server.token))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,189 @@
+'''
+Module for following the results folder of a running
+computation (stepNNN folders of XFEM runs). Each poll stats
+the files of the folder and of its step folders, and only the
+files that are new or changed since their last ingestion (by
+path, size and mtime) are parsed, with the usual readers. The
+parsed results are returned as update events, so the cost of a
+refresh depends on what changed, not on the size of the run
+'''
+
+
+import os
+import re
+import json
+import time
+
+
+step_dir_expr = re.compile(r'step(\d+)$')
+step_name_expr = re.compile(r'step(\d+)')
+
+# (kind, pattern of the file names), the first matching kind is used
+result_kinds = [('pos', re.compile(r'.*\.pos(\.gz|\.bz2|\.xz)?$')),
+                ('front', re.compile(r'(sifs-1|smoothsifs-1|InfoPropa)\.txt$')),
+                ('samres', re.compile(r'reac_.*\.out$'))]
+
+# files modified less than settle_time seconds ago may still be written
+default_settle_time = 2.0
+
+
+def result_kind(file_name):
+    for kind, expr in result_kinds:
+        if expr.match(file_name):
+            return kind
+    return None
+
+
+def file_step(path):
+    # step number of a file of a stepNNN folder or of a file named after a step, else None
+    match = step_dir_expr.match(os.path.basename(os.path.dirname(path)))
+    if match is None:
+        match = step_name_expr.search(os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def scan_results(root_dir):
+    '''
+    {path: (size, mtime_ns)} of the result files of root_dir and of
+    its stepNNN folders (see result_kinds)
+    '''
+    found = {}
+    dirs = [root_dir]
+    with os.scandir(root_dir) as entries:
+        for entry in entries:
+            if entry.is_dir() and step_dir_expr.match(entry.name):
+                dirs.append(entry.path)
+    for dir_name in dirs:
+        try:
+            entries = list(os.scandir(dir_name))
+        except OSError:
+            # step folder removed while scanning
+            continue
+        for entry in entries:
+            if not result_kind(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return found
+
+
+class ResultsWatcher(object):
+    '''
+    Polls root_dir for new or changed result files. poll() returns the
+    update events (event, kind, step, path, data):
+        ('added' or 'changed', 'pos', step, pos file, {field_type: Field})
+        ('added' or 'changed', 'front', step, step folder, (mesh, fields))
+        ('added' or 'changed', 'samres', step, answer file, Field)
+        ('removed', kind, step, path, None)
+        ('error', kind, step, path, error message)
+    Pos fields are mapped on the mesh of mapper (PosFieldMapper) when
+    given. Front files of a step are read together (read_fronts_for_step)
+    when one of them changed. The ingested files are kept in state_file
+    (JSON) when given, so a new watcher starts where the last one stopped
+    '''
+
+    def __init__(self, root_dir, state_file=None, settle_time=default_settle_time, mapper=None, dk_coef=1.0,
+                 dtype='float64', sym_tensor=False, instrumentation=None):
+        super(ResultsWatcher, self).__init__()
+        self.root_dir = root_dir
+        self.state_file = state_file
+        self.settle_time = settle_time
+        self.mapper = mapper
+        self.dk_coef = dk_coef
+        self.dtype = dtype
+        self.sym_tensor = sym_tensor
+        self.instrumentation = instrumentation
+        # {path: [size, mtime_ns]} of the ingested files
+        self.ingested = {}
+        if state_file and os.path.exists(state_file):
+            with open(state_file, 'r') as f0:
+                self.ingested = json.load(f0)
+
+    def save_state(self):
+        if not self.state_file:
+            return
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f0:
+            json.dump(self.ingested, f0)
+        os.replace(tmp_file, self.state_file)
+
+    def changed_files(self):
+        '''
+        ({path: (size, mtime_ns)} of the new or changed files that are no
+        longer written, [removed paths])
+        '''
+        found = scan_results(self.root_dir)
+        settled = time.time_ns() - int(self.settle_time * 1e9)
+        changed = {path: stat for path, stat in found.items()
+                   if list(stat) != self.ingested.get(path) and stat[1] <= settled}
+        removed = [path for path in self.ingested if path not in found]
+        return changed, removed
+
+    def read_pos(self, pos_file):
+        if self.mapper is not None:
+            return self.mapper.map_pos_file(pos_file, dtype=self.dtype, sym_tensor=self.sym_tensor)
+        from . import FieldReader
+        reader = FieldReader(self.instrumentation)
+        fields = reader.read_field_file(pos_file, as_field=True, dtype=self.dtype, sym_tensor=self.sym_tensor)
+        # the fields of the reader are numbered, there is one field of each type
+        return {field.kind: field for field in fields.values()}
+
+    def read_fronts(self, step_folder):
+        from . import XfemFrontReader
+        return XfemFrontReader(self.instrumentation).read_fronts_for_step(step_folder, self.dk_coef)
+
+    def read_samres(self, answer_file):
+        from .samres_results_reader import read_samres_out
+        return read_samres_out(answer_file, as_field=True, dtype=self.dtype)
+
+    def poll(self):
+        # update events of the files changed since the last poll, see the class
+        changed, removed = self.changed_files()
+        events = []
+        for path in sorted(removed):
+            del self.ingested[path]
+            events.append(('removed', result_kind(os.path.basename(path)), file_step(path), path, None))
+        # front files are read by step folder, once for all the files of the folder
+        updates = {}
+        for path in sorted(changed):
+            kind = result_kind(os.path.basename(path))
+            target = os.path.dirname(path) if kind == 'front' else path
+            updates.setdefault((kind, target), []).append(path)
+        readers = {'pos': self.read_pos, 'front': self.read_fronts, 'samres': self.read_samres}
+        for (kind, target), paths in sorted(updates.items(), key=lambda item: (file_step(item[1][0]) or 0, item[0])):
+            step = file_step(paths[0])
+            if kind == 'front':
+                known = any([os.path.dirname(path) == target and result_kind(os.path.basename(path)) == 'front'
+                             for path in self.ingested])
+            else:
+                known = target in self.ingested
+            event = 'changed' if known else 'added'
+            try:
+                events.append((event, kind, step, target, readers[kind](target)))
+            except (OSError, ValueError, IndexError, KeyError) as error:
+                print('Lecture impossible de "{0}" : {1}'.format(target, error))
+                events.append(('error', kind, step, target, str(error)))
+            # files in error are retried once they change again
+            for path in paths:
+                self.ingested[path] = list(changed[path])
+        if events:
+            self.save_state()
+        return events
+
+    def watch(self, interval=10.0, timeout=None):
+        '''
+        Yields the update events of the polls, every interval seconds,
+        until timeout seconds have passed (forever by default)
+        '''
+        start = time.time()
+        while True:
+            for event in self.poll():
+                yield event
+            if timeout is not None and time.time() - start + interval > timeout:
+                return
+            time.sleep(interval)
@@ -7,6 +7,8 @@ of Samcef .dat files
 import re
 from datetime import datetime
 from .common_functions import sci_float, check_num
+from .file_io import open_input
+from .instrumentation import phase
 
 
 samcef_elem_types = {2: 'bar',
@@ -34,105 +36,192 @@ def dat_cur_command(line, prev):
         return prev
 
 
-def read_dat(datin, read_nodes=1, read_elems=1, read_groups=1):
+def read_dat_node_line(line):
+    data = list(filter(lambda cell: cell not in [
+                'I', 'X', 'Y', 'Z'], line.split()))
+    return int(data[0]), [float(data[1]), float(data[2]), float(data[3])]
+
+
+def read_dat_elem_line(line):
+    cur_deg = 1
+    if "-" in line:
+        cur_deg = 2
+    data = line.split()
+    elem_id = int(data[1])
+    elem_nodes = [int(node) for node in data[3:]]
+    if cur_deg == 1:
+        elem_type = samcef_elem_types[len(elem_nodes)]
+    else:
+        elem_nodes_filtered = set(filter(lambda n: n >= 0, elem_nodes))
+        elem_type = samcef_elem_types[-len(elem_nodes_filtered)]
+    corner_nodes = [n_id for n_id in elem_nodes if n_id > 0]
+    mid_nodes = [abs(n_id) for n_id in elem_nodes if n_id < 0]
+    if elem_type == 'wedge2':
+        mid_nodes = mid_nodes[:3] + mid_nodes[6:] + mid_nodes[3:6]
+    if elem_type == 'hex2':
+        mid_nodes = mid_nodes[:4] + mid_nodes[8:] + mid_nodes[4:8]
+    return elem_id, elem_type, corner_nodes + mid_nodes
 
+
+def read_dat_sel_block(sel_lines, dict_elem_types, groups, counter=0):
+    from .mesh import split_by_elem_type
     exp_group_name = re.compile('"\w+"')
+    sel_lines = sel_lines.replace('.SEL', '')
+    sel_list = list(filter(lambda sel: not sel.isspace(), sel_lines.split('GROUP ')))
+    for sel in sel_list:
+        info, str_entities = [s.strip() for s in sel.split('\n', 1)]
+        try:
+            what = info.split()[1]
+            find_name = exp_group_name.findall(info)
+        except:
+            find_name = ''
+        if find_name:
+            gr_name = find_name[0].split()[-1].strip('"')
+        else:
+            try:
+                gr_name = 'selection_{0:03d}'.format(int(info.split()[0]))
+                counter = int(info.split()[0])
+            except Exception:
+                gr_name = 'selection_{0:03d}'.format(counter+1)
+                counter += 1
+        if (what in ['NOEUDS', 'MAILLES', 'FACES']) and (str_entities.startswith('I') or str_entities.startswith('MAILLE')):
+            if what == 'NOEUDS':
+                groups[gr_name] = {'node': [int(entity) for entity in str_entities.split()[
+                    1:] if entity != '$']}
+            else:
+                if what == 'MAILLES':
+                    entities = [int(entity) for entity in str_entities.split()[
+                        1:] if entity != '$' and check_num(entity)]
+                else:
+                    entities = [int(face.split()[1]) for face in str_entities.split(
+                        '\n') if check_num(face.split()[1])]
+                groups[gr_name] = split_by_elem_type(entities, dict_elem_types)
+        else:
+            print('N\'arrive pas de lire le contenu du groupe {}'.format(gr_name))
+    return counter
+
+
+def read_dat(datin, read_nodes=1, read_elems=1, read_groups=1):
 
     nodes = {}
     elems = {}
     groups = {}
     dict_elem_types = {}
     set_elem_types = set()
+    counter = 0
     mesh_dict = {'nodes': {}, 'elems': {}, 'groups': {}}
-    with open(datin, 'r', encoding="utf8") as f0:
+    with open_input(datin, 'r', encoding="utf8") as f0, phase('read', 'read_dat', datin, f0) as read_phase:
+        read_phase.section('header')
         cur_command = 'start'
         for line in f0:
             cur_command = dat_cur_command(line, cur_command)
             if read_nodes and cur_command == '.NOE':
+                n_nodes = len(nodes)
+                section = read_phase.section('nodes')
                 line = next(f0)
                 while cur_command == '.NOE':
-                    data = list(filter(lambda cell: cell not in [
-                                'I', 'X', 'Y', 'Z'], line.split()))
-                    nodes[int(data[0])] = [float(data[1]), float(data[2]), float(data[3])]
+                    node_id, coords = read_dat_node_line(line)
+                    nodes[node_id] = coords
                     line = next(f0)
                     cur_command = dat_cur_command(line, cur_command)
+                section.count(len(nodes) - n_nodes)
             if read_elems and cur_command == '.MAI':
+                n_elems = len(dict_elem_types)
+                section = read_phase.section('elems')
                 line = next(f0)
                 while cur_command == '.MAI':
-                    cur_deg = 1
                     while "$" in line:
                         line = line.replace("$", "")
                         line += next(f0)
-                    if "-" in line:
-                        cur_deg = 2
-                    data = line.split()
-                    elem_id = int(data[1])
-                    elem_nodes = [int(node) for node in data[3:]]
-                    if cur_deg == 1:
-                        elem_type = samcef_elem_types[len(elem_nodes)]
-                    else:
-                        elem_nodes_filtered = set(filter(lambda n: n >= 0, elem_nodes))
-                        elem_type = samcef_elem_types[-len(elem_nodes_filtered)]
+                    elem_id, elem_type, elem_nodes = read_dat_elem_line(line)
                     dict_elem_types[elem_id] = elem_type
                     if elem_type not in set_elem_types:
                         set_elem_types.add(elem_type)
                         elems[elem_type] = {}
-                    corner_nodes = [n_id for n_id in elem_nodes if n_id > 0]
-                    mid_nodes = [abs(n_id) for n_id in elem_nodes if n_id < 0]
-                    if elem_type == 'wedge2':
-                        mid_nodes = mid_nodes[:3] + mid_nodes[6:] + mid_nodes[3:6]
-                    if elem_type == 'hex2':
-                        mid_nodes = mid_nodes[:4] + mid_nodes[8:] + mid_nodes[4:8]
-                    elems[elem_type][elem_id] = corner_nodes + mid_nodes
+                    elems[elem_type][elem_id] = elem_nodes
                     line = next(f0)
                     cur_command = dat_cur_command(line, cur_command)
+                section.count(len(dict_elem_types) - n_elems)
             if read_groups and cur_command == '.SEL':
+                n_groups = len(groups)
+                section = read_phase.section('groups')
                 sel_lines = ''
                 while cur_command == '.SEL':
                     sel_lines += line
                     line = next(f0)
                     cur_command = dat_cur_command(line, cur_command)
-                sel_lines = sel_lines.replace('.SEL', '')
-                sel_list = list(filter(lambda sel: not sel.isspace(), sel_lines.split('GROUP ')))
-                for sel in sel_list:
-                    info, str_entities = [s.strip() for s in sel.split('\n', 1)]
-                    try:
-                        what = info.split()[1]
-                        find_name = exp_group_name.findall(info)
-                    except:
-                        find_name = ''
-                    if find_name:
-                        gr_name = find_name[0].split()[-1].strip('"')
-                    else:
-                        try:
-                            gr_name = 'selection_{0:03d}'.format(int(info.split()[0]))
-                            counter = int(info.split()[0])
-                        except Exception:
-                            gr_name = 'selection_{0:03d}'.format(counter+1)
-                            counter += 1
-                    if (what in ['NOEUDS', 'MAILLES', 'FACES']) and (str_entities.startswith('I') or str_entities.startswith('MAILLE')):
-                        if what == 'NOEUDS':
-                            groups[gr_name] = {'node': [int(entity) for entity in str_entities.split()[
-                                1:] if entity != '$']}
-                        else:
-                            if what == 'MAILLES':
-                                entities = [int(entity) for entity in str_entities.split()[
-                                    1:] if entity != '$' and check_num(entity)]
-                            else:
-                                entities = [int(face.split()[1]) for face in str_entities.split(
-                                    '\n') if check_num(face.split()[1])]
-                            ent_elem_types = [dict_elem_types[elem_id] for elem_id in entities]
-                            pairs = list(zip(entities, ent_elem_types))
-                            groups[gr_name] = {elem_type: [e[0] for e in list(
-                                filter(lambda el: el[1] == elem_type, pairs))] for elem_type in set(ent_elem_types)}
-                    else:
-                        print('N\'arrive pas de lire le contenu du groupe {}'.format(gr_name))
+                counter = read_dat_sel_block(sel_lines, dict_elem_types, groups, counter)
+                section.count(len(groups) - n_groups)
     mesh_dict['nodes'] = nodes
     mesh_dict['elems'] = elems
     mesh_dict['groups'] = groups
     return mesh_dict
 
 
+def iter_dat(datin, read_nodes=1, read_elems=1, read_groups=1, chunk_size=100000):
+    '''
+    Streaming version of read_dat. Yields sections one chunk at a time:
+        ('nodes', node_ids, coords)
+        ('elems', elem_type, elem_ids, elem_nodes)
+        ('group', group_name, {ent_type: ids})
+    Element nodes are in the same order as in read_dat
+    '''
+    from .mesh import ElemTypeIndex
+    dict_elem_types = ElemTypeIndex()
+    counter = 0
+    with open_input(datin, 'r', encoding="utf8") as f0:
+        cur_command = 'start'
+        for line in f0:
+            cur_command = dat_cur_command(line, cur_command)
+            if read_nodes and cur_command == '.NOE':
+                node_ids, coords = [], []
+                line = next(f0)
+                while cur_command == '.NOE':
+                    node_id, node_coords = read_dat_node_line(line)
+                    node_ids.append(node_id)
+                    coords.append(node_coords)
+                    if len(node_ids) == chunk_size:
+                        yield ('nodes', node_ids, coords)
+                        node_ids, coords = [], []
+                    line = next(f0)
+                    cur_command = dat_cur_command(line, cur_command)
+                if node_ids:
+                    yield ('nodes', node_ids, coords)
+            if read_elems and cur_command == '.MAI':
+                chunks = {}
+                line = next(f0)
+                while cur_command == '.MAI':
+                    while "$" in line:
+                        line = line.replace("$", "")
+                        line += next(f0)
+                    elem_id, elem_type, elem_nodes = read_dat_elem_line(line)
+                    if elem_type not in chunks:
+                        chunks[elem_type] = ([], [])
+                    elem_ids, conn = chunks[elem_type]
+                    elem_ids.append(elem_id)
+                    conn.append(elem_nodes)
+                    if len(elem_ids) == chunk_size:
+                        dict_elem_types.add(elem_type, elem_ids)
+                        yield ('elems', elem_type, elem_ids, conn)
+                        chunks[elem_type] = ([], [])
+                    line = next(f0)
+                    cur_command = dat_cur_command(line, cur_command)
+                for elem_type, (elem_ids, conn) in chunks.items():
+                    if elem_ids:
+                        dict_elem_types.add(elem_type, elem_ids)
+                        yield ('elems', elem_type, elem_ids, conn)
+            if read_groups and cur_command == '.SEL':
+                sel_lines = ''
+                while cur_command == '.SEL':
+                    sel_lines += line
+                    line = next(f0)
+                    cur_command = dat_cur_command(line, cur_command)
+                groups = {}
+                counter = read_dat_sel_block(sel_lines, dict_elem_types, groups, counter)
+                for gr_name, group in groups.items():
+                    yield ('group', gr_name, group)
+
+
 def write_dat_elem(elem_type, nodes):
     if elem_type == 'tet':
         return 'N {0:d} {1:d} {2:d} 0 {3:d}'.format(*nodes)
@@ -163,52 +252,125 @@ def write_dat_elem(elem_type, nodes):
         raise TypeError
 
 
-def write_dat(outdat, mesh_dict, write_nodes=1, write_elems=1, write_groups=1):
+def dat_header():
+    date = str(datetime.now().strftime('%d-%m-%y')).ljust(12)
+    time = str(datetime.now().strftime('%H:%M:%S')).ljust(12)
+    return ''.join(['.INIT &\n',
+                    '! DAT is written by mesh.py from smartec python library\n',
+                    '! date / time:  {0}{1}\n'.format(date, time),
+                    '! LINEAR STATIC (ASEF)\n',
+                    '! {0}\n'.format('-' * 40),
+                    '.ASEF &\n',
+                    '!\n! LINEAR STATIC (ASEF)\n!\n',
+                    'MODE I 0 LECT 132 M 1 ECHO 1\n',
+                    '!{0}\n! Topology\n!{1}\n'.format('-'*40, '-'*40)])
+
+
+def dat_node_line(node_id, coords):
+    return '     I {0:d} X {1} Y {2} Z {3}'.format(node_id, *[sci_float(coords[i]) for i in range(3)])
+
+
+def dat_elem_line(elem_id, elem_str):
+    return '     I {0:d} {1}'.format(elem_id, elem_str)
+
+
+def dat_group_lines(i_gr, gr_name, ent_type, entities):
+    n = len(entities) + 1
+    if ent_type == 'node':
+        str_ent_1 = 'NOEUDS'
+        str_ent_2 = '_n'
+    else:
+        str_ent_1 = 'MAILLES'
+        str_ent_2 = '_e'
+    str_entities = ' '.join(['{0:d}{1}'.format(ent_id, (' $'*int(bool(i % 160)) + '\n')*int(
+        not bool(i % 8))) for ent_id, i in zip(entities, range(1, n))]).rstrip('\n')
+    return '.SEL GROUP {0:d} {1} NOM "{2}"\n'.format(i_gr, str_ent_1, gr_name+str_ent_2) + \
+        ' I ' + str_entities.rstrip('$') + '\n'
+
+
+def write_dat(outdat, mesh_dict, write_nodes=1, write_elems=1, write_groups=1, renumber=None):
+    # renumber: None, 'compact' or 'rcm' (see renumbering.renumber_mesh). The id maps
+    # of the renumbering are returned, for renumbering.renumber_field (None otherwise)
+    id_maps = None
+    if renumber:
+        from .renumbering import renumber_mesh
+        mesh_dict, id_maps = renumber_mesh(mesh_dict, renumber)
 
     node_dict = mesh_dict['nodes']
     elem_dict = mesh_dict['elems']
     group_dict = mesh_dict['groups']
-    elem_pairs = [(elem_id, write_dat_elem(elem_type, elem_dict[elem_type][elem_id]))
-                  for elem_type in elem_dict.keys() for elem_id in elem_dict[elem_type].keys()]
+    elem_pairs = [(elem_id, write_dat_elem(elem_type, elem_nodes))
+                  for elem_type in elem_dict.keys() for elem_id, elem_nodes in elem_dict[elem_type].items()]
     elem_pairs.sort(key=lambda pair: pair[0])
     #
-    date = str(datetime.now().strftime('%d-%m-%y')).ljust(12)
-    time = str(datetime.now().strftime('%H:%M:%S')).ljust(12)
-    #
     with open(outdat, 'w') as f0:
-        f0.write('.INIT &\n')
-        f0.write('! DAT is written by mesh.py from smartec python library\n')
-        f0.write('! date / time:  {0}{1}\n'.format(date, time))
-        f0.write('! LINEAR STATIC (ASEF)\n')
-        f0.write('! {0}\n'.format('-' * 40))
-        f0.write('.ASEF &\n')
-        f0.write('!\n! LINEAR STATIC (ASEF)\n!\n')
-        f0.write('MODE I 0 LECT 132 M 1 ECHO 1\n')
-        f0.write('!{0}\n! Topology\n!{1}\n'.format('-'*40, '-'*40))
+        f0.write(dat_header())
         if write_nodes:
-            f0.write('.NOE\n' + '\n'.join(['     I {0:d} X {1} Y {2} Z {3}'.format(node, *[sci_float(
-                node_dict[node][i]) for i in range(3)]) for node in sorted(list(node_dict.keys()))]))
+            f0.write('.NOE\n' + '\n'.join([dat_node_line(node, coords)
+                                           for node, coords in sorted(node_dict.items(), key=lambda pair: pair[0])]))
             f0.write('\n')
         if write_elems:
             f0.write(
-                '.MAI\n' + '\n'.join(['     I {0:d} {1}'.format(e[0], e[1]) for e in elem_pairs]))
+                '.MAI\n' + '\n'.join([dat_elem_line(e[0], e[1]) for e in elem_pairs]))
             f0.write('\n')
         if write_groups:
             i_gr = 1
             for gr_name in sorted(group_dict.keys()):
                 for ent_type in group_dict[gr_name].keys():
-                    entities = group_dict[gr_name][ent_type]
-                    n = len(entities) + 1
-                    if ent_type == 'node':
-                        str_ent_1 = 'NOEUDS'
-                        str_ent_2 = '_n'
-                    else:
-                        str_ent_1 = 'MAILLES'
-                        str_ent_2 = '_e'
-                    f0.write('.SEL GROUP {0:d} {1} NOM "{2}"\n'.format(
-                        i_gr, str_ent_1, gr_name+str_ent_2))
-                    str_entities = ' '.join(['{0:d}{1}'.format(ent_id, (' $'*int(bool(i % 160)) + '\n')*int(
-                        not bool(i % 8))) for ent_id, i in zip(entities, range(1, n))]).rstrip('\n')
-                    f0.write(' I ' + str_entities.rstrip('$') + '\n')
+                    f0.write(dat_group_lines(i_gr, gr_name, ent_type, group_dict[gr_name][ent_type]))
                     i_gr += 1
         f0.write('RETURN\n')
+    return id_maps
+
+
+class DatStreamWriter(object):
+    '''
+    Writes a .dat file section by section, in the order the
+    sections are given (see iter_dat for the section format)
+    '''
+
+    def __init__(self, outdat):
+        super(DatStreamWriter, self).__init__()
+        self.f0 = open(outdat, 'w')
+        self.f0.write(dat_header())
+        self.cur_command = None
+        self.i_gr = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_nodes(self, node_ids, coords):
+        if self.cur_command != '.NOE':
+            self.f0.write('.NOE\n')
+            self.cur_command = '.NOE'
+        self.f0.write(''.join([dat_node_line(node_id, node_coords) + '\n'
+                               for node_id, node_coords in zip(node_ids, coords)]))
+
+    def write_elems(self, elem_type, elem_ids, elem_nodes):
+        if self.cur_command != '.MAI':
+            self.f0.write('.MAI\n')
+            self.cur_command = '.MAI'
+        self.f0.write(''.join([dat_elem_line(elem_id, write_dat_elem(elem_type, nodes)) + '\n'
+                               for elem_id, nodes in zip(elem_ids, elem_nodes)]))
+
+    def write_group(self, gr_name, group):
+        self.cur_command = '.SEL'
+        for ent_type, entities in group.items():
+            self.f0.write(dat_group_lines(self.i_gr, gr_name, ent_type, entities))
+            self.i_gr += 1
+
+    def write_section(self, section):
+        if section[0] == 'nodes':
+            self.write_nodes(*section[1:])
+        elif section[0] == 'elems':
+            self.write_elems(*section[1:])
+        elif section[0] == 'group':
+            self.write_group(*section[1:])
+
+    def close(self):
+        if not self.f0.closed:
+            self.f0.write('RETURN\n')
+            self.f0.close()
@@ -13,10 +13,12 @@ import subprocess
 
 from math import sqrt
 
+from .file_io import open_input
+
 
 def read_group_file(group_file, groups=[]):
     group_dict = {}
-    with open(group_file, 'r') as f:
+    with open_input(group_file, 'r') as f:
         file_str = f.read()
     if file_str[0] == '$':
         blocks = file_str.split('$')[1:]
@@ -40,7 +42,7 @@ def read_dat_node_sel(dat_path, groups=[]):
 
     pattern = '(.SEL GROUP \d+ NOEUDS NOM "({})"\n[I0-9\$\s]+)'.format(group_pattern)
 
-    with open(dat_path, 'r') as f0:
+    with open_input(dat_path, 'r') as f0:
         s = f0.read()
     raw_blocks = re.findall(pattern, s)
 
@@ -67,7 +69,7 @@ def read_out_node_sel(out_path, groups=[]):
 
     pattern = '\n21\s+\d+\s+\d+\s+\d+\s+0\s+0\s+0\s+0\s+0\n({})\n({})'.format(group_pattern, content_pattern)
 
-    with open(out_path, 'r') as f0:
+    with open_input(out_path, 'r') as f0:
         s = f0.read()
 
     raw_blocks = re.findall(pattern, s)
@@ -98,7 +100,7 @@ def read_groups(mesh_file, group_names=[]):
 
 def get_group_names_from_file(mesh_file):
 
-    with open(mesh_file, 'r') as f:
+    with open_input(mesh_file, 'r') as f:
         s = f.read()
 
     ext = os.path.splitext(mesh_file)[-1]
@@ -179,9 +181,10 @@ def start_extraction_reac_xfem(des_files, folder_to_dump, sam_exe, sam_zone=5500
 
 
 # region = 'all nodes', 'group', 'selected nodes'
-def read_samres_out(out_path, out_type='vector', region='all nodes'):
+def read_samres_out(out_path, out_type='vector', region='all nodes', as_field=False, dtype='float64'):
+    # with as_field, the result is a Field of dtype
     result_dict = {}
-    with open(out_path, 'r') as f0:
+    with open_input(out_path, 'r') as f0:
         lines = f0.readlines()
     if out_type == 'vector' and region == 'all nodes':
         print(lines[3].strip())
@@ -189,6 +192,11 @@ def read_samres_out(out_path, out_type='vector', region='all nodes'):
         ids_block = lines[5:n_ids + 5]
         vals_block = lines[n_ids + 5:]
         _ids = [int(ids_block[i].strip()) for i in range(0, n_ids, 3)]
+        if as_field:
+            import numpy as np
+            from .fields import Field
+            values = np.array(vals_block[:3 * len(_ids)], dtype=np.float64).reshape(-1, 3)
+            return Field.from_rows(_ids, values, 'vector', dtype)
         for i, _id in enumerate(_ids):
             rx = float(vals_block[i * 3].strip())
             ry = float(vals_block[i * 3 + 1].strip())
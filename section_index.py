@@ -0,0 +1,313 @@
+'''
+Module with byte-offset indexes of the sections of ASCII
+mesh decks (.dat, .inp, .out). Only keyword lines are
+looked at, with C-level searches in a memory-mapped file,
+so the index of a deck is built much faster than it is
+parsed. The ranges found here are parsed independently by
+the parallel and partial readers, each range giving the
+same entities as the serial reader would give for it
+'''
+
+
+import io
+import mmap
+import locale
+from bisect import bisect_left, bisect_right
+
+from .samcef_dat_parser import dat_cur_command
+from .file_io import compression_format
+
+
+def map_file(mesh_file):
+    # read-only memory map of the file, None for empty and compressed files
+    with open(mesh_file, 'rb') as f0:
+        if compression_format(f0.read(6)):
+            return None
+        try:
+            return mmap.mmap(f0.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+
+def read_range(mesh_file, start, end):
+    with open(mesh_file, 'rb') as f0:
+        f0.seek(start)
+        return f0.read(end - start)
+
+
+def text_lines(data, encoding='utf8'):
+    # lines of a byte range as a text-mode file would give them
+    return io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+
+
+def line_end(buffer, pos):
+    # start of the line following the one containing pos
+    end = buffer.find(b'\n', pos)
+    return len(buffer) if end == -1 else end + 1
+
+
+def line_start(buffer, pos):
+    return buffer.rfind(b'\n', 0, pos) + 1
+
+
+def find_all(buffer, pattern, start=0, end=None):
+    end = len(buffer) if end is None else end
+    positions = []
+    pos = buffer.find(pattern, start, end)
+    while pos != -1:
+        positions.append(pos)
+        pos = buffer.find(pattern, pos + len(pattern), end)
+    return positions
+
+
+def line_starts_after(buffer, start, end, chunk_size, is_split_point=None):
+    # line starts roughly every chunk_size bytes in [start, end)
+    points = []
+    target = start + chunk_size
+    while target < end:
+        pos = line_end(buffer, target - 1)
+        while pos < end and is_split_point is not None and not is_split_point(pos):
+            pos = line_end(buffer, pos)
+        if pos >= end:
+            break
+        points.append(pos)
+        target = pos + chunk_size
+    return points
+
+
+def split_range(buffer, start, end, chunk_size, is_split_point=None):
+    points = [start] + line_starts_after(buffer, start, end, chunk_size, is_split_point) + [end]
+    return list(zip(points[:-1], points[1:]))
+
+
+# Samcef .dat
+
+
+def dat_control_lines(buffer):
+    '''
+    Returns sorted [(start, end, command)] of the lines that
+    change the current command of read_dat: lines starting with
+    '.' or '!' and lines containing RETURN
+    '''
+    starts = set()
+    if buffer[:1] in (b'.', b'!'):
+        starts.add(0)
+    for pattern in (b'\n.', b'\n!'):
+        starts.update([pos + 1 for pos in find_all(buffer, pattern)])
+    for pos in find_all(buffer, b'RETURN'):
+        starts.add(line_start(buffer, pos))
+    controls = []
+    for start in sorted(starts):
+        end = line_end(buffer, start)
+        controls.append((start, end, dat_cur_command(buffer[start:end].decode('utf8', 'replace'), None)))
+    return controls
+
+
+def is_dat_continuation(buffer, pos):
+    # line at pos is joined to the previous element line ending with '$'
+    if pos == 0:
+        return False
+    return b'$' in buffer[line_start(buffer, pos - 1):pos]
+
+
+def dat_sections(buffer, controls=None, read_nodes=True, read_elems=True, read_groups=True):
+    '''
+    Replays the command state machine of read_dat on the control
+    lines only. Returns [(kind, start, end)] byte ranges of the
+    lines read_dat parses as nodes, elems or groups, in file order.
+    Node and element ranges start after the keyword line, group
+    ranges start with it (as sel_lines of read_dat)
+    '''
+    if controls is None:
+        controls = dat_control_lines(buffer)
+    size = len(buffer)
+    starts = [control[0] for control in controls]
+    commands = {control[0]: control[2] for control in controls}
+    enabled = set()
+    if read_nodes:
+        enabled.add('.NOE')
+    if read_elems:
+        enabled.add('.MAI')
+    if read_groups:
+        enabled.add('.SEL')
+
+    def next_change(pos, command, skip_continuations=False):
+        i = bisect_right(starts, pos)
+        while i < len(starts):
+            start = starts[i]
+            if commands[start] != command and not (skip_continuations and is_dat_continuation(buffer, start)):
+                return start
+            i += 1
+        return size
+
+    sections = []
+    pos = 0
+    cur_command = 'start'
+    while pos < size:
+        cur_command = commands.get(pos, cur_command)
+        cur_pos = pos
+        if read_nodes and cur_command == '.NOE':
+            start = line_end(buffer, cur_pos)
+            if start >= size:
+                break
+            cur_pos = next_change(start, '.NOE')
+            sections.append(('nodes', start, cur_pos))
+            cur_command = commands.get(cur_pos, cur_command)
+        if read_elems and cur_command == '.MAI':
+            start = line_end(buffer, cur_pos)
+            if start >= size:
+                break
+            cur_pos = next_change(start, '.MAI', skip_continuations=True)
+            sections.append(('elems', start, cur_pos))
+            cur_command = commands.get(cur_pos, cur_command)
+        if read_groups and cur_command == '.SEL':
+            start = cur_pos
+            cur_pos = next_change(start, '.SEL')
+            sections.append(('groups', start, cur_pos))
+            cur_command = commands.get(cur_pos, cur_command)
+        if cur_pos >= size:
+            break
+        pos = line_end(buffer, cur_pos)
+        if cur_command not in enabled:
+            # lines up to the next control line keep the command, nothing to read
+            i = bisect_left(starts, pos)
+            pos = starts[i] if i < len(starts) else size
+    return sections
+
+
+def split_dat_section(buffer, kind, start, end, chunk_size):
+    if kind == 'elems':
+        return split_range(buffer, start, end, chunk_size,
+                           lambda pos: not is_dat_continuation(buffer, pos))
+    if kind == 'nodes':
+        return split_range(buffer, start, end, chunk_size)
+    return [(start, end)]
+
+
+# Abaqus .inp
+
+
+inp_encoding = locale.getpreferredencoding(False)
+
+
+def inp_keyword_positions(buffer):
+    # positions of the '*' read_inp splits on, '*' of comment lines excluded
+    positions = []
+    size = len(buffer)
+    pos = buffer.find(b'*')
+    while pos != -1:
+        start = line_start(buffer, pos)
+        if buffer[start:start + 2] == b'**':
+            pos = buffer.find(b'*', line_end(buffer, pos))
+            continue
+        positions.append(pos)
+        pos = buffer.find(b'*', pos + 1, size)
+    return positions
+
+
+def inp_blocks(buffer):
+    '''
+    Returns [(start, end)] byte ranges of the blocks of read_inp
+    (text between two '*'), the first one starting at the beginning
+    of the file
+    '''
+    positions = inp_keyword_positions(buffer)
+    bounds = [0] + [pos + 1 for pos in positions]
+    ends = positions + [len(buffer)]
+    return list(zip(bounds, ends))
+
+
+def inp_text(data, at_line_start, at_eof, encoding=None):
+    '''
+    Text of a byte range of an .inp file as it is found in the
+    string read_inp splits: lines stripped, comment lines removed,
+    joined with newlines. at_line_start is False for ranges starting
+    after a '*', at_eof is True for ranges ending with the file
+    '''
+    pieces = data.decode(encoding or inp_encoding).split('\n')
+    is_kept = lambda line: not line.startswith('**')
+    if len(pieces) == 1:
+        piece = pieces[0]
+        if at_line_start and at_eof:
+            return piece.strip() if is_kept(piece) else ''
+        if at_line_start:
+            return piece.lstrip()
+        if at_eof:
+            return piece.rstrip()
+        return piece
+    first, middle, last = pieces[0], pieces[1:-1], pieces[-1]
+    kept = []
+    if not at_line_start:
+        kept.append(first.rstrip())
+    elif is_kept(first):
+        kept.append(first.strip())
+    kept.extend([line.strip() for line in middle if is_kept(line)])
+    if not at_eof:
+        kept.append(last.lstrip())
+    elif last and is_kept(last):
+        kept.append(last.strip())
+    return '\n'.join(kept)
+
+
+def inp_block_head(buffer, start, end):
+    # text of the keyword line of a block, with its newline if any
+    head_end = min(line_end(buffer, start), end)
+    return inp_text(buffer[start:head_end], start == 0, head_end == len(buffer))
+
+
+def is_inp_split_point(buffer, pos):
+    # element lines ending with ',' continue on the next line
+    prev_line = buffer[line_start(buffer, pos - 1):pos]
+    return not (prev_line.startswith(b'**') or prev_line.rstrip().endswith(b','))
+
+
+def split_inp_block(buffer, start, end, chunk_size, elems=False):
+    first_line_end = line_end(buffer, start)
+    if end - start <= chunk_size or first_line_end >= end:
+        return [(start, end)]
+    is_split_point = (lambda pos: is_inp_split_point(buffer, pos)) if elems else None
+    points = line_starts_after(buffer, first_line_end, end, chunk_size, is_split_point)
+    points = [start] + points + [end]
+    return list(zip(points[:-1], points[1:]))
+
+
+# Patran .out
+
+
+out_packet_types = (b' 1', b' 2', b'21')
+
+
+def is_out_packet_header(line):
+    # header card: packet type (2 columns) and 8 integer fields of 8 columns
+    line = line.rstrip(b'\r\n')
+    if line[:2] not in out_packet_types or len(line) < 66 or len(line) % 8 != 2:
+        return False
+    fields = [line[i:i + 8].strip() for i in range(2, len(line), 8)]
+    return all([field.lstrip(b'-').isdigit() for field in fields if field])
+
+
+def next_out_packet(buffer, pos, end=None):
+    # start of the first packet header card at or after the line at pos
+    end = len(buffer) if end is None else end
+    pos = line_start(buffer, pos)
+    while pos < end:
+        next_pos = line_end(buffer, pos)
+        if is_out_packet_header(buffer[pos:next_pos]):
+            return pos
+        pos = next_pos
+    return end
+
+
+def out_ranges(buffer, chunk_size):
+    size = len(buffer)
+    points = [0]
+    target = chunk_size
+    while target < size:
+        pos = next_out_packet(buffer, target)
+        if pos >= size:
+            break
+        if pos > points[-1]:
+            points.append(pos)
+        target = pos + chunk_size
+    points.append(size)
+    return list(zip(points[:-1], points[1:]))
@@ -0,0 +1,195 @@
+'''
+Module for extracting the skin (free faces) of volume meshes,
+to get light surface models for visualization. Faces of the
+tet, wedge and hex elements (linear and quadratic, in the node
+order of the mesh dict) are keyed by their sorted corner nodes,
+the keys are hashed and sorted, and faces found only once make
+the tria / quad (tria2 / quad2) skin. Each skin element keeps
+its parent element and the number of its face in the parent
+'''
+
+
+import numpy as np
+
+from .mesh import Mesh, ElemBlock, id_dtype
+from .groups import sorted_unique, sorted_contains
+
+
+# corner nodes of the faces, normals pointing out of the element
+corner_faces = {'tet': ((0, 2, 1), (0, 1, 3), (1, 2, 3), (2, 0, 3)),
+                'wedge': ((0, 2, 1), (3, 4, 5), (0, 1, 4, 3), (1, 2, 5, 4), (2, 0, 3, 5)),
+                'hex': ((0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7))}
+
+# edges of the mid-side nodes of the quadratic elements, in their order after the corners
+mid_side_edges = {'tet2': ((0, 1), (1, 2), (2, 0), (0, 3), (1, 3), (2, 3)),
+                  'wedge2': ((0, 1), (1, 2), (2, 0), (0, 3), (1, 4), (2, 5), (3, 4), (4, 5), (5, 3)),
+                  'hex2': ((0, 1), (1, 2), (2, 3), (3, 0), (0, 4), (1, 5), (2, 6), (3, 7),
+                           (4, 5), (5, 6), (6, 7), (7, 4))}
+
+skin_elem_types = {3: 'tria', 4: 'quad', 6: 'tria2', 8: 'quad2'}
+
+
+def quadratic_faces(elem_type):
+    # faces of a quadratic element: corners, then the mid-side nodes of the face edges
+    faces = corner_faces[elem_type[:-1]]
+    n_corners = max([max(face) for face in faces]) + 1
+    mid_nodes = {frozenset(edge): n_corners + i for i, edge in enumerate(mid_side_edges[elem_type])}
+    return tuple([face + tuple([mid_nodes[frozenset((face[i], face[(i + 1) % len(face)]))]
+                                for i in range(len(face))]) for face in faces])
+
+
+face_nodes = dict(corner_faces)
+face_nodes.update({elem_type: quadratic_faces(elem_type) for elem_type in mid_side_edges})
+
+
+def sorted_columns(columns):
+    # columns sorted row by row (sorting network on 2, 3 or 4 columns)
+    columns = list(columns)
+    pairs = {2: ((0, 1),), 3: ((0, 1), (1, 2), (0, 1)), 4: ((0, 1), (2, 3), (0, 2), (1, 3), (1, 2))}[len(columns)]
+    for i, j in pairs:
+        columns[i], columns[j] = np.minimum(columns[i], columns[j]), np.maximum(columns[i], columns[j])
+    return columns
+
+
+def face_keys(columns, n_nodes):
+    '''
+    One int64 key per face from its sorted corner rows: exact when the
+    rows fit in 63 bits, else a hash. Returns (keys, exact)
+    '''
+    if n_nodes ** len(columns) < 2 ** 63:
+        keys = np.zeros(len(columns[0]), dtype=np.int64)
+        for column in columns:
+            keys *= n_nodes
+            keys += column
+        return keys, True
+    keys = np.zeros(len(columns[0]), dtype=np.uint64)
+    for column in columns:
+        keys ^= column.astype(np.uint64)
+        keys *= np.uint64(0x9E3779B97F4A7C15)
+        keys ^= keys >> np.uint64(29)
+    return keys.view(np.int64), False
+
+
+def sorted_faces(columns, n_nodes):
+    '''
+    Faces of the sorted corner rows columns, sorted so that equal faces
+    follow each other. Returns (order, same), same[i] telling if the
+    faces order[i] and order[i + 1] are equal
+    '''
+    n_faces = len(columns[0])
+    if n_faces < 2:
+        return np.arange(n_faces), np.zeros(0, dtype=bool)
+    keys, exact = face_keys(columns, n_nodes)
+    order = np.argsort(keys)
+    keys = keys[order]
+    same = keys[1:] == keys[:-1]
+    if not exact:
+        equal = same.copy()
+        for column in columns:
+            sorted_column = column[order]
+            equal &= sorted_column[1:] == sorted_column[:-1]
+        if (equal != same).any():
+            # hash collision, faces are sorted by their corners
+            order = np.lexsort(columns[::-1])
+            equal = np.ones(n_faces - 1, dtype=bool)
+            for column in columns:
+                sorted_column = column[order]
+                equal &= sorted_column[1:] == sorted_column[:-1]
+        same = equal
+    return order, same
+
+
+def single_faces(columns, n_nodes):
+    # mask of the faces whose corners are not shared by another face
+    order, same = sorted_faces(columns, n_nodes)
+    single = np.ones(len(order), dtype=bool)
+    single[1:] &= ~same
+    single[:-1] &= ~same
+    free = np.zeros(len(order), dtype=bool)
+    free[order[single]] = True
+    return free
+
+
+def extract_skin(mesh, elem_ids=None, start_elem_id=1, groups=True):
+    '''
+    Skin of the volume elements of mesh (mesh dict or Mesh), or of the
+    elem_ids elements only. Returns (skin, parents): skin is a Mesh of
+    tria / quad (tria2 / quad2 for quadratic elements) numbered from
+    start_elem_id, with the nodes of its elements, parents is (skin ids,
+    parent element ids, face numbers in the parent, as in face_nodes).
+    With groups, element groups give the skin elements of their elements
+    and node groups are restricted to the skin nodes
+    '''
+    mesh = Mesh.from_dict(mesh)
+    n_nodes = len(mesh.node_ids)
+    row_dtype = np.int32 if n_nodes < 2 ** 31 else np.int64
+    if elem_ids is not None:
+        elem_ids = sorted_unique(np.asarray(elem_ids, dtype=id_dtype))
+    # faces of each element type and face number, split by number of corners
+    chunks = {3: [], 4: []}
+    for elem_type, block in mesh.elem_blocks.items():
+        if elem_type not in face_nodes or not len(block):
+            continue
+        ids, conn = block.ids, block.conn
+        if elem_ids is not None:
+            kept = sorted_contains(elem_ids, ids)
+            ids, conn = ids[kept], conn[kept]
+        rows = mesh.node_index.rows(conn.ravel(), strict=True).reshape(conn.shape).astype(row_dtype)
+        for face, corners in enumerate(corner_faces[elem_type.rstrip('2')]):
+            chunks[len(corners)].append((elem_type, face, ids, conn, rows, corners))
+    skin_types, parents, faces, skin_conns = [], [], [], []
+    for n_corners, type_chunks in chunks.items():
+        if not type_chunks:
+            continue
+        columns = sorted_columns([np.concatenate([rows[:, corners[i]] for _, _, _, _, rows, corners in type_chunks])
+                                  for i in range(n_corners)])
+        free = single_faces(columns, n_nodes)
+        del columns
+        start = 0
+        for elem_type, face, ids, conn, _, _ in type_chunks:
+            chunk_free = free[start:start + len(ids)]
+            start += len(ids)
+            nodes = face_nodes[elem_type][face]
+            skin_types.append(skin_elem_types[len(nodes)])
+            parents.append(ids[chunk_free])
+            faces.append(np.full(chunk_free.sum(), face, dtype=np.int64))
+            skin_conns.append(conn[chunk_free][:, list(nodes)])
+    if not parents:
+        return Mesh(), (np.zeros(0, dtype=id_dtype), np.zeros(0, dtype=id_dtype), np.zeros(0, dtype=np.int64))
+    # skin elements numbered in the order of their parents
+    all_parents, all_faces = np.concatenate(parents), np.concatenate(faces)
+    order = np.lexsort((all_faces, all_parents))
+    skin_ids = np.empty(len(order), dtype=id_dtype)
+    skin_ids[order] = np.arange(start_elem_id, start_elem_id + len(order), dtype=id_dtype)
+    type_ids, type_conns = {}, {}
+    start = 0
+    for skin_type, conn in zip(skin_types, skin_conns):
+        type_ids.setdefault(skin_type, []).append(skin_ids[start:start + len(conn)])
+        type_conns.setdefault(skin_type, []).append(conn)
+        start += len(conn)
+    elem_blocks = {skin_type: ElemBlock(np.concatenate(type_ids[skin_type]), np.concatenate(type_conns[skin_type]))
+                   for skin_type in type_ids}
+    skin_node_ids = sorted_unique(np.concatenate([conn.ravel() for conn in skin_conns]))
+    coords = mesh.coords[mesh.node_index.rows(skin_node_ids, strict=True)]
+    skin_ids, all_parents, all_faces = skin_ids[order], all_parents[order], all_faces[order]
+    group_arrays = {}
+    if groups:
+        for gr_name, group in mesh.group_arrays.items():
+            skin_group = {}
+            for ent_type, ids in group.items():
+                if ent_type == 'node':
+                    ids = ids[sorted_contains(skin_node_ids, ids)]
+                    if len(ids):
+                        skin_group['node'] = ids
+                    continue
+                # group ids are in file order
+                in_group = sorted_contains(sorted_unique(ids), all_parents)
+                for skin_type, block in elem_blocks.items():
+                    group_ids = skin_ids[in_group][sorted_contains(block.ids, skin_ids[in_group])]
+                    if len(group_ids):
+                        skin_group[skin_type] = sorted_unique(np.concatenate([skin_group.get(
+                            skin_type, np.zeros(0, dtype=id_dtype)), group_ids]))
+            if skin_group:
+                group_arrays[gr_name] = skin_group
+    skin = Mesh(skin_node_ids, coords, elem_blocks, group_arrays)
+    return skin, (skin_ids, all_parents, all_faces)
@@ -0,0 +1,428 @@
+'''
+Module with spatial indexes for proximity and picking
+queries on mesh nodes and front points. Points are sorted
+by the cell of a uniform grid, so a query only looks at
+the points of the cells around it. Queries are done in
+batch on arrays of points, functions of utilities are
+given here for arrays of points too
+'''
+
+
+import numpy as np
+
+
+default_points_per_cell = 4
+# max number of (query, cell) pairs looked at in one go
+default_batch_size = 2 ** 22
+
+
+def as_points(points):
+    return np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+
+def project_points_on_axis(points, p1, p2):
+    points, p1, p2 = as_points(points), as_points(p1), as_points(p2)
+    axis = p2 - p1
+    axis_len2 = (axis ** 2).sum(1)
+    t = ((points - p1) * axis).sum(1) / np.where(axis_len2 > 0, axis_len2, 1.0)
+    return p1 + t[:, None] * axis
+
+
+def distance_points_axis(points, p1, p2):
+    return np.sqrt(((as_points(points) - project_points_on_axis(points, p1, p2)) ** 2).sum(1))
+
+
+def check_points_over_segment(points, p1, p2):
+    points, p1, p2 = as_points(points), as_points(p1), as_points(p2)
+    axis = p2 - p1
+    return ((points - p1) * axis).sum(1) * ((points - p2) * axis).sum(1) <= 0
+
+
+def segment_parameters(points, p1, p2):
+    # position of the closest point of the segments, 0 at p1 and 1 at p2
+    points, p1, p2 = as_points(points), as_points(p1), as_points(p2)
+    axis = p2 - p1
+    axis_len2 = (axis ** 2).sum(1)
+    t = ((points - p1) * axis).sum(1) / np.where(axis_len2 > 0, axis_len2, 1.0)
+    return np.clip(t, 0.0, 1.0)
+
+
+def distance_points_segment(points, p1, p2):
+    points, p1, p2 = as_points(points), as_points(p1), as_points(p2)
+    t = segment_parameters(points, p1, p2)
+    return np.sqrt(((points - p1 - t[:, None] * (p2 - p1)) ** 2).sum(1))
+
+
+def default_cell_size(extent, n_points, points_per_cell=default_points_per_cell):
+    # flat directions (planar fronts, 2d meshes) don't count in the cell volume
+    size = extent.max() if len(extent) else 0.0
+    if n_points < 2 or size <= 0.0:
+        return 1.0
+    dims = extent[extent > 1e-9 * size]
+    cell_size = (np.prod(dims) * points_per_cell / n_points) ** (1.0 / len(dims))
+    return max(cell_size, size / 2 ** 20)
+
+
+def ring_offsets(ring, shape):
+    # cell offsets at Chebyshev distance ring, limited to the grid size
+    ranges = [np.arange(-min(ring, n - 1), min(ring, n - 1) + 1) for n in shape]
+    offsets = np.stack(np.meshgrid(*ranges, indexing='ij'), -1).reshape(-1, 3)
+    return offsets[np.abs(offsets).max(1) == ring]
+
+
+def ring_size(ring, shape):
+    # number of cells of ring_offsets(ring, shape)
+    return box_size(ring, shape) - (box_size(ring - 1, shape) if ring else 0)
+
+
+def box_size(radius, shape):
+    # number of cells of box_offsets(radius, shape)
+    return int(np.prod([2 * min(radius, n - 1) + 1 for n in shape]))
+
+
+def box_offsets(radius, shape):
+    ranges = [np.arange(-min(radius, n - 1), min(radius, n - 1) + 1) for n in shape]
+    return np.stack(np.meshgrid(*ranges, indexing='ij'), -1).reshape(-1, 3)
+
+
+def csr_from_pairs(n_queries, query_rows, values):
+    # values sorted by query row to offsets and values
+    offsets = np.zeros(n_queries + 1, dtype=np.int64)
+    np.cumsum(np.bincount(query_rows, minlength=n_queries), out=offsets[1:])
+    return offsets, values
+
+
+def group_argmin(group_rows, values):
+    # index of the first smallest value of each group, group_rows are grouped
+    if not len(group_rows):
+        return np.zeros(0, dtype=np.int64)
+    group_starts = np.flatnonzero(np.diff(group_rows, prepend=group_rows[0] - 1))
+    group_min = np.minimum.reduceat(values, group_starts)
+    is_min = values == np.repeat(group_min, np.diff(np.append(group_starts, len(group_rows))))
+    _, first = np.unique(group_rows[is_min], return_index=True)
+    return np.flatnonzero(is_min)[first]
+
+
+class SpatialIndex(object):
+    '''
+    Uniform grid over points, ids are the node ids (row indices
+    of points by default). Queries return ids, -1 when nothing
+    is found
+    '''
+
+    def __init__(self, points, ids=None, cell_size=None, points_per_cell=default_points_per_cell):
+        super(SpatialIndex, self).__init__()
+        points = as_points(points)
+        n_points = len(points)
+        self.ids = np.arange(n_points, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.origin = points.min(0) if n_points else np.zeros(3)
+        extent = points.max(0) - self.origin if n_points else np.zeros(3)
+        self.cell_size = float(cell_size or default_cell_size(extent, n_points, points_per_cell))
+        self.shape = (extent // self.cell_size).astype(np.int64) + 1
+        for attempt in range(4 if cell_size is None else 1):
+            keys = self.cell_keys(self.cell_coords(points))
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            self.cell_starts = np.flatnonzero(np.diff(keys, prepend=-1))
+            # points on curves or surfaces fill few cells of the volume, cells are made smaller
+            occupancy = n_points / max(len(self.cell_starts), 1)
+            if cell_size is not None or attempt == 3 or occupancy < 2 * points_per_cell:
+                break
+            self.cell_size = max(self.cell_size * points_per_cell / occupancy, extent.max() / 2 ** 20)
+            self.shape = (extent // self.cell_size).astype(np.int64) + 1
+        self.points = points[order]
+        self.ids = self.ids[order]
+        self.cells = keys[self.cell_starts]
+        self.cell_ends = np.append(self.cell_starts[1:], n_points).astype(np.int64)
+
+    @classmethod
+    def from_mesh(cls, mesh_dict, node_ids=None, **kwargs):
+        # mesh_dict can be a Mesh, node_ids restricts the index to some nodes
+        from .mesh import Mesh
+        if isinstance(mesh_dict, Mesh):
+            if node_ids is None:
+                return cls(mesh_dict.coords, mesh_dict.node_ids, **kwargs)
+            return cls(mesh_dict.node_coords(node_ids), node_ids, **kwargs)
+        nodes = mesh_dict['nodes']
+        if node_ids is None:
+            node_ids = list(nodes.keys())
+        return cls([nodes[node_id] for node_id in node_ids], node_ids, **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cell_coords(self, points):
+        return np.floor((as_points(points) - self.origin) / self.cell_size).astype(np.int64)
+
+    def cell_keys(self, coords):
+        return coords[..., 0] + self.shape[0] * (coords[..., 1] + self.shape[1] * coords[..., 2])
+
+    def gather(self, coords, offsets):
+        '''
+        Points of the cells coords + offsets. Returns (query rows,
+        point rows), grouped by query row
+        '''
+        cells = coords[:, None, :] + offsets[None, :, :]
+        keys = self.cell_keys(cells)
+        pos = np.minimum(np.searchsorted(self.cells, keys), len(self.cells) - 1)
+        found = ((cells >= 0) & (cells < self.shape)).all(2) & (self.cells[pos] == keys)
+        query_rows, cell_rows = np.nonzero(found)
+        return self.cell_points(query_rows, pos[query_rows, cell_rows])
+
+    def cell_points(self, query_rows, cell_rows):
+        # points of the (query row, occupied cell row) pairs, grouped by query row
+        starts = self.cell_starts[cell_rows]
+        counts = self.cell_ends[cell_rows] - starts
+        # concatenation of the ranges [start, start + count)
+        shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return np.repeat(query_rows, counts), shifts + np.arange(counts.sum(), dtype=np.int64)
+
+    def cell_boxes(self):
+        # (min corners, max corners) of the occupied cells
+        coords = np.stack([self.cells % self.shape[0], self.cells // self.shape[0] % self.shape[1],
+                           self.cells // (self.shape[0] * self.shape[1])], 1)
+        box_min = self.origin + coords * self.cell_size
+        return box_min, box_min + self.cell_size
+
+    def scan_cells(self, points):
+        '''
+        Points of the occupied cells that can hold the nearest point of
+        points, found from the distances to all occupied cells. Used for
+        points far from the indexed points, where rings of cells are empty
+        '''
+        box_min, box_max = self.cell_boxes()
+        all_rows, all_points = [], []
+        for start, end in self.batches(len(points), len(self.cells)):
+            batch = points[start:end, None, :]
+            lower = np.sqrt((np.maximum(np.maximum(box_min - batch, batch - box_max), 0.0) ** 2).sum(2))
+            upper = np.sqrt((np.maximum(np.abs(batch - box_min), np.abs(batch - box_max)) ** 2).sum(2))
+            query_rows, cell_rows = np.nonzero(lower <= upper.min(1)[:, None])
+            query_rows, point_rows = self.cell_points(query_rows, cell_rows)
+            all_rows.append(query_rows + start)
+            all_points.append(point_rows)
+        return np.concatenate(all_rows), np.concatenate(all_points)
+
+    def scan_radius(self, points, radii):
+        '''
+        Points of the occupied cells closer than radii of points, found
+        from the distances to all occupied cells. Used for radii spanning
+        more cells than there are occupied cells
+        '''
+        box_min, box_max = self.cell_boxes()
+        all_rows, all_points = [], []
+        for start, end in self.batches(len(points), len(self.cells)):
+            batch = points[start:end, None, :]
+            lower = np.sqrt((np.maximum(np.maximum(box_min - batch, batch - box_max), 0.0) ** 2).sum(2))
+            query_rows, cell_rows = np.nonzero(lower <= radii[start:end, None])
+            query_rows, point_rows = self.cell_points(query_rows, cell_rows)
+            all_rows.append(query_rows + start)
+            all_points.append(point_rows)
+        return np.concatenate(all_rows), np.concatenate(all_points)
+
+    def batches(self, n_queries, n_offsets):
+        batch_size = max(1, default_batch_size // max(1, n_offsets))
+        for start in range(0, n_queries, batch_size):
+            yield start, min(start + batch_size, n_queries)
+
+    def nearest(self, points, max_distance=None):
+        '''
+        Nearest indexed point of each point. Returns (ids, distances),
+        id -1 and distance inf when no point is closer than max_distance
+        '''
+        points = as_points(points)
+        n_queries = len(points)
+        best = np.full(n_queries, np.inf)
+        best_rows = np.full(n_queries, -1, dtype=np.int64)
+        if not len(self) or not n_queries:
+            return np.full(n_queries, -1, dtype=np.int64), best
+        coords = np.clip(self.cell_coords(points), 0, self.shape - 1)
+        pending = np.arange(n_queries)
+        ring = 0
+        while len(pending):
+            # rings with more cells than there are occupied cells aren't looked at
+            scan = ring > 1 and ring_size(ring, self.shape) > len(self.cells)
+            if scan:
+                batches = [(pending, self.scan_cells(points[pending]))]
+            else:
+                offsets = ring_offsets(ring, self.shape)
+                batches = ((pending[start:end], self.gather(coords[pending[start:end]], offsets))
+                           for start, end in self.batches(len(pending), len(offsets)))
+            for rows, (query_rows, point_rows) in batches:
+                if not len(point_rows):
+                    continue
+                distances = np.sqrt(((points[rows][query_rows] - self.points[point_rows]) ** 2).sum(1))
+                closest = group_argmin(query_rows, distances)
+                targets = rows[query_rows[closest]]
+                closer = distances[closest] < best[targets]
+                best[targets[closer]] = distances[closest][closer]
+                best_rows[targets[closer]] = point_rows[closest][closer]
+            # points of the next rings are at least ring cells away
+            bound = ring * self.cell_size
+            if scan or ring >= self.shape.max() or (max_distance is not None and bound > max_distance):
+                break
+            pending = pending[best[pending] > bound]
+            ring += 1
+        if max_distance is not None:
+            best_rows[best > max_distance] = -1
+            best[best > max_distance] = np.inf
+        ids = np.where(best_rows >= 0, self.ids[best_rows], -1)
+        return ids, best
+
+    def radius_pairs(self, points, radius):
+        # (query rows, point rows, distances) sorted by query row and distance,
+        # radius can be given for each point
+        points = as_points(points)
+        if not len(self) or not len(points):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        radii = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(points),))
+        # cells of points out of the grid are moved to its border, it doesn't
+        # take them farther from any indexed point
+        coords = np.clip(self.cell_coords(points), 0, self.shape - 1)
+        n_cells = np.ceil(radii / self.cell_size).astype(np.int64)
+        all_rows, all_points, all_distances = [], [], []
+        for cells in np.unique(n_cells):
+            rows = np.flatnonzero(n_cells == cells)
+            # boxes with more cells than there are occupied cells aren't looked at
+            if box_size(int(cells), self.shape) > len(self.cells):
+                batches = [(rows, self.scan_radius(points[rows], radii[rows]))]
+            else:
+                offsets = box_offsets(int(cells), self.shape)
+                batches = ((rows[start:end], self.gather(coords[rows[start:end]], offsets))
+                           for start, end in self.batches(len(rows), len(offsets)))
+            for batch, (query_rows, point_rows) in batches:
+                query_rows = batch[query_rows]
+                distances = np.sqrt(((points[query_rows] - self.points[point_rows]) ** 2).sum(1))
+                close = distances <= radii[query_rows]
+                all_rows.append(query_rows[close])
+                all_points.append(point_rows[close])
+                all_distances.append(distances[close])
+        query_rows, point_rows, distances = [np.concatenate(a) for a in (all_rows, all_points, all_distances)]
+        order = np.lexsort((distances, query_rows))
+        return query_rows[order], point_rows[order], distances[order]
+
+    def radius(self, points, radius):
+        '''
+        Indexed points closer than radius of each point. Returns
+        (offsets, ids, distances), ids[offsets[i]:offsets[i + 1]] are
+        the points around points[i], sorted by distance
+        '''
+        n_queries = len(as_points(points))
+        query_rows, point_rows, distances = self.radius_pairs(points, radius)
+        offsets, ids = csr_from_pairs(n_queries, query_rows, self.ids[point_rows])
+        return offsets, ids, distances
+
+    def near_segments(self, p1, p2, distance):
+        '''
+        Indexed points closer than distance of each segment [p1, p2].
+        Returns (offsets, ids, distances) as radius does
+        '''
+        p1, p2 = as_points(p1), as_points(p2)
+        n_segments = len(p1)
+        # points of the segments every cell_size, a point close to a segment
+        # is closer than distance + cell_size / 2 of one of them
+        segment_rows, samples = segment_samples(p1, p2, self.cell_size)
+        sample_rows, point_rows, _ = self.radius_pairs(samples, distance + 0.5 * self.cell_size)
+        pairs = np.unique(np.stack([segment_rows[sample_rows], point_rows], 1), axis=0)
+        distances = distance_points_segment(self.points[pairs[:, 1]], p1[pairs[:, 0]], p2[pairs[:, 0]])
+        close = distances <= distance
+        query_rows, point_rows, distances = pairs[close, 0], pairs[close, 1], distances[close]
+        order = np.lexsort((distances, query_rows))
+        offsets, ids = csr_from_pairs(n_segments, query_rows[order], self.ids[point_rows[order]])
+        return offsets, ids, distances[order]
+
+
+def segment_samples(p1, p2, spacing):
+    # points every spacing (at most) along the segments, ends included
+    counts = np.ceil(np.sqrt(((p2 - p1) ** 2).sum(1)) / spacing).astype(np.int64) + 1
+    segment_rows = np.repeat(np.arange(len(p1)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = steps / np.maximum(counts - 1, 1)[segment_rows]
+    return segment_rows, p1[segment_rows] + t[:, None] * (p2 - p1)[segment_rows]
+
+
+class SegmentIndex(object):
+    '''
+    Index over segments (front elements) for picking. Segments are
+    sampled along their length in a SpatialIndex, ids are the
+    segment ids (row indices by default)
+    '''
+
+    def __init__(self, p1, p2, ids=None, spacing=None):
+        super(SegmentIndex, self).__init__()
+        self.p1, self.p2 = as_points(p1), as_points(p2)
+        n_segments = len(self.p1)
+        self.ids = np.arange(n_segments, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        if spacing is None:
+            lengths = np.sqrt(((self.p2 - self.p1) ** 2).sum(1))
+            spacing = np.median(lengths) if n_segments and np.median(lengths) > 0 else 1.0
+        self.spacing = float(spacing)
+        segment_rows, samples = segment_samples(self.p1, self.p2, self.spacing)
+        self.samples = SpatialIndex(samples, segment_rows)
+
+    @classmethod
+    def from_fronts(cls, front_meshes, elem_type='bar'):
+        '''
+        Segments of the fronts read by read_sif_file, segment_keys
+        gives the (front, elem_id) of each segment id
+        '''
+        p1, p2, keys = [], [], []
+        for front, front_mesh in front_meshes.items():
+            nodes = front_mesh['nodes']
+            for elem_id, elem_nodes in front_mesh['elems'].get(elem_type, {}).items():
+                p1.append(nodes[elem_nodes[0]])
+                p2.append(nodes[elem_nodes[-1]])
+                keys.append((front, elem_id))
+        index = cls(p1, p2)
+        index.segment_keys = keys
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, points, rows):
+        return distance_points_segment(points, self.p1[rows], self.p2[rows])
+
+    def nearest(self, points, max_distance=None):
+        '''
+        Nearest segment of each point. Returns (ids, distances, t)
+        with t the position of the closest point on the segment
+        (0 at p1, 1 at p2), id -1 when nothing is found
+        '''
+        points = as_points(points)
+        n_queries = len(points)
+        ids = np.full(n_queries, -1, dtype=np.int64)
+        best = np.full(n_queries, np.inf)
+        t = np.zeros(n_queries)
+        # a segment within max_distance has a sample within max_distance + spacing / 2
+        sample_rows, sample_distances = self.samples.nearest(
+            points, None if max_distance is None else max_distance + 0.5 * self.spacing)
+        found = np.flatnonzero(sample_rows >= 0)
+        # the nearest segment passes closer than spacing / 2 of one of its samples
+        query_rows, point_rows, _ = self.samples.radius_pairs(points[found],
+                                                              sample_distances[found] + 0.5 * self.spacing)
+        pairs = np.unique(np.stack([found[query_rows], self.samples.ids[point_rows]], 1), axis=0)
+        distances = self.distances(points[pairs[:, 0]], pairs[:, 1])
+        closest = group_argmin(pairs[:, 0], distances)
+        rows, segment_rows = pairs[closest, 0], pairs[closest, 1]
+        best[rows] = distances[closest]
+        ids[rows] = self.ids[segment_rows]
+        t[rows] = segment_parameters(points[rows], self.p1[segment_rows], self.p2[segment_rows])
+        if max_distance is not None:
+            far = best > max_distance
+            ids[far], best[far] = -1, np.inf
+        return ids, best, t
+
+    def within(self, points, distance):
+        '''
+        Segments closer than distance of each point. Returns (offsets,
+        ids, distances) as SpatialIndex.radius does
+        '''
+        points = as_points(points)
+        sample_rows, point_rows, _ = self.samples.radius_pairs(points, distance + 0.5 * self.spacing)
+        pairs = np.unique(np.stack([sample_rows, self.samples.ids[point_rows]], 1), axis=0)
+        distances = self.distances(points[pairs[:, 0]], pairs[:, 1])
+        close = distances <= distance
+        query_rows, segment_rows, distances = pairs[close, 0], pairs[close, 1], distances[close]
+        order = np.lexsort((distances, query_rows))
+        offsets, ids = csr_from_pairs(len(points), query_rows[order], self.ids[segment_rows[order]])
+        return offsets, ids, distances[order]
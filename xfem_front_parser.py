@@ -7,6 +7,8 @@ InfoPropa.txt, sifs.txt, smoothsifs-1.txt
 import os
 
 from .utilities import vector_len, vector, lin_interp
+from .file_io import open_input
+from .instrumentation import phase
 
 
 smoothing_used_vars = ['J', 'K1', 'K2', 'K3', 'I1', 'I2', 'I3']
@@ -15,13 +17,21 @@ sif_vars = ['DKeq', 'K1', 'K2', 'K3', 'K1_smooth', 'K2_smooth', 'K3_smooth']
 
 
 def read_sif_file(sif_file, dk_coef=1.0, new_curv_coords=None):
+    # the read phase is closed even when the file can't be parsed
+    with phase('read', 'read_sif_file', sif_file) as read_phase:
+        return parse_sif_file(read_phase, sif_file, dk_coef, new_curv_coords)
+
+
+def parse_sif_file(read_phase, sif_file, dk_coef=1.0, new_curv_coords=None):
     smooth = 'smoothsifs' in os.path.basename(sif_file)
     smooth_key = '_smooth' if smooth else ''
 
     print('Lecture du fichier "{}"'.format(sif_file))
 
-    with open(sif_file, 'r') as f0:
+    section = read_phase.section('header')
+    with open_input(sif_file, 'r') as f0:
         lines = f0.readlines()
+    section.add_bytes(sum([len(line) for line in lines]))
     init_labels = lines[0][1:].split()
 
     labels = []
@@ -34,6 +44,7 @@ def read_sif_file(sif_file, dk_coef=1.0, new_curv_coords=None):
             _label = label
         labels.append(_label)
 
+    section = read_phase.section('fields')
     val_lines = [line for line in lines[1:] if line.strip()]
     table = []
     for line in val_lines:
@@ -94,12 +105,13 @@ def read_sif_file(sif_file, dk_coef=1.0, new_curv_coords=None):
             elems[elem_id] = [elem_id, elem_id + 1]
         cur_mesh[front]['nodes'] = nodes
         cur_mesh[front]['elems'] = {'bar': elems}
+    section.count(len(val_lines))
 
     return cur_mesh, cur_fields
 
 
 def get_front_indices(sif_file):
-    with open(sif_file, 'r') as f0:
+    with open_input(sif_file, 'r') as f0:
         lines = f0.readlines()
 
     val_lines = [line for line in lines[1:] if line.strip()]
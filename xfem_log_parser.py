@@ -9,6 +9,8 @@ value of ecart KIaux
 
 import re
 
+from .file_io import open_input
+
 
 float_expr = r"\-?\d+\.?\d*(?i:E\-?\+?\d+)?"
 split_pattern = "Start STEP \d+"
@@ -76,7 +78,7 @@ def write_log_report(report_path, log_file):
     _res_table = []
     _res_table.append(labels)
 
-    with open(log_file, 'r') as f0:
+    with open_input(log_file, 'r') as f0:
         s = f0.read()
 
     blocks = re.split(split_pattern, s)[1:]